@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# SyConn - Synaptic connectivity inference toolkit
+#
+# Copyright (c) 2016 - now
+# Max-Planck-Institute of Neurobiology, Munich, Germany
+# Authors: Philipp Schubert
+"""
+Micro-benchmark of the contact site detection kernels used in
+:func:`~syconn.extraction.cs_extraction_steps.extract_contact_sites`:
+
+    * single-threaded numba kernels :func:`~syconn.extraction.find_object_properties.detect_seg_boundaries` and
+      :func:`~syconn.extraction.find_object_properties.detect_contact_partners`,
+    * Cython kernel :func:`~syconn.extraction.block_processing_C.process_block_nonzero` (uint32),
+    * multi-threaded numba kernels :func:`~syconn.extraction.find_object_properties.detect_seg_boundaries_parallel`,
+      :func:`~syconn.extraction.find_object_properties.detect_contact_partners_parallel` (uint64) and
+      :func:`~syconn.extraction.find_object_properties.detect_contact_partners_packed` (uint32).
+"""
+import argparse
+import time
+
+import numba
+import numpy as np
+
+from syconn import global_params
+from syconn.extraction.block_processing_C import process_block_nonzero
+from syconn.extraction.find_object_properties import detect_seg_boundaries, detect_contact_partners, \
+    detect_seg_boundaries_parallel, detect_contact_partners_parallel, detect_contact_partners_packed
+
+
+def generate_segmentation(shape, n_cells: int, seed: int = 0) -> np.ndarray:
+    """Nearest-seed (Voronoi) segmentation with background voxels, mimicking dense neuropil."""
+    rng = np.random.default_rng(seed)
+    seeds = rng.integers(0, shape, size=(n_cells, 3))
+    grid = np.stack(np.meshgrid(*[np.arange(s) for s in shape], indexing='ij'), axis=-1).reshape(-1, 3)
+    seg = np.zeros(len(grid), dtype=np.uint64)
+    dists = np.full(len(grid), np.inf)
+    for ix, s in enumerate(seeds, 1):
+        d = np.sum((grid - s) ** 2, axis=1)
+        closer = d < dists
+        seg[closer] = ix
+        dists[closer] = d[closer]
+    seg = seg.reshape(shape)
+    seg[rng.random(shape) < 0.01] = 0
+    return seg
+
+
+def timeit(func, *args, n_repetitions: int = 3) -> float:
+    func(*args)  # JIT compilation / warm-up
+    start = time.time()
+    for _ in range(n_repetitions):
+        func(*args)
+    return (time.time() - start) / n_repetitions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark contact site detection kernels.')
+    parser.add_argument('--shape', type=int, nargs=3, default=[256, 256, 128], help='Volume shape (XYZ).')
+    parser.add_argument('--n_cells', type=int, default=500, help='Number of cell supervoxels.')
+    parser.add_argument('--n_repetitions', type=int, default=3, help='Number of timed runs.')
+    args = parser.parse_args()
+
+    seg = generate_segmentation(tuple(args.shape), args.n_cells)
+    seg32 = seg.astype(np.uint32)
+    stencil = global_params.config['cell_objects']['cs_filtersize']
+    offset = np.array([(-(s // 2), s // 2) for s in stencil], dtype=np.int64)
+    bdry = detect_seg_boundaries_parallel(seg)
+    print(f'Volume {args.shape}, {args.n_cells} cells, {bdry.mean():.1%} boundary voxels, stencil {stencil}, '
+          f'{numba.get_num_threads()} numba threads.')
+
+    res = dict()
+    res['detect_seg_boundaries'] = timeit(detect_seg_boundaries, seg, n_repetitions=args.n_repetitions)
+    res['detect_seg_boundaries_parallel'] = timeit(detect_seg_boundaries_parallel, seg,
+                                                   n_repetitions=args.n_repetitions)
+    res['detect_contact_partners'] = timeit(detect_contact_partners, seg, bdry, offset,
+                                            n_repetitions=args.n_repetitions)
+    res['detect_contact_partners_parallel'] = timeit(detect_contact_partners_parallel, seg, bdry, offset,
+                                                     n_repetitions=args.n_repetitions)
+    res['process_block_nonzero'] = timeit(process_block_nonzero, bdry.astype(np.uint32), seg32, stencil,
+                                          n_repetitions=args.n_repetitions)
+    res['detect_contact_partners_packed'] = timeit(detect_contact_partners_packed, seg32, bdry, offset,
+                                                   n_repetitions=args.n_repetitions)
+    for k, v in res.items():
+        print(f'{k:<35s} {v:8.3f} s')
+
+    # sanity check: the packed numba kernel reproduces the Cython kernel
+    assert np.array_equal(np.asarray(process_block_nonzero(bdry.astype(np.uint32), seg32, stencil)),
+                          detect_contact_partners_packed(seg32, bdry, offset))
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# SyConn - Synaptic connectivity inference toolkit
+#
+# Copyright (c) 2016 - now
+# Max-Planck-Institute of Neurobiology, Munich, Germany
+# Authors: Philipp Schubert
+"""
+Micro-benchmark of the neighborhood majority votes used for label smoothing on meshes and skeletons:
+
+    * :func:`~syconn.proc.graphs.bfs_smoothing` on synthetic mesh vertices, networkx breadth-first search from
+      every vertex (previous implementation) vs. :func:`~syconn.proc.graphs.neighborhood_majority_vote`,
+    * :func:`~syconn.reps.super_segmentation_helper.majorityvote_skeleton_property` on a synthetic skeleton,
+      networkx Dijkstra with cutoff from every node (previous implementation) vs.
+      :func:`~syconn.proc.graphs.neighborhood_majority_vote`.
+"""
+import argparse
+import itertools
+import time
+
+import networkx as nx
+import numpy as np
+from scipy import spatial
+
+from syconn.proc.graphs import bfs_smoothing, neighborhood_majority_vote
+
+
+def _majority(labels: np.ndarray) -> int:
+    cls, cnts = np.unique(labels, return_counts=True)
+    return cls[np.argmax(cnts)]
+
+
+def bfs_smoothing_nx(vertices, vertex_labels, max_edge_length=120, n_voting=40):
+    pairs = spatial.cKDTree(vertices).query_pairs(r=max_edge_length, output_type="ndarray")
+    g = nx.Graph()
+    g.add_nodes_from(range(len(vertices)))
+    g.add_edges_from(pairs)
+    return np.array([_majority(vertex_labels[[n] + [e[1] for e in itertools.islice(nx.bfs_edges(g, n), n_voting)]])
+                     for n in range(len(vertices))], dtype=vertex_labels.dtype)
+
+
+def skeleton_majority_nx(edges, weights, labels, max_dist):
+    g = nx.Graph()
+    g.add_nodes_from(range(len(labels)))
+    g.add_weighted_edges_from([(e1, e2, w) for (e1, e2), w in zip(edges, weights)])
+    return np.array([_majority(labels[list(nx.single_source_dijkstra_path(g, n, max_dist).keys())])
+                     for n in range(len(labels))])
+
+
+def generate_skeleton(n_nodes: int, seed: int = 0):
+    """Random walk skeleton with short side branches, node labels change every ~200 nodes."""
+    rng = np.random.default_rng(seed)
+    nodes = np.cumsum(rng.normal(0, 100, (n_nodes, 3)), axis=0)
+    parents = np.maximum(np.arange(n_nodes) - rng.integers(1, 4, n_nodes), 0)
+    edges = np.stack([parents[1:], np.arange(1, n_nodes)], axis=1)
+    weights = np.linalg.norm(nodes[edges[:, 0]] - nodes[edges[:, 1]], axis=1)
+    labels = (np.arange(n_nodes) // 200) % 3
+    noise = rng.random(n_nodes) < 0.2
+    labels[noise] = rng.integers(0, 3, noise.sum())
+    return edges, weights, labels
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark neighborhood majority votes.')
+    parser.add_argument('--n_vertices', type=int, default=200000, help='Number of mesh vertices.')
+    parser.add_argument('--n_nodes', type=int, default=20000, help='Number of skeleton nodes.')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vertices = rng.random((args.n_vertices, 3)) * 5000 * (args.n_vertices / 2e5) ** (1 / 3)
+    vertex_labels = rng.integers(0, 3, args.n_vertices).astype(np.int32)
+    edges, weights, node_labels = generate_skeleton(args.n_nodes)
+    print(f'{args.n_vertices} mesh vertices, {args.n_nodes} skeleton nodes.')
+    # numba compilation
+    neighborhood_majority_vote(edges[:10], node_labels[:11], max_nb=2)
+    neighborhood_majority_vote(edges[:10], node_labels[:11], max_dist=1000, weights=weights[:10])
+
+    res = dict()
+    start = time.time()
+    smoothed_nx = bfs_smoothing_nx(vertices, vertex_labels)
+    res['bfs_smoothing (networkx)'] = time.time() - start
+    start = time.time()
+    smoothed = bfs_smoothing(vertices, vertex_labels)
+    res['bfs_smoothing (CSR)'] = time.time() - start
+    start = time.time()
+    node_maj_nx = skeleton_majority_nx(edges, weights, node_labels, 10000)
+    res['skeleton majority (networkx)'] = time.time() - start
+    start = time.time()
+    node_maj = neighborhood_majority_vote(edges, node_labels, max_dist=10000, weights=weights)
+    res['skeleton majority (CSR)'] = time.time() - start
+    for k, v in res.items():
+        print(f'{k:<30s} {v:8.3f} s')
+
+    # sanity check: identical labels
+    assert np.array_equal(smoothed, smoothed_nx)
+    assert np.array_equal(node_maj, node_maj_nx)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# SyConn - Synaptic connectivity inference toolkit
+#
+# Copyright (c) 2016 - now
+# Max-Planck-Institute of Neurobiology, Munich, Germany
+# Authors: Philipp Schubert
+"""
+Micro-benchmark of the multi-view rendering at many locations of a synthetic neurite mesh on the CPU (OSMesa),
+see :func:`~syconn.proc.rendering_osmesa.multi_view_mesh_coords`:
+
+    * every location is rendered separately, including a dummy screenshot, and every view is read back with
+      its own ``glReadPixels`` call (previous implementation, ``atlas_size=0``),
+    * all views of many locations are rendered into a single framebuffer atlas which is read back at once.
+"""
+import argparse
+import os
+import time
+
+os.environ['PYOPENGL_PLATFORM'] = 'osmesa'
+
+import numpy as np
+from OpenGL.osmesa import OSMesaDestroyContext
+
+from syconn.proc.meshes import MeshObject, calc_rot_matrices
+from syconn.proc.rendering_osmesa import init_ctx, multi_view_mesh_coords
+
+
+def generate_tube_mesh(length: float = 50000, radius: float = 500, n_rings: int = 2000, n_segments: int = 32,
+                       seed: int = 0):
+    """
+    Triangulated tube along the x-axis with a randomly varying radius and center line (in nm).
+
+    Returns:
+        Flat index and vertex arrays.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, length, n_rings)
+    center = np.cumsum(rng.normal(0, 10, (n_rings, 2)), axis=0)
+    radii = radius * (1 + 0.3 * np.sin(x / 2000)) + rng.normal(0, 10, n_rings)
+    phi = np.linspace(0, 2 * np.pi, n_segments, endpoint=False)
+    vertices = np.stack([np.repeat(x, n_segments),
+                         (center[:, 0, None] + radii[:, None] * np.cos(phi)).ravel(),
+                         (center[:, 1, None] + radii[:, None] * np.sin(phi)).ravel()], axis=1)
+    ring, seg = np.meshgrid(np.arange(n_rings - 1), np.arange(n_segments), indexing='ij')
+    v00 = (ring * n_segments + seg).ravel()
+    v01 = (ring * n_segments + (seg + 1) % n_segments).ravel()
+    v10, v11 = v00 + n_segments, v01 + n_segments
+    indices = np.concatenate([np.stack([v00, v10, v11], axis=1), np.stack([v00, v11, v01], axis=1)])
+    return indices.ravel().astype(np.uint32), vertices.ravel().astype(np.float32)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark batched multi-view rendering with OSMesa.')
+    parser.add_argument('--n_locations', type=int, default=500, help='Number of rendering locations.')
+    parser.add_argument('--nb_views', type=int, default=2, help='Number of views per location.')
+    parser.add_argument('--ws', type=int, nargs=2, default=[256, 128], help='Window size (x, y) in pixels.')
+    parser.add_argument('--atlas_size', type=int, default=4096, help='Maximum edge length of the view atlas.')
+    parser.add_argument('--comp_window', type=float, default=8000, help='Extent of the rendering window in nm.')
+    args = parser.parse_args()
+
+    ws = tuple(args.ws)
+    ind, vert = generate_tube_mesh()
+    mesh = MeshObject('raw', ind, vert)
+    rng = np.random.default_rng(0)
+    # locations on the center line of the tube
+    coords = vert.reshape(-1, 32, 3).mean(axis=1)[rng.choice(len(vert) // 96, args.n_locations)]
+    edge_lengths = np.array([args.comp_window, args.comp_window / 2, args.comp_window])
+    rot_matrices = calc_rot_matrices(mesh.transform_external_coords(coords), mesh.vert_resh,
+                                     args.comp_window / mesh.max_dist)
+    print(f'{args.n_locations} locations, {args.nb_views} views of {ws[0]}x{ws[1]} pixels, '
+          f'{len(ind) // 3} triangles.')
+
+    res = dict()
+    views = dict()
+    for name, atlas_size in [('per-location rendering', 0), ('atlas rendering', args.atlas_size)]:
+        ctx = init_ctx(ws, depth_map=True)
+        start = time.time()
+        views[name] = multi_view_mesh_coords(mesh, coords, rot_matrices, edge_lengths, ws=ws, depth_map=True,
+                                             nb_views=args.nb_views, atlas_size=atlas_size)
+        res[name] = time.time() - start
+        OSMesaDestroyContext(ctx)
+    for k, v in res.items():
+        print(f'{k:<25s} {v:8.3f} s {args.n_locations / v:10.1f} locations/s')
+
+    # sanity check: identical views up to the depth quantization of the framebuffers
+    assert views['atlas rendering'].shape == views['per-location rendering'].shape
+    assert np.abs(views['atlas rendering'].astype(np.int16) - views['per-location rendering']).max() <= 1
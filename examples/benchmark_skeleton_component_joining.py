@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# SyConn - Synaptic connectivity inference toolkit
+#
+# Copyright (c) 2016 - now
+# Max-Planck-Institute of Neurobiology, Munich, Germany
+# Authors: Philipp Schubert
+"""
+Micro-benchmark of joining disconnected skeleton fragments into a single connected component, as done in
+:func:`~syconn.proc.graphs.stitch_skel_nx`:
+
+    * iterative joining of the largest component to its closest component with a new KD-tree per
+      iteration (previous implementation),
+    * minimum spanning tree over the components :func:`~syconn.proc.graphs.connect_components_mst`.
+"""
+import argparse
+import time
+
+import networkx as nx
+import numpy as np
+from scipy import spatial
+
+from syconn.proc.graphs import stitch_skel_nx
+
+
+def generate_skeleton_fragments(n_fragments: int, n_nodes: int = 20, seed: int = 0) -> nx.Graph:
+    """Random walk skeleton fragments with 'position' node attributes."""
+    rng = np.random.default_rng(seed)
+    g = nx.Graph()
+    extent = 500 * n_fragments ** (1 / 3)
+    for ii in range(n_fragments):
+        coords = rng.integers(0, extent, 3) + np.cumsum(rng.integers(-20, 21, (n_nodes, 3)), axis=0)
+        g.add_nodes_from([(ii * n_nodes + jj, dict(position=c)) for jj, c in enumerate(coords)])
+        g.add_edges_from([(ii * n_nodes + jj, ii * n_nodes + jj + 1) for jj in range(n_nodes - 1)])
+    return g
+
+
+def stitch_skel_nx_iterative(skel_nx: nx.Graph) -> nx.Graph:
+    skel_nx_nodes = np.array([skel_nx.nodes[ix]['position'] for ix in skel_nx.nodes()], dtype=np.int64)
+    no_of_seg = nx.number_connected_components(skel_nx)
+    while no_of_seg != 1:
+        list_of_comp = sorted(nx.connected_components(skel_nx), key=len, reverse=True)
+        rest_nodes_ixs = [ix for comp in list_of_comp[1:] for ix in comp]
+        current_set_of_nodes_ixs = list(list_of_comp[0])
+        tree = spatial.cKDTree(skel_nx_nodes[rest_nodes_ixs], 1)
+        thread_lengths, indices = tree.query(skel_nx_nodes[current_set_of_nodes_ixs])
+        start_thread_index = np.argmin(thread_lengths)
+        skel_nx.add_edge(current_set_of_nodes_ixs[start_thread_index], rest_nodes_ixs[indices[start_thread_index]])
+        no_of_seg -= 1
+    return skel_nx
+
+
+def added_length(g: nx.Graph, stitched: nx.Graph) -> float:
+    new_edges = set(map(frozenset, stitched.edges())) - set(map(frozenset, g.edges()))
+    return sum(np.linalg.norm(g.nodes[e1]['position'] - g.nodes[e2]['position']) for e1, e2 in new_edges)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark joining of skeleton fragments.')
+    parser.add_argument('--n_fragments', type=int, default=1000, help='Number of skeleton fragments.')
+    parser.add_argument('--n_nodes', type=int, default=20, help='Number of nodes per fragment.')
+    args = parser.parse_args()
+
+    g = generate_skeleton_fragments(args.n_fragments, args.n_nodes)
+    print(f'{args.n_fragments} fragments, {g.number_of_nodes()} nodes.')
+
+    res = dict()
+    start = time.time()
+    stitched_iterative = stitch_skel_nx_iterative(g.copy())
+    res['iterative joining'] = time.time() - start
+    start = time.time()
+    stitched = stitch_skel_nx(g.copy())
+    res['stitch_skel_nx'] = time.time() - start
+    for k, v in res.items():
+        print(f'{k:<25s} {v:8.3f} s')
+
+    # sanity check: both add a minimum spanning tree over the fragments
+    assert nx.number_connected_components(stitched) == 1
+    assert np.isclose(added_length(g, stitched), added_length(g, stitched_iterative))
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# SyConn - Synaptic connectivity inference toolkit
+#
+# Copyright (c) 2016 - now
+# Max-Planck-Institute of Neurobiology, Munich, Germany
+# Authors: Philipp Schubert
+"""
+Micro-benchmark of the supervoxel skeleton stitching used in
+:func:`~syconn.reps.super_segmentation_helper.from_sso_to_netkx_fast` on a synthetic supervoxel graph:
+
+    * per-edge stitching with boolean node masks and one KD-tree per edge (previous implementation),
+    * grouped stitching :func:`~syconn.reps.super_segmentation_helper.stitch_sv_skeletons`.
+"""
+import argparse
+import time
+
+import numpy as np
+from scipy import spatial
+
+from syconn.reps.super_segmentation_helper import stitch_sv_skeletons
+
+
+def generate_sv_skeletons(n_svs: int, n_nodes: int = 10, seed: int = 0):
+    """
+    Random walk skeletons of `n_svs` supervoxels which branch off from randomly chosen previous supervoxels.
+
+    Returns:
+        Node coordinates (voxels), supervoxel ID of every node and supervoxel graph edges.
+    """
+    rng = np.random.default_rng(seed)
+    nodes = np.zeros((n_svs, n_nodes, 3), dtype=np.int64)
+    nodes[0] = 10000 + np.cumsum(rng.integers(-20, 21, (n_nodes, 3)), axis=0)
+    sv_edges = []
+    for ix in range(1, n_svs):
+        parent = rng.integers(0, ix)
+        start = nodes[parent, rng.integers(0, n_nodes)] + rng.integers(-5, 6, 3)
+        nodes[ix] = start + np.cumsum(rng.integers(-20, 21, (n_nodes, 3)), axis=0)
+        sv_edges.append((parent, ix) if rng.random() < 0.5 else (ix, parent))
+    sv_ids = np.arange(1, n_svs + 1, dtype=np.uint64) * 7
+    # shuffle the order of the SVs in the node array
+    perm = rng.permutation(n_svs)
+    nodes = np.abs(nodes[perm].reshape(-1, 3)).astype(np.uint32)
+    node_sv_ids = np.repeat(sv_ids[perm], n_nodes)
+    return nodes, node_sv_ids, sv_ids[np.array(sv_edges)]
+
+
+def stitch_sv_skeletons_per_edge(nodes, node_sv_ids, sv_edges, scaling, max_edge_length=1.5e3):
+    node_ix_arr = np.arange(len(node_sv_ids))
+    edges = []
+    for e1, e2 in sv_edges:
+        nodes1 = (nodes[node_sv_ids == e1] * scaling).astype(np.float32)
+        nodes2 = (nodes[node_sv_ids == e2] * scaling).astype(np.float32)
+        if len(nodes1) == 0 or len(nodes2) == 0:
+            continue
+        nodes1_ix = node_ix_arr[node_sv_ids == e1]
+        nodes2_ix = node_ix_arr[node_sv_ids == e2]
+        dists, node_ixs1 = spatial.cKDTree(nodes1).query(nodes2)
+        ix2 = nodes2_ix[np.argmin(dists)]
+        ix1 = nodes1_ix[node_ixs1[np.argmin(dists)]]
+        node_dist_check = np.linalg.norm(nodes[ix1].astype(np.float32) * scaling -
+                                         nodes[ix2].astype(np.float32) * scaling)
+        if np.min(dists) < node_dist_check or node_dist_check > max_edge_length:
+            continue
+        edges.append((ix1, ix2))
+    return np.array(edges, dtype=np.uint32).reshape(-1, 2)
+
+
+def timeit(func, *args, n_repetitions: int = 3) -> float:
+    func(*args)  # warm-up
+    start = time.time()
+    for _ in range(n_repetitions):
+        func(*args)
+    return (time.time() - start) / n_repetitions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark supervoxel skeleton stitching.')
+    parser.add_argument('--n_svs', type=int, default=10000, help='Number of supervoxels.')
+    parser.add_argument('--n_nodes', type=int, default=10, help='Number of skeleton nodes per supervoxel.')
+    parser.add_argument('--n_repetitions', type=int, default=1, help='Number of timed runs.')
+    args = parser.parse_args()
+
+    scaling = np.array([10, 10, 25])
+    nodes, node_sv_ids, sv_edges = generate_sv_skeletons(args.n_svs, args.n_nodes)
+    print(f'{args.n_svs} SVs, {len(nodes)} skeleton nodes, {len(sv_edges)} SV graph edges.')
+
+    res = dict()
+    res['per-edge stitching'] = timeit(stitch_sv_skeletons_per_edge, nodes, node_sv_ids, sv_edges, scaling,
+                                       n_repetitions=args.n_repetitions)
+    res['stitch_sv_skeletons'] = timeit(stitch_sv_skeletons, nodes, node_sv_ids, sv_edges, scaling,
+                                        n_repetitions=args.n_repetitions)
+    for k, v in res.items():
+        print(f'{k:<25s} {v:8.3f} s')
+
+    # sanity check: both implementations add the same edges
+    assert np.array_equal(stitch_sv_skeletons_per_edge(nodes, node_sv_ids, sv_edges, scaling),
+                          stitch_sv_skeletons(nodes, node_sv_ids, sv_edges, scaling))
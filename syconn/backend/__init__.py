@@ -6,12 +6,14 @@
 # Authors: Philipp Schubert, Sven Dorkenwald, Joergen Kornfeld
 
 from ..global_params import config
-from .base import FSBase, BTBase
+from .base import FSBase, BTBase, FSIndexedBase
 from ..handler.logger import log_main
 
 # init backend
 if config['backend'] == 'FS':
     StorageClass = FSBase
+elif config['backend'] == 'FSIndexed':
+    StorageClass = FSIndexedBase
 elif config['backend'] == 'BT':
     StorageClass = BTBase
 # init log
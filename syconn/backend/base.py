@@ -5,12 +5,20 @@
 # Max Planck Institute of Neurobiology, Martinsried, Germany
 # Authors: Philipp Schubert, Sven Dorkenwald, Joergen Kornfeld
 
+import mmap
 import os
+import pickle
 import shutil
+import struct
 import time
+from collections.abc import MutableMapping
 from pickle import UnpicklingError
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
 
 from .. import global_params
+from .cache import get_object_cache, object_cache_key, file_token
 from ..extraction import log_extraction
 from ..handler.basics import write_obj2pkl, load_pkl2obj
 
@@ -26,7 +34,7 @@ except ImportError:
           "Please install fasteners to enable locking (pip install fasteners).")
     LOCKING = False
 
-__all__ = ['FSBase', 'BTBase']
+__all__ = ['FSBase', 'BTBase', 'FSIndexedBase', 'IndexedDict']
 
 
 class StorageBase(dict):
@@ -38,8 +46,54 @@ class StorageBase(dict):
         super(StorageBase, self).__init__()
         self._cache_decomp = cache_decomp
         self._cache_dc = {}
+        self._cache_token = None
         self._dc_intern = {}
 
+    @property
+    def _use_object_cache(self) -> bool:
+        # only read-only storages share decompressed items via the process-wide cache, the
+        # modification time of the storage file at load time is used as validity token.
+        return self._cache_decomp and getattr(self, 'read_only', False) and self._cache_token is not None
+
+    def _cache_key(self, key) -> tuple:
+        return object_cache_key(self._path, type(self).__name__, None, key, 'decomp')
+
+    def _cache_get(self, key):
+        """
+        Decompressed item cached via `cache_decomp`. Raises KeyError if the item is not cached.
+        """
+        if not self._cache_decomp:
+            raise KeyError(key)
+        if key in self._cache_dc:
+            return self._cache_dc[key]
+        if self._use_object_cache:
+            value = get_object_cache().get(self._cache_key(key), self._cache_token)
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def _cache_put(self, key, value, modified: bool = False):
+        """
+        Args:
+            key: Item key.
+            value: Decompressed value.
+            modified: `value` was set on this instance and is not persisted; it is only cached locally.
+        """
+        if modified:
+            self._cache_invalidate(key)
+        if not self._cache_decomp:
+            return
+        if self._use_object_cache and not modified:
+            get_object_cache().put(self._cache_key(key), value, self._cache_token)
+        else:
+            self._cache_dc[key] = value
+
+    def _cache_invalidate(self, key):
+        if self._cache_token is not None:
+            get_object_cache().invalidate(self._cache_key(key))
+        if key in self._cache_dc:
+            del self._cache_dc[key]
+
     def __getitem__(self, key):
         raise NotImplementedError
 
@@ -148,6 +202,7 @@ class FSBase(StorageBase):
         self._cache_decomp = cache_decomp
         self._max_nb_attempts = max_nb_attempts
         self._cache_dc = {}
+        self._cache_token = None
         self._dc_intern = {}
         self._path = inp_p
         if inp_p is not None:
@@ -160,12 +215,13 @@ class FSBase(StorageBase):
 
     def __delitem__(self, key):
         try:
-            del self[key]
+            del self._dc_intern[key]
         except KeyError:
             msg = "No such attribute {} in dict at {}. Existing keys:" \
                   " {}.".format(key, self._path, list(self.keys()))
             log_extraction.error(msg)
             raise AttributeError(msg)
+        self._cache_invalidate(key)
 
     def __del__(self):
         if self.a_lock is not None and self.a_lock.acquired:
@@ -235,6 +291,29 @@ class FSBase(StorageBase):
         """
         if source is None:
             source = self._path
+        self._acquire_lock(source)
+        if os.path.isfile(source):
+            try:
+                self._dc_intern = load_pkl2obj(source)
+            except (UnpicklingError, EOFError) as e:
+                log_extraction.warning("Could not load LZ4Dict ({}). 'push' will"
+                                       " overwrite broken .pkl file: {}.".format(self._path, e))
+                self._dc_intern = {}
+        else:
+            self._dc_intern = {}
+        self._cache_token = file_token(source)
+        if self.read_only and not self.disable_locking:
+            self.a_lock.release()
+
+    def _acquire_lock(self, source: str):
+        """
+        Creates the parent folder of `source` (if not :attr:`~read_only`) and acquires the
+        file lock (if locking is enabled). The lock is released after loading if
+        :attr:`~read_only`, otherwise after :func:`~push`.
+
+        Args:
+            source: Source location
+        """
         fold, fname = os.path.split(source)
         lock_path = fold + "/." + fname + ".lk"
         # only create directory if read_only is false. -> support virtual SSO
@@ -267,14 +346,478 @@ class FSBase(StorageBase):
                 msg = "Unable to acquire file lock for {} after {:.0f}s.".format(source, time.time() - start)
                 log_extraction.warning(msg)
                 raise RuntimeError(msg)
-        if os.path.isfile(source):
+
+
+# ---------------------------- indexed, append-only binary file
+# ------------------------------------------------------------------------------
+#: Magic bytes at the beginning of every indexed storage file.
+IDX_MAGIC = b'SYCNIDX1'
+#: Magic bytes of every record header.
+REC_MAGIC = b'SREC'
+#: Alignment of record payloads and out-of-band buffers in bytes.
+IDX_ALIGN = 64
+
+
+def _aligned(pos: int) -> int:
+    return (pos + IDX_ALIGN - 1) // IDX_ALIGN * IDX_ALIGN
+
+
+class IndexedDict(MutableMapping):
+    """
+    Lazy dictionary on top of an append-only binary file with one record per
+    key. Used as ``_dc_intern`` of :class:`FSIndexedBase`.
+
+    Records are serialized with pickle protocol 5 and numpy arrays are stored
+    as out-of-band buffers (aligned to :attr:`IDX_ALIGN` bytes). Reading an item
+    only unpickles its own record and, if `zero_copy` is True, returns numpy
+    arrays as read-only views onto the memory-mapped file. The mapping
+    key -> (data offset, payload length, buffer offsets/lengths, array meta) is
+    stored in the sidecar file ``<path>.idx``. Records are self-describing, i.e.
+    the index can be rebuilt by scanning the data file (see :func:`~scan`).
+
+    Array records (see :func:`~set_arrays`) contain a list of (optionally lz4
+    compressed) numpy arrays without any pickle payload. Their dtypes, shapes
+    and compression flags are part of the index, which allows to read and
+    decompress single arrays of a record via :func:`~get_arrays`.
+
+    Notes:
+        * If `track_changes` is True, items which were accessed and changed in
+          place (e.g. the attribute dictionaries of
+          :class:`~syconn.backend.storage.AttributeDict`) are detected during
+          :func:`~flush` by comparing their serialization with the stored record.
+          Otherwise only items set via ``__setitem__`` are written. Array records
+          are not tracked, they have to be set again via :func:`~set_arrays`
+          after modification.
+        * Deletions and overwrites only append tombstones or new records. Use
+          :func:`~syconn.backend.base.FSIndexedBase.compact` to reclaim space.
+    """
+
+    def __init__(self, path: Optional[str], zero_copy: bool = True, track_changes: bool = True):
+        self.path = path
+        self.zero_copy = zero_copy
+        self.track_changes = track_changes
+        # key -> (data offset, payload length, ((buffer offset, buffer length), ...), array meta)
+        self._index = {}
+        self._end = len(IDX_MAGIC)
+        # deserialized items and their serialization at load time
+        self._loaded = {}
+        self._snapshots = {}
+        self._dirty = set()
+        self._deleted = set()
+        # key -> compression flag of array records which were set in memory
+        self._array_keys = {}
+        self._mm = None
+        # True if the data file has to be rewritten entirely, e.g. legacy pickle files
+        self._rewrite = False
+
+    # --------------------------------------------------------------- file access
+    @property
+    def index_path(self) -> str:
+        return self.path + '.idx'
+
+    def _mmap(self) -> mmap.mmap:
+        if self._mm is None:
+            with open(self.path, 'rb') as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mm
+
+    def load(self):
+        """
+        Reads the index of an existing storage file. Legacy pickle files
+        (:class:`FSBase`) are loaded entirely and converted during the next
+        :func:`~flush`.
+        """
+        self._index, self._loaded, self._snapshots = {}, {}, {}
+        self._dirty, self._deleted, self._array_keys = set(), set(), {}
+        self._mm = None
+        self._rewrite = False
+        if self.path is None or not os.path.isfile(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            magic = f.read(len(IDX_MAGIC))
+        if magic != IDX_MAGIC:
             try:
-                self._dc_intern = load_pkl2obj(source)
+                dc = load_pkl2obj(self.path)
             except (UnpicklingError, EOFError) as e:
-                log_extraction.warning("Could not load LZ4Dict ({}). 'push' will"
-                                       " overwrite broken .pkl file: {}.".format(self._path, e))
-                self._dc_intern = {}
+                log_extraction.warning("Could not load indexed storage ({}). 'push' will"
+                                       " overwrite broken file: {}.".format(self.path, e))
+                dc = {}
+            for k, v in dc.items():
+                self[k] = v
+            self._rewrite = True
+            return
+        if os.path.isfile(self.index_path):
+            try:
+                self._index, self._end = load_pkl2obj(self.index_path)
+            except (UnpicklingError, EOFError, ValueError) as e:
+                log_extraction.warning("Could not load index of storage ({}). Index will be "
+                                       "rebuilt from records: {}.".format(self.path, e))
+                self._index, self._end = {}, len(IDX_MAGIC)
+        if os.path.getsize(self.path) < self._end:
+            log_extraction.warning(f'Index of storage ({self.path}) is outdated and will be rebuilt.')
+            self._index, self._end = {}, len(IDX_MAGIC)
+        # pick up records which were appended after the index was written
+        if os.path.getsize(self.path) > self._end:
+            self.scan(self._end)
+
+    def scan(self, start: int = len(IDX_MAGIC)):
+        """
+        Updates the index with all records located after `start`.
+
+        Args:
+            start: Offset of the first record header.
+        """
+        mm = self._mmap()
+        pos = start
+        hdr_size = len(REC_MAGIC) + 4
+        while pos + hdr_size <= len(mm):
+            magic, hdr_len = struct.unpack('<4sI', mm[pos:pos + hdr_size])
+            if magic != REC_MAGIC or pos + hdr_size + hdr_len > len(mm):
+                log_extraction.warning(f'Truncated record at offset {pos} in "{self.path}".')
+                break
+            key, payload_len, bufs, meta = pickle.loads(mm[pos + hdr_size:pos + hdr_size + hdr_len])
+            data_off = _aligned(pos + hdr_size + hdr_len)
+            rec_end = data_off + max(payload_len, 0)
+            if len(bufs) > 0:
+                rec_end = data_off + bufs[-1][0] + bufs[-1][1]
+            if rec_end > len(mm):
+                log_extraction.warning(f'Truncated record at offset {pos} in "{self.path}".')
+                break
+            if payload_len < 0:  # tombstone
+                self._index.pop(key, None)
+            else:
+                self._index[key] = (data_off, payload_len, bufs, meta)
+            pos = rec_end
+        self._end = pos
+
+    def _record_buffers(self, key) -> Tuple[bytes, List[memoryview]]:
+        data_off, payload_len, bufs, _ = self._index[key]
+        mm = self._mmap()
+        mv = memoryview(mm)
+        buffers = [mv[data_off + b_off:data_off + b_off + b_len] for b_off, b_len in bufs]
+        return mm[data_off:data_off + payload_len], buffers
+
+    def _read(self, key) -> Any:
+        payload, buffers = self._record_buffers(key)
+        if self.zero_copy:
+            value = pickle.loads(payload, buffers=buffers)
         else:
-            self._dc_intern = {}
+            value = pickle.loads(payload, buffers=[bytearray(b) for b in buffers])
+        if self.track_changes:
+            # re-serialize the loaded value, because the read-only state of buffers is part of
+            # the pickle stream; buffer contents are compared against the stored record
+            self._snapshots[key] = (self._serialize(value)[0], buffers)
+        return value
+
+    @staticmethod
+    def _serialize(value: Any) -> Tuple[bytes, List[memoryview]]:
+        buffers = []
+        payload = pickle.dumps(value, protocol=5, buffer_callback=buffers.append)
+        return payload, [b.raw() for b in buffers]
+
+    @staticmethod
+    def _serialize_arrays(arrays: List[np.ndarray], compress_arrays: bool) -> Tuple[List[bytes], tuple]:
+        buffers, meta = [], []
+        for arr in arrays:
+            arr = np.ascontiguousarray(arr)
+            buf = memoryview(arr).cast('B') if arr.nbytes > 0 else b''
+            is_comp = compress_arrays and arr.nbytes > 0
+            if is_comp:
+                try:
+                    buf = compress(buf)
+                except (OverflowError, ValueError):  # lz4 block size limit, store uncompressed
+                    is_comp = False
+            buffers.append(buf)
+            meta.append((arr.dtype.str, arr.shape, is_comp))
+        return buffers, tuple(meta)
+
+    def _changed(self, key) -> bool:
+        if key in self._dirty or key not in self._index:
+            return True
+        if key not in self._snapshots:
+            return False
+        payload, buffers = self._serialize(self._loaded[key])
+        old_payload, old_buffers = self._snapshots[key]
+        if payload != old_payload or len(buffers) != len(old_buffers):
+            return True
+        return any(b != old_b for b, old_b in zip(buffers, old_buffers))
+
+    @staticmethod
+    def _write_record(f, key, payload: bytes, buffers: list, meta: Optional[tuple] = None,
+                      tombstone: bool = False) -> Tuple[int, int, tuple, Optional[tuple]]:
+        bufs = []
+        pos = _aligned(len(payload))
+        for b in buffers:
+            b_len = memoryview(b).nbytes
+            bufs.append((pos, b_len))
+            pos = _aligned(pos + b_len)
+        bufs = tuple(bufs)
+        payload_len = -1 if tombstone else len(payload)
+        hdr = pickle.dumps((key, payload_len, bufs, meta), protocol=pickle.HIGHEST_PROTOCOL)
+        f.write(struct.pack('<4sI', REC_MAGIC, len(hdr)) + hdr)
+        data_off = _aligned(f.tell())
+        f.write(b'\0' * (data_off - f.tell()))
+        f.write(payload)
+        for (b_off, _), b in zip(bufs, buffers):
+            f.write(b'\0' * (data_off + b_off - f.tell()))
+            f.write(b)
+        return data_off, payload_len, bufs, meta
+
+    def flush(self, dest: Optional[str] = None):
+        """
+        Appends all new or changed items to the data file and writes the
+        index. If `dest` differs from :attr:`~path` or the source was a legacy
+        pickle file, all items are written into a new file.
+
+        Args:
+            dest: Destination of the data file. Defaults to :attr:`~path`.
+        """
+        if dest is None:
+            dest = self.path
+        rewrite = self._rewrite or dest != self.path or not os.path.isfile(dest)
+        if rewrite:
+            keys = list(self.keys())
+            index = {}
+            tmp_p = dest + '.tmp'
+            f = open(tmp_p, 'wb')
+            f.write(IDX_MAGIC)
+        else:
+            keys = [k for k in self._loaded if self._changed(k)]
+            if len(keys) == 0 and len(self._deleted) == 0:
+                return
+            index = dict(self._index)
+            f = open(dest, 'ab')
+            f.seek(0, os.SEEK_END)
+        with f:
+            if not rewrite:
+                for k in self._deleted:
+                    self._write_record(f, k, b'', [], tombstone=True)
+            for k in keys:
+                if k in self._array_keys:
+                    buffers, meta = self._serialize_arrays(self._loaded[k], self._array_keys[k])
+                    index[k] = self._write_record(f, k, b'', buffers, meta)
+                elif k in self._loaded:
+                    payload, buffers = self._serialize(self._loaded[k])
+                    index[k] = self._write_record(f, k, payload, buffers)
+                else:  # copy stored record
+                    payload, buffers = self._record_buffers(k)
+                    index[k] = self._write_record(f, k, payload, buffers, self._index[k][3])
+            end = f.tell()
+        if rewrite:
+            os.replace(tmp_p, dest)
+        write_obj2pkl(dest + '.idx', (index, end))
+        if dest == self.path:
+            self._index, self._end = index, end
+            self._dirty, self._deleted, self._array_keys = set(), set(), {}
+            self._loaded = {k: v for k, v in self._loaded.items() if self._index[k][3] is None}
+            self._snapshots = {}
+            self._rewrite = False
+            # file was changed; existing views keep their reference to the old map
+            self._mm = None
+
+    # --------------------------------------------------------------- array records
+    def is_array_record(self, key) -> bool:
+        """
+        Args:
+            key: Item key.
+
+        Returns:
+            True if the item is stored as array record, see :func:`~set_arrays`.
+        """
+        if key in self._loaded:
+            return key in self._array_keys
+        return key in self._index and self._index[key][3] is not None
+
+    def set_arrays(self, key, arrays: List[np.ndarray], compress_arrays: bool = True):
+        """
+        Store a list of numpy arrays as array record.
+
+        Args:
+            key: Item key.
+            arrays: Arrays of the record. Dtype and shape are stored in the index.
+            compress_arrays: Compress arrays with lz4. Uncompressed arrays are
+                read zero-copy.
+        """
+        self[key] = list(arrays)
+        self._array_keys[key] = compress_arrays
+
+    def get_arrays(self, key, ixs: Optional[List[int]] = None) -> List[np.ndarray]:
+        """
+        Read arrays of an array record. Only the bytes of the requested arrays
+        are read and decompressed.
+
+        Args:
+            key: Item key.
+            ixs: Indices of the arrays within the record. Defaults to all.
+
+        Returns:
+            List of arrays.
+        """
+        if key in self._loaded:
+            arrays = self._loaded[key]
+            return list(arrays) if ixs is None else [arrays[ix] for ix in ixs]
+        data_off, _, bufs, meta = self._index[key]
+        if ixs is None:
+            ixs = range(len(bufs))
+        mv = memoryview(self._mmap())
+        arrays = []
+        for ix in ixs:
+            b_off, b_len = bufs[ix]
+            dt, sh, is_comp = meta[ix]
+            buf = mv[data_off + b_off:data_off + b_off + b_len]
+            if is_comp:
+                buf = decompress(buf, return_bytearray=True)
+            elif not self.zero_copy:
+                buf = bytearray(buf)
+            arrays.append(np.frombuffer(buf, dtype=dt).reshape(sh))
+        return arrays
+
+    def iter_arrays(self, keys: Iterable) -> Iterator[Tuple[Any, List[np.ndarray]]]:
+        """
+        Batched read of array records in the order they are located in the data
+        file.
+
+        Args:
+            keys: Item keys of array records.
+
+        Yields:
+            Key and list of arrays.
+        """
+        keys = list(keys)
+        in_file = sorted([k for k in keys if k not in self._loaded], key=lambda k: self._index[k][0])
+        if len(in_file) > 0 and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            self._mmap().madvise(mmap.MADV_SEQUENTIAL)
+        for k in in_file:
+            yield k, self.get_arrays(k)
+        for k in keys:
+            if k in self._loaded:
+                yield k, self.get_arrays(k)
+
+    # --------------------------------------------------------------- mapping API
+    def __getitem__(self, key):
+        try:
+            return self._loaded[key]
+        except KeyError:
+            pass
+        if key not in self._index:
+            raise KeyError(key)
+        if self.is_array_record(key):
+            # array records are not tracked for in-place changes, see class notes
+            return self.get_arrays(key)
+        value = self._read(key)
+        self._loaded[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self._loaded[key] = value
+        self._snapshots.pop(key, None)
+        self._array_keys.pop(key, None)
+        self._dirty.add(key)
+        self._deleted.discard(key)
+
+    def __delitem__(self, key):
+        if key not in self._loaded and key not in self._index:
+            raise KeyError(key)
+        self._loaded.pop(key, None)
+        self._snapshots.pop(key, None)
+        self._array_keys.pop(key, None)
+        self._dirty.discard(key)
+        if key in self._index:
+            del self._index[key]
+            self._deleted.add(key)
+
+    def __contains__(self, key):
+        return key in self._loaded or key in self._index
+
+    def __iter__(self):
+        yield from self._index
+        for k in self._loaded:
+            if k not in self._index:
+                yield k
+
+    def __len__(self):
+        return len(self._index) + sum(1 for k in self._loaded if k not in self._index)
+
+    def __repr__(self):
+        return f'{type(self).__name__}(path="{self.path}", n_items={len(self)})'
+
+
+class FSIndexedBase(FSBase):
+    """
+    Alternative to :class:`FSBase` which stores every item as separate record in
+    an append-only, indexed binary file (see :class:`IndexedDict`) instead of
+    pickling the whole dictionary. Opening a storage only reads its index,
+    items are deserialized on access (numpy arrays are zero-copy views onto
+    the memory-mapped file if `zero_copy` is True) and :func:`~push` only
+    appends new or modified items. In-place changes of accessed items are only
+    detected if the storage is not read-only.
+
+    The data file is located at the given path (e.g. ``.../mesh.pkl``), the index
+    at ``<path>.idx``. Existing :class:`FSBase` pickle files are read and
+    converted during the first :func:`~push`. Enable via ``backend: "FSIndexed"``
+    in the config.
+    """
+
+    def __init__(self, inp_p: str, cache_decomp: bool = False,
+                 read_only: bool = True, zero_copy: Optional[bool] = None, **kwargs):
+        """
+
+        Args:
+            inp_p: Path to file.
+            cache_decomp: Cache deserialized arrays.
+            read_only: In case locking is enabled, no semaphore will be placed.
+            zero_copy: Return numpy arrays as read-only views onto the memory-mapped
+                file. Defaults to `read_only`.
+            **kwargs: Keyword arguments passed to :class:`FSBase`.
+        """
+        self.zero_copy = read_only if zero_copy is None else zero_copy
+        super().__init__(inp_p, cache_decomp=cache_decomp, read_only=read_only, **kwargs)
+        if inp_p is None:
+            self._dc_intern = IndexedDict(None, zero_copy=self.zero_copy, track_changes=not self.read_only)
+
+    def __eq__(self, other):
+        if not isinstance(other, FSBase):
+            return False
+        return dict(self._dc_intern.items()) == dict(other._dc_intern.items())
+
+    def push(self, dest: str = None):
+        """
+        Appends new and modified items to the data file and updates the index.
+
+        Args:
+            dest: storage destination. If different from the source, all items
+                are written to a new file.
+        """
+        if dest is None:
+            dest = self._path
+        if dest is None:  # support virtual / temporary SSO objects
+            log_extraction.warning('"push" called but Storage object was initialized '
+                                   'with "None". Content will not be written.')
+            return
+        self._dc_intern.flush(dest)
+        if not self.read_only and not self.disable_locking:
+            self.a_lock.release()
+
+    def pull(self, source: str = None):
+        """
+        Reads the index of the source file. Items are loaded on access.
+
+        Args:
+            source: Source location
+        """
+        if source is None:
+            source = self._path
+        self._acquire_lock(source)
+        self._dc_intern = IndexedDict(source, zero_copy=self.zero_copy, track_changes=not self.read_only)
+        self._dc_intern.load()
+        self._cache_token = file_token(source)
         if self.read_only and not self.disable_locking:
             self.a_lock.release()
+
+    def compact(self):
+        """
+        Rewrites the data file with the current items only, i.e. drops
+        overwritten and deleted records.
+        """
+        self._dc_intern._rewrite = True
+        self._dc_intern.flush()
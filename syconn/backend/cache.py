@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+# SyConn - Synaptic connectivity inference toolkit
+#
+# Copyright (c) 2016 - now
+# Max Planck Institute of Neurobiology, Martinsried, Germany
+# Authors: Philipp Schubert, Sven Dorkenwald, Joergen Kornfeld
+"""
+Process-wide, byte-size-bounded LRU cache for decompressed object data (meshes, skeletons, voxel masks,
+attribute dictionaries, ..). Items are keyed by ``(dataset, obj_type, version, id, kind)``, see
+:func:`~object_cache_key`, and may carry a validity token (e.g. the modification time of the underlying
+storage file, see :func:`~file_token`) which is compared on every look-up. The maximum cache size per
+process is defined by ``object_cache_mb`` in the config; the cache is disabled by default.
+"""
+import copy
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+import numpy as np
+
+__all__ = ['ObjectCache', 'get_object_cache', 'object_cache_key', 'file_token', 'estimate_nbytes', 'load_cached']
+
+
+def estimate_nbytes(obj: Any, _seen: Optional[set] = None) -> int:
+    """
+    Estimate the memory footprint of `obj`. Numpy arrays contribute their buffer size, containers
+    and class instances the sum of their items / attributes.
+
+    Args:
+        obj: Object.
+
+    Returns:
+        Approximate number of bytes.
+    """
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            return obj.nbytes + sum(estimate_nbytes(v, _seen) for v in obj.flat)
+        return obj.nbytes
+    if isinstance(obj, (bytes, bytearray, str)):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimate_nbytes(k, _seen) + estimate_nbytes(v, _seen)
+                                        for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set)):
+        return sys.getsizeof(obj) + sum(estimate_nbytes(v, _seen) for v in obj)
+    if hasattr(obj, '__dict__'):
+        return sys.getsizeof(obj) + estimate_nbytes(vars(obj), _seen)
+    return sys.getsizeof(obj)
+
+
+def _copy_value(obj: Any) -> Any:
+    """Copy arrays and containers to prevent in-place modifications of cached items."""
+    if isinstance(obj, np.ndarray):
+        return obj.copy()
+    if isinstance(obj, dict):
+        out = copy.copy(obj)
+        for k, v in obj.items():
+            out[k] = _copy_value(v)
+        return out
+    if isinstance(obj, list):
+        return [_copy_value(v) for v in obj]
+    if isinstance(obj, tuple):
+        return tuple(_copy_value(v) for v in obj)
+    return obj
+
+
+def file_token(path: Optional[str]) -> Optional[Tuple[int, int]]:
+    """
+    Validity token of a file.
+
+    Args:
+        path: Path to file.
+
+    Returns:
+        Modification time (in ns) and size of the file. None if the file does not exist.
+    """
+    if path is None:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def object_cache_key(dataset: str, obj_type: Optional[str], version: Optional[Any], obj_id: Any,
+                     kind: Hashable) -> tuple:
+    """
+    Cache key of an object item.
+
+    Args:
+        dataset: Dataset identifier, e.g. the storage path of a
+            :class:`~syconn.reps.segmentation.SegmentationDataset` or the path to a storage file.
+        obj_type: Object type, e.g. 'sv', 'ssv'.
+        version: Dataset version.
+        obj_id: Object ID.
+        kind: Item kind, e.g. 'mesh', 'skeleton', 'attr_dict'.
+
+    Returns:
+        Hashable key.
+    """
+    if isinstance(obj_id, np.integer):
+        obj_id = int(obj_id)
+    return dataset, obj_type, str(version) if version is not None else None, obj_id, kind
+
+
+def load_cached(key: Hashable, path: Optional[str], loader: Callable[[], Any]) -> Any:
+    """
+    Look-up `key` in the process-wide object cache and call `loader` on a miss. The file at `path`
+    provides the validity token, see :func:`~file_token`. Nothing is cached if the file does not exist.
+
+    Args:
+        key: Cache key, see :func:`~object_cache_key`.
+        path: Path to the storage file `loader` reads from.
+        loader: Loads the value from `path`.
+
+    Returns:
+        The (cached) value.
+    """
+    token = file_token(path)
+    if token is None:
+        return loader()
+    cache = get_object_cache()
+    value = cache.get(key, token)
+    if value is None:
+        value = loader()
+        if value is not None:
+            cache.put(key, value, token)
+    return value
+
+
+class ObjectCache:
+    """
+    Thread-safe LRU cache bounded by the estimated byte size of its items.
+
+    Examples:
+        Look-up of a mesh with the modification time of its storage as validity token::
+
+            cache = get_object_cache()
+            key = object_cache_key(so.so_storage_path, so.type, so.version, so.id, 'mesh')
+            token = file_token(so.mesh_path)
+            mesh = cache.get(key, token)
+            if mesh is None:
+                mesh = load_mesh(so)
+                cache.put(key, mesh, token)
+
+    Args:
+        max_bytes: Maximum total size of all cached items. 0 disables caching.
+        copy: Return copies of cached arrays and containers to prevent in-place modifications of cached
+            items.
+    """
+
+    def __init__(self, max_bytes: int, copy: bool = True):
+        self.max_bytes = int(max_bytes)
+        self.copy = copy
+        self._data = OrderedDict()  # key: (value, token, nbytes)
+        self._nbytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: Hashable):
+        return key in self._data
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.stats()})'
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def get(self, key: Hashable, token: Optional[Hashable] = None, default: Any = None) -> Any:
+        """
+        Args:
+            key: Cache key, see :func:`~object_cache_key`.
+            token: Validity token. Cached items with a different token are dropped.
+            default: Returned if `key` is not cached.
+
+        Returns:
+            Cached value or `default`.
+        """
+        with self._lock:
+            try:
+                value, cached_token, nbytes = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if cached_token != token:
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+        return _copy_value(value) if self.copy else value
+
+    def put(self, key: Hashable, value: Any, token: Optional[Hashable] = None, nbytes: Optional[int] = None):
+        """
+        Add `value` to the cache and evict the least recently used items if the size limit is exceeded.
+        Items larger than the size limit are not cached.
+
+        Args:
+            key: Cache key, see :func:`~object_cache_key`.
+            value: Value.
+            token: Validity token.
+            nbytes: Size of `value`. Estimated via :func:`~estimate_nbytes` if None.
+        """
+        if self.max_bytes <= 0:
+            return
+        if nbytes is None:
+            nbytes = estimate_nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        if self.copy:
+            value = _copy_value(value)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, token, nbytes)
+            self._nbytes += nbytes
+            while self._nbytes > self.max_bytes:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        """
+        Remove `key` from the cache (if cached).
+
+        Args:
+            key: Cache key.
+        """
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def _remove(self, key: Hashable):
+        self._nbytes -= self._data.pop(key)[2]
+
+    def clear(self):
+        """Remove all items and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self._nbytes = 0
+            self.hits, self.misses, self.evictions = 0, 0, 0
+
+    def resize(self, max_bytes: int):
+        """
+        Change the size limit and evict items if necessary.
+
+        Args:
+            max_bytes: Maximum total size of all cached items.
+        """
+        with self._lock:
+            self.max_bytes = int(max_bytes)
+            while self._nbytes > max(self.max_bytes, 0) and len(self._data) > 0:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            Number of hits, misses and evictions, number of items, total size and size limit in bytes.
+        """
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions, n_items=len(self._data),
+                    nbytes=self._nbytes, max_bytes=self.max_bytes)
+
+
+_object_cache = None
+
+
+def get_object_cache() -> ObjectCache:
+    """
+    Returns:
+        Process-wide object cache, its size limit is given by ``object_cache_mb`` in the config.
+    """
+    global _object_cache
+    if _object_cache is None:
+        from ..global_params import config
+        _object_cache = ObjectCache(int(config['object_cache_mb'] * 2**20))
+    return _object_cache
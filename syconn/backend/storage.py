@@ -7,15 +7,19 @@
 import os.path
 import shutil
 from collections import defaultdict
-from typing import Any, Tuple, Optional, Union, List, Iterator, Dict
+from typing import Any, Tuple, Optional, Union, List, Iterator, Dict, Iterable
 
 from ..backend import StorageClass
 from ..backend import log_backend
+from ..backend.base import IndexedDict
+from ..backend.cache import object_cache_key
 from ..handler.basics import kd_factory
 from ..handler.compression import lz4string_listtoarr, arrtolz4string_list
 
 import h5py
 import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
 
 try:
     from lz4.block import compress, decompress
@@ -62,15 +66,18 @@ class CompressedStorage(StorageClass):
 
     def __getitem__(self, item: Union[int, str]):
         try:
-            return self._cache_dc[item]
+            return self._cache_get(item)
         except KeyError:
             pass
-        value_intern = self._dc_intern[item]
-        sh = value_intern["sh"]
-        dt = np.dtype(value_intern["dt"])
-        decomp_arr = lz4string_listtoarr(value_intern["arr"], dtype=dt, shape=sh)
-        if self._cache_decomp:
-            self._cache_dc[item] = decomp_arr
+        if isinstance(self._dc_intern, IndexedDict) and self._dc_intern.is_array_record(item):
+            # only the bytes of this item are read, dtype and shape are stored in the index
+            decomp_arr = self._dc_intern.get_arrays(item)[0]
+        else:
+            value_intern = self._dc_intern[item]
+            sh = value_intern["sh"]
+            dt = np.dtype(value_intern["dt"])
+            decomp_arr = lz4string_listtoarr(value_intern["arr"], dtype=dt, shape=sh)
+        self._cache_put(item, decomp_arr)
         return decomp_arr
 
     def __setitem__(self, key: Union[int, str], value: np.ndarray):
@@ -78,8 +85,10 @@ class CompressedStorage(StorageClass):
             msg = "CompressedStorage supports np.array values only."
             log_backend.error(msg)
             raise ValueError(msg)
-        if self._cache_decomp:
-            self._cache_dc[key] = value
+        self._cache_put(key, value, modified=True)
+        if isinstance(self._dc_intern, IndexedDict):
+            self._dc_intern.set_arrays(key, [value])
+            return
         sh = list(value.shape)
         sh[0] = -1
         value_intern = {"arr": arrtolz4string_list(value), "sh": tuple(sh),
@@ -88,8 +97,7 @@ class CompressedStorage(StorageClass):
 
     def __delitem__(self, key):
         del self._dc_intern[key]
-        if key in self._cache_dc:
-            del self._cache_dc[key]
+        self._cache_invalidate(key)
 
 
 class VoxelStorageL(StorageClass):
@@ -113,7 +121,7 @@ class VoxelStorageL(StorageClass):
             Decompressed voxel masks with corresponding offsets.
         """
         try:
-            return self._cache_dc[item], self._dc_intern[item]["off"]
+            return self._cache_get(item), self._dc_intern[item]["off"]
         except KeyError:
             pass
         value_intern = self._dc_intern[item]
@@ -124,8 +132,7 @@ class VoxelStorageL(StorageClass):
         decomp_arrs = []
         for i in range(len(sh)):
             decomp_arrs.append(lz4string_listtoarr(comp_arrs[i], dt, sh[i]))
-        if self._cache_decomp:
-            self._cache_dc[item] = decomp_arrs
+        self._cache_put(item, decomp_arrs)
         return decomp_arrs, offsets
 
     def __setitem__(self, key: Union[int, str],
@@ -142,8 +149,7 @@ class VoxelStorageL(StorageClass):
         voxel_masks, offsets = values
         assert np.all([voxel_masks[0].dtype == v.dtype for v in voxel_masks])
         assert len(voxel_masks) == len(offsets)
-        if self._cache_decomp:
-            self._cache_dc[key] = voxel_masks
+        self._cache_put(key, voxel_masks, modified=True)
         sh = [v.shape for v in voxel_masks]
         for i in range(len(sh)):
             curr_sh = list(sh[i])
@@ -205,6 +211,141 @@ class VoxelStorageClass(VoxelStorageL):
         super(VoxelStorageL, self).__init__(inp, **kwargs)
 
 
+def _cube_keys(cube_coords: np.ndarray, origin: np.ndarray, dims: np.ndarray) -> np.ndarray:
+    """Flat int64 keys of cube coordinates (N, 3) relative to `origin` in a grid of shape `dims`."""
+    c = cube_coords - origin
+    return (c[:, 0] * dims[1] + c[:, 1]) * dims[2] + c[:, 2]
+
+
+def load_voxelmasks_grouped(kd, item_bbs: Dict[int, np.ndarray], overlap: int = 0,
+                            batch_size: Optional[int] = 200, max_fill_ratio: float = 2.
+                            ) -> Iterator[Tuple[int, List[np.ndarray]]]:
+    """
+    Grouped voxel fetch for many objects stored in a segmentation KnossosDataset.
+
+    Instead of one ``kd.load_seg`` call per bounding box (see
+    :func:`~VoxelStorageDyn.get_voxelmask_offset`), the bounding boxes of all objects
+    are mapped onto the cube grid of `kd`. Touched cubes are grouped into face-connected
+    components and every component is read with a single cube-aligned ``load_seg`` call.
+    Components whose bounding box is mostly empty (see `max_fill_ratio`) are bisected
+    until their bounding boxes are sufficiently filled. Each cube is therefore read
+    exactly once per batch and the binary masks of all bounding
+    boxes are sliced out of the loaded blocks.
+
+    Objects are processed in batches of spatially sorted objects to bound memory usage.
+
+    Args:
+        kd: KnossosDataset of the segmentation.
+        item_bbs: Bounding boxes (N, 2, 3) for every object ID (in voxels; xyz), see
+            :func:`~VoxelStorageDyn.get_boundingdata`.
+        overlap: Additional voxels added to each side of the bounding boxes.
+        batch_size: Number of objects loaded at once. If None, all objects are loaded at once.
+        max_fill_ratio: Read a group of cubes with a single call only if the volume of its
+            bounding box (in cubes) is at most `max_fill_ratio` times its number of cubes.
+
+    Yields:
+        Object ID and list of 3D binary masks (xyz) with the same order as its bounding boxes.
+        Mask offsets are given by the lower bounding box corners minus `overlap`.
+    """
+    items = list(item_bbs.keys())
+    if len(items) == 0:
+        return
+    cube_shape = np.array(kd.cube_shape, dtype=np.int64)
+    item_bbs = {k: np.asarray(item_bbs[k], dtype=np.int64).reshape(-1, 2, 3) for k in items}
+    # spatially sort objects by the cube of their lower bounding box corner (z, y, x)
+    first_cubes = np.array([np.min(item_bbs[k][:, 0], axis=0) for k in items]) // cube_shape
+    items = [items[ii] for ii in np.lexsort(first_cubes.T)]
+    if batch_size is None:
+        batch_size = len(items)
+    n_reads_tot, n_cubes_tot = 0, 0
+    for ii in range(0, len(items), batch_size):
+        batch = items[ii:ii + batch_size]
+        # bounding boxes of the current batch; upper bounds are exclusive
+        bb_lo = np.concatenate([item_bbs[k][:, 0] for k in batch]) - overlap
+        bb_hi = np.concatenate([item_bbs[k][:, 1] for k in batch]) + overlap
+        bb_hi = np.maximum(bb_hi, bb_lo)
+        cube_lo = bb_lo // cube_shape
+        cube_hi = (bb_hi - 1) // cube_shape
+        cube_coords = []
+        for lo, hi in zip(cube_lo, cube_hi):
+            if np.any(hi < lo):
+                continue
+            cube_coords.append(np.mgrid[lo[0]:hi[0] + 1, lo[1]:hi[1] + 1, lo[2]:hi[2] + 1].reshape(3, -1).T)
+        if len(cube_coords) == 0:
+            for k in batch:
+                yield k, [np.zeros(np.maximum(bb[1] - bb[0] + 2 * overlap, 0), dtype=bool) for bb in item_bbs[k]]
+            continue
+        cube_coords = np.unique(np.concatenate(cube_coords), axis=0)
+        # flat cube keys with a margin of one cube to allow neighbor look-ups
+        origin = cube_coords.min(axis=0) - 1
+        dims = cube_coords.max(axis=0) - origin + 2
+        keys = _cube_keys(cube_coords, origin, dims)  # sorted, because cube_coords is sorted lexicographically
+        # face-connected components of all touched cubes
+        strides = np.array([dims[1] * dims[2], dims[2], 1], dtype=np.int64)
+        edges_src, edges_dst = [], []
+        for stride in strides:
+            nb_ixs = np.searchsorted(keys, keys + stride)
+            nb_ixs[nb_ixs == len(keys)] = 0
+            valid = keys[nb_ixs] == keys + stride
+            edges_src.append(np.nonzero(valid)[0])
+            edges_dst.append(nb_ixs[valid])
+        edges_src, edges_dst = np.concatenate(edges_src), np.concatenate(edges_dst)
+        adj = csr_matrix((np.ones(len(edges_src), dtype=bool), (edges_src, edges_dst)),
+                         shape=(len(keys), len(keys)))
+        n_comps, comp_labels = connected_components(adj, directed=False)
+        # read blocks; every cube is assigned to exactly one block
+        blocks = []  # (offset, xyz array)
+        cube2block = np.zeros(len(keys), dtype=np.int64)
+        comp_order = np.argsort(comp_labels, kind='stable')
+        comp_bounds = np.searchsorted(comp_labels[comp_order], np.arange(n_comps + 1))
+        stack = [comp_order[comp_bounds[c]:comp_bounds[c + 1]] for c in range(n_comps)]
+        while len(stack) > 0:
+            cube_ixs = stack.pop()
+            comp_cubes = cube_coords[cube_ixs]
+            lo, hi = comp_cubes.min(axis=0), comp_cubes.max(axis=0) + 1
+            if np.prod(hi - lo) > max_fill_ratio * len(cube_ixs):
+                # sparse cube group: bisect along its longest axis
+                ax = np.argmax(hi - lo)
+                split_mask = comp_cubes[:, ax] < (lo[ax] + hi[ax]) // 2
+                stack.extend([cube_ixs[split_mask], cube_ixs[~split_mask]])
+                continue
+            cube2block[cube_ixs] = len(blocks)
+            off = lo * cube_shape
+            size = (hi - lo) * cube_shape
+            blocks.append((off, kd.load_seg(size=size, offset=off, mag=1).swapaxes(0, 2)))
+        n_reads_tot += len(blocks)
+        n_cubes_tot += len(keys)
+        # slice out binary masks of every bounding box
+        bb_cnt = 0
+        for k in batch:
+            masks = []
+            for _ in range(len(item_bbs[k])):
+                lo, hi = bb_lo[bb_cnt], bb_hi[bb_cnt]
+                c_lo, c_hi = cube_lo[bb_cnt], cube_hi[bb_cnt]
+                bb_cnt += 1
+                mask = np.zeros(hi - lo, dtype=bool)
+                if np.any(c_hi < c_lo):
+                    masks.append(mask)
+                    continue
+                bb_cubes = np.mgrid[c_lo[0]:c_hi[0] + 1, c_lo[1]:c_hi[1] + 1, c_lo[2]:c_hi[2] + 1].reshape(3, -1).T
+                block_ixs = np.unique(cube2block[np.searchsorted(keys, _cube_keys(bb_cubes, origin, dims))])
+                for b_ix in block_ixs:
+                    b_off, b_arr = blocks[b_ix]
+                    i_lo = np.maximum(lo, b_off)
+                    i_hi = np.minimum(hi, b_off + b_arr.shape)
+                    if np.any(i_hi <= i_lo):
+                        continue
+                    src = b_arr[i_lo[0] - b_off[0]:i_hi[0] - b_off[0], i_lo[1] - b_off[1]:i_hi[1] - b_off[1],
+                                i_lo[2] - b_off[2]:i_hi[2] - b_off[2]]
+                    mask[i_lo[0] - lo[0]:i_hi[0] - lo[0], i_lo[1] - lo[1]:i_hi[1] - lo[1],
+                         i_lo[2] - lo[2]:i_hi[2] - lo[2]] = src == k
+                masks.append(mask)
+            yield k, masks
+        del blocks
+    log_backend.debug(f'Loaded voxel masks of {len(items)} objects with {n_reads_tot} read(s) of '
+                      f'{n_cubes_tot} cube(s).')
+
+
 class VoxelStorageDyn(CompressedStorage):
     """
     Similar to `VoxelStorageL` but does not store the voxels explicitly,
@@ -298,6 +439,46 @@ class VoxelStorageDyn(CompressedStorage):
             curr_mask = self.voxeldata.load_seg(size=size, offset=off, mag=1) == item
             yield curr_mask.swapaxes(0, 2), bb[0]
 
+    def iter_voxelmask_offset_bulk(self, items: Iterable[int], overlap: int = 0, cubed: bool = False,
+                                   batch_size: Optional[int] = 200) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+        """
+        Bulk version of :func:`~get_voxelmask_offset` and :func:`~get_voxel_data_cubed`. Reads the
+        underlying segmentation cubes once per batch of spatially sorted objects, see
+        :func:`~load_voxelmasks_grouped`. The objects are yielded in spatial order, not in the
+        order of `items`.
+
+        Args:
+            items: Object IDs.
+            overlap: Additional voxels added to each side of the bounding boxes. Must be 0 if
+                `cubed` is True.
+            cubed: Yield a single dense 3D mask per object, see :func:`~get_voxel_data_cubed`.
+            batch_size: Number of objects loaded at once.
+
+        Yields:
+            Object ID, list of 3D binary masks (xyz) and their offsets (N, 3) as in
+            :func:`~get_voxelmask_offset` or, if `cubed` is True, object ID, 3D mask and offset.
+        """
+        if cubed and overlap != 0:
+            raise ValueError('`overlap` is not supported for `cubed=True`.')
+        item_bbs = {item: self.get_boundingdata(item) for item in items}
+        for item, masks in load_voxelmasks_grouped(self._get_voxeldata_kd(), item_bbs, overlap=overlap,
+                                                   batch_size=batch_size):
+            offsets = np.array(item_bbs[item])[:, 0]
+            if cubed:
+                yield (item, ) + self._cube_voxel_masks(masks, offsets)
+            else:
+                yield item, masks, offsets
+
+    def _get_voxeldata_kd(self):
+        if not hasattr(self, 'voxeldata'):
+            voxeldata_path = self._dc_intern['meta']['voxeldata_path']
+            if voxeldata_path is None:
+                msg = 'No path to voxeldata given / found.'
+                log_backend.error(msg)
+                raise ValueError(msg)
+            self.voxeldata = kd_factory(voxeldata_path)
+        return self.voxeldata
+
     def object_size(self, item):
         if not self.voxel_mode:
             log_backend.warn('`object_size` sould only be called during `voxel_mode=True`.')
@@ -386,6 +567,11 @@ class VoxelStorageDyn(CompressedStorage):
             3D mask, cube offset in voxels (xyz).
         """
         bin_arrs, block_offsets = self[item]
+        return self._cube_voxel_masks(bin_arrs, block_offsets)
+
+    @staticmethod
+    def _cube_voxel_masks(bin_arrs: List[np.ndarray], block_offsets: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        block_offsets = np.array(block_offsets)
         min_off = np.min(block_offsets, axis=0)
         block_extents = np.array([off + np.array(bin_arr.shape) for bin_arr, off in zip(bin_arrs, block_offsets)],
                                  dtype=np.int32)
@@ -509,6 +695,10 @@ class MeshStorage(StorageClass):
         self.compress = compress
         super().__init__(inp, **kwargs)
 
+    def _cache_key(self, key) -> tuple:
+        return object_cache_key(self._path, type(self).__name__, None, key,
+                                'decomp_colarr' if self.load_colarr else 'decomp')
+
     def __getitem__(self, item: Union[int, str]) -> List[np.ndarray]:
         """
 
@@ -519,24 +709,27 @@ class MeshStorage(StorageClass):
             Flat arrays: (indices, vertices, [normals, [colors/labels]])
         """
         try:
-            return self._cache_dc[item]
+            return self._cache_get(item)
         except KeyError:
             pass
-        mesh = self._dc_intern[item]
-        # if no normals were given in file / cache append empty array
-        if len(mesh) == 2:
-            mesh.append([""])
-        # if no colors/labels were given in file / cache append empty array
-        if len(mesh) == 3:
-            mesh.append([""])
-        decomp_arrs = [lz4string_listtoarr(mesh[0], dtype=np.uint32),
-                       lz4string_listtoarr(mesh[1], dtype=np.float32),
-                       lz4string_listtoarr(mesh[2], dtype=np.float32),
-                       lz4string_listtoarr(mesh[3], dtype=np.uint8)]
+        if isinstance(self._dc_intern, IndexedDict) and self._dc_intern.is_array_record(item):
+            # only read and decompress the arrays of this mesh
+            decomp_arrs = self._dc_intern.get_arrays(item, None if self.load_colarr else [0, 1, 2])
+        else:
+            mesh = list(self._dc_intern[item])
+            # if no normals were given in file / cache append empty array
+            if len(mesh) == 2:
+                mesh.append([""])
+            # if no colors/labels were given in file / cache append empty array
+            if len(mesh) == 3:
+                mesh.append([""])
+            decomp_arrs = [lz4string_listtoarr(mesh[0], dtype=np.uint32),
+                           lz4string_listtoarr(mesh[1], dtype=np.float32),
+                           lz4string_listtoarr(mesh[2], dtype=np.float32),
+                           lz4string_listtoarr(mesh[3], dtype=np.uint8)]
         if not self.load_colarr:
             decomp_arrs = decomp_arrs[:3]
-        if self._cache_decomp:
-            self._cache_dc[item] = decomp_arrs
+        self._cache_put(item, decomp_arrs)
         return decomp_arrs
 
     def __setitem__(self, key: int, mesh: List[np.ndarray]):
@@ -550,8 +743,7 @@ class MeshStorage(StorageClass):
             mesh.append(np.zeros((0,), dtype=np.float32))
         if len(mesh) == 3:
             mesh.append(np.zeros((0,), dtype=np.uint8))
-        if self._cache_decomp:
-            self._cache_dc[key] = mesh
+        self._cache_put(key, mesh, modified=True)
         if len(mesh[1]) != len(mesh[2]) > 0:
             log_backend.warning('Lengths of vertex array and length of normal'
                                 ' array differ!')
@@ -561,6 +753,11 @@ class MeshStorage(StorageClass):
                                      len(mesh[1]) == len(mesh[3]) * 3):
             log_backend.warning('Lengths of vertex array and length of color/'
                                 'label array differ!')
+        if isinstance(self._dc_intern, IndexedDict):
+            mesh = [mesh[0].astype(np.uint32, copy=False), mesh[1].astype(np.float32, copy=False),
+                    mesh[2].astype(np.float32, copy=False), mesh[3].astype(np.uint8, copy=False)]
+            self._dc_intern.set_arrays(key, mesh, compress_arrays=self.compress)
+            return
         if self.compress:
             transf = arrtolz4string_list
         else:
@@ -590,7 +787,7 @@ class SkeletonStorage(StorageClass):
             dict
         """
         try:
-            return self._cache_dc[item]
+            return self._cache_get(item)
         except KeyError:
             pass
         comp_arrs = self._dc_intern[item]
@@ -600,8 +797,7 @@ class SkeletonStorage(StorageClass):
         if len(comp_arrs) > 3:
             for k, v in comp_arrs[3].items():
                 skeleton[k] = v
-        if self._cache_decomp:
-            self._cache_dc[item] = skeleton
+        self._cache_put(item, skeleton)
         return skeleton
 
     def __setitem__(self, key, skeleton):
@@ -612,8 +808,7 @@ class SkeletonStorage(StorageClass):
             skeleton : dict
             keys: nodes diameters edges and other attributes (uncompressed).
         """
-        if self._cache_decomp:
-            self._cache_dc[key] = skeleton
+        self._cache_put(key, skeleton, modified=True)
         comp_n = arrtolz4string_list(skeleton["nodes"].astype(dtype=np.uint32))
         comp_d = arrtolz4string_list(skeleton["diameters"].astype(dtype=np.float32))
         comp_e = arrtolz4string_list(skeleton["edges"].astype(dtype=np.uint32))
@@ -627,15 +822,23 @@ class SkeletonStorage(StorageClass):
 
 
 class BinarySearchStore:
+    #: Maximum number of rows between two requested rows of a shard which are read as one slice (non-resident mode).
+    max_read_gap = 1024
+
     def __init__(self, fname: str, id_array: Optional[np.ndarray] = None,
                  attr_arrays: Optional[Dict[str, np.ndarray]] = None, overwrite: bool = False,
-                 n_shards: Optional[int] = None, rdcc_nbytes: int = 5*2**20):
+                 n_shards: Optional[int] = None, rdcc_nbytes: int = 5*2**20, resident: bool = False):
         """
         Data structure to store properties (values) of a corresponding ID array (keys). Internally a binary search
         is used that uses a sorted representation of keys and values to enable sparse look-ups with a much lower
         memory complexity than python dictionaries.
         Maximum ID is the last element of :attr:`~id_array`.
 
+        In resident mode the sorted ID and attribute arrays are memory-mapped from ``.npy`` sidecar files
+        (``<fname>.<key>.npy``, see :func:`~resident_path`) and look-ups do not touch the HDF5 file. Missing
+        sidecars are created from the HDF5 file. Otherwise the HDF5 file is kept open between queries and the
+        shard ID arrays are cached after their first use.
+
         Args:
             fname: File name.
             id_array: (Unsorted) ID array.
@@ -643,9 +846,17 @@ class BinarySearchStore:
             overwrite: Overwrite existing array files.
             n_shards: Number of shards/chunks the ID and attribute arrays are split into. Defaults to 5.
             rdcc_nbytes: Size of h5 chunks in bytes. Default is 5 MiB.
+            resident: Memory-map sorted ID and attribute arrays from ``.npy`` sidecar files. If `fname` is not a
+                path, the arrays are kept in memory.
         """
         self.fname = fname
+        self.resident = resident
         self._h5_file = None
+        self._bucket_ranges = None
+        self._attr_keys = None
+        # shard ID arrays (non-resident mode) or flat arrays (resident mode)
+        self._ids_cache = dict()
+        self._resident_arrays = dict()
         if id_array is not None:
             if attr_arrays is None:
                 raise ValueError('ID array is given, but no attribute array(s).')
@@ -654,8 +865,13 @@ class BinarySearchStore:
                     raise FileExistsError(f'BinarySearchStore at "{fname}" already exists and overwrite is False."')
                 else:
                     os.remove(fname)
+                    for k in ['ids'] + list(attr_arrays.keys()):
+                        if os.path.isfile(self.resident_path(k)):
+                            os.remove(self.resident_path(k))
             if n_shards is None:
                 n_shards = 5
+            # every shard must contain at least one ID to define its ID range
+            n_shards = max(1, min(n_shards, len(id_array)))
             if isinstance(fname, str):
                 os.makedirs(os.path.split(self.fname)[0], exist_ok=True)
             # sort keys / ID array
@@ -665,8 +881,11 @@ class BinarySearchStore:
             h5_file = h5py.File(fname, 'w', libver='latest', rdcc_nbytes=rdcc_nbytes)
             grp = h5_file.create_group("ids")
             for ii, id_sub in enumerate(np.array_split(id_array, n_shards)):
-                bucket_ranges.append((id_sub[0], id_sub[-1]))
+                # the ID range of the single shard of an empty store does not contain any ID
+                bucket_ranges.append((id_sub[0], id_sub[-1]) if len(id_sub) > 0 else (1, 0))
                 grp.create_dataset(f'{ii}', data=id_sub)
+            if resident and isinstance(fname, str):
+                self._save_resident('ids', id_array)
             for k, v in attr_arrays.items():
                 v_sorted = v[ixs]
                 grp = h5_file.create_group(k)
@@ -674,6 +893,8 @@ class BinarySearchStore:
                 grp.attrs['dtype'] = np.dtype(v_sorted.dtype).str
                 for ii, attr_sub in enumerate(np.array_split(v_sorted, n_shards)):
                     grp.create_dataset(f'{ii}', data=attr_sub)
+                if resident and isinstance(fname, str):
+                    self._save_resident(k, v_sorted)
             del ixs
             h5_file.attrs['bucket_ranges'] = bucket_ranges
             h5_file.close()
@@ -681,6 +902,52 @@ class BinarySearchStore:
             if isinstance(fname, str) and not os.path.isfile(fname):
                 raise FileNotFoundError(f'Could not find BinarySearchStore at "{self.fname}".')
 
+    def __getstate__(self):
+        # h5py handles and memory-maps are re-opened lazily, e.g. after sending the store to another process
+        state = self.__dict__.copy()
+        state['_h5_file'] = None
+        state['_ids_cache'] = dict()
+        state['_resident_arrays'] = dict()
+        return state
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        """
+        Close the HDF5 file handle.
+        """
+        if getattr(self, '_h5_file', None) is not None:
+            self._h5_file.close()
+            self._h5_file = None
+
+    @property
+    def h5_file(self) -> h5py.File:
+        """
+        Persistent read-only handle of the HDF5 file.
+        """
+        if self._h5_file is None:
+            self._h5_file = h5py.File(self.fname, 'r', libver='latest')
+        return self._h5_file
+
+    @property
+    def bucket_ranges(self) -> np.ndarray:
+        """
+        Minimum and maximum ID of every shard, shape (n_shards, 2).
+        """
+        if self._bucket_ranges is None:
+            self._bucket_ranges = np.array(self.h5_file.attrs['bucket_ranges'])
+        return self._bucket_ranges
+
+    @property
+    def attr_keys(self) -> List[str]:
+        """
+        Keys of the stored attributes.
+        """
+        if self._attr_keys is None:
+            self._attr_keys = [k for k in self.h5_file.keys() if k != 'ids']
+        return self._attr_keys
+
     @property
     def n_shards(self) -> int:
         """
@@ -688,9 +955,7 @@ class BinarySearchStore:
         Returns:
 
         """
-        with h5py.File(self.fname, 'r', libver='latest') as f:
-            n_shards = len(f.attrs['bucket_ranges'])
-        return n_shards
+        return len(self.bucket_ranges)
 
     @property
     def id_array(self) -> np.ndarray:
@@ -699,52 +964,176 @@ class BinarySearchStore:
         Returns:
             Flat ID array.
         """
-        ids = []
-        with h5py.File(self.fname, 'r', libver='latest') as f:
-            for bucket_id in range(len(f.attrs['bucket_ranges'])):
-                ids.append(f[f'ids/{bucket_id}'][()])
-        return np.concatenate(ids)
+        if self.resident:
+            return self._get_resident('ids')
+        return np.concatenate([self._get_bucket_id_array(bucket_id) for bucket_id in range(self.n_shards)])
+
+    def resident_path(self, key: str) -> str:
+        """
+        Args:
+            key: 'ids' or attribute key.
+
+        Returns:
+            Path to the ``.npy`` sidecar file of the sorted array used in resident mode.
+        """
+        return f'{self.fname}.{key}.npy'
+
+    def _save_resident(self, key: str, arr: np.ndarray):
+        # write to temporary file first, other processes might memory-map the sidecar concurrently
+        tmp_p = self.resident_path(key) + f'.{os.getpid()}.tmp'
+        with open(tmp_p, 'wb') as f:
+            np.save(f, arr)
+        os.replace(tmp_p, self.resident_path(key))
+
+    def _get_resident(self, key: str) -> np.ndarray:
+        if key in self._resident_arrays:
+            return self._resident_arrays[key]
+        if key != 'ids' and key not in self.attr_keys:
+            raise KeyError(f'Key "{key}" does not exist.')
+        if not isinstance(self.fname, str):
+            # file objects: keep arrays in memory
+            self._resident_arrays[key] = self._read_h5_array(key)
+            return self._resident_arrays[key]
+        if not os.path.isfile(self.resident_path(key)):
+            log_backend.debug(f'Creating resident array "{self.resident_path(key)}".')
+            try:
+                self._save_resident(key, self._read_h5_array(key))
+            except OSError as e:
+                log_backend.warning(f'Could not write resident array of key "{key}" for BinarySearchStore at '
+                                    f'"{self.fname}", array will be loaded into memory: {e}')
+                self._resident_arrays[key] = self._read_h5_array(key)
+                return self._resident_arrays[key]
+        self._resident_arrays[key] = np.load(self.resident_path(key), mmap_mode='r')
+        return self._resident_arrays[key]
+
+    def _read_h5_array(self, key: str) -> np.ndarray:
+        return np.concatenate([self.h5_file[f'{key}/{bucket_id}'][()] for bucket_id in range(self.n_shards)])
+
+    def _get_bucket_id_array(self, bucket_id: int) -> np.ndarray:
+        if bucket_id not in self._ids_cache:
+            self._ids_cache[bucket_id] = self.h5_file[f'ids/{bucket_id}'][()]
+        return self._ids_cache[bucket_id]
 
     def _get_bucket_ids(self, obj_ids: np.ndarray) -> np.ndarray:
-        bucket_ids = np.ones(obj_ids.shape, dtype=np.int32) * -1
-        for ii, bucket_range in enumerate(self._h5_file.attrs['bucket_ranges']):
-            bucket_ids[(bucket_range[0] <= obj_ids) & (obj_ids <= bucket_range[1])] = ii
-        if -1 in bucket_ids:
-            raise ValueError(f'IDs {obj_ids[bucket_ids == -1]} not in {self.fname}.')
-        return bucket_ids
+        """
+        Args:
+            obj_ids: Object IDs.
 
-    def get_attributes(self, obj_ids: np.ndarray, attr_key: str) -> np.ndarray:
+        Returns:
+            Shard index of every ID, -1 if the ID is outside of all ID ranges.
         """
-        Query attributes of given `obj_ids`. Note that this will not raise an Exception if a ID does not exist in the
-        store, as the lookup uses binary search.
+        ranges = self.bucket_ranges
+        bucket_ids = np.searchsorted(ranges[:, 0], obj_ids, side='right').astype(np.int32) - 1
+        outside = bucket_ids < 0
+        bucket_ids[outside] = 0
+        outside |= obj_ids > ranges[bucket_ids, 1]
+        bucket_ids[outside] = -1
+        return bucket_ids
 
+    def _lookup(self, obj_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
         Args:
-            obj_ids: Object IDs to query.
-            attr_key: Value type obtained from the store.
+            obj_ids: Object IDs.
 
         Returns:
-            Value array.
+            Shard index (0 in resident mode) and index within the shard of every ID and the mask of found IDs.
         """
-        self._h5_file = h5py.File(self.fname, 'r', libver='latest')
-        if attr_key not in self._h5_file.keys():
-            raise KeyError(f'Key "{attr_key}" does not exist.')
+        if self.resident:
+            ids = self._get_resident('ids')
+            bucket_ids = np.zeros(obj_ids.shape, dtype=np.int32)
+            if len(ids) == 0:
+                return bucket_ids, np.zeros(obj_ids.shape, dtype=np.int64), np.zeros(obj_ids.shape, dtype=bool)
+            indices = np.searchsorted(ids, obj_ids)
+            indices[indices == len(ids)] = max(len(ids) - 1, 0)
+            found = ids[indices] == obj_ids
+            return bucket_ids, indices, found
         bucket_ids = self._get_bucket_ids(obj_ids)
-        grp = self._h5_file[f'{attr_key}']
-        sh = [len(obj_ids)]
-        if len(grp.attrs['shape']) > 1:
-            sh += list(grp.attrs['shape'])[1:]
-        data = np.zeros(sh, dtype=grp.attrs['dtype'])
+        indices = np.zeros(obj_ids.shape, dtype=np.int64)
+        found = np.zeros(obj_ids.shape, dtype=bool)
         for bucket_id in np.unique(bucket_ids):
-            ids = self._h5_file[f'ids/{bucket_id}'][()]
+            if bucket_id == -1:
+                continue
+            ids = self._get_bucket_id_array(bucket_id)
             bucket_mask = bucket_ids == bucket_id
             queries = obj_ids[bucket_mask]
-            ixs_sort = np.argsort(queries)
-            indices = np.searchsorted(ids, queries[ixs_sort])
-            d = grp[f'{bucket_id}'][list(indices)]
-            # undo sorting using argsort of argsort to match slicing mask on the left
-            data[bucket_mask] = d[np.argsort(ixs_sort)]
-        self._h5_file.close()
-        self._h5_file = None
+            ixs = np.searchsorted(ids, queries)
+            ixs[ixs == len(ids)] = len(ids) - 1
+            indices[bucket_mask] = ixs
+            found[bucket_mask] = ids[ixs] == queries
+        return bucket_ids, indices, found
+
+    def _gather(self, attr_key: str, bucket_ids: np.ndarray, indices: np.ndarray, found: np.ndarray) -> np.ndarray:
+        if self.resident:
+            arr = self._get_resident(attr_key)
+            if len(arr) == 0:
+                return np.zeros((len(indices),) + arr.shape[1:], dtype=arr.dtype)
+            data = arr[indices]
+            data[~found] = 0
+            return data
+        if attr_key not in self.attr_keys:
+            raise KeyError(f'Key "{attr_key}" does not exist.')
+        grp = self.h5_file[f'{attr_key}']
+        sh = [len(indices)]
+        if len(grp.attrs['shape']) > 1:
+            sh += list(grp.attrs['shape'])[1:]
+        data = np.zeros(sh, dtype=grp.attrs['dtype'])
+        for bucket_id in np.unique(bucket_ids[found]):
+            bucket_mask = (bucket_ids == bucket_id) & found
+            ixs, inv = np.unique(indices[bucket_mask], return_inverse=True)
+            # read runs of close indices as slices instead of h5py point selection; large gaps start a new run
+            runs = np.split(ixs, np.flatnonzero(np.diff(ixs) > self.max_read_gap) + 1)
+            dset = grp[f'{bucket_id}']
+            vals = np.concatenate([dset[run[0]:run[-1] + 1][run - run[0]] for run in runs])
+            data[bucket_mask] = vals[inv]
+        return data
+
+    def get_attributes(self, obj_ids: np.ndarray, attr_key: str,
+                       return_found_mask: bool = False) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+        """
+        Query attributes of given `obj_ids`. Values of IDs that do not exist in the store are set to zero.
+
+        Args:
+            obj_ids: Object IDs to query.
+            attr_key: Value type obtained from the store.
+            return_found_mask: Additionally return a boolean mask of the IDs which exist in the store. If False,
+                IDs outside of the stored ID range raise a ValueError.
+
+        Returns:
+            Value array (and mask of found IDs).
+        """
+        res = self.get_attributes_multi(obj_ids, [attr_key], return_found_mask=return_found_mask)
+        if return_found_mask:
+            return res[0][attr_key], res[1]
+        return res[attr_key]
+
+    def get_attributes_multi(self, obj_ids: np.ndarray, attr_keys: Iterable[str], return_found_mask: bool = False) \
+            -> Union[Dict[str, np.ndarray], Tuple[Dict[str, np.ndarray], np.ndarray]]:
+        """
+        Query multiple attributes of given `obj_ids`. The binary search is only performed once for all attributes.
+        Values of IDs that do not exist in the store are set to zero.
+
+        Args:
+            obj_ids: Object IDs to query.
+            attr_keys: Value types obtained from the store.
+            return_found_mask: Additionally return a boolean mask of the IDs which exist in the store. If False,
+                IDs outside of the stored ID range raise a ValueError.
+
+        Returns:
+            Dictionary with attribute key as key and value array as value (and mask of found IDs).
+        """
+        # avoid implicit casts to float when comparing e.g. int64 queries with uint64 IDs
+        obj_ids = np.asarray(obj_ids).astype(self.bucket_ranges.dtype, copy=False)
+        for k in attr_keys:
+            if k not in self.attr_keys:
+                raise KeyError(f'Key "{k}" does not exist.')
+        if not return_found_mask:
+            outside = self._get_bucket_ids(obj_ids) == -1
+            if np.any(outside):
+                raise ValueError(f'IDs {obj_ids[outside]} not in {self.fname}.')
+        bucket_ids, indices, found = self._lookup(obj_ids)
+        data = {k: self._gather(k, bucket_ids, indices, found) for k in attr_keys}
+        if return_found_mask:
+            return data, found
         return data
 
 
@@ -753,10 +1142,11 @@ def bss_get_attr_helper(args):
     Helper function to query attributes from a BinarySearchStore instance.
 
     Args:
-        args: BinarySearchStore, query_ids, attribute key.
+        args: BinarySearchStore, query_ids, attribute key and optionally `return_found_mask`.
 
     Returns:
         Query result.
     """
-    bss, samples, key = args
-    return bss.get_attributes(samples, key)
+    bss, samples, key = args[:3]
+    return_found_mask = args[3] if len(args) > 3 else False
+    return bss.get_attributes(samples, key, return_found_mask=return_found_mask)
@@ -14,7 +14,6 @@ from typing import Optional, Callable, Tuple, Dict, Any, Union
 
 import networkx as nx
 import numpy as np
-import tqdm
 
 from syconn import global_params
 from syconn.extraction import object_extraction_wrapper as oew
@@ -323,7 +322,7 @@ def run_create_rag(graph_node_dtype=None):
     log.info("Found {} SVs in initial RAG.".format(len(all_sv_ids_in_rag)))
 
     # add single SV connected components to initial graph
-    sd = SegmentationDataset(obj_type='sv', working_dir=global_params.config.working_dir, cache_properties=['size'])
+    sd = SegmentationDataset(obj_type='sv', working_dir=global_params.config.working_dir)
     diff = np.setdiff1d(sd.ids, all_sv_ids_in_rag)
     log.info(f'Found {len(diff)} single-element connected component SVs which were missing in initial RAG.')
     for ix in diff:
@@ -333,10 +332,8 @@ def run_create_rag(graph_node_dtype=None):
               "components.".format(G.number_of_nodes()))
 
     # remove small connected components
-    sv_size_dict = {}
     bbs = sd.load_numpy_data('bounding_box') * sd.scaling
-    for ii in range(len(sd.ids)):
-        sv_size_dict[sd.ids[ii]] = bbs[ii]
+    sv_size_dict = dict(zip(sd.ids, bbs))
     try:
         ccsize_dict = create_ccsize_dict(G, sv_size_dict)
     except ValueError as e:
@@ -344,14 +341,9 @@ def run_create_rag(graph_node_dtype=None):
     log.debug("Finished preparation of SSV size dictionary based "
               "on bounding box diagonal of corresponding SVs.")
     before_cnt = G.number_of_nodes()
-    # explicit copy needed, as G is modified in the  loop
-    for ix in tqdm.tqdm(list(G.nodes()), total=before_cnt, desc='CC size filter'):
-        if ccsize_dict[ix] <= global_params.config['min_cc_size_ssv']:
-            G.remove_node(ix)
-    # TODO: check if this loop (despite cache_properties=['size'], see above) is limiting speed
-    total_size = 0
-    for n in tqdm.tqdm(G.nodes(), total=G.number_of_nodes(), desc='Total size'):
-        total_size += sd.get_segmentation_object(n).size
+    G.remove_nodes_from([ix for ix in G.nodes() if ccsize_dict[ix] <= global_params.config['min_cc_size_ssv']])
+    node_ids = np.fromiter(G.nodes(), dtype=np.uint64, count=G.number_of_nodes())
+    total_size = np.sum(sd.get_attributes(node_ids, 'size'), dtype=np.int64)
     total_size_cmm = np.prod(sd.scaling) * total_size / 1e18
     log.info(f"Removed {before_cnt - G.number_of_nodes()} SVs from RAG because of size (bounding box diagonal <= "
              f"{global_params.config['min_cc_size_ssv']} nm). Final RAG contains {G.number_of_nodes()} SVs in "
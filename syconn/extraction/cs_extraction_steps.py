@@ -15,10 +15,10 @@ from collections import defaultdict
 from logging import Logger
 from typing import Optional, Dict, List, Tuple, Union, Callable
 
-from multiprocessing import Process
+from multiprocessing import Process, cpu_count
 
+import numba
 import numpy as np
-import scipy.ndimage
 import tqdm
 from knossos_utils import chunky
 from knossos_utils import knossosdataset
@@ -30,15 +30,17 @@ from .object_extraction_wrapper import calculate_chunk_numbers_for_box
 from .. import global_params
 from ..backend.storage import AttributeDict, VoxelStorageDyn, VoxelStorage, CompressedStorage
 from ..handler import compression, basics
+from ..handler.kd_io import ChunkReader, KDWriter
 from ..mp import batchjob_utils as qu
 from ..mp.mp_utils import start_multiprocess_imap
 from ..proc.sd_proc import _cache_storage_paths
-from ..proc.sd_proc import merge_prop_dicts, dataset_analysis
+from ..proc.sd_proc import dataset_analysis, PROP_RECORD_DTYPE, prop_records_from_dicts, merge_prop_records, \
+    prop_records_to_dicts
 from ..proc.image import apply_morphological_operations, get_aniso_struct
 from ..reps import rep_helper
 from ..reps import segmentation
 from .find_object_properties import merge_type_dicts, detect_cs_64bit, detect_cs, find_object_properties, \
-find_object_properties_cs_64bit, merge_voxel_dicts
+find_object_properties_cs_64bit, close_and_dilate_labels
 
 
 def extract_contact_sites(chunk_size: Optional[Tuple[int, int, int]] = None, log: Optional[Logger] = None,
@@ -198,9 +200,15 @@ def extract_contact_sites(chunk_size: Optional[Tuple[int, int, int]] = None, log
 
     multi_params = []
     iter_params = basics.chunkify(chunk_list, max_n_jobs)
+    # number of threads used by the numba kernels of every worker; batch jobs are allocated a single core, local
+    # workers share the cores of the node
+    if qu.batchjob_enabled():
+        n_threads = 1
+    else:
+        n_threads = max(1, global_params.config['ncores_per_node'] // min(len(iter_params), cpu_count()))
     for ii, chunk_k in enumerate(iter_params):
         multi_params.append([[cset.chunk_dict[k] for k in chunk_k],
-                             global_params.config.kd_seg_path, ii, dir_props, transf_func_sj_seg])
+                             global_params.config.kd_seg_path, ii, dir_props, transf_func_sj_seg, n_threads])
 
     # reduce step
     start = time.time()
@@ -323,6 +331,10 @@ def _contact_site_extraction_thread(args: Union[tuple, list]) \
         args:
             * ``Chunk`` objects
             * Path to KnossosDataset containing the cell supervoxels.
+            * Worker number.
+            * Directory for the property records.
+            * Transformation function of the synaptic junction data.
+            * Number of threads of the numba kernels.
 
     Todo:
         * Get rid of the second argument -> use config parameter instead.
@@ -338,6 +350,7 @@ def _contact_site_extraction_thread(args: Union[tuple, list]) \
     worker_nr = args[2]
     dir_props = args[3]
     transf_func_sj_seg = args[4]
+    numba.set_num_threads(min(args[5], numba.config.NUMBA_NUM_THREADS))
     worker_dir_props = f"{dir_props}/{worker_nr}/"
     os.makedirs(worker_dir_props, exist_ok=True)
 
@@ -356,21 +369,28 @@ def _contact_site_extraction_thread(args: Union[tuple, list]) \
     kd_cs = basics.kd_factory(f"{global_params.config.working_dir}/knossosdatasets/cs_seg/")
     kd_syn = basics.kd_factory(f"{global_params.config.working_dir}/knossosdatasets/syn_seg/")
 
-    # init. synaptic junction (sj) KD
-    kd_sj = basics.kd_factory(global_params.config.kd_sj_path)
-    # init synapse type KD if available
+    # cell segmentation, synaptic junction (sj) and synapse type sources; identical reads (e.g. if both synapse
+    # types are stored in the same KD) are performed only once
+    sources = dict(cell=dict(kd=knossos_path, datatype=np.uint64))
+    sources['sj'] = dict(kd=global_params.config.kd_sj_path,
+                         method='load_raw' if transf_func_sj_seg is None else 'load_seg')
     if global_params.config.syntype_available:
-        kd_syntype_sym = basics.kd_factory(global_params.config.kd_sym_path)
-        kd_syntype_asym = basics.kd_factory(global_params.config.kd_asym_path)
-    else:
-        kd_syntype_sym, kd_syntype_asym = None, None
-
-    # cell segmentation
-    kd = basics.kd_factory(knossos_path)
-
-    cs_props = [{}, defaultdict(list), {}]
-    syn_props = [{}, defaultdict(list), {}]
-    syn_voxels = {}
+        if global_params.config.kd_asym_path == global_params.config.kd_sym_path:
+            assert global_params.config.asym_label is not None, \
+                'Label of asymmetric synapses is not set.'
+            assert global_params.config.sym_label is not None, \
+                'Label of symmetric synapses is not set.'
+        # TODO: add thresholds to global_params
+        sources['sym'] = dict(kd=global_params.config.kd_sym_path,
+                              method='load_raw' if global_params.config.sym_label is None else 'load_seg')
+        sources['asym'] = dict(kd=global_params.config.kd_asym_path,
+                               method='load_raw' if global_params.config.asym_label is None else 'load_seg')
+
+    # property records (see `PROP_RECORD_DTYPE`) of every chunk
+    cs_recs = []
+    syn_recs = []
+    # synapse voxels of every chunk; keys are converted to str to enable `np.savez`
+    syn_voxels = defaultdict(list)
     tot_sym_cnt = {}
     tot_asym_cnt = {}
     cs_filtersize = np.array(global_params.config['cell_objects']['cs_filtersize'])
@@ -379,23 +399,29 @@ def _contact_site_extraction_thread(args: Union[tuple, list]) \
     stencil_offset = cs_filtersize // 2
     # additional overlap, e.g. to prevent boundary artifacts by dilation/closing
     overlap = max(stencil_offset)
-    for chunk in chunks:
-        offset = np.array(chunk.coordinates - overlap)  # also used for loading synapse data
-        size = 2 * overlap + np.array(chunk.size)  # also used for loading synapse data
-        data = kd.load_seg(size=size + 2 * stencil_offset,
-                           offset=offset - stencil_offset,
-                           mag=1, datatype=np.uint64).astype(np.uint32, copy=False).swapaxes(0, 2)
+
+    def chunk_request(ch):
+        offset = np.array(ch.coordinates - overlap)  # also used for loading synapse data
+        size = 2 * overlap + np.array(ch.size)  # also used for loading synapse data
+        request = {k: (offset, size) for k in sources}
+        request['cell'] = (offset - stencil_offset, size + 2 * stencil_offset)
+        return request
+
+    reader = ChunkReader(sources)
+    writer = KDWriter()
+    for chunk, vols in reader.iter_chunks(chunks, chunk_request):
+        offset = np.array(chunk.coordinates - overlap)
+        data = vols['cell'].astype(np.uint32, copy=False)
 
         # contacts has size as given with `size`, because detect_cs performs valid conv.
         # -> contacts result is cropped by stencil_offset on each side
         contacts = np.asarray(detect_cs(data))
+        del data
 
         if transf_func_sj_seg is None:
-            sj_d = (kd_sj.load_raw(size=size, offset=offset, mag=1).swapaxes(0, 2) >
-                    255 * global_params.config['cell_objects']["probathresholds"]['sj']).astype('u1')
+            sj_d = (vols['sj'] > 255 * global_params.config['cell_objects']["probathresholds"]['sj']).astype('u1')
         else:
-            sj_d = transf_func_sj_seg(
-                kd_sj.load_seg(size=size, offset=offset, mag=1).swapaxes(0, 2)).astype('u1', copy=False)
+            sj_d = transf_func_sj_seg(vols['sj']).astype('u1', copy=False)
         # apply morphological operations on sj binary mask
         if 'sj' in morph_ops:
             sj_d = apply_morphological_operations(
@@ -403,62 +429,26 @@ def _contact_site_extraction_thread(args: Union[tuple, list]) \
 
         # get binary mask for symmetric and asymmetric syn. type per voxel
         if global_params.config.syntype_available:
-            if global_params.config.kd_asym_path != global_params.config.kd_sym_path:
-                # TODO: add thresholds to global_params
-                if global_params.config.sym_label is None:
-                    sym_d = (kd_syntype_sym.load_raw(size=size, offset=offset, mag=1).swapaxes(0, 2)
-                             >= 123).astype('u1', copy=False)
-                else:
-                    sym_d = (kd_syntype_sym.load_seg(size=size, offset=offset, mag=1).swapaxes(0, 2)
-                             == global_params.config.sym_label).astype('u1', copy=False)
-
-                if global_params.config.asym_label is None:
-                    asym_d = (kd_syntype_asym.load_raw(size=size, offset=offset, mag=1).swapaxes(0, 2)
-                              >= 123).astype('u1', copy=False)
-                else:
-                    asym_d = (kd_syntype_asym.load_seg(size=size, offset=offset, mag=1).swapaxes(0, 2)
-                              == global_params.config.asym_label).astype('u1', copy=False)
+            if global_params.config.sym_label is None:
+                sym_d = (vols['sym'] >= 123).astype('u1', copy=False)
+            else:
+                sym_d = (vols['sym'] == global_params.config.sym_label).astype('u1', copy=False)
+            if global_params.config.asym_label is None:
+                asym_d = (vols['asym'] >= 123).astype('u1', copy=False)
             else:
-                assert global_params.config.asym_label is not None, \
-                    'Label of asymmetric synapses is not set.'
-                assert global_params.config.sym_label is not None, \
-                    'Label of symmetric synapses is not set.'
-                # load synapse type classification results stored in the same KD
-                sym_d = kd_syntype_sym.load_seg(size=size, offset=offset, mag=1).swapaxes(0, 2)
-                # create copy
-                asym_d = np.array(sym_d == global_params.config.asym_label, dtype=np.uint8)
-                sym_d = np.array(sym_d == global_params.config.sym_label, dtype=np.uint8)
+                asym_d = (vols['asym'] == global_params.config.asym_label).astype('u1', copy=False)
         else:
             sym_d = np.zeros_like(sj_d)
             asym_d = np.zeros_like(sj_d)
+        del vols
 
         # close gaps of contact sites prior to overlapping synaptic junction map with contact sites
 
         # returns rep. coords, bounding box and size for every ID in contacts
         # used to get location of every contact site to perform closing operation
         _, bb_dc, _ = find_object_properties(contacts)
-        n_closings = overlap
-        for ix in bb_dc.keys():
-            obj_start, obj_end = np.array(bb_dc[ix])
-            obj_start -= n_closings
-            obj_start[obj_start < 0] = 0
-            obj_end += n_closings
-            # create slice obj
-            new_obj_slices = tuple(slice(obj_start[ii], obj_end[ii], None) for
-                                   ii in range(3))
-            sub_vol = contacts[new_obj_slices]
-            binary_mask = (sub_vol == ix).astype(np.int8, copy=False)
-            if n_closings > 0:
-                res = scipy.ndimage.binary_closing(
-                    binary_mask, iterations=n_closings)
-            else:
-                res = binary_mask
-            # reduce fragmenting of contact sites
-            if cs_dilation > 0:
-                res = scipy.ndimage.binary_dilation(res, iterations=cs_dilation)
-            # only update background or the objects itself and do not remove object voxels (res == 1), e.g. at boundary
-            proc_mask = ((binary_mask == 1) | (sub_vol == 0)) & (res == 1)
-            contacts[new_obj_slices][proc_mask] = res[proc_mask] * ix
+        # reduce fragmenting of contact sites; only updates background or the objects itself
+        close_and_dilate_labels(contacts, n_closings=overlap, n_dilations=cs_dilation, bounding_boxes=bb_dc)
 
         # this counts SJ foreground voxels overlapping with the CS objects
         # and the asym and sym voxels, do not use overlap here!
@@ -469,29 +459,38 @@ def _contact_site_extraction_thread(args: Union[tuple, list]) \
             # overlap was removed; use correct offset for the analysis of the object properties
             sym_d[overlap:-overlap, overlap:-overlap, overlap:-overlap], offset=offset + overlap)
 
-        kd_cs.save_seg(offset=offset + overlap, mags=[1, ],
-                       data=contacts[overlap:-overlap, overlap:-overlap, overlap:-overlap].swapaxes(0, 2),
-                       data_mag=1)
+        # written in the background; `contacts` and `syn_d` are not modified afterwards
+        contacts = contacts[overlap:-overlap, overlap:-overlap, overlap:-overlap]
+        writer.save_seg(kd_cs, offset=offset + overlap, mags=[1, ], data=contacts.swapaxes(0, 2), data_mag=1,
+                        copy=False)
         # syn segmentation contains the intersecting voxels between SJ and CS
-        contacts[sj_d == 0] = 0
-        kd_syn.save_seg(offset=offset + overlap, mags=[1, ],
-                        data=contacts[overlap:-overlap, overlap:-overlap, overlap:-overlap].swapaxes(0, 2),
-                        data_mag=1)
+        syn_d = contacts * (sj_d[overlap:-overlap, overlap:-overlap, overlap:-overlap] != 0)
+        writer.save_seg(kd_syn, offset=offset + overlap, mags=[1, ], data=syn_d.swapaxes(0, 2), data_mag=1,
+                        copy=False)
+        del contacts, syn_d
 
         # overlap was removed; use correct offset for the analysis of the object properties
-        merge_prop_dicts([cs_props, curr_cs_p], offset=offset + overlap)
-        merge_prop_dicts([syn_props, curr_syn_p], offset=offset + overlap)
-        merge_voxel_dicts([syn_voxels, curr_syn_vx], key_to_str=True)
+        cs_recs.append(prop_records_from_dicts(curr_cs_p, offset=offset + overlap))
+        syn_recs.append(prop_records_from_dicts(curr_syn_p, offset=offset + overlap))
+        for k, vxs in curr_syn_vx.items():
+            syn_voxels[str(k)].append(np.array(vxs, dtype=np.int32).reshape(-1, 3))
+        del curr_syn_vx
         merge_type_dicts([tot_asym_cnt, asym_cnt])
         merge_type_dicts([tot_sym_cnt, sym_cnt])
         del curr_cs_p, curr_syn_p, asym_cnt, sym_cnt
-    basics.write_obj2pkl(f'{worker_dir_props}/cs_props_{worker_nr}.pkl', cs_props)
-    basics.write_obj2pkl(f'{worker_dir_props}/syn_props_{worker_nr}.pkl', syn_props)
-    np.savez(f'{worker_dir_props}/syn_voxels_{worker_nr}.npz', **syn_voxels)
+    reader.close()
+    writer.close()
+    reader.log_stats(f'[worker {worker_nr}] ')
+    writer.log_stats(f'[worker {worker_nr}] ')
+    cs_recs = merge_prop_records(cs_recs)
+    syn_recs = merge_prop_records(syn_recs)
+    basics.write_obj2pkl(f'{worker_dir_props}/cs_props_{worker_nr}.pkl', cs_recs)
+    basics.write_obj2pkl(f'{worker_dir_props}/syn_props_{worker_nr}.pkl', syn_recs)
+    np.savez(f'{worker_dir_props}/syn_voxels_{worker_nr}.npz', **{k: np.concatenate(v) for k, v in syn_voxels.items()})
     basics.write_obj2pkl(f'{worker_dir_props}/tot_asym_cnt_{worker_nr}.pkl', tot_asym_cnt)
     basics.write_obj2pkl(f'{worker_dir_props}/tot_sym_cnt_{worker_nr}.pkl', tot_sym_cnt)
 
-    return worker_nr, dict(cs=list(cs_props[0].keys()), syn=list(syn_props[0].keys()))
+    return worker_nr, dict(cs=np.unique(cs_recs['id']).tolist(), syn=np.unique(syn_recs['id']).tolist())
 
 
 # iterate over the subcellular SV ID chunks
@@ -528,11 +527,11 @@ def _write_props_to_syn_thread(args):
         sd_cs = segmentation.SegmentationDataset(n_folders_fs=n_folders_fs, obj_type='cs',
                                                  working_dir=global_params.config.working_dir,
                                                  version=0)
-        cs_props = [{}, defaultdict(list), {}]
-        syn_props = [{}, defaultdict(list), {}]
+        cs_recs = []
+        syn_recs = []
         cs_sym_cnt = {}
         cs_asym_cnt = {}
-        syn_voxels = {}
+        syn_voxels = defaultdict(list)
 
         # get cached worker lookup
         with open(f'{global_params.config.temp_path}/cs_worker_dict.pkl', "rb") as f:
@@ -541,21 +540,22 @@ def _write_props_to_syn_thread(args):
         del cs_workers_tmp
         res = start_multiprocess_imap(_write_props_collect_helper, params, nb_cpus=nb_cores, show_progress=False,
                                       debug=False)
-        for tmp_dcs_cs, tmp_dcs_syn, tmp_sym_dc, tmp_asym_dc, tmp_syn_vxs in res:
-            if len(tmp_dcs_cs) == 0:
+        for tmp_recs_cs, tmp_recs_syn, tmp_sym_dc, tmp_asym_dc, tmp_syn_vxs in res:
+            if len(tmp_recs_cs) == 0:
                 continue
-            # cs
-            merge_prop_dicts([cs_props, tmp_dcs_cs])
-            del tmp_dcs_cs
-            # syn
-            merge_prop_dicts([syn_props, tmp_dcs_syn])
-            del tmp_dcs_syn
+            cs_recs.append(tmp_recs_cs)
+            syn_recs.append(tmp_recs_syn)
             merge_type_dicts([cs_asym_cnt, tmp_asym_dc])
             del tmp_asym_dc
             merge_type_dicts([cs_sym_cnt, tmp_sym_dc])
             del tmp_sym_dc
-            merge_voxel_dicts([syn_voxels, tmp_syn_vxs], key_to_str=False)
+            for k, vxs in tmp_syn_vxs.items():
+                syn_voxels[k].append(vxs)
             del tmp_syn_vxs
+        del res
+        cs_props = prop_records_to_dicts(merge_prop_records(cs_recs))
+        syn_props = prop_records_to_dicts(merge_prop_records(syn_recs))
+        del cs_recs, syn_recs
 
         # get dummy segmentation object to fetch attribute dictionary for this batch of object IDs
         dummy_so = sd.get_segmentation_object(obj_id_mod)
@@ -579,7 +579,7 @@ def _write_props_to_syn_thread(args):
             if cs_props[2][cs_id] < min_obj_vx_dc['cs']:
                 continue
             rp_cs = np.array(cs_props[0][cs_id], dtype=np.int32)
-            bbs_cs = np.concatenate(cs_props[1][cs_id])
+            bbs_cs = cs_props[1][cs_id]
             size_cs = cs_props[2][cs_id]
             this_attr_dc_cs[cs_id]["rep_coord"] = rp_cs
             this_attr_dc_cs[cs_id]["bounding_box"] = np.array(
@@ -593,7 +593,7 @@ def _write_props_to_syn_thread(args):
             if cs_id not in syn_props[0] or syn_props[2][cs_id] < min_obj_vx_dc['syn']:
                 continue
             rp = np.array(syn_props[0][cs_id], dtype=np.int32)
-            bbs = np.concatenate(syn_props[1][cs_id])
+            bbs = syn_props[1][cs_id]
             size = syn_props[2][cs_id]
             this_attr_dc[cs_id]["rep_coord"] = rp
             bb = np.array(
@@ -619,7 +619,7 @@ def _write_props_to_syn_thread(args):
             voxel_dc.set_object_repcoord(cs_id, rp)
             ids_to_load_voxels.append(cs_id)
             # # write voxels explicitly - this assumes reasonably sized synapses
-            voxel_dc.set_voxel_cache(cs_id, np.array(syn_voxels[cs_id], dtype=np.uint32))
+            voxel_dc.set_voxel_cache(cs_id, np.concatenate(syn_voxels[cs_id]).astype(np.uint32))
             del syn_voxels[cs_id]
 
         voxel_dc.push()
@@ -628,26 +628,22 @@ def _write_props_to_syn_thread(args):
         this_attr_dc_cs.push()
 
 
-def _write_props_collect_helper(args) -> Tuple[List[dict], List[dict], dict, dict, dict]:
+def _write_props_collect_helper(args) -> Tuple[np.ndarray, np.ndarray, dict, dict, dict]:
     dir_props, worker_id, intersec = args
     if len(intersec) == 0:
-        return [{}, {}, {}], [{}, {}, {}], {}, {}, {}
+        return np.zeros(0, dtype=PROP_RECORD_DTYPE), np.zeros(0, dtype=PROP_RECORD_DTYPE), {}, {}, {}
     worker_dir_props = f"{dir_props}/{worker_id}/"
     # cs
     fname = f'{worker_dir_props}/cs_props_{worker_id}.pkl'
-    dc = basics.load_pkl2obj(fname)
-
-    # convert lists to numpy arrays
-    tmp_dcs_cs = [dict(), defaultdict(list), dict()]
-    for k in intersec:
-        tmp_dcs_cs[0][k] = np.array(dc[0][k], dtype=np.int32)
-        tmp_dcs_cs[1][k] = np.array(dc[1][k], dtype=np.int32)
-        tmp_dcs_cs[2][k] = dc[2][k]
-    del dc
+    recs = basics.load_pkl2obj(fname)
+    tmp_recs_cs = recs[np.isin(recs['id'], intersec)]
+    del recs
 
     # syn
     fname = f'{worker_dir_props}/syn_props_{worker_id}.pkl'
-    dc = basics.load_pkl2obj(fname)
+    recs = basics.load_pkl2obj(fname)
+    tmp_recs_syn = recs[np.isin(recs['id'], intersec)]
+    del recs
     fname = f'{worker_dir_props}/tot_sym_cnt_{worker_id}.pkl'
     curr_sym_cnt = basics.load_pkl2obj(fname)
     fname = f'{worker_dir_props}/tot_asym_cnt_{worker_id}.pkl'
@@ -655,22 +651,16 @@ def _write_props_collect_helper(args) -> Tuple[List[dict], List[dict], dict, dic
     fname = f'{worker_dir_props}/syn_voxels_{worker_id}.npz'
     curr_syn_vxs = np.load(fname)
 
-    tmp_dcs_syn = [dict(), defaultdict(list), dict()]
     tmp_sym_dc = dict()
     tmp_asym_dc = dict()
     tmp_syn_vx = dict()
-    for k in intersec:
-        if k not in dc[0]:
-            continue
-        tmp_dcs_syn[0][k] = dc[0][k]
-        tmp_dcs_syn[1][k] = dc[1][k]
-        tmp_dcs_syn[2][k] = dc[2][k]
+    for k in np.unique(tmp_recs_syn['id']).tolist():
         tmp_syn_vx[k] = curr_syn_vxs[str(k)]  # savez only allows string keys
         if k in curr_sym_cnt:
             tmp_sym_dc[k] = curr_sym_cnt[k]
         if k in curr_asym_cnt:
             tmp_asym_dc[k] = curr_asym_cnt[k]
-    return tmp_dcs_cs, tmp_dcs_syn, tmp_sym_dc, tmp_asym_dc, tmp_syn_vx
+    return tmp_recs_cs, tmp_recs_syn, tmp_sym_dc, tmp_asym_dc, tmp_syn_vx
 
 
 def _generate_storage_lookup(args):
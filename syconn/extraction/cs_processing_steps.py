@@ -39,6 +39,7 @@ from ..reps.super_segmentation_dataset import filter_ssd_by_total_pathlength
 from ..reps import super_segmentation, segmentation, connectivity_helper as ch
 from ..reps.rep_helper import subfold_from_ix, ix_from_subfold, get_unique_subfold_ixs
 from ..proc.meshes import gen_mesh_voxelmask, calc_contact_syn_mesh
+from ..proc.graphs import UnionFind, split_by_labels, union_voxel_neighbors, union_radius_neighbors
 
 
 def collect_properties_from_ssv_partners(wd, obj_version=None, ssd_version=None, debug=False):
@@ -265,18 +266,12 @@ def filter_relevant_syn(sd_syn: segmentation.SegmentationDataset,
     sv_ids = ch.cs_id_to_partner_ids_vec(syn_ids)
     log.debug(f'Generated supervoxel IDs for all {sd_syn.type} objects.')
 
-    # this might mean that all syn between svs with IDs>max(np.uint32) are discarded
-    sv_ids[sv_ids > ssd.mapping_lookup_reverse.id_array[-1]] = 0
-    # this creates a lookup dict for SV to SSV ID only for SV involved in synaptic contacts
-    # -> This produces extra overhead when processing flattened SV graphs (SSVs only consist of 1 SV)
-    mapping_dc = ssd.sv2ssv_ids(np.unique(sv_ids.flatten()), nb_cpus=sm.cpu_count())
-    log.debug('Generated sv-ssv mapping dict.')
-    # TODO: apply with multiple processes and shared mapping_dc
-    def mapper(x): return mapping_dc[x] if x in mapping_dc else 0
-    # np.vectorize is not concurrent/more efficient than "map", just a more convenient.
-    mapped_ssv_ids = np.vectorize(mapper)(sv_ids.reshape(-1)).reshape(sv_ids.shape)
+    # vectorized look-up of the SSV IDs; SVs which are not part of any SSV are mapped to 0
+    mapped_ssv_ids, found = ssd.mapping_lookup_reverse.get_attributes(
+        sv_ids.reshape(-1), 'ssv_ids', return_found_mask=True)
+    mapped_ssv_ids[~found] = 0
+    mapped_ssv_ids = mapped_ssv_ids.reshape(sv_ids.shape)
     log.debug(f'Mapped SV IDs to SSV IDs for all {sd_syn.type} objects.')
-    del mapping_dc
     mask = np.all(mapped_ssv_ids > 0, axis=1)
     syn_ids = syn_ids[mask]
     filtered_mapped_ssv_ids = mapped_ssv_ids[mask]
@@ -446,14 +441,13 @@ def _combine_and_split_syn_thread(args):
             log_extraction.error(msg)
             raise ValueError(msg)
 
-        ccs = connected_cluster_kdtree(voxel_list, dist_intra_object=cs_gap_nm,
-                                       dist_inter_object=20000, scale=scaling)
+        cc_labels = connected_cluster_kdtree(voxel_list, dist_intra_object=cs_gap_nm,
+                                             dist_inter_object=20000, scale=scaling)
 
         voxel_list = np.concatenate(voxel_list)
-        for this_cc in ccs:
+        for this_cc_mask in split_by_labels(cc_labels):
             # do not process synapse again if job has been restarted
             if syn_ssv_id not in attr_dc:
-                this_cc_mask = np.array(list(this_cc))
                 # retrieve the index of the syn objects selected for this CC
                 this_syn_ixs, this_syn_ids_cnt = np.unique(synix_list[this_cc_mask],
                                                            return_counts=True)
@@ -550,14 +544,14 @@ def _combine_and_split_syn_thread(args):
 
 
 def connected_cluster_kdtree(voxel_coords: List[np.ndarray], dist_intra_object: float,
-                             dist_inter_object: float, scale: np.ndarray) -> List[set]:
+                             dist_inter_object: float, scale: np.ndarray, batch_size: int = 10000) -> np.ndarray:
     """
-    Identify connected components within N objects. Two stage process: 1st stage adds edges between every
-    object voxel which are at most 2 voxels apart. The edges are added to a global graph which is used to
-    calculate connected components. In the 2nd stage, connected components are considered close if they are within a
-    maximum distance of `dist_inter_object` between a random voxel used as their representative coordinate.
-    Close connected components will then be connected if the minimum distance between any of their voxels is
-    smaller than `dist_intra_object`.
+    Identify connected components within N objects. Two stage process: 1st stage connects every
+    object voxel which are at most 2 voxels apart. In the 2nd stage, connected components are considered close if
+    they are within a maximum distance of `dist_inter_object` between a voxel used as their representative
+    coordinate. Close connected components will then be connected if the minimum distance between any of their
+    voxels is smaller than `dist_intra_object`. Both stages merge components via
+    :class:`~syconn.proc.graphs.UnionFind`, i.e. memory consumption is linear in the number of voxels.
 
     Args:
         voxel_coords: List of numpy arrays in voxel coordinates.
@@ -566,40 +560,42 @@ def connected_cluster_kdtree(voxel_coords: List[np.ndarray], dist_intra_object:
         dist_inter_object: Maximum distance between two objects to check for close voxels
             between them. In nm.
         scale: Voxel sizes in nm (XYZ).
+        batch_size: Number of close component pairs which are filtered at once.
 
     Returns:
-        Connected components across all N input objects with at most `dist_intra_cluster` distance.
+        Connected component label of every voxel in the concatenated `voxel_coords` with at most
+        `dist_intra_object` distance between components. Labels are consecutive, see
+        :func:`~syconn.proc.graphs.split_by_labels`.
     """
-    import networkx as nx
-    graph = nx.Graph()
     ixs_offset = np.cumsum([0] + [len(syn_vxs) for syn_vxs in voxel_coords[:-1]])
+    uf = UnionFind(int(np.sum([len(syn_vxs) for syn_vxs in voxel_coords])))
     # add intra object edges
     for ii in range(len(voxel_coords)):
-        off = ixs_offset[ii]
-        graph.add_nodes_from(np.arange(len(voxel_coords[ii])) + off)
-        kdtree = spatial.cKDTree(voxel_coords[ii])
-        pairs = np.array(list(kdtree.query_pairs(r=2)), dtype=np.int64)
-        graph.add_edges_from(pairs + off)
-    del kdtree, pairs
+        union_voxel_neighbors(uf, voxel_coords[ii], max_dist=2, offset=ixs_offset[ii])
     voxel_coords_flat = np.concatenate(voxel_coords) * scale
-    ccs = [np.array(list(cc)) for cc in nx.connected_components(graph)]
+    ccs = split_by_labels(uf.labels())
     rep_coords = np.array([voxel_coords_flat[cc[0]] for cc in ccs])
     kdtree = spatial.cKDTree(rep_coords)
-    pairs = kdtree.query_pairs(r=dist_inter_object)
+    pairs = kdtree.query_pairs(r=dist_inter_object, output_type='ndarray')
     del kdtree
-    # add minimal inter-object edges
-    for c1, c2 in pairs:
-        c1_ixs = ccs[c1]
-        c2_ixs = ccs[c2]
-        kd1 = spatial.cKDTree(voxel_coords_flat[c1_ixs])
-        dists, nn_ixs = kd1.query(voxel_coords_flat[c2_ixs], distance_upper_bound=dist_intra_object)
-        if min(dists) > dist_intra_object:
-            continue
-        argmin = np.argmin(dists)
-        ix_c1 = c1_ixs[nn_ixs[argmin]]
-        ix_c2 = c2_ixs[argmin]
-        graph.add_edge(ix_c1, ix_c2)
-    return list(nx.connected_components(graph))
+    rep_ixs = np.array([cc[0] for cc in ccs], dtype=np.int64)
+    # add minimal inter-object edges; pairs of already connected components are skipped (checked in batches)
+    # and KD-trees are built at most once per component
+    cc_trees = dict()
+    for start in range(0, len(pairs), batch_size):
+        batch = pairs[start:start + batch_size]
+        batch = batch[uf.find(rep_ixs[batch[:, 0]]) != uf.find(rep_ixs[batch[:, 1]])]
+        for c1, c2 in batch:
+            if uf.connected(rep_ixs[c1], rep_ixs[c2]):
+                continue
+            if len(ccs[c1]) < len(ccs[c2]):
+                c1, c2 = c2, c1
+            if c1 not in cc_trees:
+                cc_trees[c1] = spatial.cKDTree(voxel_coords_flat[ccs[c1]])
+            dists, _ = cc_trees[c1].query(voxel_coords_flat[ccs[c2]], distance_upper_bound=dist_intra_object)
+            if np.min(dists) <= dist_intra_object:
+                uf.union(rep_ixs[c1], rep_ixs[c2])
+    return uf.labels()
 
 
 def combine_and_split_cs(wd, ssd_version=None, cs_version=None, nb_cpus=None, n_folders_fs=10000,
@@ -699,18 +695,21 @@ def _combine_and_split_cs_thread(args):
 
         # verify ssv_partner_ids
         cs_lst = sd_cs.get_segmentation_object(cs_ids)
-        vxl_iter_lst = []
         vx_cnt = 0
+        vx_stores = dict()
         for cs in cs_lst:
-            vx_store = VoxelStorageDyn(cs.voxel_path, read_only=True,
-                                       disable_locking=True)
-            vxl_iter_lst.append(vx_store.iter_voxelmask_offset(cs.id, overlap=1))
-            vx_cnt += vx_store.object_size(cs.id)
+            # re-use voxel storages of contact sites in the same storage
+            if cs.voxel_path not in vx_stores:
+                vx_stores[cs.voxel_path] = VoxelStorageDyn(cs.voxel_path, read_only=True, disable_locking=True)
+            vx_cnt += vx_stores[cs.voxel_path].object_size(cs.id)
         if mesh_min_obj_vx > vx_cnt:
             ccs = []
         else:
+            # load voxels of all contact sites at once; segmentation cubes are read only once
+            vxl_dc = seghelp.load_so_voxels_bulk(cs_lst, use_new_subfold, overlap=1)
+            vxl_iter = chain(*[zip(*vxl_dc[cs_id]) for cs_id in cs_ids])
             # generate connected component meshes; vertices are in nm
-            ccs = gen_mesh_voxelmask(chain(*vxl_iter_lst), scale=scaling, **meshing_kws)
+            ccs = gen_mesh_voxelmask(vxl_iter, scale=scaling, **meshing_kws)
 
         for mesh_cc in ccs:
             cs_ssv = sd_cs_ssv.get_segmentation_object(cs_ssv_id)
@@ -771,41 +770,22 @@ def _combine_and_split_cs_thread(args):
         mesh_dc.push()
 
 
-def cc_large_voxel_lists(voxel_list, cs_gap_nm, max_concurrent_nodes=5000, verbose=False):
-    kdtree = spatial.cKDTree(voxel_list)
-
-    checked_ids = np.array([], dtype=np.int32)
-    next_ids = np.array([0])
-    ccs = [set(next_ids)]
-
-    current_ccs = 0
-    vx_ids = np.arange(len(voxel_list), dtype=np.int32)
-
-    while True:
-        if verbose:
-            log_extraction.debug("NEXT - %d - %d" % (len(next_ids),
-                                                     len(checked_ids)))
-            for cc in ccs:
-                log_extraction.debug("N voxels in cc: %d" % (len(cc)))
-
-        if len(next_ids) == 0:
-            p_ids = vx_ids[~np.in1d(vx_ids, checked_ids)]
-            if len(p_ids) == 0:
-                break
-            else:
-                current_ccs += 1
-                ccs.append(set([p_ids[0]]))
-                next_ids = p_ids[:1]
-
-        q_ids = kdtree.query_ball_point(voxel_list[next_ids], r=cs_gap_nm, )
-        checked_ids = np.concatenate([checked_ids, next_ids])
+def cc_large_voxel_lists(voxel_list: np.ndarray, cs_gap_nm: float, batch_size: int = 5000) -> np.ndarray:
+    """
+    Connected components of a point cloud, two points are connected if they are at most `cs_gap_nm` apart.
 
-        for q_id in q_ids:
-            ccs[current_ccs].update(q_id)
+    Args:
+        voxel_list: Point coordinates (e.g. voxels in nm), shape (N, 3).
+        cs_gap_nm: Maximum distance between connected points.
+        batch_size: Number of points whose neighbors are queried at once.
 
-        cc_ids = np.array(list(ccs[current_ccs]))
-        next_ids = vx_ids[cc_ids[~np.in1d(cc_ids, checked_ids)][:max_concurrent_nodes]]
-    return ccs
+    Returns:
+        Connected component label of every point. Labels are consecutive, see
+        :func:`~syconn.proc.graphs.split_by_labels`.
+    """
+    uf = UnionFind(len(voxel_list))
+    union_radius_neighbors(uf, voxel_list, cs_gap_nm, batch_size=batch_size)
+    return uf.labels()
 
 
 def map_objects_from_synssv_partners(wd: str, obj_version: Optional[str] = None,
@@ -3,12 +3,11 @@ import scipy.ndimage
 from numba import typed
 from numba import types
 import numpy as np
-from typing import Tuple, List
+from typing import Tuple, List, Optional
 
 from syconn import global_params
-from syconn.extraction.block_processing_C import process_block_nonzero
-# needed because all other module import these two methods from here
-from syconn.extraction.find_object_properties_C import find_object_properties, map_subcell_extract_props
+# needed because all other module import this method from here
+from syconn.extraction.find_object_properties_C import find_object_properties
 
 
 int64_arr2d = types.int64[:, :]
@@ -346,7 +345,8 @@ def merge_voxel_dicts(voxel_dicts: List[dict], key_to_str=False):
 
 def detect_cs_64bit(arr: np.ndarray) -> np.ndarray:
     """
-    Uses :func:`detect_seg_boundaries` to generate initial contact mask.
+    Uses :func:`detect_seg_boundaries_parallel` to generate initial contact mask and
+    :func:`detect_contact_partners_parallel` to identify the contact partners.
 
     Args:
         arr: 3D segmentation array
@@ -355,15 +355,9 @@ def detect_cs_64bit(arr: np.ndarray) -> np.ndarray:
         4D contact site segmentation array (XYZC; with C=2).
     """
     # first identify boundary voxels
-    bdry = detect_seg_boundaries(arr)
-
-    stencil = np.array(global_params.config['cell_objects']['cs_filtersize'])
-    assert np.sum(stencil % 2) == 3
-    offset = stencil // 2
-
+    bdry = detect_seg_boundaries_parallel(arr)
     # extract adjacent majority ID on sparse boundary voxels
-    offset = np.array([(-offset[0], offset[0]), (-offset[1], offset[1]), (-offset[2], offset[2])])
-    cs_seg = detect_contact_partners(arr, bdry, offset)
+    cs_seg = detect_contact_partners_parallel(arr, bdry, _cs_stencil_offset())
     return cs_seg
 
 
@@ -455,9 +449,183 @@ def detect_seg_boundaries(arr: np.ndarray) -> np.ndarray:
     return boundary
 
 
+@numba.jit(nopython=True, parallel=True)
+def detect_seg_boundaries_parallel(arr: np.ndarray) -> np.ndarray:
+    """
+    Multi-threaded version of :func:`detect_seg_boundaries`.
+
+    Args:
+        arr: Segmentation volume (XYZ).
+
+    Returns:
+        Binary boundary mask (1: segmentation boundary, 0: inside segmentation or background).
+    """
+    nx, ny, nz = arr.shape[:3]
+    boundary = np.zeros((nx, ny, nz), dtype=np.bool_)
+    for xx in numba.prange(nx):
+        for yy in range(ny):
+            for zz in range(nz):
+                center_id = arr[xx, yy, zz]
+                # no need to flag background
+                if center_id == 0:
+                    continue
+                if (xx > 0 and arr[xx - 1, yy, zz] != center_id) or \
+                        (xx < nx - 1 and arr[xx + 1, yy, zz] != center_id) or \
+                        (yy > 0 and arr[xx, yy - 1, zz] != center_id) or \
+                        (yy < ny - 1 and arr[xx, yy + 1, zz] != center_id) or \
+                        (zz > 0 and arr[xx, yy, zz - 1] != center_id) or \
+                        (zz < nz - 1 and arr[xx, yy, zz + 1] != center_id):
+                    boundary[xx, yy, zz] = True
+    return boundary
+
+
+@numba.jit(nopython=True)
+def _majority_partner(seg_arr: np.ndarray, xx: int, yy: int, zz: int, offset: np.ndarray,
+                      ids: np.ndarray, counts: np.ndarray):
+    """
+    Most common ID (excluding background and the center ID) within `offset` around voxel (`xx`, `yy`, `zz`).
+    Ties are resolved by the smallest ID (as in
+    :func:`~syconn.extraction.block_processing_C.process_block_nonzero`).
+
+    Args:
+        seg_arr: Segmentation volume (XYZ).
+        xx: X coordinate.
+        yy: Y coordinate.
+        zz: Z coordinate.
+        offset: Offset for all spatial axes, shape (3, 2).
+        ids: Buffer for the IDs within the stencil, must be at least the size of the stencil.
+        counts: Buffer for the ID counts, same size as `ids`.
+
+    Returns:
+        Index of the most common ID in `ids`, -1 if there is no other ID than background or the center ID.
+    """
+    center_id = seg_arr[xx, yy, zz]
+    n_ids = 0
+    for neigh_x in range(offset[0, 0], offset[0, 1] + 1):
+        for neigh_y in range(offset[1, 0], offset[1, 1] + 1):
+            for neigh_z in range(offset[2, 0], offset[2, 1] + 1):
+                neigh_id = seg_arr[xx + neigh_x, yy + neigh_y, zz + neigh_z]
+                if (neigh_id == 0) or (neigh_id == center_id):
+                    continue
+                for ii in range(n_ids):
+                    if ids[ii] == neigh_id:
+                        counts[ii] += 1
+                        break
+                else:
+                    ids[n_ids] = neigh_id
+                    counts[n_ids] = 1
+                    n_ids += 1
+    most_comm_ix = -1
+    most_comm_cnt = 0
+    for ii in range(n_ids):
+        if (counts[ii] > most_comm_cnt) or (counts[ii] == most_comm_cnt and ids[ii] < ids[most_comm_ix]):
+            most_comm_ix = ii
+            most_comm_cnt = counts[ii]
+    return most_comm_ix
+
+
+@numba.jit(nopython=True, parallel=True)
+def detect_contact_partners_parallel(seg_arr: np.ndarray, edge_arr: np.ndarray, offset: np.ndarray) -> np.ndarray:
+    """
+    Multi-threaded version of :func:`detect_contact_partners`, which uses fixed-size buffers instead of a
+    dictionary to count the IDs in the neighborhood of every boundary voxel. Ties are resolved by the smallest
+    ID.
+
+    Args:
+        seg_arr: Segmentation volume (XYZ).
+        edge_arr: Boundary/edge mask array (XYZ). Inspects location if != 0, skips if 0.
+        offset: Offset for all spatial axes. Must have shape (3, 2). E.g. [(-1, 1), (-1, 1), (-1, 1)]
+            will check a 3x3x3 cube around every voxel.
+
+    Returns:
+        Contact partner IDs (XYZC; with C=2, sorted). Spatial axes will be ``2*offset`` smaller.
+    """
+    nx, ny, nz = seg_arr.shape[:3]
+    contact_partners = np.zeros((nx+offset[0, 0]-offset[0, 1],
+                                 ny+offset[1, 0]-offset[1, 1],
+                                 nz+offset[2, 0]-offset[2, 1], 2
+                                 ), dtype=np.uint64)
+    n_stencil = (offset[0, 1] - offset[0, 0] + 1) * (offset[1, 1] - offset[1, 0] + 1) * \
+                (offset[2, 1] - offset[2, 0] + 1)
+    for xx in numba.prange(-offset[0, 0], nx-offset[0, 1]):
+        ids = np.zeros(n_stencil, dtype=seg_arr.dtype)
+        counts = np.zeros(n_stencil, dtype=np.int64)
+        for yy in range(-offset[1, 0], ny-offset[1, 1]):
+            for zz in range(-offset[2, 0], nz-offset[2, 1]):
+                if edge_arr[xx, yy, zz] == 0:
+                    continue
+                most_comm_ix = _majority_partner(seg_arr, xx, yy, zz, offset, ids, counts)
+                if most_comm_ix < 0:
+                    continue
+                most_comm = ids[most_comm_ix]
+                center_id = seg_arr[xx, yy, zz]
+                ox, oy, oz = xx+offset[0, 0], yy+offset[1, 0], zz+offset[2, 0]
+                if center_id > most_comm:
+                    contact_partners[ox, oy, oz, 0] = most_comm
+                    contact_partners[ox, oy, oz, 1] = center_id
+                else:
+                    contact_partners[ox, oy, oz, 0] = center_id
+                    contact_partners[ox, oy, oz, 1] = most_comm
+    return contact_partners
+
+
+@numba.jit(nopython=True, parallel=True)
+def detect_contact_partners_packed(seg_arr: np.ndarray, edge_arr: np.ndarray, offset: np.ndarray) -> np.ndarray:
+    """
+    Same as :func:`detect_contact_partners_parallel`, but for segmentations with IDs < 2**32. The sorted
+    partner IDs are packed into a single uint64 (``(smaller_id << 32) + larger_id``), equivalent to
+    :func:`~syconn.extraction.block_processing_C.process_block_nonzero`.
+
+    Args:
+        seg_arr: Segmentation volume (XYZ) with IDs < 2**32.
+        edge_arr: Boundary/edge mask array (XYZ). Inspects location if != 0, skips if 0.
+        offset: Offset for all spatial axes. Must have shape (3, 2).
+
+    Returns:
+        Contact site instance segmentation. Axes will be ``2*offset`` smaller.
+    """
+    nx, ny, nz = seg_arr.shape[:3]
+    contact_ids = np.zeros((nx+offset[0, 0]-offset[0, 1],
+                            ny+offset[1, 0]-offset[1, 1],
+                            nz+offset[2, 0]-offset[2, 1]), dtype=np.uint64)
+    n_stencil = (offset[0, 1] - offset[0, 0] + 1) * (offset[1, 1] - offset[1, 0] + 1) * \
+                (offset[2, 1] - offset[2, 0] + 1)
+    for xx in numba.prange(-offset[0, 0], nx-offset[0, 1]):
+        ids = np.zeros(n_stencil, dtype=seg_arr.dtype)
+        counts = np.zeros(n_stencil, dtype=np.int64)
+        for yy in range(-offset[1, 0], ny-offset[1, 1]):
+            for zz in range(-offset[2, 0], nz-offset[2, 1]):
+                if edge_arr[xx, yy, zz] == 0:
+                    continue
+                most_comm_ix = _majority_partner(seg_arr, xx, yy, zz, offset, ids, counts)
+                if most_comm_ix < 0:
+                    continue
+                most_comm = np.uint64(ids[most_comm_ix])
+                center_id = np.uint64(seg_arr[xx, yy, zz])
+                if center_id > most_comm:
+                    packed = (most_comm << np.uint64(32)) + center_id
+                else:
+                    packed = (center_id << np.uint64(32)) + most_comm
+                contact_ids[xx+offset[0, 0], yy+offset[1, 0], zz+offset[2, 0]] = packed
+    return contact_ids
+
+
+def _cs_stencil_offset() -> np.ndarray:
+    """
+    Returns:
+        Offset array of shape (3, 2) derived from ``global_params.config['cell_objects']['cs_filtersize']``.
+    """
+    stencil = np.array(global_params.config['cell_objects']['cs_filtersize'])
+    assert np.sum(stencil % 2) == 3
+    offset = stencil // 2
+    return np.array([(-offset[0], offset[0]), (-offset[1], offset[1]), (-offset[2], offset[2])], dtype=np.int64)
+
+
 def detect_cs(arr: np.ndarray) -> np.ndarray:
     """
     Only works if ``arr.dtype`` is uint32. Use detect_cs_64bit for uin64 segmentation.
+    Equivalent to :func:`~syconn.extraction.block_processing_C.process_block_nonzero`, but uses the
+    multi-threaded :func:`detect_contact_partners_packed`.
 
     Args:
         arr: 3D segmentation array (only np.uint32).
@@ -465,8 +633,282 @@ def detect_cs(arr: np.ndarray) -> np.ndarray:
     Returns:
         3D contact site instance segmentation array (np.uint64).
     """
-    edges = detect_seg_boundaries(arr).astype(np.uint32, copy=False)
     arr = arr.astype(np.uint32, copy=False)
-    cs_seg = process_block_nonzero(
-        edges, arr, global_params.config['cell_objects']['cs_filtersize'])
+    edges = detect_seg_boundaries_parallel(arr)
+    cs_seg = detect_contact_partners_packed(arr, edges, _cs_stencil_offset())
     return cs_seg
+
+
+@numba.jit(nopython=True)
+def _binary_morph_step(src: np.ndarray, dst: np.ndarray, erode: bool):
+    """
+    Single binary dilation or erosion step with a 6-connected structuring element. Voxels outside of `src`
+    are treated as background (``border_value=0`` in :func:`scipy.ndimage.binary_erosion`).
+
+    Args:
+        src: Binary input mask (XYZ).
+        dst: Output mask, same shape as `src`.
+        erode: Perform erosion if True, dilation otherwise.
+    """
+    nx, ny, nz = src.shape
+    for xx in range(nx):
+        for yy in range(ny):
+            for zz in range(nz):
+                val = src[xx, yy, zz]
+                if erode and val:
+                    if xx == 0 or yy == 0 or zz == 0 or xx == nx - 1 or yy == ny - 1 or zz == nz - 1:
+                        val = 0
+                    elif not (src[xx - 1, yy, zz] and src[xx + 1, yy, zz] and src[xx, yy - 1, zz] and
+                              src[xx, yy + 1, zz] and src[xx, yy, zz - 1] and src[xx, yy, zz + 1]):
+                        val = 0
+                elif not erode and not val:
+                    if (xx > 0 and src[xx - 1, yy, zz]) or (xx < nx - 1 and src[xx + 1, yy, zz]) or \
+                            (yy > 0 and src[xx, yy - 1, zz]) or (yy < ny - 1 and src[xx, yy + 1, zz]) or \
+                            (zz > 0 and src[xx, yy, zz - 1]) or (zz < nz - 1 and src[xx, yy, zz + 1]):
+                        val = 1
+                dst[xx, yy, zz] = val
+
+
+@numba.jit(nopython=True)
+def _binary_morph(mask: np.ndarray, buffer: np.ndarray, iterations: int, erode: bool) -> np.ndarray:
+    """
+    Apply :func:`_binary_morph_step` `iterations` times. `mask` and `buffer` are used as ping-pong buffers.
+
+    Returns:
+        The buffer which contains the result.
+    """
+    for _ in range(iterations):
+        _binary_morph_step(mask, buffer, erode)
+        mask, buffer = buffer, mask
+    return mask
+
+
+@numba.jit(nopython=True)
+def _close_and_dilate_labels(seg: np.ndarray, ids: np.ndarray, bbs: np.ndarray, n_closings: int,
+                             n_dilations: int):
+    """
+    Numba kernel of :func:`close_and_dilate_labels`; modifies `seg` in-place.
+
+    Args:
+        seg: Instance segmentation (XYZ).
+        ids: Object IDs.
+        bbs: Bounding boxes of the objects, shape (N, 2, 3). Lower bound inclusive, upper bound exclusive.
+        n_closings: Number of closing iterations.
+        n_dilations: Number of dilation iterations.
+    """
+    nx, ny, nz = seg.shape
+    for ii in range(len(ids)):
+        ix = ids[ii]
+        x0, y0, z0 = max(bbs[ii, 0, 0] - n_closings, 0), max(bbs[ii, 0, 1] - n_closings, 0), \
+            max(bbs[ii, 0, 2] - n_closings, 0)
+        x1, y1, z1 = min(bbs[ii, 1, 0] + n_closings, nx), min(bbs[ii, 1, 1] + n_closings, ny), \
+            min(bbs[ii, 1, 2] + n_closings, nz)
+        sub_vol = seg[x0:x1, y0:y1, z0:z1]
+        binary_mask = (sub_vol == ix).astype(np.uint8)
+        res = binary_mask.copy()
+        buffer = np.empty_like(res)
+        if n_closings > 0:
+            res = _binary_morph(res, buffer, n_closings, False)
+            buffer = np.empty_like(res)
+            res = _binary_morph(res, buffer, n_closings, True)
+        if n_dilations > 0:
+            buffer = np.empty_like(res)
+            res = _binary_morph(res, buffer, n_dilations, False)
+        # only update background or the object itself
+        for xx in range(x1 - x0):
+            for yy in range(y1 - y0):
+                for zz in range(z1 - z0):
+                    if res[xx, yy, zz] and (binary_mask[xx, yy, zz] or sub_vol[xx, yy, zz] == 0):
+                        sub_vol[xx, yy, zz] = ix
+
+
+def close_and_dilate_labels(seg: np.ndarray, n_closings: int, n_dilations: int = 0,
+                            bounding_boxes: Optional[dict] = None) -> np.ndarray:
+    """
+    Label-aware binary closing followed by binary dilation (6-connected structuring element) of all objects in
+    `seg`, e.g. to close gaps in and reduce fragmenting of the contact sites generated by :func:`detect_cs`.
+    Objects are processed one after another within their bounding box (extended by `n_closings`) and may
+    only grow into background voxels; voxels of other objects and object voxels removed by the closing at
+    the volume boundary are left unchanged. Equivalent to :func:`scipy.ndimage.binary_closing` and
+    :func:`scipy.ndimage.binary_dilation` on the binary mask of every object, but processes all objects
+    within a single numba call.
+
+    Args:
+        seg: Instance segmentation (XYZ). Modified in-place.
+        n_closings: Number of closing iterations.
+        n_dilations: Number of dilation iterations.
+        bounding_boxes: Bounding box (lower bound inclusive, upper bound exclusive) of every object ID as
+            returned by :func:`find_object_properties`. Will be computed if None.
+
+    Returns:
+        The processed segmentation `seg`.
+    """
+    if n_closings <= 0 and n_dilations <= 0:
+        return seg
+    if bounding_boxes is None:
+        _, bounding_boxes, _ = find_object_properties(seg)
+    if len(bounding_boxes) == 0:
+        return seg
+    ids = np.fromiter(bounding_boxes.keys(), dtype=seg.dtype, count=len(bounding_boxes))
+    bbs = np.array([bounding_boxes[ix] for ix in bounding_boxes], dtype=np.int64).reshape(-1, 2, 3)
+    _close_and_dilate_labels(seg, ids, bbs, int(n_closings), int(n_dilations))
+    return seg
+
+
+int64_pair = types.UniTuple(types.int64, 2)
+obj_key = types.Tuple((types.int64, types.uint64))
+
+
+@numba.jit(nopython=True)
+def _grow(arr: np.ndarray, cap: int) -> np.ndarray:
+    res = np.empty((cap,) + arr.shape[1:], dtype=arr.dtype)
+    res[:len(arr)] = arr
+    return res
+
+
+@numba.jit(nopython=True)
+def _update_bb(bbs: np.ndarray, sizes: np.ndarray, ix: int, x: int, y: int, z: int):
+    bbs[ix, 0, 0] = min(bbs[ix, 0, 0], x)
+    bbs[ix, 0, 1] = min(bbs[ix, 0, 1], y)
+    bbs[ix, 0, 2] = min(bbs[ix, 0, 2], z)
+    bbs[ix, 1, 0] = max(bbs[ix, 1, 0], x + 1)
+    bbs[ix, 1, 1] = max(bbs[ix, 1, 1], y + 1)
+    bbs[ix, 1, 2] = max(bbs[ix, 1, 2], z + 1)
+    sizes[ix] += 1
+
+
+@numba.jit(nopython=True)
+def _find_object_properties_fused(segs: np.ndarray, cap: int):
+    n_ch, sx, sy, sz = segs.shape
+    obj_ch = np.empty(cap, dtype=np.int64)
+    obj_ids = np.empty(cap, dtype=np.uint64)
+    rep_coords = np.empty((cap, 3), dtype=np.int64)
+    bbs = np.empty((cap, 2, 3), dtype=np.int64)
+    sizes = np.empty(cap, dtype=np.int64)
+    bdry = np.empty(cap, dtype=np.bool_)
+    n_obj = 0
+    # (channel, object ID) -> object index
+    index = typed.Dict.empty(key_type=obj_key, value_type=types.int64)
+    # (subcell. object index, cell object index) -> number of overlapping voxels
+    overlap = typed.Dict.empty(key_type=int64_pair, value_type=types.int64)
+    # labels are mostly constant along z -> cache the previous object and overlap of every channel
+    last_key = np.zeros(n_ch, dtype=np.uint64)
+    last_ix = np.full(n_ch, -1, dtype=np.int64)
+    last_ov = np.full((n_ch, 2), -1, dtype=np.int64)
+    last_ov_cnt = np.zeros(n_ch, dtype=np.int64)
+    for x in range(sx):
+        for y in range(sy):
+            for z in range(sz):
+                on_bdry = x == 0 or y == 0 or z == 0 or x == sx - 1 or y == sy - 1 or z == sz - 1
+                cell_ix = -1
+                for c in range(n_ch):
+                    key = np.uint64(segs[c, x, y, z])
+                    if key == 0:
+                        continue
+                    if last_ix[c] >= 0 and key == last_key[c]:
+                        ix = last_ix[c]
+                        _update_bb(bbs, sizes, ix, x, y, z)
+                    elif (c, key) in index:
+                        ix = index[(c, key)]
+                        _update_bb(bbs, sizes, ix, x, y, z)
+                    else:
+                        if n_obj == cap:
+                            cap *= 2
+                            obj_ch = _grow(obj_ch, cap)
+                            obj_ids = _grow(obj_ids, cap)
+                            rep_coords = _grow(rep_coords, cap)
+                            bbs = _grow(bbs, cap)
+                            sizes = _grow(sizes, cap)
+                            bdry = _grow(bdry, cap)
+                        ix = n_obj
+                        n_obj += 1
+                        index[(c, key)] = ix
+                        obj_ch[ix] = c
+                        obj_ids[ix] = key
+                        rep_coords[ix, 0] = x
+                        rep_coords[ix, 1] = y
+                        rep_coords[ix, 2] = z
+                        bbs[ix, 0, 0] = x
+                        bbs[ix, 0, 1] = y
+                        bbs[ix, 0, 2] = z
+                        bbs[ix, 1, 0] = x + 1
+                        bbs[ix, 1, 1] = y + 1
+                        bbs[ix, 1, 2] = z + 1
+                        sizes[ix] = 1
+                        bdry[ix] = False
+                    last_key[c] = key
+                    last_ix[c] = ix
+                    if on_bdry:
+                        bdry[ix] = True
+                    if c == 0:
+                        cell_ix = ix
+                    elif cell_ix >= 0:
+                        if last_ov[c, 0] == ix and last_ov[c, 1] == cell_ix:
+                            last_ov_cnt[c] += 1
+                        else:
+                            if last_ov_cnt[c] > 0:
+                                ov_key = (last_ov[c, 0], last_ov[c, 1])
+                                overlap[ov_key] = overlap.get(ov_key, 0) + last_ov_cnt[c]
+                            last_ov[c, 0] = ix
+                            last_ov[c, 1] = cell_ix
+                            last_ov_cnt[c] = 1
+    for c in range(n_ch):
+        if last_ov_cnt[c] > 0:
+            ov_key = (last_ov[c, 0], last_ov[c, 1])
+            overlap[ov_key] = overlap.get(ov_key, 0) + last_ov_cnt[c]
+    ov_pairs = np.empty((len(overlap), 2), dtype=np.int64)
+    ov_counts = np.empty(len(overlap), dtype=np.int64)
+    for ii, (k, v) in enumerate(overlap.items()):
+        ov_pairs[ii, 0] = k[0]
+        ov_pairs[ii, 1] = k[1]
+        ov_counts[ii] = v
+    return obj_ch[:n_obj], obj_ids[:n_obj], rep_coords[:n_obj], bbs[:n_obj], sizes[:n_obj], bdry[:n_obj], \
+        ov_pairs, ov_counts
+
+
+def find_object_properties_fused(seg: np.ndarray, subcell_segs: Optional[np.ndarray] = None) \
+        -> Tuple[List[Tuple[np.ndarray, ...]], List[Tuple[np.ndarray, np.ndarray]]]:
+    """
+    Extract the properties of all objects in the cell segmentation `seg` and the subcellular segmentations
+    `subcell_segs` together with their overlap within a single traversal of the volume. Replaces
+    :func:`find_object_properties`, :func:`~syconn.extraction.find_object_properties_C.map_subcell_extract_props`
+    and the subsequent search for objects which touch the chunk boundary.
+
+    Notes:
+        * `rep_coord` is the first voxel of every object (same as :func:`find_object_properties`).
+        * `seg` and `subcell_segs` must all have the same spatial shape.
+
+    Args:
+        seg: Cell segmentation (XYZ).
+        subcell_segs: Subcellular segmentations (CXYZ).
+
+    Returns:
+        Object properties of the cell segmentation and every subcellular segmentation, each as tuple of flat arrays
+        sorted by object ID: IDs (N,), representative coordinates (N, 3), bounding boxes (N, 2, 3) with
+        exclusive upper bound, sizes (N,) and a flag whether the object touches the volume boundary (N,).
+        Overlap of every subcellular segmentation with the cell segmentation as sparse COO table: ID pairs
+        (M, 2) with subcellular ID first and cell ID second and the number of overlapping voxels (M,).
+    """
+    if subcell_segs is None or len(subcell_segs) == 0:
+        segs = seg[None]
+    else:
+        if subcell_segs.shape[1:] != seg.shape:
+            raise ValueError(f'Segmentation of cells and subcellular structures must have same shape. '
+                             f'{subcell_segs.shape[1:]} {seg.shape}')
+        segs = np.concatenate([seg[None], subcell_segs.astype(seg.dtype, copy=False)])
+    obj_ch, ids, rep_coords, bbs, sizes, bdry, ov_pairs, ov_counts = _find_object_properties_fused(
+        segs, max(1024, int(np.prod(seg.shape)) // 4096))
+    props = []
+    ch_ixs = []
+    for c in range(len(segs)):
+        ixs = np.flatnonzero(obj_ch == c)
+        ixs = ixs[np.argsort(ids[ixs], kind='stable')]
+        ch_ixs.append(ixs)
+        props.append((ids[ixs], rep_coords[ixs], bbs[ixs], sizes[ixs], bdry[ixs]))
+    overlaps = []
+    ov_ch = obj_ch[ov_pairs[:, 0]]
+    for c in range(1, len(segs)):
+        m = ov_ch == c
+        pairs = np.stack([ids[ov_pairs[m, 0]], ids[ov_pairs[m, 1]]], axis=1).reshape(-1, 2)
+        overlaps.append((pairs, ov_counts[m]))
+    return props, overlaps
@@ -20,8 +20,8 @@ from .block_processing_C import relabel_vol
 from .. import global_params
 from ..handler import basics, log_handler, compression
 from ..handler.basics import kd_factory
+from ..handler.kd_io import KDWriter
 from ..mp import batchjob_utils as qu, mp_utils as sm
-from ..proc.general import cut_array_in_one_dim
 from ..proc.image import apply_morphological_operations, get_aniso_struct
 
 try:
@@ -368,9 +368,11 @@ def _object_segmentation_thread(args):
 
 def make_unique_labels(cset, filename, hdf5names, chunk_list, max_nb_dict,
                        chunk_translator, debug, suffix="",
-                       n_chunk_jobs=None, nb_cpus=1):
+                       n_chunk_jobs=None, nb_cpus=1, overlap=None):
     """
-    Makes labels unique across chunks
+    Makes labels unique across chunks. If `overlap` is given, the six face slabs of every chunk which
+    are shared with its neighbors are stored in a separate file (see :func:`save_face_slabs`) to allow
+    stitching without loading the entire chunk volumes.
 
     Args:
         cset : chunkdataset instance
@@ -395,6 +397,8 @@ def make_unique_labels(cset, filename, hdf5names, chunk_list, max_nb_dict,
         n_chunk_jobs: int
             Number of total jobs.
         nb_cpus: int
+        overlap: np.array
+            Overlap of the chunk volumes with neighbouring chunks. Face slabs are not stored if None.
     """
 
     if n_chunk_jobs is None:
@@ -410,7 +414,7 @@ def make_unique_labels(cset, filename, hdf5names, chunk_list, max_nb_dict,
                     chunk_translator[nb_chunk]]
 
             multi_params.append([cset.chunk_dict[nb_chunk], filename, hdf5names,
-                                 this_max_nb_dict, suffix])
+                                 this_max_nb_dict, suffix, overlap])
         multi_params_glob.append(multi_params)
 
     if not qu.batchjob_enabled():
@@ -430,6 +434,7 @@ def _make_unique_labels_thread(func_args):
         hdf5names = args[2]
         this_max_nb_dict = args[3]
         suffix = args[4]
+        overlap = args[5]
 
         cc_data_list = compression.load_from_h5py(
             chunk.folder + filename + "_connected_components%s.h5" % suffix, hdf5names)
@@ -441,6 +446,132 @@ def _make_unique_labels_thread(func_args):
             matrix[matrix > 0] += this_max_nb_dict[hdf5_name]
 
         compression.save_to_h5py(cc_data_list, chunk.folder + filename + "_unique_components%s.h5" % suffix, hdf5names)
+        if overlap is not None:
+            save_face_slabs(cc_data_list, chunk.folder + filename + "_face_slabs%s.h5" % suffix, hdf5names,
+                            overlap)
+
+
+def _face_slab_key(hdf5_name: str, dim: int, upper: bool) -> str:
+    return '{}_{}{}'.format(hdf5_name, 'upper' if upper else 'lower', dim)
+
+
+def extract_face_slab(data: np.ndarray, overlap: np.ndarray, dim: int, upper: bool) -> np.ndarray:
+    """
+    Extracts the face slab of a chunk volume (incl. its overlap) which is shared with the neighbouring chunk, i.e.
+    a slab with thickness ``2 * overlap[dim]`` at the lower or upper end of dimension `dim`. The upper slab of a
+    chunk and the lower slab of its upper neighbour cover the same voxels.
+
+    Args:
+        data: Chunk volume including the overlap.
+        overlap: Overlap of the chunk volume with neighbouring chunks.
+        dim: Dimension perpendicular to the face.
+        upper: If True, returns the slab at the upper end of `dim`.
+
+    Returns:
+        The face slab.
+    """
+    thickness = 2 * int(overlap[dim])
+    sl = [slice(None)] * data.ndim
+    sl[dim] = slice(data.shape[dim] - thickness, None) if upper else slice(0, thickness)
+    return data[tuple(sl)]
+
+
+def save_face_slabs(cc_data_list, path, hdf5names, overlap):
+    """
+    Stores the six face slabs (see :func:`extract_face_slab`) of every chunk volume in `cc_data_list` together
+    with the object sizes (number of voxels of every non-zero ID in the chunk volume). This is all
+    :func:`_make_stitch_list_thread` requires, i.e. stitching scales with the chunk surface instead of
+    its volume.
+
+    Args:
+        cc_data_list: Unique components of every hdf5name.
+        path: Destination file.
+        hdf5names: Keys of `cc_data_list`.
+        overlap: Overlap of the chunk volume with neighbouring chunks.
+    """
+    slabs = {}
+    for hdf5_name, data in zip(hdf5names, cc_data_list):
+        for dim in range(3):
+            for upper in [False, True]:
+                slabs[_face_slab_key(hdf5_name, dim, upper)] = extract_face_slab(data, overlap, dim, upper)
+        ids, counts = np.unique(data[data != 0], return_counts=True)
+        slabs[hdf5_name + '_ids'] = ids
+        slabs[hdf5_name + '_counts'] = counts
+    compression.save_to_h5py(slabs, path)
+
+
+def load_face_slabs(chunk, filename, hdf5names, overlap, dim, upper, suffix="",
+                    load_sizes=False):
+    """
+    Loads the face slabs of `chunk` stored by :func:`save_face_slabs`. Falls back to the full
+    ``_unique_components`` volumes if the chunk does not provide face slabs.
+
+    Args:
+        chunk: Chunk object.
+        filename: Filename of the prediction in the chunkdataset.
+        hdf5names: Names of the components.
+        overlap: Overlap of the chunk volume with neighbouring chunks.
+        dim: Dimension perpendicular to the face.
+        upper: If True, loads the slabs at the upper end of `dim`.
+        suffix: Suffix for the intermediate results.
+        load_sizes: Additionally return the object IDs and their sizes in number of voxels.
+
+    Returns:
+        The face slab of every hdf5name and, if `load_sizes` is True, dictionaries with the object IDs and
+        sizes of every hdf5name.
+    """
+    slab_path = chunk.folder + filename + "_face_slabs%s.h5" % suffix
+    if os.path.isfile(slab_path):
+        keys = [_face_slab_key(hdf5_name, dim, upper) for hdf5_name in hdf5names]
+        if load_sizes:
+            keys += [hdf5_name + k for hdf5_name in hdf5names for k in ['_ids', '_counts']]
+        data = compression.load_from_h5py(slab_path, keys, as_dict=True)
+        slabs = [data[_face_slab_key(hdf5_name, dim, upper)] for hdf5_name in hdf5names]
+        if not load_sizes:
+            return slabs
+        return slabs, {k: data[k + '_ids'] for k in hdf5names}, {k: data[k + '_counts'] for k in hdf5names}
+    cc_data_list = compression.load_from_h5py(chunk.folder + filename + "_unique_components%s.h5" % suffix,
+                                              hdf5names)
+    slabs = [extract_face_slab(data, overlap, dim, upper) for data in cc_data_list]
+    if not load_sizes:
+        return slabs
+    ids, counts = {}, {}
+    for hdf5_name, data in zip(hdf5names, cc_data_list):
+        ids[hdf5_name], counts[hdf5_name] = np.unique(data[data != 0], return_counts=True)
+    return slabs, ids, counts
+
+
+def stitch_face_slabs(slab, slab_to_compare, overlap, stitch_overlap, dim):
+    """
+    Finds the overlapping object IDs of two face slabs which cover the same voxels, i.e. the upper slab of a chunk
+    and the lower slab of its upper neighbour (see :func:`extract_face_slab`). Only voxels within `stitch_overlap`
+    of the chunk border are considered.
+
+    Args:
+        slab: Face slab of the lower chunk.
+        slab_to_compare: Face slab of the upper chunk.
+        overlap: Overlap of the chunk volumes with neighbouring chunks.
+        stitch_overlap: Overlap evaluated during stitching.
+        dim: Dimension perpendicular to the face.
+
+    Returns:
+        Unique ID pairs (N, 2) which overlap within the stitch region and the number of voxels both objects
+        share within the entire slab.
+    """
+    both = (slab != 0) & (slab_to_compare != 0)
+    pairs, match_vx = np.unique(np.stack([slab[both], slab_to_compare[both]], axis=1), axis=0, return_counts=True)
+    band = [slice(None)] * slab.ndim
+    band[dim] = slice(int(overlap[dim] - stitch_overlap[dim]), int(overlap[dim] + stitch_overlap[dim]))
+    band = tuple(band)
+    both = both[band]
+    stitch_pairs = np.unique(np.stack([slab[band][both], slab_to_compare[band][both]], axis=1), axis=0)
+    # stitch pairs are a subset of all pairs in the slab
+    keep = np.zeros(len(pairs), dtype=bool)
+    if len(stitch_pairs) > 0:
+        pair_view = np.ascontiguousarray(pairs).view([('', pairs.dtype)] * 2).ravel()
+        stitch_view = np.ascontiguousarray(stitch_pairs).view([('', pairs.dtype)] * 2).ravel()
+        keep = np.isin(pair_view, stitch_view)
+    return pairs[keep], match_vx[keep]
 
 
 def make_stitch_list(cset, filename, hdf5names, chunk_list, stitch_overlap,
@@ -543,8 +674,6 @@ def _make_stitch_list_thread(args):
     cset = chunky.load_dataset(cpath_head_folder)
     for nb_chunk in nb_chunks:
         chunk = cset.chunk_dict[nb_chunk]
-        cc_data_list = compression.load_from_h5py(chunk.folder + filename +
-                                                  "_unique_components%s.h5" % suffix, hdf5names)
 
         # TODO: optimize get_neighbouring_chunks
         neighbours, pos = cset.get_neighbouring_chunks(chunk, chunklist=chunk_list,
@@ -555,63 +684,34 @@ def _make_stitch_list_thread(args):
         pos = pos[np.any(pos > 0, axis=1)]
 
         # Compare only half of 6-neighborhood for every chunk which suffices to cover all overlap areas. Checking all
-        # neighbors for every chunk would lead to twice and redundant computational load
+        # neighbors for every chunk would lead to twice and redundant computational load. Only the face slabs
+        # shared by the two chunks are loaded.
         for ii in range(3):
             if neighbours[ii] != -1:
                 compare_chunk = cset.chunk_dict[neighbours[ii]]
-                cc_data_list_to_compare = \
-                    compression.load_from_h5py(
-                        compare_chunk.folder + filename + "_unique_components%s.h5" % suffix, hdf5names)
-
-                cc_area = {}
-                cc_area_to_compare = {}
-
                 id = np.argmax(pos[ii])  # get contact dimension (perpendicular to contact plane)
-                for nb_hdf5_name in range(len(hdf5names)):
-                    this_cc_data = cc_data_list[nb_hdf5_name]
-                    this_cc_data_to_compare = \
-                        cc_data_list_to_compare[nb_hdf5_name]
-
-                    cc_area[nb_hdf5_name] = \
-                        cut_array_in_one_dim(
-                            this_cc_data,
-                            -overlap[id] - stitch_overlap[id],
-                            -overlap[id] + stitch_overlap[id], id)
-
-                    cc_area_to_compare[nb_hdf5_name] = \
-                        cut_array_in_one_dim(
-                            this_cc_data_to_compare,
-                            overlap[id] - stitch_overlap[id],
-                            overlap[id] + stitch_overlap[id], id)
+                if overlap_thresh > 0:
+                    cc_area, ids, counts = load_face_slabs(chunk, filename, hdf5names, overlap, id, True,
+                                                           suffix=suffix, load_sizes=True)
+                    cc_area_to_compare, ids_to_compare, counts_to_compare = load_face_slabs(
+                        compare_chunk, filename, hdf5names, overlap, id, False, suffix=suffix, load_sizes=True)
+                else:
+                    cc_area = load_face_slabs(chunk, filename, hdf5names, overlap, id, True, suffix=suffix)
+                    cc_area_to_compare = load_face_slabs(compare_chunk, filename, hdf5names, overlap, id, False,
+                                                         suffix=suffix)
                 for nb_hdf5_name in range(len(hdf5names)):
                     hdf5_name = hdf5names[nb_hdf5_name]
-                    stitch_ixs = np.transpose(np.nonzero((cc_area[nb_hdf5_name] != 0) &
-                                                         (cc_area_to_compare[nb_hdf5_name] != 0)))
-                    ignore_ids = set()  # if already inspected and overlap is insufficient
-                    for stitch_pos in stitch_ixs:
-                        stitch_pos = tuple(stitch_pos)
-                        this_id = cc_area[nb_hdf5_name][stitch_pos]
-                        compare_id = cc_area_to_compare[nb_hdf5_name][stitch_pos]
-                        pair = tuple(sorted([this_id, compare_id]))
-                        if (pair not in map_dict[hdf5_name]) and (pair not in ignore_ids):
-                            if overlap_thresh > 0:
-                                obj_coord_intern = np.transpose(np.nonzero(cc_data_list[nb_hdf5_name] == this_id))
-                                obj_coord_intern_compare = np.transpose(
-                                    np.nonzero(cc_data_list_to_compare[nb_hdf5_name] == compare_id))
-                                c1 = chunk.coordinates - chunk.overlap + obj_coord_intern + np.array([1, 1, 1])
-                                c2 = compare_chunk.coordinates - compare_chunk.overlap + obj_coord_intern_compare + np.array(
-                                    [1, 1, 1])
-                                from scipy import spatial
-                                kdt = spatial.cKDTree(c1)
-                                dists, ixs = kdt.query(c2)
-                                match_vx = np.sum(dists == 0)
-                                match_vx_rel = 2 * float(match_vx) / (len(c1) + len(c2))
-                                if match_vx_rel > 0.1:
-                                    map_dict[hdf5_name].add(pair)
-                                else:
-                                    ignore_ids.add(pair)
-                            else:
-                                map_dict[hdf5_name].add(pair)
+                    pairs, match_vx = stitch_face_slabs(cc_area[nb_hdf5_name], cc_area_to_compare[nb_hdf5_name],
+                                                        overlap, stitch_overlap, id)
+                    if overlap_thresh > 0:
+                        # relative number of matching voxels w.r.t. the object sizes in both chunks
+                        size = counts[hdf5_name][np.searchsorted(ids[hdf5_name], pairs[:, 0])]
+                        size_to_compare = counts_to_compare[hdf5_name][
+                            np.searchsorted(ids_to_compare[hdf5_name], pairs[:, 1])]
+                        match_vx_rel = 2 * match_vx / (size + size_to_compare)
+                        pairs = pairs[match_vx_rel > 0.1]
+                    for this_id, compare_id in pairs:
+                        map_dict[hdf5_name].add(tuple(sorted([this_id, compare_id])))
     for k, v in map_dict.items():
         map_dict[k] = list(v)
     return map_dict
@@ -847,18 +947,20 @@ def _export_cset_as_kds_thread(args):
 
     data_dict = cset.from_chunky_to_matrix(size, coords, name, hdf5names,
                                            dtype=orig_dtype)
-    for hdf5name in hdf5names:
-        curr_d = data_dict[hdf5name]
-        if (curr_d.dtype.kind not in ("u", "i")) and (0 < np.max(curr_d) <= 1.0):
-            curr_d = (curr_d * 255).astype(np.uint8)
-        data_dict[hdf5name] = []
-        data_list = curr_d
-        # make it ZYX
-        data_list = np.swapaxes(data_list, 0, 2)
-        kd = target_kds[hdf5name]
-        if as_raw:
-            kd.save_raw(offset=coords, mags=kd.available_mags, data=data_list, data_mag=1,
-                        fast_resampling=fast_downsampling)
-        else:
-            kd.save_seg(offset=coords, mags=kd.available_mags, data=data_list, data_mag=1,
-                        fast_resampling=fast_downsampling, compresslevel=compresslevel)
+    # write the datasets in parallel; arrays are not modified after they were queued
+    with KDWriter(n_threads=len(hdf5names)) as writer:
+        for hdf5name in hdf5names:
+            curr_d = data_dict[hdf5name]
+            if (curr_d.dtype.kind not in ("u", "i")) and (0 < np.max(curr_d) <= 1.0):
+                curr_d = (curr_d * 255).astype(np.uint8)
+            data_dict[hdf5name] = []
+            data_list = curr_d
+            # make it ZYX
+            data_list = np.swapaxes(data_list, 0, 2)
+            kd = target_kds[hdf5name]
+            if as_raw:
+                writer.save_raw(kd, offset=coords, mags=kd.available_mags, data=data_list, data_mag=1,
+                                fast_resampling=fast_downsampling, copy=False)
+            else:
+                writer.save_seg(kd, offset=coords, mags=kd.available_mags, data=data_list, data_mag=1,
+                                fast_resampling=fast_downsampling, compresslevel=compresslevel, copy=False)
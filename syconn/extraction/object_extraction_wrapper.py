@@ -318,7 +318,7 @@ def from_probabilities_to_kd(
     time_start = time.time()
     oes.make_unique_labels(cset, filename, hdf5names, chunk_list, max_nb_dict,
                            chunk_translator, debug, suffix=suffix,
-                           n_chunk_jobs=n_chunk_jobs, nb_cpus=n_cores)
+                           n_chunk_jobs=n_chunk_jobs, nb_cpus=n_cores, overlap=overlap)
     all_times.append(time.time() - time_start)
     step_names.append("unique labels")
 
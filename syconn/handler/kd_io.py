@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+# SyConn - Synaptic connectivity inference toolkit
+#
+# Copyright (c) 2016 - now
+# Max Planck Institute of Neurobiology, Martinsried, Germany
+# Authors: Philipp Schubert, Joergen Kornfeld
+"""
+Chunk-wise I/O of KnossosDatasets. :class:`~ChunkReader` loads the volumes of several sources (e.g. cell
+segmentation, synaptic junction probabilities and synapse type predictions) per chunk, deduplicates identical
+reads and prefetches the volumes of the next chunk(s) on background threads while the current chunk is
+processed. :class:`~KDWriter` writes volumes on background threads with a bounded amount of pending data.
+"""
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, Tuple, Union, TYPE_CHECKING
+
+import numpy as np
+
+from . import log_handler
+
+if TYPE_CHECKING:
+    from knossos_utils import KnossosDataset
+
+__all__ = ['ChunkReader', 'KDWriter']
+
+
+class ChunkReader:
+    """
+    Loads the volumes of multiple KnossosDataset sources for a sequence of chunks.
+
+    * Reads with identical dataset, method, offset, size, magnification and data type are performed only
+      once per chunk and the resulting array is shared between the requesting sources, e.g. if symmetric
+      and asymmetric synapse type predictions are stored in the same dataset. Copy shared arrays before
+      modifying them in-place.
+    * :meth:`~iter_chunks` prefetches the volumes of the next `n_prefetch` chunks on background threads
+      while the current chunk is processed.
+    * The I/O time spent on every source and the time the caller was blocked waiting for data are
+      accumulated in :attr:`~io_times` and :attr:`~wait_time`.
+
+    Examples:
+        Read the cell segmentation with a larger field of view than the synaptic junction
+        probabilities::
+
+            sources = dict(cell=dict(kd=kd_path, datatype=np.uint64),
+                           sj=dict(kd=kd_sj_path, method='load_raw'))
+            with ChunkReader(sources) as reader:
+                for chunk, vols in reader.iter_chunks(chunks, lambda ch: dict(
+                        cell=(ch.coordinates - 5, ch.size + 10), sj=(ch.coordinates, ch.size))):
+                    cell_d, sj_d = vols['cell'], vols['sj']
+
+    Args:
+        sources: Source name mapped to its properties:
+
+            * ``kd``: KnossosDataset or path to the KnossosDataset (see
+              :func:`~syconn.handler.basics.kd_factory`).
+            * ``method``: 'load_seg' (default) or 'load_raw'.
+            * ``mag``: Magnification, default: 1.
+            * ``datatype``: Data type passed to ``load_seg``, default: None (dataset default).
+            * ``xyz``: Return arrays in XYZ order instead of ZYX as loaded from the dataset, default: True.
+
+        n_prefetch: Number of chunks loaded ahead of the currently processed chunk. 0 disables prefetching.
+        n_threads: Number of threads used for loading.
+    """
+
+    def __init__(self, sources: Dict[str, dict], n_prefetch: int = 1, n_threads: int = 2):
+        self.sources = {}
+        self._kds = {}
+        for name, props in sources.items():
+            props = dict(props)
+            kd = props.pop('kd')
+            method = props.pop('method', 'load_seg')
+            if method not in ('load_seg', 'load_raw'):
+                raise ValueError(f'Unknown load method "{method}" of source "{name}".')
+            kd_key = kd if isinstance(kd, str) else getattr(kd, 'knossos_path', None) or id(kd)
+            self._kds[kd_key] = kd
+            self.sources[name] = dict(kd_key=kd_key, method=method, mag=props.pop('mag', 1),
+                                      datatype=props.pop('datatype', None), xyz=props.pop('xyz', True))
+            if len(props) > 0:
+                raise ValueError(f'Unknown properties {list(props.keys())} of source "{name}".')
+        self.n_prefetch = n_prefetch
+        self.n_threads = n_threads
+        self.io_times = defaultdict(float)
+        self.wait_time = 0
+        self.n_reads = 0
+        self.n_dedup_reads = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return f'{type(self).__name__}(sources={list(self.sources.keys())}, n_prefetch={self.n_prefetch})'
+
+    def close(self):
+        """Shut down the loader threads."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _get_kd(self, kd_key: Any) -> 'KnossosDataset':
+        with self._lock:
+            kd = self._kds[kd_key]
+            if isinstance(kd, str):
+                from .basics import kd_factory
+                kd = kd_factory(kd)
+                self._kds[kd_key] = kd
+        return kd
+
+    def _read_key(self, name: str, offset: np.ndarray, size: np.ndarray) -> tuple:
+        src = self.sources[name]
+        return (src['kd_key'], src['method'], tuple(int(o) for o in offset), tuple(int(s) for s in size),
+                src['mag'], np.dtype(src['datatype']).str if src['datatype'] is not None else None)
+
+    def _load(self, name: str, offset: np.ndarray, size: np.ndarray) -> np.ndarray:
+        src = self.sources[name]
+        start = time.time()
+        kd = self._get_kd(src['kd_key'])
+        kwargs = dict(offset=np.array(offset), size=np.array(size), mag=src['mag'])
+        if src['datatype'] is not None:
+            kwargs['datatype'] = src['datatype']
+        arr = getattr(kd, src['method'])(**kwargs)
+        if src['xyz']:
+            arr = arr.swapaxes(0, 2)
+        with self._lock:
+            self.io_times[name] += time.time() - start
+        return arr
+
+    def _submit(self, request: Dict[str, Tuple[np.ndarray, np.ndarray]], sync: bool = False) -> Dict[str, Any]:
+        """
+        Start all distinct reads of `request`.
+
+        Returns:
+            Source name mapped to the future (or array if `sync` is True) holding its volume.
+        """
+        reads = dict()
+        res = dict()
+        for name, (offset, size) in request.items():
+            key = self._read_key(name, offset, size)
+            if key not in reads:
+                if sync:
+                    reads[key] = self._load(name, offset, size)
+                else:
+                    if self._executor is None:
+                        self._executor = ThreadPoolExecutor(max_workers=self.n_threads)
+                    reads[key] = self._executor.submit(self._load, name, offset, size)
+                self.n_reads += 1
+            else:
+                self.n_dedup_reads += 1
+            res[name] = reads[key]
+        return res
+
+    def read(self, request: Dict[str, Tuple[np.ndarray, np.ndarray]]) -> Dict[str, np.ndarray]:
+        """
+        Synchronously load the volumes of a single chunk.
+
+        Args:
+            request: Source name mapped to offset and size (XYZ, in voxels at the source magnification).
+
+        Returns:
+            Source name mapped to its volume.
+        """
+        start = time.time()
+        res = self._submit(request, sync=True)
+        self.wait_time += time.time() - start
+        return res
+
+    def iter_chunks(self, items: Iterable[Any],
+                    request_func: Callable[[Any], Dict[str, Tuple[np.ndarray, np.ndarray]]]
+                    ) -> Iterator[Tuple[Any, Dict[str, np.ndarray]]]:
+        """
+        Iterate over `items` (e.g. chunks) and their volumes. The volumes of the next `n_prefetch` items are
+        loaded in the background while the current item is processed by the caller.
+
+        Args:
+            items: Items, e.g. ``Chunk`` objects or (offset, chunk ID) tuples.
+            request_func: Returns the source name mapped to offset and size for an item, see :meth:`~read`.
+
+        Yields:
+            The item and the source name mapped to its volume.
+        """
+        if self.n_prefetch <= 0:
+            for item in items:
+                yield item, self.read(request_func(item))
+            return
+        items = iter(items)
+        pending = deque()
+        try:
+            for item in items:
+                pending.append((item, self._submit(request_func(item))))
+                if len(pending) <= self.n_prefetch:
+                    continue
+                yield self._collect(*pending.popleft())
+            while len(pending) > 0:
+                yield self._collect(*pending.popleft())
+        finally:
+            for _, futures in pending:
+                for fut in futures.values():
+                    fut.cancel()
+
+    def _collect(self, item: Any, futures: Dict[str, Any]) -> Tuple[Any, Dict[str, np.ndarray]]:
+        start = time.time()
+        res = {name: fut.result() for name, fut in futures.items()}
+        self.wait_time += time.time() - start
+        return item, res
+
+    def stats(self) -> Dict[str, Union[int, float, Dict[str, float]]]:
+        """
+        Returns:
+            Accumulated I/O time per source, time spent waiting for data, number of performed and
+            deduplicated reads.
+        """
+        return dict(io_times=dict(self.io_times), wait_time=self.wait_time, n_reads=self.n_reads,
+                    n_dedup_reads=self.n_dedup_reads)
+
+    def log_stats(self, prefix: str = ''):
+        """Log :meth:`~stats` at debug level."""
+        io_str = ', '.join(f'{k}: {v:.2f}s' for k, v in self.io_times.items())
+        log_handler.debug(f'{prefix}I/O time per source ({io_str}); waited {self.wait_time:.2f}s for data; '
+                          f'{self.n_reads} reads, {self.n_dedup_reads} deduplicated.')
+
+
+class KDWriter:
+    """
+    Background writer queue for KnossosDataset volumes. Jobs (dataset, offset, array) are written by
+    `n_threads` threads, such that computations and write I/O overlap. :meth:`~save_seg` and
+    :meth:`~save_raw` block if the size of the pending arrays would exceed `max_bytes`.
+
+    Notes:
+        * Arrays are only copied if ``copy=True``. Do not modify arrays which were passed with ``copy=False``
+          until :meth:`~flush` returned.
+        * Jobs are executed concurrently if ``n_threads > 1``. As with multiple worker processes, volumes
+          written to the same dataset must not share storage cubes.
+        * Exceptions raised by a job are re-raised by the next call to :meth:`~save_seg`, :meth:`~save_raw`,
+          :meth:`~flush` or :meth:`~close`.
+
+    Examples:
+        Write two outputs per chunk while the next chunk is processed::
+
+            with KDWriter() as writer:
+                for chunk in chunks:
+                    cs, syn = process(chunk)
+                    writer.save_seg(kd_cs, offset=chunk.coordinates, data=cs.swapaxes(0, 2), data_mag=1, mags=[1])
+                    writer.save_seg(kd_syn, offset=chunk.coordinates, data=syn.swapaxes(0, 2), data_mag=1,
+                                    mags=[1])
+
+    Args:
+        n_threads: Number of writer threads.
+        max_bytes: Maximum size of all pending arrays. A single array larger than `max_bytes` is accepted if
+            no other job is pending.
+    """
+
+    def __init__(self, n_threads: int = 2, max_bytes: int = 2 * 1024 ** 3):
+        self.n_threads = n_threads
+        self.max_bytes = max_bytes
+        self.write_time = 0
+        self.wait_time = 0
+        self.n_jobs = 0
+        self._pending_bytes = 0
+        self._n_pending = 0
+        self._error = None
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=n_threads)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:  # do not mask the original exception
+            self._executor.shutdown(wait=True)
+
+    def __repr__(self):
+        return f'{type(self).__name__}(n_threads={self.n_threads}, pending={self._n_pending})'
+
+    def _raise_error(self):
+        if self._error is not None:
+            err, self._error = self._error, None
+            raise err
+
+    def _write(self, kd: 'KnossosDataset', method: str, nbytes: int, kwargs: dict):
+        start = time.time()
+        try:
+            getattr(kd, method)(**kwargs)
+        except Exception as e:
+            log_handler.error(f'Failed to write volume at offset {kwargs.get("offset")} via {method}: {e}')
+            with self._cond:
+                if self._error is None:
+                    self._error = e
+        finally:
+            with self._cond:
+                self.write_time += time.time() - start
+                self._pending_bytes -= nbytes
+                self._n_pending -= 1
+                self._cond.notify_all()
+
+    def submit(self, kd: 'KnossosDataset', method: str, data: np.ndarray, copy: bool = True, **kwargs):
+        """
+        Add a write job.
+
+        Args:
+            kd: Target KnossosDataset.
+            method: 'save_seg' or 'save_raw'.
+            data: Volume (ZYX, as expected by the KnossosDataset).
+            copy: Copy `data` before it is queued. Set to False if `data` is not modified afterwards.
+            **kwargs: Keyword arguments passed to `method`, e.g. ``offset``, ``data_mag`` and ``mags``.
+        """
+        if method not in ('save_seg', 'save_raw'):
+            raise ValueError(f'Unknown write method "{method}".')
+        self._raise_error()
+        if copy:
+            data = np.array(data, copy=True)
+        nbytes = data.nbytes
+        start = time.time()
+        with self._cond:
+            while self._n_pending > 0 and self._pending_bytes + nbytes > self.max_bytes:
+                self._cond.wait()
+            self._pending_bytes += nbytes
+            self._n_pending += 1
+        self.wait_time += time.time() - start
+        self.n_jobs += 1
+        self._executor.submit(self._write, kd, method, nbytes, dict(kwargs, data=data))
+
+    def save_seg(self, kd: 'KnossosDataset', data: np.ndarray, copy: bool = True, **kwargs):
+        """Queue ``kd.save_seg(data=data, **kwargs)``, see :meth:`~submit`."""
+        self.submit(kd, 'save_seg', data, copy=copy, **kwargs)
+
+    def save_raw(self, kd: 'KnossosDataset', data: np.ndarray, copy: bool = True, **kwargs):
+        """Queue ``kd.save_raw(data=data, **kwargs)``, see :meth:`~submit`."""
+        self.submit(kd, 'save_raw', data, copy=copy, **kwargs)
+
+    def flush(self):
+        """Block until all pending jobs are written."""
+        start = time.time()
+        with self._cond:
+            while self._n_pending > 0:
+                self._cond.wait()
+        self.wait_time += time.time() - start
+        self._raise_error()
+
+    def close(self):
+        """Write all pending jobs and shut down the writer threads."""
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def log_stats(self, prefix: str = ''):
+        """Log write and wait times at debug level."""
+        log_handler.debug(f'{prefix}Wrote {self.n_jobs} volumes in {self.write_time:.2f}s (thread time); '
+                          f'waited {self.wait_time:.2f}s for pending writes.')
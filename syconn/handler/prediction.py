@@ -31,6 +31,7 @@ from sklearn.neighbors import KNeighborsClassifier
 from .basics import read_txt_from_zip, get_filepaths_from_dir, \
     parse_cc_dict_from_kzip
 from .compression import load_from_h5py, save_to_h5py
+from .kd_io import KDWriter
 from .. import global_params
 from ..handler import log_handler, log_main, basics
 from ..handler.basics import chunkify
@@ -793,7 +794,9 @@ def dense_predictor(args):
                           f'{tile_shape} to reduce memory requirements.')
             ix = (ix + 1) % 3  # permute spatial dimension which is reduced
 
-    # predict Chunks
+    # predict Chunks; results are written in the background while the next chunk is predicted.
+    # Use a single writer thread: neighboring chunks share the storage cubes of the down-sampled mags
+    writer = KDWriter(n_threads=1)
     for ch_id in chunk_ids:
         ch = cd.chunk_dict[ch_id]
         ol = ch.overlap
@@ -832,15 +835,16 @@ def dense_predictor(args):
                     # -> store probability map.
                     data = pred[label]
             if save_as_raw:
-                target_kd_dict[path].save_raw(
-                    offset=ch.coordinates * mag, data=data.astype(np.uint8),
+                writer.save_raw(
+                    target_kd_dict[path], offset=ch.coordinates * mag, data=data.astype(np.uint8),
                     data_mag=mag, mags=[mag, mag * 2, mag * 4],
-                    fast_resampling=True, upsample=False)
+                    fast_resampling=True, upsample=False, copy=False)
             else:
-                target_kd_dict[path].save_seg(
-                    offset=ch.coordinates * mag, data=data, data_mag=mag,
+                writer.save_seg(
+                    target_kd_dict[path], offset=ch.coordinates * mag, data=data, data_mag=mag,
                     mags=[mag, mag * 2, mag * 4],
-                    fast_resampling=True, upsample=False)
+                    fast_resampling=True, upsample=False, copy=False)
+    writer.close()
 
 
 def dense_predicton_helper(raw: np.ndarray, predictor: 'Predictor', is_zyx=False,
@@ -31,6 +31,7 @@ from scipy import spatial
 from scipy.spatial import cKDTree
 from sklearn.preprocessing import label_binarize
 from syconn import global_params
+from syconn.backend.cache import get_object_cache, file_token
 from syconn.handler import log_handler
 from syconn.handler.basics import chunkify_successive, chunkify
 from syconn.mp.mp_utils import start_multiprocess_imap
@@ -513,9 +514,22 @@ def predict_pts_plain(ssd_kwargs: Union[dict, Iterable], model_loader: Callable,
     return dict_out
 
 
-@functools.lru_cache(256)
 def _load_ssv_hc_cached(args):
-    return _load_ssv_hc(args)
+    """
+    Cached version of :func:`~_load_ssv_hc`. Uses the process-wide object cache (keyed by the SSV and the
+    loader arguments) instead of keeping the SSV objects themselves alive. Cached clouds are invalidated if
+    the skeleton or mesh storage of the SSV changed.
+    """
+    ssv = args[0]
+    cache = get_object_cache()
+    key = ssv._object_cache_key(('hc', ) + tuple(args[1:]))
+    token = (file_token(ssv.skeleton_path), file_token(ssv.mesh_dc_path))
+    hc = cache.get(key, token)
+    if hc is None:
+        hc = _load_ssv_hc(args)
+        # the loader might have written the skeleton
+        cache.put(key, hc, (file_token(ssv.skeleton_path), file_token(ssv.mesh_dc_path)))
+    return hc
 
 
 def _load_ssv_hc(args):
@@ -4,10 +4,12 @@
 # Copyright (c) 2016 - now
 # Max Planck Institute of Neurobiology, Martinsried, Germany
 # Authors: Philipp Schubert, Joergen Kornfeld
+import heapq
 import itertools
-from typing import List, Any, Optional, TYPE_CHECKING
+from typing import List, Any, Optional, Union, Tuple, TYPE_CHECKING
 
 import networkx as nx
+import numba
 import numpy as np
 import tqdm
 from knossos_utils.skeleton import Skeleton, SkeletonAnnotation, SkeletonNode
@@ -40,16 +42,11 @@ def bfs_smoothing(vertices, vertex_labels, max_edge_length=120, n_voting=40):
         smoothed vertex labels
 
     """
-    G = create_graph_from_coords(vertices, max_dist=max_edge_length, mst=False,
-                                 force_single_cc=False)
-    # create BFS subset
-    bfs_nn = split_subcc(G, max_nb=n_voting, verbose=False)
+    # same graph as ``create_graph_from_coords(vertices, max_dist=max_edge_length, force_single_cc=False)``
+    pairs = spatial.cKDTree(vertices).query_pairs(r=max_edge_length, output_type="ndarray")
     new_vertex_labels = np.zeros_like(vertex_labels)
-    for ii in range(len(vertex_labels)):
-        curr_labels = vertex_labels[bfs_nn[ii]]
-        labels, counts = np.unique(curr_labels, return_counts=True)
-        majority_label = labels[np.argmax(counts)]
-        new_vertex_labels[ii] = majority_label
+    new_vertex_labels[:] = neighborhood_majority_vote(pairs, vertex_labels, max_nb=n_voting).reshape(
+        new_vertex_labels.shape)
     return new_vertex_labels
 
 
@@ -700,7 +697,8 @@ def svgraph2kzip(ssv: 'SuperSegmentationObject', kzip_path: str):
 
 def stitch_skel_nx(skel_nx: nx.Graph, n_jobs: int = 1) -> nx.Graph:
     """
-    Stitch connected components within a graph by recursively adding edges between the closest components.
+    Stitch connected components within a graph by adding the edges of a minimum spanning tree over the
+    components, see :func:`connect_components_mst`.
 
     Args:
         skel_nx: Networkx graph. Nodes require 'position' attribute.
@@ -711,29 +709,428 @@ def stitch_skel_nx(skel_nx: nx.Graph, n_jobs: int = 1) -> nx.Graph:
     """
     if skel_nx.number_of_nodes() == 0:
         return skel_nx
-    no_of_seg = nx.number_connected_components(skel_nx)
-    if no_of_seg == 1:
+    if nx.number_connected_components(skel_nx) == 1:
         return skel_nx
-
-    skel_nx_nodes = np.array([skel_nx.nodes[ix]['position'] for ix in skel_nx.nodes()], dtype=np.int64)
-
-    while no_of_seg != 1:
-        rest_nodes = []
-        rest_nodes_ixs = []
-        list_of_comp = np.array([c for c in sorted(nx.connected_components(skel_nx), key=len, reverse=True)])
-        for single_rest_graph in list_of_comp[1:]:
-            rest_nodes += [skel_nx_nodes[int(ix)] for ix in single_rest_graph]
-            rest_nodes_ixs += list(single_rest_graph)
-        current_set_of_nodes = [skel_nx_nodes[int(ix)] for ix in list_of_comp[0]]
-        current_set_of_nodes_ixs = list(list_of_comp[0])
-        tree = spatial.cKDTree(rest_nodes, 1)
-
-        thread_lengths, indices = tree.query(current_set_of_nodes, n_jobs=n_jobs)
-
-        start_thread_index = np.argmin(thread_lengths)
-        stop_thread_index = indices[start_thread_index]
-        e1 = current_set_of_nodes_ixs[start_thread_index]
-        e2 = rest_nodes_ixs[stop_thread_index]
-        skel_nx.add_edge(e1, e2)
-        no_of_seg -= 1
+    nodes = list(skel_nx.nodes())
+    node_ixs = {n: ii for ii, n in enumerate(nodes)}
+    coords = np.array([skel_nx.nodes[n]['position'] for n in nodes], dtype=np.float64)
+    edges = np.array([(node_ixs[e1], node_ixs[e2]) for e1, e2 in skel_nx.edges()], dtype=np.int64)
+    new_edges = connect_components_mst(coords, edges, n_jobs=n_jobs)
+    skel_nx.add_edges_from([(nodes[e1], nodes[e2]) for e1, e2 in new_edges])
     return skel_nx
+
+
+@numba.jit(nopython=True)
+def _uf_find(parent: np.ndarray, x: int) -> int:
+    while parent[x] != x:
+        parent[x] = parent[parent[x]]  # path halving
+        x = parent[x]
+    return x
+
+
+@numba.jit(nopython=True)
+def _uf_union(parent: np.ndarray, a: np.ndarray, b: np.ndarray) -> int:
+    n_merged = 0
+    for ii in range(len(a)):
+        ra = _uf_find(parent, a[ii])
+        rb = _uf_find(parent, b[ii])
+        # the smallest element index is the root of every component
+        if ra < rb:
+            parent[rb] = ra
+            n_merged += 1
+        elif rb < ra:
+            parent[ra] = rb
+            n_merged += 1
+    return n_merged
+
+
+@numba.jit(nopython=True)
+def _uf_roots(parent: np.ndarray, ixs: np.ndarray) -> np.ndarray:
+    roots = np.empty(len(ixs), dtype=parent.dtype)
+    for ii in range(len(ixs)):
+        roots[ii] = _uf_find(parent, ixs[ii])
+    return roots
+
+
+class UnionFind:
+    """
+    Array-based disjoint-set forest (union-find) over the elements ``0, .., n - 1``. Memory consumption is a
+    single int64 array of length `n`; unions of edge arrays are performed in a numba kernel.
+
+    Examples:
+        Connected components of a graph given by its edge list::
+
+            uf = UnionFind(n_nodes)
+            uf.union(edges[:, 0], edges[:, 1])
+            labels = uf.labels()
+
+    Args:
+        n: Number of elements.
+    """
+
+    def __init__(self, n: int):
+        self.parent = np.arange(n, dtype=np.int64)
+        self.n_components = n
+
+    def __len__(self):
+        return len(self.parent)
+
+    def union(self, a: Union[int, np.ndarray], b: Union[int, np.ndarray]):
+        """
+        Merge the components of ``a[i]`` and ``b[i]`` for every i.
+
+        Args:
+            a: Element index or array of element indices.
+            b: Element index or array of element indices, same length as `a`.
+        """
+        a = np.atleast_1d(np.asarray(a, dtype=np.int64))
+        b = np.atleast_1d(np.asarray(b, dtype=np.int64))
+        if len(a) != len(b):
+            raise ValueError(f'Length of index arrays differ: {len(a)} vs. {len(b)}.')
+        if len(a) > 0:
+            self.n_components -= _uf_union(self.parent, a, b)
+
+    def find(self, ixs: Optional[Union[int, np.ndarray]] = None) -> Union[int, np.ndarray]:
+        """
+        Args:
+            ixs: Element index or array of element indices. All elements if None.
+
+        Returns:
+            Root (smallest element index of the component) of every element in `ixs`.
+        """
+        if ixs is None:
+            ixs = np.arange(len(self.parent))
+        elif np.isscalar(ixs):
+            return int(_uf_find(self.parent, int(ixs)))
+        return _uf_roots(self.parent, np.asarray(ixs, dtype=np.int64))
+
+    def connected(self, a: int, b: int) -> bool:
+        """
+        Returns:
+            True if `a` and `b` are in the same component.
+        """
+        return self.find(a) == self.find(b)
+
+    def labels(self) -> np.ndarray:
+        """
+        Returns:
+            Component label of every element. Labels are consecutive and ordered by the first occurrence of
+            the component.
+        """
+        return np.unique(self.find(), return_inverse=True)[1].ravel()
+
+
+def split_by_labels(labels: np.ndarray) -> List[np.ndarray]:
+    """
+    Group element indices by their label.
+
+    Args:
+        labels: Consecutive labels ``0, .., n_labels - 1`` of every element, e.g. from :meth:`UnionFind.labels`.
+
+    Returns:
+        Element indices of every label.
+    """
+    if len(labels) == 0:
+        return []
+    order = np.argsort(labels, kind='stable')
+    return np.split(order, np.cumsum(np.bincount(labels))[:-1])
+
+
+def union_voxel_neighbors(uf: UnionFind, voxels: np.ndarray, max_dist: float = 2, offset: int = 0):
+    """
+    Merge all voxels which are at most `max_dist` voxels apart (euclidean distance). Neighbors are looked up
+    via sorted linear voxel indices within the bounding box of `voxels`, i.e. no KD-tree and only O(N) memory
+    is required.
+
+    Args:
+        uf: Union-find structure.
+        voxels: Unique integer voxel coordinates, shape (N, 3).
+        max_dist: Maximum distance between connected voxels in voxels.
+        offset: Index of the first voxel in `uf`.
+    """
+    if len(voxels) == 0:
+        return
+    voxels = np.asarray(voxels, dtype=np.int64)
+    bb_min = voxels.min(axis=0)
+    r = int(np.floor(max_dist))
+    # pad the bounding box such that neighbors never wrap around
+    shape = voxels.max(axis=0) - bb_min + 2 * r + 1
+    voxels = voxels - bb_min + r
+    keys = np.ravel_multi_index(voxels.T, shape)
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+    for dx, dy, dz in itertools.product(range(-r, r + 1), repeat=3):
+        # only half of the symmetric neighborhood is required
+        if (dx, dy, dz) <= (0, 0, 0) or dx ** 2 + dy ** 2 + dz ** 2 > max_dist ** 2:
+            continue
+        neigh_keys = keys + (dx * shape[1] + dy) * shape[2] + dz
+        pos = np.clip(np.searchsorted(sorted_keys, neigh_keys), 0, len(keys) - 1)
+        found = sorted_keys[pos] == neigh_keys
+        if np.any(found):
+            uf.union(np.flatnonzero(found) + offset, order[pos[found]] + offset)
+
+
+def union_radius_neighbors(uf: UnionFind, coords: np.ndarray, radius: float, offset: int = 0,
+                           batch_size: int = 10000):
+    """
+    Merge all points which are at most `radius` apart. Neighbors are queried in batches to limit the
+    memory consumption.
+
+    Args:
+        uf: Union-find structure.
+        coords: Point coordinates, shape (N, 3).
+        radius: Maximum distance between connected points.
+        offset: Index of the first point in `uf`.
+        batch_size: Number of points queried at once.
+    """
+    if len(coords) == 0:
+        return
+    kdtree = spatial.cKDTree(coords)
+    for start in range(0, len(coords), batch_size):
+        neighbors = kdtree.query_ball_point(coords[start:start + batch_size], r=radius)
+        lengths = np.array([len(n) for n in neighbors])
+        if np.sum(lengths) == 0:
+            continue
+        src = np.repeat(np.arange(start, start + len(neighbors)), lengths)
+        uf.union(src + offset, np.concatenate(neighbors).astype(np.int64) + offset)
+
+
+def _closest_foreign_neighbors(labels: np.ndarray, ixs: np.ndarray, dists: np.ndarray, nn_ixs: np.ndarray) \
+        -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Args:
+        labels: Group label of every node.
+        ixs: Indices of the query nodes.
+        dists: Distances to the nearest neighbors of the query nodes, sorted in ascending order.
+        nn_ixs: Indices of the nearest neighbors of the query nodes.
+
+    Returns:
+        Distance to and index of the closest neighbor in a different group (inf if there is none within the
+        nearest neighbors) and a lower bound of this distance (inf if the closest neighbor was found).
+    """
+    cross = labels[nn_ixs] != labels[ixs, None]
+    has_cross = np.any(cross, axis=1)
+    first_cross = np.argmax(cross, axis=1)
+    rows = np.arange(len(ixs))
+    foreign_dists = np.where(has_cross, dists[rows, first_cross], np.inf)
+    lower_bounds = np.where(has_cross, np.inf, dists[:, -1])
+    return foreign_dists, nn_ixs[rows, first_cross], lower_bounds
+
+
+def connect_components_mst(coords: np.ndarray, edges: np.ndarray, k: int = 8, n_jobs: int = 1) -> np.ndarray:
+    """
+    Edges which join all connected components of a graph with minimal total edge length, i.e. a minimum
+    spanning tree over the component graph with the distance of the closest node pair as edge weight. The tree is
+    built with Boruvka steps: every group of components is joined to its closest other group at once. Closest
+    node pairs are looked up in the `k` nearest neighbors of every node, which are queried only once. Nodes of
+    groups for which this does not suffice are queried again with an increasing number of neighbors.
+
+    Args:
+        coords: Node coordinates (N, D).
+        edges: Node index pairs (M, 2).
+        k: Number of nearest neighbors queried for every node.
+        n_jobs: Number of jobs used for the query of cKDTree.
+
+    Returns:
+        Node index pairs (C - 1, 2) of the additional edges, with C the number of connected components.
+    """
+    n = len(coords)
+    coords = np.asarray(coords, dtype=np.float64).reshape(n, -1)
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    uf = UnionFind(n)
+    uf.union(edges[:, 0], edges[:, 1])
+    new_edges = [np.zeros((0, 2), dtype=np.int64)]
+    if uf.n_components <= 1:
+        return new_edges[0]
+    tree = spatial.cKDTree(coords)
+    k = min(k + 1, n)
+    dists, nn_ixs = tree.query(coords, k=k, n_jobs=n_jobs)
+    dists, nn_ixs = dists.reshape(n, -1), nn_ixs.reshape(n, -1)
+    all_ixs = np.arange(n)
+    while uf.n_components > 1:
+        labels = uf.labels()
+        n_groups = uf.n_components
+        foreign_dists, partners, lower_bounds = _closest_foreign_neighbors(labels, all_ixs, dists, nn_ixs)
+        k_curr = k
+        while True:
+            group_dists = np.full(n_groups, np.inf)
+            np.minimum.at(group_dists, labels, foreign_dists)
+            group_bounds = np.full(n_groups, np.inf)
+            np.minimum.at(group_bounds, labels, lower_bounds)
+            # nodes whose closest neighbor in a different group might be closer than the current candidate
+            requery = np.flatnonzero(lower_bounds < group_dists[labels])
+            if len(requery) == 0:
+                break
+            k_curr = min(2 * k_curr, n)
+            # large groups are resolved by a single query of their own KD-tree with all other nodes
+            group_sizes = np.bincount(labels, minlength=n_groups)
+            for group in np.unique(labels[requery]):
+                if group_sizes[group] * k_curr <= n:
+                    continue
+                members = np.flatnonzero(labels == group)
+                others = np.flatnonzero(labels != group)
+                d, ixs = spatial.cKDTree(coords[members]).query(coords[others], n_jobs=n_jobs)
+                closest = np.argmin(d)
+                foreign_dists[members[ixs[closest]]] = d[closest]
+                partners[members[ixs[closest]]] = others[closest]
+                lower_bounds[members] = np.inf
+            requery = requery[group_sizes[labels[requery]] * k_curr <= n]
+            if len(requery) == 0:
+                continue
+            d, ixs = tree.query(coords[requery], k=k_curr, n_jobs=n_jobs)
+            foreign_dists[requery], partners[requery], lower_bounds[requery] = _closest_foreign_neighbors(
+                labels, requery, d.reshape(len(requery), -1), ixs.reshape(len(requery), -1))
+        # closest node pair of every group
+        order = np.lexsort((foreign_dists, labels))
+        best = order[np.searchsorted(labels[order], np.arange(n_groups))]
+        candidates = np.stack([np.minimum(best, partners[best]), np.maximum(best, partners[best])], axis=1)
+        # add the closest connections first, skip connections between already joined groups
+        for ix1, ix2 in candidates[np.lexsort((candidates[:, 1], candidates[:, 0], group_dists))]:
+            if not uf.connected(ix1, ix2):
+                uf.union(ix1, ix2)
+                new_edges.append(np.array([[ix1, ix2]], dtype=np.int64))
+    return np.concatenate(new_edges)
+
+
+def csr_adjacency(edges: np.ndarray, n_nodes: int, weights: Optional[np.ndarray] = None) \
+        -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Undirected adjacency of a graph in compressed sparse row format. The neighbors of every node are in the
+    order of the edges, i.e. the same order as the adjacency of a ``nx.Graph`` built via ``add_edges_from(edges)``.
+
+    Args:
+        edges: Node index pairs, shape (M, 2).
+        n_nodes: Number of nodes.
+        weights: Edge weights, shape (M,). Defaults to 1.
+
+    Returns:
+        Row pointers (N + 1), neighbor indices and weights (2M each). The neighbors of node i are
+        ``indices[indptr[i]:indptr[i + 1]]``.
+    """
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    if weights is None:
+        weights = np.ones(len(edges), dtype=np.float64)
+    src = edges.ravel()  # interleaved: (e1, e2) of edge 0, (e1, e2) of edge 1, ..
+    dst = edges[:, ::-1].ravel()
+    order = np.argsort(src, kind='stable')
+    indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n_nodes), out=indptr[1:])
+    return indptr, dst[order], np.repeat(np.asarray(weights, dtype=np.float64), 2)[order]
+
+
+@numba.jit(nopython=True)
+def _majority_code(nodes: np.ndarray, n_nodes: int, codes: np.ndarray, counts: np.ndarray) -> int:
+    # `counts` is a zeroed scratch array of length n_labels and is reset before returning
+    for ii in range(n_nodes):
+        counts[codes[nodes[ii]]] += 1
+    best = codes[nodes[0]]
+    for ii in range(n_nodes):
+        c = codes[nodes[ii]]
+        if counts[c] > counts[best] or (counts[c] == counts[best] and c < best):
+            best = c
+    for ii in range(n_nodes):
+        counts[codes[nodes[ii]]] = 0
+    return best
+
+
+@numba.jit(nopython=True)
+def _bfs_majority_codes(indptr: np.ndarray, indices: np.ndarray, codes: np.ndarray, n_labels: int,
+                        max_nb: int) -> np.ndarray:
+    n = len(indptr) - 1
+    res = np.empty(n, dtype=np.int64)
+    counts = np.zeros(n_labels, dtype=np.int64)
+    # visit stamp of every node, avoids resetting a visited mask for every source
+    stamp = np.full(n, -1, dtype=np.int64)
+    queue = np.empty(max_nb + 1, dtype=np.int64)
+    for src in range(n):
+        stamp[src] = src
+        queue[0] = src
+        n_queued = 1
+        head = 0
+        while head < n_queued and n_queued <= max_nb:
+            u = queue[head]
+            head += 1
+            for jj in range(indptr[u], indptr[u + 1]):
+                v = indices[jj]
+                if stamp[v] != src:
+                    stamp[v] = src
+                    queue[n_queued] = v
+                    n_queued += 1
+                    if n_queued > max_nb:
+                        break
+        res[src] = _majority_code(queue, n_queued, codes, counts)
+    return res
+
+
+@numba.jit(nopython=True)
+def _dijkstra_majority_codes(indptr: np.ndarray, indices: np.ndarray, weights: np.ndarray, codes: np.ndarray,
+                             n_labels: int, max_dist: float) -> np.ndarray:
+    n = len(indptr) - 1
+    res = np.empty(n, dtype=np.int64)
+    counts = np.zeros(n_labels, dtype=np.int64)
+    dist = np.full(n, np.inf)
+    done = np.zeros(n, dtype=np.bool_)
+    touched = np.empty(n, dtype=np.int64)
+    for src in range(n):
+        dist[src] = 0.
+        touched[0] = src
+        n_touched = 1
+        heap = [(0., src)]
+        while len(heap) > 0:
+            d, u = heapq.heappop(heap)
+            if done[u]:
+                continue
+            done[u] = True
+            for jj in range(indptr[u], indptr[u + 1]):
+                v = indices[jj]
+                nd = d + weights[jj]
+                if nd <= max_dist and nd < dist[v]:
+                    if dist[v] == np.inf:
+                        touched[n_touched] = v
+                        n_touched += 1
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        # every touched node is reached within `max_dist`
+        res[src] = _majority_code(touched, n_touched, codes, counts)
+        for ii in range(n_touched):
+            dist[touched[ii]] = np.inf
+            done[touched[ii]] = False
+    return res
+
+
+def neighborhood_majority_vote(edges: np.ndarray, labels: np.ndarray, max_nb: Optional[int] = None,
+                               max_dist: Optional[float] = None, weights: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Majority label of the neighborhood of every node in a graph. A neighborhood is either given by the
+    source node and the first `max_nb` nodes discovered by a breadth-first search (same order as
+    ``nx.bfs_edges``) or by all nodes within a path length of `max_dist` (``nx.single_source_dijkstra_path``
+    with cutoff). Traversals and votes run in numba kernels on the CSR adjacency, see :func:`csr_adjacency`;
+    the label counts are only kept for the current neighborhood. Ties are resolved in favor of the smallest
+    label (as ``np.unique`` + ``np.argmax``).
+
+    Args:
+        edges: Node index pairs, shape (M, 2).
+        labels: Label of every node, shape (N,).
+        max_nb: Number of collected nodes during the breadth-first search (excluding the source node).
+        max_dist: Maximum path length, requires `weights`.
+        weights: Edge weights, shape (M,).
+
+    Returns:
+        Majority label of every node, shape (N,).
+    """
+    if (max_nb is None) == (max_dist is None):
+        raise ValueError('Either "max_nb" or "max_dist" must be given.')
+    labels = np.asarray(labels).reshape(-1)
+    uniq_labels, codes = np.unique(labels, return_inverse=True)
+    codes = codes.reshape(-1).astype(np.int64)
+    if len(labels) == 0:
+        return uniq_labels
+    indptr, indices, csr_weights = csr_adjacency(edges, len(labels), weights)
+    if max_nb is not None:
+        maj_codes = _bfs_majority_codes(indptr, indices, codes, len(uniq_labels), int(max_nb))
+    else:
+        if weights is None:
+            raise ValueError('"max_dist" requires edge weights.')
+        maj_codes = _dijkstra_majority_codes(indptr, indices, csr_weights, codes, len(uniq_labels),
+                                             float(max_dist))
+    return uniq_labels[maj_codes]
@@ -18,8 +18,10 @@ from plyfile import PlyData, PlyElement
 from scipy import spatial
 from scipy.ndimage import zoom
 from scipy.ndimage.morphology import binary_erosion
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 from sklearn.decomposition import PCA
-from zmesh import Mesher
+from zmesh import Mesher, Mesh
 try:
     from vigra.filters import gaussianGradient
 except ImportError:
@@ -62,7 +64,7 @@ if TYPE_CHECKING:
 __all__ = ['MeshObject', 'get_object_mesh', 'merge_meshes', 'calc_contact_syn_mesh',
            'get_random_centered_coords', 'write_mesh2kzip', 'write_meshes2kzip', 'gen_mesh_voxelmask',
            'compartmentalize_mesh', 'mesh_chunk', 'mesh_creator_sso', 'merge_meshes_incl_norm',
-           'mesh_area_calc', 'mesh2obj_file', 'calc_rot_matrices', 'merge_someshes', 'find_meshes',
+           'mesh_area_calc', 'mesh2obj_file', 'calc_rot_matrices', 'merge_someshes', 'find_meshes', 'stitch_meshes',
            ]
 
 
@@ -519,6 +521,99 @@ def merge_meshes_incl_norm(ind_lst, vert_lst, norm_lst, nb_simplices=3):
     return [all_ind, all_vert, all_norm]
 
 
+def stitch_meshes(ind_lst: List[np.ndarray], vert_lst: List[np.ndarray], norm_lst: List[np.ndarray],
+                  weld_tolerance: float = 1, simplify: bool = False, scaling: Optional[np.ndarray] = None,
+                  simplification_factor: int = 0, max_simplification_error: float = 40,
+                  **kwargs) -> List[np.ndarray]:
+    """
+    Combine the partial meshes of an object which spans several chunks (e.g. the output of
+    :func:`~find_meshes` of every chunk) into a single mesh. In contrast to :func:`~merge_meshes_incl_norm`,
+    vertices at the shared chunk faces are welded and duplicated faces are removed:
+
+        * Vertices which are at most `weld_tolerance` apart are merged (transitively). Normals of welded
+          vertices are averaged.
+        * Faces which collapsed to a line or point are dropped.
+        * Faces which occur multiple times with the same orientation are kept once, faces which occur with
+          opposite orientations (interior walls between two chunks) are dropped entirely.
+        * Unreferenced vertices are removed.
+
+    Args:
+        ind_lst: Flat face arrays.
+        vert_lst: Flat vertex arrays in nm.
+        norm_lst: Flat normal arrays. Empty arrays if normals are not available.
+        weld_tolerance: Maximum distance in nm between welded vertices.
+        simplify: Re-simplify the stitched mesh via ``zmesh.Mesher.simplify``.
+        scaling: Voxel size of the meshed segmentation (including downsampling) in nm, used for
+            simplification. Defaults to ``global_params.config['scaling']``.
+        simplification_factor: Target reduction factor of the number of faces used for simplification.
+        max_simplification_error: Maximum vertex displacement in nm used for simplification.
+        **kwargs: Remaining meshing properties, ignored.
+
+    Returns:
+        Flat faces (uint32), vertices (float32) and normals (float32).
+    """
+    ind, vert, norm = merge_meshes_incl_norm(ind_lst, vert_lst, norm_lst)
+    vert = vert.reshape(-1, 3).astype(np.float32, copy=False)
+    faces = ind.reshape(-1, 3).astype(np.int64)
+    if len(faces) == 0:
+        return [np.zeros((0,), dtype=np.uint32), np.zeros((0,), dtype=np.float32),
+                np.zeros((0,), dtype=np.float32)]
+    has_norm = len(norm) == vert.size
+    norm = norm.reshape(-1, 3) if has_norm else None
+
+    # weld vertices within `weld_tolerance`; a radius query does not separate close vertices at grid cell borders
+    pairs = spatial.cKDTree(vert).query_pairs(weld_tolerance, output_type='ndarray')
+    adj = coo_matrix((np.ones(len(pairs), dtype=bool), (pairs[:, 0], pairs[:, 1])), shape=(len(vert), len(vert)))
+    inv = connected_components(adj, directed=False)[1]
+    first_ix = np.unique(inv, return_index=True)[1]
+    faces = inv[faces]
+    if has_norm:
+        welded_norm = np.zeros((len(first_ix), 3), dtype=np.float64)
+        np.add.at(welded_norm, inv, norm)
+        lengths = np.linalg.norm(welded_norm, axis=1)
+        lengths[lengths == 0] = 1
+        norm = (welded_norm / lengths[:, None]).astype(np.float32)
+    vert = vert[first_ix]
+
+    # remove degenerated faces
+    faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])]
+
+    # remove duplicated faces; rotate every face such that its smallest index comes first (preserves the
+    # orientation), the orientation is then given by the order of the remaining two indices
+    shift = np.argmin(faces, axis=1)
+    faces = faces[np.arange(len(faces))[:, None], (shift[:, None] + np.arange(3)) % 3]
+    orientation = np.where(faces[:, 1] < faces[:, 2], 1, -1)
+    _, first_ix, inv, counts = np.unique(np.sort(faces, axis=1), axis=0, return_index=True, return_inverse=True,
+                                         return_counts=True)
+    inv = inv.ravel()
+    orientation_sum = np.bincount(inv, weights=orientation, minlength=len(first_ix))
+    keep = np.abs(orientation_sum) == counts  # all duplicates have the same orientation
+    faces = faces[np.sort(first_ix[keep])]
+
+    # remove unreferenced vertices
+    used, faces = np.unique(faces, return_inverse=True)
+    faces = faces.reshape(-1, 3)
+    vert = vert[used]
+    if has_norm:
+        norm = norm[used]
+
+    if simplify and len(faces) > 0:
+        if scaling is None:
+            scaling = global_params.config['scaling']
+        mesher = Mesher(np.array(scaling))
+        try:
+            tmp = mesher.simplify(Mesh(vert, faces.astype(np.uint32), None), reduction_factor=simplification_factor,
+                                  max_error=max_simplification_error, compute_normals=has_norm)
+        except ValueError as e:  # vertex coordinates exceed the simplifier representation limit
+            log_proc.warning(f'Could not simplify stitched mesh: {e}')
+        else:
+            faces, vert = tmp.faces, tmp.vertices
+            if has_norm:
+                norm = tmp.normals
+    return [faces.flatten().astype(np.uint32), vert.flatten().astype(np.float32),
+            norm.flatten().astype(np.float32) if has_norm else np.zeros((0,), dtype=np.float32)]
+
+
 def _mesh_loader(so):
     return so.mesh
 
@@ -937,7 +1032,8 @@ def mesh_creator_sso(ssv: 'super_segmentation_object.SuperSegmentationObject',
 def find_meshes(chunk: np.ndarray, offset: np.ndarray, pad: int = 0,
                 ds: Optional[Union[list, tuple, np.ndarray]] = None,
                 scaling: Optional[Union[tuple, list, np.ndarray]] = None,
-                meshing_props: Optional[dict] = None) -> Dict[int, List[np.ndarray]]:
+                meshing_props: Optional[dict] = None,
+                obj_ids: Optional[np.ndarray] = None) -> Dict[int, List[np.ndarray]]:
     """
     Find meshes within a segmented cube. The offset is given in voxels. Mesh vertices are scaled according to
     ``global_params.config['scaling']``.
@@ -949,6 +1045,7 @@ def find_meshes(chunk: np.ndarray, offset: np.ndarray, pad: int = 0,
         ds: Downsampling array in xyz. Default: No downsampling.
         scaling: Voxel size.
         meshing_props: Keyword arguments used in ``zmesh.Mesher.get_mesh``.
+        obj_ids: IDs of all objects in `chunk`, if already known. Will be computed if None.
 
     Returns:
         The mesh of each segmentation ID in the input `chunk`. Vertices are in nm!
@@ -961,7 +1058,7 @@ def find_meshes(chunk: np.ndarray, offset: np.ndarray, pad: int = 0,
         meshing_props = global_params.config['meshes']['meshing_props']
     offset = offset * scaling
     # keep small segmentation objects
-    seg_objs = set(np.unique(chunk))
+    seg_objs = set(np.unique(chunk) if obj_ids is None else obj_ids)
     if 0 in seg_objs:
         seg_objs.remove(0)
     meshes = {ix: [np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.float32),
@@ -1011,14 +1108,16 @@ def mesh_chunk(args):
         raise NotImplementedError("Object type '{}' must be one of the following:\n"
                                   "{}".format(obj_type, str(valid_obj_types)))
     ds = global_params.config['meshes']['downsampling'][obj_type]
+    min_obj_vx = global_params.config['meshes']['mesh_min_obj_vx']
+    mesh_ixs = []
     for ix in obj_ixs:
-        min_obj_vx = global_params.config['meshes']['mesh_min_obj_vx']
         if ad[ix]['size'] < min_obj_vx:
             md[ix] = [np.zeros((0,), dtype=np.int32), np.zeros((0,), dtype=np.int32),
                       np.zeros((0,), dtype=np.float32)]
-            continue
-        # create binary mask as single 3D cube
-        mask, off = voxel_dc.get_voxel_data_cubed(ix)
+        else:
+            mesh_ixs.append(ix)
+    # create binary masks as single 3D cubes; segmentation cubes shared by neighboring objects are read once
+    for ix, mask, off in voxel_dc.iter_voxelmask_offset_bulk(mesh_ixs, cubed=True):
         # create mesh
         indices, vertices, normals = find_meshes(mask, off, pad=1, ds=ds, scaling=scaling, meshing_props=meshing_props)[
             ix]
@@ -457,13 +457,194 @@ def multi_view_sso(sso, colors=None, obj_to_render=('sv',),
     return np.concatenate(c_views)
 
 
+def init_atlas(ws, n_tiles, max_size):
+    """
+    Create and bind a framebuffer object with color and depth render buffers which holds
+    a grid of `ws`-sized tiles (view atlas).
+
+    Args:
+        ws: tuple
+            Window size of a single view.
+        n_tiles: int
+            Number of requested tiles, the grid is limited by `max_size`.
+        max_size: int
+            Maximum edge length of the atlas in pixels.
+
+    Returns: tuple
+        Framebuffer, render buffers, number of tile columns and rows. None if no
+        complete framebuffer could be created.
+    """
+    max_size = min(max_size, int(glGetIntegerv(GL_MAX_RENDERBUFFER_SIZE)),
+                   *[int(d) for d in glGetIntegerv(GL_MAX_VIEWPORT_DIMS)])
+    n_cols = max(1, min(n_tiles, max_size // ws[0]))
+    n_rows = max(1, min(int(np.ceil(n_tiles / n_cols)), max_size // ws[1]))
+    fbo = glGenFramebuffers(1)
+    glBindFramebuffer(GL_FRAMEBUFFER, fbo)
+    rbos = glGenRenderbuffers(2)
+    for rbo, fmt, attachment in zip(rbos, [GL_RGBA8, GL_DEPTH_COMPONENT24],
+                                    [GL_COLOR_ATTACHMENT0, GL_DEPTH_ATTACHMENT]):
+        glBindRenderbuffer(GL_RENDERBUFFER, rbo)
+        glRenderbufferStorage(GL_RENDERBUFFER, fmt, n_cols * ws[0], n_rows * ws[1])
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, attachment, GL_RENDERBUFFER, rbo)
+    if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+        delete_atlas((fbo, rbos, n_cols, n_rows))
+        return None
+    return fbo, rbos, n_cols, n_rows
+
+
+def delete_atlas(atlas):
+    """
+    Delete the view atlas created by :func:`init_atlas` and bind the default framebuffer.
+
+    Args:
+        atlas: tuple
+    """
+    fbo, rbos = atlas[:2]
+    glBindFramebuffer(GL_FRAMEBUFFER, 0)
+    glDeleteRenderbuffers(len(rbos), rbos)
+    glDeleteFramebuffers(1, [fbo])
+
+
+def read_atlas(ws, n_cols, n_rows, n_tiles, colored=False, depth_map=False, clahe=False):
+    """
+    Read the view atlas with a single transfer and split it into its tiles (row-major
+    order). Views are post-processed as in :func:`screen_shot`.
+
+    Args:
+        ws: tuple
+        n_cols: int
+        n_rows: int
+        n_tiles: int
+            Number of returned tiles.
+        colored: bool
+        depth_map: bool
+        clahe: bool
+
+    Returns: np.array
+        [n_tiles, ws[1], ws[0]] or [n_tiles, ws[1], ws[0], 4] if `colored`.
+    """
+    if depth_map:
+        fmt, n_channels = GL_DEPTH_COMPONENT, 1
+    elif colored:
+        fmt, n_channels = GL_RGBA, 4
+    else:
+        fmt, n_channels = GL_RGB, 3
+    glPixelStorei(GL_PACK_ALIGNMENT, 1)
+    glReadBuffer(GL_COLOR_ATTACHMENT0)
+    data = glReadPixels(0, 0, n_cols * ws[0], n_rows * ws[1], fmt, GL_UNSIGNED_BYTE)
+    data = np.frombuffer(data, dtype=np.uint8).reshape(n_rows, ws[1], n_cols, ws[0], n_channels)
+    # the origin of OpenGL is the lower left corner
+    data = data.transpose(0, 2, 1, 3, 4).reshape(n_rows * n_cols, ws[1], ws[0], n_channels)[:n_tiles, ::-1]
+    if depth_map:
+        data = gaussian_filter(data[..., 0], (0, .7, .7))
+        if clahe:
+            data = np.array([apply_clahe(d) for d in data])
+        data[np.sum(data, axis=(1, 2)) == 0] = 255
+    elif colored:
+        data = np.array(data)
+    else:
+        # normalization of rgb2gray is image-dependent
+        data = np.array([rgb2gray(d) for d in data]) * 255
+    return data
+
+
+def _render_views_atlas(res, ixs, mesh, coords, rot_matrices, edge_lengths, ws, nb_views, atlas_size,
+                        colored=False, depth_map=True, clahe=False, triangulation=True, verbose=False):
+    """
+    Render `nb_views` views at every location into a framebuffer atlas, see
+    :func:`init_atlas`. The atlas is read back once per batch of locations. Helper of
+    :func:`multi_view_mesh_coords`, requires an initialized mesh object.
+
+    Args:
+        res: np.array
+            Output array [N, nb_views, y, x(, 4)], views are written in-place.
+        ixs: np.array
+            Indices of the rendered locations.
+        mesh: MeshObject
+        coords: np.array
+            [N, 3] rendering locations.
+        rot_matrices: np.array
+        edge_lengths: np.array
+            Normalized spatial extent of the sub-volumes.
+        ws: tuple
+        nb_views: int
+        atlas_size: int
+            Maximum edge length of the atlas in pixels.
+        colored: bool
+        depth_map: bool
+        clahe: bool
+        triangulation: bool
+        verbose: bool
+
+    Returns: bool
+        False if the atlas could not be created, nothing was rendered in that case.
+    """
+    atlas = init_atlas(ws, len(ixs) * nb_views, atlas_size)
+    if atlas is None:
+        return False
+    n_cols, n_rows = atlas[2:]
+    locs_per_atlas = (n_cols * n_rows) // nb_views
+    if locs_per_atlas == 0:
+        delete_atlas(atlas)
+        return False
+    transformed_coords = mesh.transform_external_coords(coords)
+    # the projection is the same for all locations
+    glMatrixMode(GL_PROJECTION)
+    glLoadIdentity()
+    glOrtho(-edge_lengths[0] / 2, edge_lengths[0] / 2, edge_lengths[1] / 2,
+            -edge_lengths[1] / 2, -edge_lengths[2] / 2, edge_lengths[2] / 2)
+    glMatrixMode(GL_MODELVIEW)
+    glLoadIdentity()
+    if verbose:
+        pbar = tqdm.tqdm(total=len(ixs), mininterval=0.5, leave=False)
+    for start in range(0, len(ixs), locs_per_atlas):
+        batch = ixs[start:start + locs_per_atlas]
+        glDisable(GL_SCISSOR_TEST)
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        # restrict each tile to its viewport, e.g. wide points or lines must not bleed into neighboring tiles
+        glEnable(GL_SCISSOR_TEST)
+        for jj, ii in enumerate(batch):
+            c = transformed_coords[ii]
+            for m in range(nb_views):
+                tile = jj * nb_views + m
+                x0, y0 = (tile % n_cols) * ws[0], (tile // n_cols) * ws[1]
+                glViewport(x0, y0, ws[0], ws[1])
+                glScissor(x0, y0, ws[0], ws[1])
+                if nb_views == 2:
+                    rot_angle = (-1) ** (m + 1) * 25  # views are orthogonal
+                else:
+                    rot_angle = 360. / nb_views * m  # views are equi-angular
+                glPushMatrix()
+                glRotate(rot_angle, edge_lengths[0], 0, 0)
+                glMultMatrixf(rot_matrices[ii])
+                glTranslate(-c[0], -c[1], -c[2])
+                light_position = [1., 1., 2., 0.]
+                glLightfv(GL_LIGHT0, GL_POSITION, light_position)
+                glLightModeli(GL_LIGHT_MODEL_TWO_SIDE, GL_TRUE)
+                draw_object(triangulation)
+                glPopMatrix()
+        views = read_atlas(ws, n_cols, n_rows, len(batch) * nb_views, colored=colored,
+                           depth_map=depth_map, clahe=clahe)
+        res[batch] = views.astype(np.float32).reshape((len(batch), ) + res.shape[1:])
+        if verbose:
+            pbar.update(len(batch))
+    if verbose:
+        pbar.close()
+    glDisable(GL_SCISSOR_TEST)
+    glViewport(0, 0, ws[0], ws[1])
+    delete_atlas(atlas)
+    return True
+
+
 def multi_view_mesh_coords(mesh, coords, rot_matrices, edge_lengths, alpha=None,
                            ws=None, views_key="raw", nb_simplices=3,
                            depth_map=True, clahe=False, smooth_shade=True,
                            verbose=False, wire_frame=False, egl_args=None,
-                           nb_views=None, triangulation=True):
+                           nb_views=None, triangulation=True, atlas_size=None):
     """
-    Same as multi_view_mesh_coords but without creating gl context.
+    Same as multi_view_mesh_coords but without creating gl context. If `atlas_size` is
+    positive, all views are rendered into a framebuffer atlas which is read back once
+    per batch of locations, see :func:`init_atlas`.
 
     Args:
         mesh: MeshObject
@@ -490,6 +671,9 @@ def multi_view_mesh_coords(mesh, coords, rot_matrices, edge_lengths, alpha=None,
             Optional arguments if EGL platform is used
         nb_views: int
         triangulation: bool
+        atlas_size: int
+            Maximum edge length (in pixels) of the view atlas. If 0, every location is
+            rendered separately. Default: ``rendering_atlas_size`` in the config.
 
     Returns: np.array
         Returns array of views, else None
@@ -528,65 +712,90 @@ def multi_view_mesh_coords(mesh, coords, rot_matrices, edge_lengths, alpha=None,
     init_opengl(ws, depth_map=depth_map, clear_value=1.0,
                 smooth_shade=smooth_shade, wire_frame=wire_frame)
     init_object(indices, vertices, normals, colors, ws)
+    if atlas_size is None:
+        atlas_size = global_params.config['rendering_atlas_size']
     n_empty_views = 0
-    if verbose:
-        pbar = tqdm.tqdm(total=len(res), mininterval=0.5, leave=False)
-    for ii, c in enumerate(coords):
-        c_views = np.ones(view_sh, dtype=np.float32)
-        rot_mat = rot_matrices[ii]
-        if np.sum(np.abs(rot_mat)) == 0 or np.sum(np.abs(mesh.vertices)) == 0:
-            if views_key in ["raw", "index"]:
+    rendered = False
+    if atlas_size > 0:
+        if np.sum(np.abs(mesh.vertices)) == 0:
+            valid = np.zeros(len(coords), dtype=bool)
+        else:
+            valid = np.sum(np.abs(np.reshape(rot_matrices, (len(coords), -1))), axis=1) != 0
+        if views_key in ["raw", "index"]:
+            for c in np.asarray(coords)[~valid]:
                 log_proc.warning(
                     "Rotation matrix or vertices of '%s' with %d vertices is"
                     " zero during rendering at %s. Skipping."
                     % (views_key, len(mesh.vert_resh), str(c)))
-            continue
-        glMatrixMode(GL_MODELVIEW)
-        glLoadIdentity()
-
-        glMatrixMode(GL_PROJECTION)
-        glLoadIdentity()
-        glOrtho(-edge_lengths[0] / 2, edge_lengths[0] / 2, edge_lengths[1] / 2,
-                -edge_lengths[1] / 2, -edge_lengths[2] / 2, edge_lengths[2] / 2)
-        glMatrixMode(GL_MODELVIEW)
-
-        transformed_c = mesh.transform_external_coords([c])[0]
-        # dummy rendering, somehow first projection is always black
-        _ = screen_shot(ws, colored=colored, depth_map=depth_map, clahe=clahe,
-                        triangulation=triangulation, egl_args=egl_args)
-
-        glMatrixMode(GL_MODELVIEW)
-        for m in range(0, nb_views):
-            if nb_views == 2:
-                rot_angle = (-1) ** (m + 1) * 25  # views are orthogonal
-            else:
-                rot_angle = 360. / nb_views * m  # views are equi-angular
-            glPushMatrix()
-            glRotate(rot_angle, edge_lengths[0], 0, 0)
-            glMultMatrixf(rot_mat)
-            glTranslate(-transformed_c[0], -transformed_c[1], -transformed_c[2])
-            light_position = [1., 1., 2., 0.]
-            glLightfv(GL_LIGHT0, GL_POSITION, light_position)
-            glLightModeli(GL_LIGHT_MODEL_TWO_SIDE, GL_TRUE)
-            c_views[m] = screen_shot(ws, colored=colored, depth_map=depth_map,
-                                     clahe=clahe, triangulation=triangulation,
-                                     egl_args=egl_args)
-            glPopMatrix()
-        res[ii] = c_views
+        valid_ixs = np.flatnonzero(valid)
+        rendered = _render_views_atlas(res, valid_ixs, mesh, coords, rot_matrices, edge_lengths, ws, nb_views,
+                                       atlas_size, colored=colored, depth_map=depth_map, clahe=clahe,
+                                       triangulation=triangulation, verbose=verbose)
+        if not rendered:
+            log_proc.warning('Could not create framebuffer atlas for batched rendering, rendering every '
+                             'location separately.')
+        elif views_key == "raw" or views_key == "index":
+            views = res[valid_ixs].reshape(len(valid_ixs), nb_views, -1)
+            n_empty_views = int(np.sum(views.min(axis=2) == views.max(axis=2)))
+    if not rendered:
+        if verbose:
+            pbar = tqdm.tqdm(total=len(res), mininterval=0.5, leave=False)
+        for ii, c in enumerate(coords):
+            c_views = np.ones(view_sh, dtype=np.float32)
+            rot_mat = rot_matrices[ii]
+            if np.sum(np.abs(rot_mat)) == 0 or np.sum(np.abs(mesh.vertices)) == 0:
+                if views_key in ["raw", "index"]:
+                    log_proc.warning(
+                        "Rotation matrix or vertices of '%s' with %d vertices is"
+                        " zero during rendering at %s. Skipping."
+                        % (views_key, len(mesh.vert_resh), str(c)))
+                continue
+            glMatrixMode(GL_MODELVIEW)
+            glLoadIdentity()
+
+            glMatrixMode(GL_PROJECTION)
+            glLoadIdentity()
+            glOrtho(-edge_lengths[0] / 2, edge_lengths[0] / 2, edge_lengths[1] / 2,
+                    -edge_lengths[1] / 2, -edge_lengths[2] / 2, edge_lengths[2] / 2)
+            glMatrixMode(GL_MODELVIEW)
+
+            transformed_c = mesh.transform_external_coords([c])[0]
+            # dummy rendering, somehow first projection is always black
+            _ = screen_shot(ws, colored=colored, depth_map=depth_map, clahe=clahe,
+                            triangulation=triangulation, egl_args=egl_args)
+
+            glMatrixMode(GL_MODELVIEW)
+            for m in range(0, nb_views):
+                if nb_views == 2:
+                    rot_angle = (-1) ** (m + 1) * 25  # views are orthogonal
+                else:
+                    rot_angle = 360. / nb_views * m  # views are equi-angular
+                glPushMatrix()
+                glRotate(rot_angle, edge_lengths[0], 0, 0)
+                glMultMatrixf(rot_mat)
+                glTranslate(-transformed_c[0], -transformed_c[1], -transformed_c[2])
+                light_position = [1., 1., 2., 0.]
+                glLightfv(GL_LIGHT0, GL_POSITION, light_position)
+                glLightModeli(GL_LIGHT_MODEL_TWO_SIDE, GL_TRUE)
+                c_views[m] = screen_shot(ws, colored=colored, depth_map=depth_map,
+                                         clahe=clahe, triangulation=triangulation,
+                                         egl_args=egl_args)
+                glPopMatrix()
+            res[ii] = c_views
+            if verbose:
+                pbar.update(1)
+            for cv in c_views:
+                if views_key == "raw" or views_key == "index":
+                    if len(np.unique(cv)) == 1:
+                        n_empty_views += 1
+                        continue  # check at most one occurrence
         if verbose:
-            pbar.update(1)
-        for cv in c_views:
-            if views_key == "raw" or views_key == "index":
-                if len(np.unique(cv)) == 1:
-                    n_empty_views += 1
-                    continue  # check at most one occurrence
+            pbar.close()
     if n_empty_views / len(res) > 0.5:  # more than 10% locations contain at least one empty view
         log_proc.critical(
             "WARNING: Found {}/{} locations with empty views.\t'{}'-mesh with "
             "{} vertices. Example location: {}".format(n_empty_views, len(coords), views_key,
-                                                       len(mesh.vertices), repr(c)))
-    if verbose:
-        pbar.close()
+                                                       len(mesh.vertices), repr(coords[-1])))
     return res
 
 
@@ -15,17 +15,19 @@ import tqdm
 
 from . import log_proc
 from .image import single_conn_comp_img
-from .meshes import mesh_area_calc, merge_meshes_incl_norm
+from .meshes import mesh_area_calc, stitch_meshes
 from .. import global_params
 from ..backend.storage import AttributeDict, VoxelStorage, VoxelStorageDyn, MeshStorage, CompressedStorage
 from ..extraction import object_extraction_wrapper as oew
 from ..handler import basics
+from ..handler.kd_io import ChunkReader
 from ..mp import batchjob_utils as qu
 from ..mp import mp_utils as sm
 from ..proc.meshes import mesh_chunk, find_meshes
 from ..reps import rep_helper
 from ..reps import segmentation
-from ..extraction.find_object_properties import map_subcell_extract_props as map_subcell_extract_props_func
+from ..reps.segmentation_helper import load_so_voxels_bulk
+from ..extraction.find_object_properties import find_object_properties_fused
 
 from multiprocessing import Process
 import pickle as pkl
@@ -34,7 +36,25 @@ from logging import Logger
 import shutil
 from collections import defaultdict
 from knossos_utils import chunky
-from typing import Optional, List, Union
+from typing import Optional, List, Union, Tuple, Dict, Iterator
+
+
+# object properties with a variable number of values per object, stored as ragged arrays
+# (flat values and row pointers) in the shards of `dataset_analysis`
+_RAGGED_ATTRIBUTES = dict(cs_ids=np.uint64, mapping_mi_ids=np.uint64, mapping_mi_ratios=np.float64,
+                          mapping_sj_ids=np.uint64, mapping_sj_ratios=np.float64,
+                          mapping_vc_ids=np.uint64, mapping_vc_ratios=np.float64)
+
+# attributes with a fixed dtype and shape per object; dataset_analysis workers fill them into pre-allocated arrays
+_FIXED_ATTRIBUTES = dict(size=(np.int64, ()), bounding_box=(np.int32, (2, 3)), rep_coord=(np.int32, (3,)),
+                         mesh_area=(np.float32, ()))
+
+# structured record tables of object properties and of overlap counts. Records of several chunks are
+# merged by concatenation and grouped by object ID, see `merge_prop_records` and `merge_overlap_records`.
+PROP_RECORD_DTYPE = np.dtype([('id', np.uint64), ('rc', np.int32, 3), ('bb_min', np.int32, 3),
+                              ('bb_max', np.int32, 3), ('size', np.int64)])
+# sparse COO table, e.g. organelle ID -> cell SV ID -> number of overlapping voxels
+OVERLAP_RECORD_DTYPE = np.dtype([('id', np.uint64), ('partner_id', np.uint64), ('count', np.int64)])
 
 
 def dataset_analysis(sd, recompute=True, n_jobs=None, compute_meshprops=False):
@@ -42,6 +62,10 @@ def dataset_analysis(sd, recompute=True, n_jobs=None, compute_meshprops=False):
     attributes as numpy arrays. Will only recognize dict/storage entries of type int
     for object attribute collection.
 
+    Every worker writes the attribute columns of its objects to ``.npy`` shards (see
+    :func:`~_dataset_analysis_thread`), which are then merged into the cache arrays with a
+    single pass per attribute (see :func:`~_dataset_analysis_collect`).
+
     Args:
         sd: SegmentationDataset of e.g. cell supervoxels ('sv').
         recompute: Whether or not to (re-)compute key information of each object (rep_coord, bounding_box, size).
@@ -59,132 +83,149 @@ def dataset_analysis(sd, recompute=True, n_jobs=None, compute_meshprops=False):
                   'Please add them to global_params.py accordingly.'
             log_proc.error(msg)
             raise ValueError(msg)
+    shard_dir = f'{sd.path}/dataset_analysis_shards/'
+    if os.path.isdir(shard_dir):
+        shutil.rmtree(shard_dir)
+    os.makedirs(shard_dir)
     # Partitioning the work
     multi_params = basics.chunkify(paths, n_jobs)
     multi_params = [(mps, sd.type, sd.version, sd.working_dir, recompute,
-                     compute_meshprops) for mps in multi_params]
+                     compute_meshprops, f'{shard_dir}/{ii:06d}') for ii, mps in enumerate(multi_params)]
 
     # Running workers
     if not qu.batchjob_enabled():
-        results = sm.start_multiprocess_imap(_dataset_analysis_thread,
-                                             multi_params, debug=False)
-        # Creating summaries
-        attr_dict = {}
-        for this_attr_dict in results:
-            for attribute in this_attr_dict:
-                if len(this_attr_dict['id']) == 0:
-                    continue
-                value = this_attr_dict[attribute]
-                if attribute == 'id':
-                    value = np.array(value, np.uint64)
-                if attribute not in attr_dict:
-                    if type(value) is not list:
-                        sh = list(value.shape)
-                        sh[0] = 0
-                        attr_dict[attribute] = np.empty(sh, dtype=value.dtype)
-                    else:
-                        attr_dict[attribute] = []
-
-                if type(value) is not list:  # assume numpy array
-                    attr_dict[attribute] = np.concatenate([attr_dict[attribute], value])
-                else:
-                    attr_dict[attribute] += value
-
-        for attribute in attr_dict:
-            if attribute in ['cs_ids', 'mapping_mi_ids', 'mapping_mi_ratios', 'mapping_sj_ids',
-                             'mapping_vc_ids', 'mapping_vc_ratios', 'mapping_sj_ratios']:
-                np.save(sd.path + "/%ss.npy" % attribute, np.array(attr_dict[attribute], dtype=object))
-            else:
-                np.save(sd.path + "/%ss.npy" % attribute, attr_dict[attribute])
+        shards = list(sm.start_multiprocess_imap(_dataset_analysis_thread, multi_params, debug=False))
     else:
         path_to_out = qu.batchjob_script(multi_params, "dataset_analysis",
                                          suffix=sd.type)
-        out_files = np.array(glob.glob(path_to_out + "/*"))
-
-        res_keys = []
-        file_mask = np.zeros(len(out_files), dtype=np.int64)
-        res = sm.start_multiprocess_imap(_dataset_analysis_check, out_files, sm.cpu_count())
-        for ix_cnt, r in enumerate(res):
-            rk, n_el = r
-            if n_el > 0:
-                file_mask[ix_cnt] = n_el
-                if len(res_keys) == 0:
-                    res_keys = rk
-        if len(res_keys) == 0:
-            raise ValueError(f'No objects found during dataset_analysis of {sd}.')
-        n_ids = np.sum(file_mask)
-        log_proc.info(f'Caching {len(res_keys)} attributes of {n_ids} objects in {sd} during '
-                      f'dataset_analysis:\n{res_keys}')
-        out_files = out_files[file_mask > 0]
-        params = [(attr, out_files, n_ids, sd.path) for attr in res_keys]
+        shards = []
+        for out_file in glob.glob(path_to_out + "/*"):
+            with open(out_file, 'rb') as f:
+                shards.append(pkl.load(f))
+        shutil.rmtree(os.path.abspath(path_to_out + "/../"), ignore_errors=True)
+    # keep the ordering of the jobs
+    shards = sorted([sh for sh in shards if sh['n'] > 0], key=lambda sh: sh['prefix'])
+    if len(shards) == 0:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+        raise ValueError(f'No objects found during dataset_analysis of {sd}.')
+    res_keys = list(shards[0]['attributes'])
+    n_ids = int(np.sum([sh['n'] for sh in shards]))
+    log_proc.info(f'Caching {len(res_keys)} attributes of {n_ids} objects in {sd} during '
+                  f'dataset_analysis:\n{res_keys}')
+    params = [(attr, [(sh['prefix'], sh['n']) for sh in shards], n_ids, sd.path) for attr in res_keys]
+    if not qu.batchjob_enabled():
+        sm.start_multiprocess_imap(_dataset_analysis_collect, params, debug=False)
+    else:
         qu.batchjob_script(params, 'dataset_analysis_collect', n_cores=global_params.config['ncores_per_node'],
                            remove_jobfolder=True)
-        shutil.rmtree(os.path.abspath(path_to_out + "/../"), ignore_errors=True)
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    # ID look-up of the cache arrays
+    sd.save_id_index()
 
 
-def _dataset_analysis_check(out_file):
-    res_keys = []
-    with open(out_file, 'rb') as f:
-        res_dc = pkl.load(f)
-        n_el = len(res_dc['id'])
-        if n_el > 0:
-            res_keys = list(res_dc.keys())
-    return res_keys, n_el
+def _write_attr_shard(prefix: str, attribute: str, values: list):
+    """
+    Store the values of `attribute` of all objects processed by a
+    :func:`~_dataset_analysis_thread` worker at ``<prefix>_<attribute>``. Ragged attributes
+    (see ``_RAGGED_ATTRIBUTES``) are stored as :class:`~syconn.reps.rep_helper.RaggedArray`.
+
+    Args:
+        prefix: Path prefix of the shard.
+        attribute: Attribute key.
+        values: One entry per object.
+    """
+    base_path = f'{prefix}_{attribute}'
+    if attribute in _RAGGED_ATTRIBUTES:
+        indptr = np.zeros(len(values) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(v) for v in values])
+        flat = np.fromiter((el for v in values for el in v), dtype=_RAGGED_ATTRIBUTES[attribute],
+                           count=indptr[-1])
+        rep_helper.RaggedArray(flat, indptr).save(base_path)
+    else:
+        try:
+            arr = np.asarray(values)
+        except ValueError:  # inhomogeneous entries
+            arr = np.empty(len(values), dtype=object)
+            for ii, v in enumerate(values):
+                arr[ii] = v
+        np.save(base_path + '.npy', arr)
+
+
+def _load_attr_shard(p: str) -> np.ndarray:
+    try:
+        return np.load(p, mmap_mode='r')
+    except ValueError:  # object arrays cannot be memory-mapped
+        return np.load(p, allow_pickle=True)
 
 
 def _dataset_analysis_collect(args):
-    attribute, out_files, n_ids, sd_path = args
-    # start_multiprocess_imap obeys parameter order and therefore the
-    # collected attributes will share the same ordering.
-    n_jobs = min(len(out_files), global_params.config['ncores_per_node'] * 4)
-    params = list(basics.chunkify([(p, attribute) for p in out_files], n_jobs))
-    tmp_res = sm.start_multiprocess_imap(
-        _load_attr_helper, params, nb_cpus=global_params.config['ncores_per_node'] // 2, debug=False)
-    if attribute in ['cs_ids', 'mapping_mi_ids', 'mapping_mi_ratios', 'mapping_sj_ids',
-                     'mapping_vc_ids', 'mapping_vc_ratios', 'mapping_sj_ratios']:
-        tmp_res = [el for lst in tmp_res for el in lst]  # flatten lists
-        tmp_res = np.array(tmp_res, dtype=object)
-    else:
-        tmp_res = np.concatenate(tmp_res)
-    assert tmp_res.shape[0] == n_ids, f'Shape mismatch during dataset_analysis of property {attribute}.'
-    np.save(f"{sd_path}/{attribute}s.npy", tmp_res)
-
-
-def _load_attr_helper(args):
-    res = []
-    attr = args[0][1]
-    for arg in args:
-        fname, attr_ex = arg
-        assert attr == attr_ex
-        with open(fname, 'rb') as f:
-            dc = pkl.load(f)
-            if len(dc['id']) == 0:
-                continue
+    """
+    Merge the shards of one attribute written by :func:`~_dataset_analysis_thread` into the
+    cache array ``<attribute>s.npy``. Arrays with a fixed number of values per object are copied
+    into a pre-allocated memory-mapped array. Ragged attributes are additionally stored as
+    :class:`~syconn.reps.rep_helper.RaggedArray` (``<attribute>s_values.npy`` and
+    ``<attribute>s_indptr.npy``), see ``ragged`` in
+    :func:`~syconn.reps.segmentation.SegmentationDataset.load_numpy_data`.
 
-            value = dc[attr]
-            if attr == 'id':
-                value = np.array(value, np.uint64)
-            if type(value) is not list:  # assume numpy array
-                if len(res) == 0:
-                    sh = list(value.shape)
-                    sh[0] = 0
-                    res = np.empty(sh, dtype=value.dtype)
-                res = np.concatenate([res, value])
-            else:
-                res += value
-    return res
+    Args:
+        args: Attribute key, shard prefixes and their number of objects, total number of objects
+            and the dataset path.
+    """
+    attribute, shards, n_ids, sd_path = args
+    dest_p = f"{sd_path}/{attribute}s.npy"
+    if attribute in _RAGGED_ATTRIBUTES:
+        values, indptr = [], [np.zeros(1, dtype=np.int64)]
+        offset = 0
+        for prefix, n in shards:
+            shard = rep_helper.RaggedArray.load(f'{prefix}_{attribute}')
+            values.append(shard.values)
+            indptr.append(shard.indptr[1:] + offset)
+            offset += len(shard.values)
+        res = rep_helper.RaggedArray(np.concatenate(values), np.concatenate(indptr))
+        assert len(res) == n_ids, f'Shape mismatch during dataset_analysis of property {attribute}.'
+        res.save(dest_p[:-len('.npy')])
+        np.save(dest_p, res.to_object_array())
+        return
+    arrs = [_load_attr_shard(f'{prefix}_{attribute}.npy') for prefix, _ in shards]
+    n_rows = int(np.sum([len(arr) for arr in arrs]))
+    assert n_rows == n_ids, f'Shape mismatch during dataset_analysis of property {attribute}.'
+    if any(arr.dtype == object for arr in arrs) or len({arr.shape[1:] for arr in arrs}) > 1:
+        res = np.empty(n_ids, dtype=object)
+        for ii, row in enumerate(row for arr in arrs for row in arr):
+            res[ii] = row
+        np.save(dest_p, res)
+        return
+    dtype = np.result_type(*arrs)
+    tmp_p = f'{dest_p[:-len(".npy")]}.{os.getpid()}.tmp.npy'
+    res = np.lib.format.open_memmap(tmp_p, mode='w+', dtype=dtype, shape=(n_ids,) + arrs[0].shape[1:])
+    offset = 0
+    for arr in arrs:
+        res[offset:offset + len(arr)] = arr
+        offset += len(arr)
+    res.flush()
+    del res
+    os.replace(tmp_p, dest_p)
 
 
 def _dataset_analysis_thread(args):
-    """ Worker of dataset_analysis """
-    # TODO: use arrays to store properties already during collection
+    """ Worker of dataset_analysis, stores the attribute columns of all its objects as shards with
+    the path prefix ``args[6]``, see :func:`~_write_attr_shard`.
+
+    Returns:
+        Shard prefix, number of objects and attribute keys.
+    """
     paths = args[0]
     obj_type = args[1]
     version = args[2]
     working_dir = args[3]
     recompute = args[4]
     compute_meshprops = args[5]
-    global_attr_dict = dict(id=[], size=[], bounding_box=[], rep_coord=[])
+    shard_prefix = args[6]
+    # per storage folder: object IDs and columns of `_FIXED_ATTRIBUTES`, pre-allocated with the number of objects
+    id_blocks = []
+    fixed_blocks = defaultdict(list)
+    # remaining attributes, one entry per object
+    global_attr_dict = defaultdict(list)
     for p in paths:
         if not len(os.listdir(p)) > 0:
             os.rmdir(p)
@@ -198,10 +239,20 @@ def _dataset_analysis_thread(args):
                 so_ids = list(this_vx_dc.keys())
             else:
                 so_ids = list(this_attr_dc.keys())
+            missing_voxels = dict()
             if compute_meshprops:
                 this_mesh_dc = MeshStorage(p + "/mesh.pkl", read_only=True, disable_locking=True)
-            for so_id in so_ids:
-                global_attr_dict["id"].append(so_id)
+                # voxels of objects without mesh are loaded with a minimal number of segmentation reads
+                ids_missing = [so_id for so_id in so_ids if so_id not in this_mesh_dc]
+                if len(ids_missing) > 0 and obj_type not in ['syn', 'syn_ssv'] and os.path.isfile(p + "/voxel.pkl"):
+                    sos_missing = [segmentation.SegmentationObject(so_id, obj_type, version, working_dir)
+                                   for so_id in ids_missing]
+                    missing_voxels = load_so_voxels_bulk(sos_missing, global_params.config.use_new_subfold,
+                                                         cubed=True)
+            id_blocks.append(np.array(so_ids, dtype=np.uint64))
+            block = dict()
+            n_filled = defaultdict(int)
+            for ii, so_id in enumerate(so_ids):
                 so = segmentation.SegmentationObject(so_id, obj_type,
                                                      version, working_dir)
                 so.attr_dict = this_attr_dc[so_id]
@@ -227,29 +278,40 @@ def _dataset_analysis_thread(args):
                         so._mesh = this_mesh_dc[so.id]
                     else:
                         new_mesh_generated = True
+                        if so_id in missing_voxels:
+                            so._voxels = missing_voxels.pop(so_id)[0]
                         so._mesh = so.mesh_from_scratch()
                         this_mesh_dc[so.id] = so._mesh
                     # if mesh does not exist beforehand, it will be generated
                     so.attr_dict["mesh_bb"] = so.mesh_bb
                     so.attr_dict["mesh_area"] = so.mesh_area
-                for attribute in so.attr_dict.keys():
-                    if attribute not in global_attr_dict:
-                        global_attr_dict[attribute] = []
-                    global_attr_dict[attribute].append(so.attr_dict[attribute])
+                for attribute, value in so.attr_dict.items():
+                    if attribute in _FIXED_ATTRIBUTES:
+                        if attribute not in block:
+                            dtype, shape = _FIXED_ATTRIBUTES[attribute]
+                            block[attribute] = np.zeros((len(so_ids),) + shape, dtype=dtype)
+                        block[attribute][ii] = value
+                        n_filled[attribute] += 1
+                    else:
+                        global_attr_dict[attribute].append(value)
                 this_attr_dc[so_id] = so.attr_dict
+            for attribute, arr in block.items():
+                if n_filled[attribute] != len(arr):
+                    raise ValueError(f'Attribute "{attribute}" is missing for {len(arr) - n_filled[attribute]} '
+                                     f'objects in "{p}".')
+                fixed_blocks[attribute].append(arr)
             if recompute or compute_meshprops:
                 this_attr_dc.push()
                 if new_mesh_generated:
                     this_mesh_dc.push()
-    if 'bounding_box' in global_attr_dict:
-        global_attr_dict['bounding_box'] = np.array(global_attr_dict['bounding_box'], dtype=np.int32)
-    if 'rep_coord' in global_attr_dict:
-        global_attr_dict['rep_coord'] = np.array(global_attr_dict['rep_coord'], dtype=np.int32)
-    if 'size' in global_attr_dict:
-        global_attr_dict['size'] = np.array(global_attr_dict['size'], dtype=np.int64)
-    if 'mesh_area' in global_attr_dict:
-        global_attr_dict['mesh_area'] = np.array(global_attr_dict['mesh_area'], dtype=np.float32)
-    return global_attr_dict
+    n_objects = int(np.sum([len(ids) for ids in id_blocks]))
+    attr_dict = dict(id=np.concatenate(id_blocks) if n_objects > 0 else np.zeros(0, dtype=np.uint64))
+    attr_dict.update({attribute: np.concatenate(blocks) for attribute, blocks in fixed_blocks.items()})
+    attr_dict.update(global_attr_dict)
+    if n_objects > 0:
+        for attribute, values in attr_dict.items():
+            _write_attr_shard(shard_prefix, attribute, values)
+    return dict(prefix=shard_prefix, n=n_objects, attributes=list(attr_dict.keys()))
 
 
 def _cache_storage_paths(args):
@@ -270,6 +332,97 @@ def _cache_storage_paths(args):
     cd.push()
 
 
+def _storage_buckets(n_folders_fs: int, n_jobs: int) -> Tuple[List[np.ndarray], Dict[str, int]]:
+    """
+    Partition the storage folders of a SegmentationDataset into `n_jobs` writer jobs.
+
+    Args:
+        n_folders_fs: Number of storage folders.
+        n_jobs: Number of jobs.
+
+    Returns:
+        Dummy object IDs which represent the storage folders of every job and the job index of every
+        storage folder.
+    """
+    if global_params.config.use_new_subfold:
+        target_dir_func = rep_helper.subfold_from_ix_new
+    else:
+        target_dir_func = rep_helper.subfold_from_ix_OLD
+    id_blocks = basics.chunkify(rep_helper.get_unique_subfold_ixs(n_folders_fs), n_jobs)
+    bucket_dc = {target_dir_func(obj_id, n_folders_fs): job_ix for job_ix, id_block in enumerate(id_blocks)
+                 for obj_id in id_block}
+    return id_blocks, bucket_dc
+
+
+def _write_shuffle_buckets(path: str, tables: List[np.ndarray], n_folders_fs: int, bucket_dc: Dict[str, int]) \
+        -> np.ndarray:
+    """
+    Split record tables (see :attr:`PROP_RECORD_DTYPE` and :attr:`OVERLAP_RECORD_DTYPE`) by the storage folder
+    of their object IDs into one bucket per writer job (see :func:`~_storage_buckets`) and store the buckets
+    consecutively in a single pickle file. Writer jobs only read their own buckets, see
+    :func:`~_read_shuffle_buckets`.
+
+    Args:
+        path: Path to the output file.
+        tables: Record tables with object IDs in field 'id'.
+        n_folders_fs: Number of storage folders.
+        bucket_dc: Job index of every storage folder.
+
+    Returns:
+        Byte offsets of the buckets in the file; bucket ``i`` is stored in ``[offsets[i], offsets[i+1])``.
+    """
+    if global_params.config.use_new_subfold:
+        target_dir_func = rep_helper.subfold_from_ix_new
+    else:
+        target_dir_func = rep_helper.subfold_from_ix_OLD
+    n_buckets = max(bucket_dc.values()) + 1
+    # job index of every storage folder index, see `rep_helper.get_unique_subfold_ixs`
+    folder_buckets = np.array([bucket_dc[target_dir_func(ix, n_folders_fs)]
+                               for ix in rep_helper.get_unique_subfold_ixs(n_folders_fs)], dtype=np.int64)
+    bucketed_tables = []
+    for table in tables:
+        bucket_ixs = folder_buckets[rep_helper.subfold_ixs(table['id'], n_folders_fs)]
+        order = np.argsort(bucket_ixs, kind='stable')
+        bounds = np.searchsorted(bucket_ixs[order], np.arange(n_buckets + 1))
+        table = table[order]
+        bucketed_tables.append([table[bounds[ii]:bounds[ii + 1]] for ii in range(n_buckets)])
+    offsets = np.zeros(n_buckets + 1, dtype=np.int64)
+    with open(path, 'wb') as f:
+        for ii in range(n_buckets):
+            bucket = [buckets[ii] for buckets in bucketed_tables]
+            if any(len(table) > 0 for table in bucket):
+                pkl.dump(bucket, f, protocol=4)
+            offsets[ii + 1] = f.tell()
+    return offsets
+
+
+def _bucket_segments(shuffle_index: List[Tuple[str, np.ndarray]], job_ix: int) -> List[Tuple[str, int, int]]:
+    """
+    Args:
+        shuffle_index: File path and bucket offsets of every chunk worker, see :func:`~_write_shuffle_buckets`.
+        job_ix: Index of the writer job.
+
+    Returns:
+        File path, start and end byte of all non-empty buckets of the writer job.
+    """
+    return [(p, int(offsets[job_ix]), int(offsets[job_ix + 1])) for p, offsets in shuffle_index
+            if offsets[job_ix + 1] > offsets[job_ix]]
+
+
+def _read_shuffle_buckets(segments: List[Tuple[str, int, int]]) -> Iterator[List[np.ndarray]]:
+    """
+    Args:
+        segments: File path, start and end byte of the buckets, see :func:`~_bucket_segments`.
+
+    Yields:
+        Record tables of every bucket.
+    """
+    for p, start, stop in segments:
+        with open(p, 'rb') as f:
+            f.seek(start)
+            yield pkl.loads(f.read(stop - start))
+
+
 def map_subcell_extract_props(kd_seg_path: str, kd_organelle_paths: dict,
                               n_folders_fs: int = 1000, n_folders_fs_sc: int = 1000,
                               n_chunk_jobs: Optional[int] = None, n_cores: int = 1,
@@ -354,6 +507,16 @@ def map_subcell_extract_props(kd_seg_path: str, kd_organelle_paths: dict,
     step_names = []
     dict_paths_tmp = []
 
+    # partition the storage folders into the jobs which write the object properties. The chunk workers
+    # store their results bucketed by these jobs, see `_write_shuffle_buckets`.
+    n_folders_sv = len(rep_helper.get_unique_subfold_ixs(n_folders_fs))
+    n_folders_sc = len(rep_helper.get_unique_subfold_ixs(n_folders_fs_sc))
+    sv_id_blocks, sv_bucket_dc = _storage_buckets(
+        n_folders_fs, int(max(2 * global_params.config.ncore_total, n_folders_sv / 15)))
+    sc_id_blocks, sc_bucket_dc = _storage_buckets(
+        n_folders_fs_sc, int(min(2 * global_params.config.ncore_total, n_folders_sc / 2)))
+    shuffle_params = dict(sv=(n_folders_fs, sv_bucket_dc), sc=(n_folders_fs_sc, sc_bucket_dc))
+
     # extract mapping
     start = time.time()
     # create chunk list represented by offset and unique ID
@@ -362,14 +525,15 @@ def map_subcell_extract_props(kd_seg_path: str, kd_organelle_paths: dict,
     ch_list = [ch for ch in basics.chunkify_successive(ch_list, max(1, len(cd.coord_dict) // n_chunk_jobs))]
 
     multi_params = [(ch, chunk_size, kd_seg_path, kd_organelle_paths,
-                     worker_nr, global_params.config.allow_mesh_gen_cells)
+                     worker_nr, global_params.config.allow_mesh_gen_cells, shuffle_params)
                     for worker_nr, ch in enumerate(ch_list)]
 
     # results contain meshing information
     cell_mesh_workers = dict()
-    cell_prop_worker = dict()
     subcell_mesh_workers = [dict() for _ in range(len(kd_organelle_paths))]
-    subcell_prop_workers = [dict() for _ in range(len(kd_organelle_paths))]
+    # locations of the bucketed property and mapping records, keys: result type, values: list of
+    # file path and bucket offsets
+    shuffle_index = defaultdict(list)
     # needed for caching target storage folder for all objects
     all_ids = {k: [] for k in list(kd_organelle_paths.keys()) + ['sv']}
 
@@ -380,36 +544,29 @@ def map_subcell_extract_props(kd_seg_path: str, kd_organelle_paths: dict,
 
         for out_file in tqdm.tqdm(out_files, leave=False):
             with open(out_file, 'rb') as f:
-                worker_nr, ref_mesh_dc = pkl.load(f)
+                worker_nr, ref_mesh_dc, worker_shuffle_index = pkl.load(f)
             for chunk_id, cell_ids in ref_mesh_dc['sv'].items():
                 cell_mesh_workers[chunk_id] = (worker_nr, cell_ids)
-            # memory consumption of list is about 0.25
-            cell_prop_worker[worker_nr] = list(set().union(*ref_mesh_dc['sv'].values()))
-            all_ids['sv'].extend(cell_prop_worker[worker_nr])
+            all_ids['sv'].extend(set().union(*ref_mesh_dc['sv'].values()))
+            for k, v in worker_shuffle_index.items():
+                shuffle_index[k].append(v)
         c_mesh_worker_dc = "{}/c_mesh_worker_dict.pkl".format(global_params.config.temp_path)
         with open(c_mesh_worker_dc, 'wb') as f:
             pkl.dump(cell_mesh_workers, f, protocol=4)
         del cell_mesh_workers
-        c_prop_worker_dc = "{}/c_prop_worker_dict.pkl".format(global_params.config.temp_path)
-        with open(c_prop_worker_dc, 'wb') as f:
-            pkl.dump(cell_prop_worker, f, protocol=4)
-
         all_ids['sv'] = np.unique(all_ids['sv'])
-        del cell_prop_worker
 
         # Collect organelle worker info
         # memory consumption of list is about 0.25
         for out_file in tqdm.tqdm(out_files, leave=False):
             with open(out_file, 'rb') as f:
-                worker_nr, ref_mesh_dc = pkl.load(f)
+                worker_nr, ref_mesh_dc, _ = pkl.load(f)
             # iterate over each subcellular structure
             for ii, organelle in enumerate(kd_organelle_paths):
                 organelle = global_params.config['process_cell_organelles'][ii]
                 for chunk_id, subcell_ids in ref_mesh_dc[organelle].items():
                     subcell_mesh_workers[ii][chunk_id] = (worker_nr, subcell_ids)
-                subcell_prop_workers[ii][worker_nr] = list(set().union(*ref_mesh_dc[
-                    organelle].values()))
-                all_ids[organelle].extend(subcell_prop_workers[ii][worker_nr])
+                all_ids[organelle].extend(set().union(*ref_mesh_dc[organelle].values()))
         for ii, organelle in enumerate(kd_organelle_paths):
             all_ids[organelle] = np.unique(all_ids[organelle])
             sc_mesh_worker_dc = "{}/sc_{}_mesh_worker_dict.pkl".format(
@@ -417,39 +574,27 @@ def map_subcell_extract_props(kd_seg_path: str, kd_organelle_paths: dict,
             with open(sc_mesh_worker_dc, 'wb') as f:
                 pkl.dump(subcell_mesh_workers[ii], f, protocol=4)
             dict_paths_tmp += [sc_mesh_worker_dc]
-
-            sc_prop_worker_dc = "{}/sc_{}_prop_worker_dict.pkl".format(
-                global_params.config.temp_path, organelle)
-            with open(sc_prop_worker_dc, 'wb') as f:
-                pkl.dump(subcell_prop_workers[ii], f, protocol=4)
-            dict_paths_tmp += [sc_prop_worker_dc]
     else:
         results = sm.start_multiprocess_imap(
             _map_subcell_extract_props_thread, multi_params,
             verbose=False, debug=False)
 
-        for worker_nr, ref_mesh_dc in tqdm.tqdm(results, leave=False):
+        for worker_nr, ref_mesh_dc, worker_shuffle_index in tqdm.tqdm(results, leave=False):
             for chunk_id, cell_ids in ref_mesh_dc['sv'].items():
                 cell_mesh_workers[chunk_id] = (worker_nr, cell_ids)
-            # memory consumption of list is about 0.25
-            cell_prop_worker[worker_nr] = list(set().union(*ref_mesh_dc['sv'].values()))
-            all_ids['sv'].extend(cell_prop_worker[worker_nr])
+            all_ids['sv'].extend(set().union(*ref_mesh_dc['sv'].values()))
             # iterate over each subcellular structure
             for ii, organelle in enumerate(kd_organelle_paths):
                 for chunk_id, subcell_ids in ref_mesh_dc[organelle].items():
                     subcell_mesh_workers[ii][chunk_id] = (worker_nr, subcell_ids)
-                subcell_prop_workers[ii][worker_nr] = list(set().union(*ref_mesh_dc[
-                    organelle].values()))
-                all_ids[organelle].extend(subcell_prop_workers[ii][worker_nr])
+                all_ids[organelle].extend(set().union(*ref_mesh_dc[organelle].values()))
+            for k, v in worker_shuffle_index.items():
+                shuffle_index[k].append(v)
         del results
         c_mesh_worker_dc = "{}/c_mesh_worker_dict.pkl".format(global_params.config.temp_path)
         with open(c_mesh_worker_dc, 'wb') as f:
             pkl.dump(cell_mesh_workers, f, protocol=4)
         del cell_mesh_workers
-        c_prop_worker_dc = "{}/c_prop_worker_dict.pkl".format(global_params.config.temp_path)
-        with open(c_prop_worker_dc, 'wb') as f:
-            pkl.dump(cell_prop_worker, f, protocol=4)
-        del cell_prop_worker
         all_ids['sv'] = np.unique(all_ids['sv'])
 
         for ii, organelle in enumerate(kd_organelle_paths):
@@ -460,13 +605,7 @@ def map_subcell_extract_props(kd_seg_path: str, kd_organelle_paths: dict,
                 pkl.dump(subcell_mesh_workers[ii], f, protocol=4)
             dict_paths_tmp += [sc_mesh_worker_dc]
 
-            sc_prop_worker_dc = "{}/sc_{}_prop_worker_dict.pkl".format(
-                global_params.config.temp_path, organelle)
-            with open(sc_prop_worker_dc, 'wb') as f:
-                pkl.dump(subcell_prop_workers[ii], f, protocol=4)
-            dict_paths_tmp += [sc_prop_worker_dc]
-
-    del subcell_mesh_workers, subcell_prop_workers
+    del subcell_mesh_workers
 
     params_cache = []
     for k, v in all_ids.items():
@@ -478,7 +617,7 @@ def map_subcell_extract_props(kd_seg_path: str, kd_organelle_paths: dict,
                                    nb_cpus=global_params.config['ncores_per_node'])
     del all_ids, params_cache
 
-    dict_paths_tmp += [c_mesh_worker_dc, c_prop_worker_dc]
+    dict_paths_tmp += [c_mesh_worker_dc]
     step_names.append("extract and map segmentation objects")
     all_times.append(time.time() - start)
 
@@ -507,11 +646,12 @@ def map_subcell_extract_props(kd_seg_path: str, kd_organelle_paths: dict,
     # write to subcell. SV attribute dicts
     # must be executed before '_write_props_to_sv_thread'
     start = time.time()
-    # create "dummy" IDs which represent each a unique storage path
-    storage_location_ids = rep_helper.get_unique_subfold_ixs(n_folders_fs_sc)
-    n_jobs = int(min(2 * global_params.config.ncore_total, len(storage_location_ids) / 2))
-    multi_params = [(sv_id_block, n_folders_fs_sc, kd_organelle_paths)
-                    for sv_id_block in basics.chunkify(storage_location_ids, n_jobs)]
+    # "dummy" IDs which represent each a unique storage path
+    multi_params = []
+    for job_ix, sc_id_block in enumerate(sc_id_blocks):
+        segments = {k: _bucket_segments(shuffle_index[k], job_ix) for organelle in kd_organelle_paths
+                    for k in [f'scp_{organelle}', f'scm_{organelle}']}
+        multi_params.append((sc_id_block, n_folders_fs_sc, kd_organelle_paths, segments))
     if not qu.batchjob_enabled():
         sm.start_multiprocess_imap(_write_props_to_sc_thread, multi_params, debug=False)
     else:
@@ -542,12 +682,14 @@ def map_subcell_extract_props(kd_seg_path: str, kd_organelle_paths: dict,
 
     # writing cell SV properties to SD
     start = time.time()
-    # create "dummy" IDs which represent each a unique storage path
-    storage_location_ids = rep_helper.get_unique_subfold_ixs(n_folders_fs)
-    n_jobs = int(max(2 * global_params.config.ncore_total, len(storage_location_ids) / 15))
-    multi_params = [(sv_id_block, n_folders_fs, global_params.config.allow_mesh_gen_cells,
-                     list(kd_organelle_paths.keys()))
-                    for sv_id_block in basics.chunkify(storage_location_ids, n_jobs)]
+    # "dummy" IDs which represent each a unique storage path
+    multi_params = []
+    for job_ix, sv_id_block in enumerate(sv_id_blocks):
+        segments = {k: _bucket_segments(shuffle_index[k], job_ix)
+                    for k in ['cp'] + [f'scm_inv_{organelle}' for organelle in kd_organelle_paths]}
+        multi_params.append((sv_id_block, n_folders_fs, global_params.config.allow_mesh_gen_cells,
+                             list(kd_organelle_paths.keys()), segments))
+    del shuffle_index
     if not qu.batchjob_enabled():
         sm.start_multiprocess_imap(_write_props_to_sv_thread, multi_params, debug=False)
     else:
@@ -583,26 +725,27 @@ def _map_subcell_extract_props_thread(args):
     kd_subcell_ps = args[3]  # Dict
     worker_nr = args[4]
     generate_sv_mesh = args[5]
+    shuffle_params = args[6]
     worker_dir_meshes = f"{global_params.config.temp_path}/tmp_meshes/meshes_{worker_nr}/"
     os.makedirs(worker_dir_meshes, exist_ok=True)
     worker_dir_props = f"{global_params.config.temp_path}/tmp_props/props_{worker_nr}/"
     os.makedirs(worker_dir_props, exist_ok=True)
-    kd_cell = basics.kd_factory(kd_cell_p)
-    kd_subcells = {k: basics.kd_factory(kd_subcell_p) for k, kd_subcell_p in kd_subcell_ps.items()}
-    n_subcell = len(kd_subcells)
+    # cell and organelle segmentations are loaded ahead of time while the current chunk is processed
+    reader = ChunkReader(dict(sv=dict(kd=kd_cell_p), **{k: dict(kd=kd_subcell_p) for k, kd_subcell_p in
+                                                        kd_subcell_ps.items()}))
+    n_subcell = len(kd_subcell_ps)
 
     min_obj_vx = global_params.config['cell_objects']['min_obj_vx']
     downsampling_dc = global_params.config['meshes']['downsampling']
 
-    # cell property dicts
-    cpd_lst = [{}, defaultdict(list), {}]
-    # subcell. property dicts
-    scpd_lst = [[{}, defaultdict(list), {}] for _ in range(n_subcell)]
-    # subcell. mapping dicts
-    scmd_lst = [{} for _ in range(n_subcell)]
+    # existing_oragnelles has the same ordering as kd_subcell_ps
+    existing_oragnelles = kd_subcell_ps.keys()
+    obj_types = ['sv'] + list(existing_oragnelles)
 
-    # existing_oragnelles has the same ordering as kd_subcells.keys() and kd_subcell_p
-    existing_oragnelles = kd_subcells.keys()
+    # property records (see `PROP_RECORD_DTYPE`) of every chunk for cells and subcell. structures
+    prop_recs = [[] for _ in obj_types]
+    # subcell. to cell overlap records (see `OVERLAP_RECORD_DTYPE`) of every chunk
+    overlap_recs = [[] for _ in range(n_subcell)]
 
     # objects that are not purely inside this chunk
     ref_mesh_dict = dict()
@@ -616,73 +759,40 @@ def _map_subcell_extract_props_thread(args):
     # iterate over chunks and store information in property dicts for
     # subcellular and cellular structures
     start_all = time.time()
-    for offset, ch_id in chunks:
+    for (offset, ch_id), vols in reader.iter_chunks(chunks, lambda ch: dict.fromkeys(reader.sources,
+                                                                                     (ch[0], chunk_size))):
         # get all segmentation arrays concatenates as 4D array: [C, X, Y, Z]
-        subcell_d = []
-        obj_ids_bdry = dict()
-        small_obj_ids_inside = defaultdict(list)
-        for organelle in existing_oragnelles:
-            obj_ids_bdry[organelle] = []
-        for organelle in kd_subcell_ps:
-            start = time.time()
-            kd_sc = kd_subcells[organelle]
-            subc_d = kd_sc.load_seg(size=chunk_size, offset=offset, mag=1).swapaxes(0, 2)
-            # get objects that are not purely inside this chunk
-            obj_bdry = np.concatenate(
-                [subc_d[0].flat, subc_d[:, 0].flat, subc_d[:, :, 0].flat, subc_d[-1].flat,
-                 subc_d[:, -1].flat, subc_d[:, :, -1].flat])
-            obj_bdry = np.unique(obj_bdry)
-            obj_ids_bdry[organelle] = obj_bdry
-            dt_times_dc['data_io'] += time.time() - start
-            # add auxiliary axis
-            subcell_d.append(subc_d[None,])
-        subcell_d = np.concatenate(subcell_d)
-        start = time.time()
-        cell_d = kd_cell.load_seg(size=chunk_size, offset=offset, mag=1).swapaxes(0, 2)
-        dt_times_dc['data_io'] += time.time() - start
+        subcell_d = np.concatenate([vols[organelle][None, ] for organelle in kd_subcell_ps]) if n_subcell > 0 \
+            else None
+        cell_d = vols['sv']
+        del vols
 
         start = time.time()
-        # extract properties and mapping information
-        cell_prop_dicts, subcell_prop_dicts, subcell_mapping_dicts = \
-            map_subcell_extract_props_func(cell_d, subcell_d)
+        # extract properties, boundary flags and mapping information within a single pass
+        props, overlaps = find_object_properties_fused(cell_d, subcell_d)
         dt_times_dc['prop_dicts_extract'] += time.time() - start
 
-        # remove objects that are purely inside this chunk and smaller than the size threshold
-        if min_obj_vx['sv'] > 1:
-            obj_bdry = np.concatenate(
-                [cell_d[0].flat, cell_d[:, 0].flat, cell_d[:, :, 0].flat, cell_d[-1].flat,
-                 cell_d[:, -1].flat, cell_d[:, :, -1].flat])
-            obj_bdry = set(np.unique(obj_bdry))
-            obj_inside = set(list(cell_prop_dicts[0].keys())).difference(obj_bdry)
-            # cell_prop_dicts: [rc, bb, size]
-            for ix in obj_inside:
-                if cell_prop_dicts[2][ix] < min_obj_vx['sv']:
-                    small_obj_ids_inside['sv'].append(ix)
-                    del cell_prop_dicts[0][ix], cell_prop_dicts[1][ix], cell_prop_dicts[2][ix]
-
-        # merge cell properties: list list of dicts
-        merge_prop_dicts([cpd_lst, cell_prop_dicts], offset)
-        del cell_prop_dicts
-
-        # reorder to match [[rc, bb, size], [rc, bb, size]] for e.g. [mi, vc]
-        subcell_prop_dicts = [[subcell_prop_dicts[0][ii], subcell_prop_dicts[1][ii],
-                               subcell_prop_dicts[2][ii]] for ii in range(n_subcell)]
-        # remove objects that are purely inside this chunk and smaller than the size threshold
-        for ii, organelle in enumerate(existing_oragnelles):
-            if min_obj_vx[organelle] > 1:
-                # subcell_prop_dicts: [[rc, bb, size], [rc, bb, size], ..]
-                obj_bdry = obj_ids_bdry[organelle]
-                obj_inside = set(list(subcell_prop_dicts[ii][0].keys())).difference(obj_bdry)
-                for ix in obj_inside:
-                    if subcell_prop_dicts[ii][2][ix] < min_obj_vx[organelle]:
-                        small_obj_ids_inside[organelle].append(ix)
-                        del subcell_prop_dicts[ii][0][ix], subcell_prop_dicts[ii][1][ix]
-                        del subcell_prop_dicts[ii][2][ix]
-                        if ix in subcell_mapping_dicts[ii]:  # could not be mapped to cell sv
-                            del subcell_mapping_dicts[ii][ix]
-            merge_map_dicts([scmd_lst[ii], subcell_mapping_dicts[ii]])
-            merge_prop_dicts([scpd_lst[ii], subcell_prop_dicts[ii]], offset)
-        del subcell_mapping_dicts, subcell_prop_dicts
+        chunk_obj_ids = dict()
+        small_obj_ids_inside = dict()
+        for ii, obj_type in enumerate(obj_types):
+            ids, rep_coords, bbs, sizes, touches_bdry = props[ii]
+            chunk_obj_ids[obj_type] = ids
+            # remove objects that are purely inside this chunk and smaller than the size threshold
+            if min_obj_vx[obj_type] > 1:
+                small = ~touches_bdry & (sizes < min_obj_vx[obj_type])
+                small_obj_ids_inside[obj_type] = ids[small].tolist()
+                ids, rep_coords, bbs, sizes = ids[~small], rep_coords[~small], bbs[~small], sizes[~small]
+                if ii > 0:  # drop mapping info of the removed subcell. objects
+                    pairs, counts = overlaps[ii - 1]
+                    keep = ~np.isin(pairs[:, 0], small_obj_ids_inside[obj_type])
+                    overlaps[ii - 1] = (pairs[keep], counts[keep])
+            else:
+                small_obj_ids_inside[obj_type] = []
+            prop_recs[ii].append(prop_records(ids, rep_coords, bbs, sizes, offset=offset))
+        for ii in range(n_subcell):
+            pairs, counts = overlaps[ii]
+            overlap_recs[ii].append(overlap_records(pairs[:, 0], pairs[:, 1], counts))
+        del props, overlaps
 
         if global_params.config.use_new_meshing:
             for ii, organelle in enumerate(kd_subcell_ps):
@@ -710,7 +820,8 @@ def _map_subcell_extract_props_thread(args):
                 if not ch_cache_exists:
                     start = time.time()
                     tmp_subcell_meshes = find_meshes(subcell_d[ii], offset, pad=1,
-                                                     ds=downsampling_dc[organelle])
+                                                     ds=downsampling_dc[organelle],
+                                                     obj_ids=chunk_obj_ids[organelle])
                     dt_times_dc['find_mesh'] += time.time() - start
                     start = time.time()
                     output_worker = open(p, 'wb')
@@ -752,7 +863,8 @@ def _map_subcell_extract_props_thread(args):
                     ch_cache_exists = True
             if not ch_cache_exists:
                 start = time.time()
-                tmp_cell_mesh = find_meshes(cell_d, offset, pad=1, ds=downsampling_dc['sv'])
+                tmp_cell_mesh = find_meshes(cell_d, offset, pad=1, ds=downsampling_dc['sv'],
+                                            obj_ids=chunk_obj_ids['sv'])
                 dt_times_dc['find_mesh'] += time.time() - start
                 start = time.time()
                 output_worker = open(p, 'wb')
@@ -769,20 +881,49 @@ def _map_subcell_extract_props_thread(args):
         del cell_d
         gc.collect()
 
-    # write worker results
-    basics.write_obj2pkl(f'{worker_dir_props}/cp_{worker_nr}.pkl', cpd_lst)
-    del cpd_lst
-    for ii, organelle in enumerate(existing_oragnelles):
-        basics.write_obj2pkl(f'{worker_dir_props}/scp_{organelle}_{worker_nr}.pkl', scpd_lst[ii])
-        basics.write_obj2pkl(f'{worker_dir_props}/scm_{organelle}_{worker_nr}.pkl', scmd_lst[ii])
-    del scmd_lst
-    del scpd_lst
+    # merged cell and subcell. property records and subcell. to cell overlap records
+    prop_recs = [merge_prop_records(recs) for recs in prop_recs]
+    overlap_recs = [merge_overlap_records(recs) for recs in overlap_recs]
 
+    # write worker results bucketed by the jobs that write the object storages
+    shuffle_index = dict()
+    results = [('cp', [prop_recs[0]], 'sv')]
+    for ii, organelle in enumerate(existing_oragnelles):
+        results += [(f'scp_{organelle}', [prop_recs[ii + 1]], 'sc'), (f'scm_{organelle}', [overlap_recs[ii]], 'sc'),
+                    # cell SV IDs in top layer
+                    (f'scm_inv_{organelle}', [invert_overlap_records(overlap_recs[ii])], 'sv')]
+    del prop_recs, overlap_recs
+    for k, tables, target in results:
+        p = f'{worker_dir_props}/{k}_{worker_nr}.pkl'
+        shuffle_index[k] = (p, _write_shuffle_buckets(p, tables, *shuffle_params[target]))
+    del results
+
+    reader.close()
+    # time spent waiting for chunk data, the I/O time per source is given by `reader.io_times`
+    dt_times_dc['data_io'] += reader.wait_time
     if global_params.config.use_new_meshing:
         dt_times_dc['overall'] = time.time() - start_all
         dt_str = ["{:<20}".format(f"{k}: {v:.2f}s") for k, v in dt_times_dc.items()]
         # log_proc.debug('{}'.format("".join(dt_str)))
-    return worker_nr, ref_mesh_dict
+    return worker_nr, ref_mesh_dict, shuffle_index
+
+
+def _stitch_kwargs(obj_type: str) -> dict:
+    """
+    Keyword arguments of :func:`~syconn.proc.meshes.stitch_meshes` for objects of type `obj_type`.
+
+    Args:
+        obj_type: Object type, e.g. 'sv', 'mi'.
+
+    Returns:
+        Stitching properties as defined in ``global_params.config['meshes']`` and the voxel size used
+        for meshing.
+    """
+    mesh_cfg = global_params.config['meshes']
+    kws = dict(mesh_cfg['meshing_props'])
+    kws.update(mesh_cfg.get('stitch_props', {}))
+    kws['scaling'] = np.array(global_params.config['scaling']) * np.array(mesh_cfg['downsampling'][obj_type])
+    return kws
 
 
 def _write_props_to_sc_thread(args):
@@ -790,6 +931,7 @@ def _write_props_to_sc_thread(args):
     obj_id_chs = args[0]
     n_folders_fs = args[1]
     kd_subcell_ps = args[2]  # Dict of kd paths
+    segments = args[3]  # locations of the bucketed property and mapping records, see `_write_shuffle_buckets`
 
     if global_params.config.use_new_subfold:
         target_dir_func = rep_helper.subfold_from_ix_new
@@ -801,11 +943,7 @@ def _write_props_to_sc_thread(args):
     # iterate over the subcell structures
     for organelle in kd_subcell_ps:
         min_obj_vx = global_params.config['cell_objects']['min_obj_vx'][organelle]
-
-        # get cached mapping and property dicts of current subcellular structure
-        sc_prop_worker_dc = f"{global_tmp_path}/sc_{organelle}_prop_worker_dict.pkl"
-        with open(sc_prop_worker_dc, "rb") as f:
-            subcell_prop_workers_tmp = pkl.load(f)
+        stitch_kws = _stitch_kwargs(organelle)
 
         # load target storage folders for all objects in this chunk
         dest_dc = dict()
@@ -824,34 +962,13 @@ def _write_props_to_sc_thread(args):
         if len(all_obj_keys) == 0:
             continue
 
-        # Now given to IDs of interest, load properties and mapping info
-        prop_dict = [{}, defaultdict(list), {}]
-        mapping_dict = dict()
-        for worker_id, obj_ids in subcell_prop_workers_tmp.items():
-            intersec = set(obj_ids).intersection(all_obj_keys)
-            if len(intersec) > 0:
-                worker_dir_props = f"{global_tmp_path}/tmp_props/props_{worker_id}/"
-                fname = f'{worker_dir_props}/scp_{organelle}_{worker_id}.pkl'
-                dc = basics.load_pkl2obj(fname)
-
-                tmp_dcs = [dict(), defaultdict(list), dict()]
-                for k in intersec:
-                    tmp_dcs[0][k] = dc[0][k]
-                    tmp_dcs[1][k] = dc[1][k]
-                    tmp_dcs[2][k] = dc[2][k]
-                del dc
-                merge_prop_dicts([prop_dict, tmp_dcs])
-                del tmp_dcs
-                # TODO: optimize as above - by creating a temporary dictionary with the intersecting IDs only
-                fname = f'{worker_dir_props}/scm_{organelle}_{worker_id}.pkl'
-                dc = basics.load_pkl2obj(fname)
-                for k in list(dc.keys()):
-                    if k not in all_obj_keys:
-                        del dc[k]
-                # store number of overlap voxels
-                merge_map_dicts([mapping_dict, dc])
-                del dc
-        del subcell_prop_workers_tmp
+        # Now given to IDs of interest, load properties and mapping info. The buckets of this job only
+        # contain objects of its storages.
+        prop_dict = prop_records_to_dicts(merge_prop_records(
+            [tables[0] for tables in _read_shuffle_buckets(segments[f'scp_{organelle}'])]))
+        # store number of overlap voxels
+        mapping_dict = overlap_records_to_dict(merge_overlap_records(
+            [tables[0] for tables in _read_shuffle_buckets(segments[f'scm_{organelle}'])]))
 
         # Trim mesh info to objects of interest
         # keys: chunk IDs, values: (worker_nr, object IDs)
@@ -937,7 +1054,7 @@ def _write_props_to_sc_thread(args):
                     this_attr_dc[sc_id]["mapping_ids"] = []
                     this_attr_dc[sc_id]["mapping_ratios"] = []
                 rp = np.array(prop_dict[0][sc_id], dtype=np.int32)
-                bbs = np.concatenate(prop_dict[1][sc_id])
+                bbs = prop_dict[1][sc_id]
                 size = prop_dict[2][sc_id]
                 this_attr_dc[sc_id]["rep_coord"] = rp
                 this_attr_dc[sc_id]["bounding_box"] = np.array(
@@ -961,7 +1078,7 @@ def _write_props_to_sc_thread(args):
                         list_of_ind.append(single_mesh[0])
                         list_of_ver.append(single_mesh[1])
                         list_of_norm.append(single_mesh[2])
-                    mesh = merge_meshes_incl_norm(list_of_ind, list_of_ver, list_of_norm)
+                    mesh = stitch_meshes(list_of_ind, list_of_ver, list_of_norm, **stitch_kws)
                     obj_mesh_dc[sc_id] = mesh
                     verts = mesh[1].reshape(-1, 3)
                     if len(verts) > 0:
@@ -994,6 +1111,7 @@ def _write_props_to_sv_thread(args):
     n_folders_fs = args[1]
     generate_sv_mesh = args[2]
     processsed_organelles = args[3]
+    segments = args[4]  # locations of the bucketed property and mapping records, see `_write_shuffle_buckets`
     dt_loading_cache = time.time()
     if global_params.config.use_new_subfold:
         target_dir_func = rep_helper.subfold_from_ix_new
@@ -1001,12 +1119,9 @@ def _write_props_to_sv_thread(args):
         target_dir_func = rep_helper.subfold_from_ix_OLD
     mesh_min_obj_vx = global_params.config['meshes']['mesh_min_obj_vx']
     min_obj_vx = global_params.config['cell_objects']['min_obj_vx']['sv']
+    stitch_kws = _stitch_kwargs('sv')
     global_tmp_path = global_params.config.temp_path
     wd = global_params.config.working_dir
-    # get cached mapping and property dicts of current subcellular structure
-    c_prop_worker_dc = f"{global_tmp_path}/c_prop_worker_dict.pkl"
-    with open(c_prop_worker_dc, "rb") as f:
-        cell_prop_workers_tmp = pkl.load(f)
 
     # load target storage folders for all objects in this chunk
     dest_dc = dict()
@@ -1027,61 +1142,32 @@ def _write_props_to_sv_thread(args):
     del dest_dc_tmp
 
     # Now given to IDs of interest, load properties and mapping info
-    prop_dict = [{}, defaultdict(list), {}]
-    mapping_dicts = {k: {} for k in processsed_organelles}
+    # The buckets of this job only contain objects of its storages.
+    prop_dict = prop_records_to_dicts(merge_prop_records(
+        [tables[0] for tables in _read_shuffle_buckets(segments['cp'])]))
     # No size threshold applied in mapping dict as it would require loading the property
     # dictionaries -> when mapping decision is made on cell level non-existing organelles are
     # assumed to be below the size threshold.
-    for worker_id, obj_ids in cell_prop_workers_tmp.items():
-        intersec = set(obj_ids).intersection(all_obj_keys)
-        if len(intersec) > 0:
-            worker_dir_props = f"{global_tmp_path}/tmp_props/props_{worker_id}/"
-            fname = f'{worker_dir_props}/cp_{worker_id}.pkl'
-            dc = basics.load_pkl2obj(fname)
-            tmp_dcs = [dict(), defaultdict(list), dict()]
-            for k in intersec:
-                tmp_dcs[0][k] = dc[0][k]
-                tmp_dcs[1][k] = dc[1][k]
-                tmp_dcs[2][k] = dc[2][k]
-            del dc
-            merge_prop_dicts([prop_dict, tmp_dcs])
-            del tmp_dcs
-
-            # TODO: optimize as above - by creating a temporary dictionary with the intersecting IDs only
-            for organelle in processsed_organelles:
-                fname = f'{worker_dir_props}/scm_{organelle}_{worker_id}.pkl'
-                dc = basics.load_pkl2obj(fname)
-                dc = invert_mdc(dc)  # invert to have cell IDs in top layer
-                for k in list(dc.keys()):
-                    if k not in all_obj_keys:
-                        del dc[k]
-                # should behave also for inverted dicts
-                merge_map_dicts([mapping_dicts[organelle], dc])
-                del dc
-
-    del cell_prop_workers_tmp
-    for md_k in mapping_dicts.keys():
-        md = mapping_dicts[md_k]
-        md = invert_mdc(md)  # invert to have organelle IDs in highest layer
+    mapping_dicts = dict()
+    for organelle in processsed_organelles:
+        # overlap records with cell IDs in field 'id' and organelle IDs in field 'partner_id'
+        recs = merge_overlap_records(
+            [tables[0] for tables in _read_shuffle_buckets(segments[f'scm_inv_{organelle}'])])
         sd_sc = segmentation.SegmentationDataset(
-            obj_type=md_k, working_dir=wd, version=0)
-        size_dc = {k: v for k, v in zip(sd_sc.ids, sd_sc.sizes) if k in md}
+            obj_type=organelle, working_dir=wd, version=0)
+        sc_ids, sc_sizes = sd_sc.ids, sd_sc.sizes
         del sd_sc
-        # normalize overlap with respect to the objects total size
-        for subcell_id in list(md.keys()):
-            # size threshold for objects at the chunk boundary is not applied
-            # when mapping dictionaries are written, therefore objects that
-            # are not part of the SD have been removed.
-            if subcell_id not in size_dc:
-                del md[subcell_id]
-                continue
-            subcell_dc = md[subcell_id]
-            for k, v in subcell_dc.items():
-                # normalize with respect to the number of voxels of the object
-                subcell_dc[k] = v / size_dc[subcell_id]
-        del size_dc
-        md = invert_mdc(md)  # invert to have cell SV IDs in highest layer
-        mapping_dicts[md_k] = md
+        order = np.argsort(sc_ids)
+        sc_ids, sc_sizes = sc_ids[order], sc_sizes[order]
+        # size threshold for objects at the chunk boundary is not applied
+        # when mapping dictionaries are written, therefore objects that
+        # are not part of the SD are removed.
+        ixs = np.clip(np.searchsorted(sc_ids, recs['partner_id']), 0, max(len(sc_ids) - 1, 0))
+        valid = sc_ids[ixs] == recs['partner_id'] if len(sc_ids) > 0 else np.zeros(len(recs), dtype=bool)
+        recs = recs[valid]
+        # normalize with respect to the number of voxels of the organelle
+        mapping_dicts[organelle] = overlap_records_to_dict(recs, values=recs['count'] / sc_sizes[ixs[valid]])
+        del sc_ids, sc_sizes, recs
 
     if global_params.config.use_new_meshing and generate_sv_mesh:
         c_mesh_worker_dc = f"{global_tmp_path}/c_mesh_worker_dict.pkl"
@@ -1170,7 +1256,7 @@ def _write_props_to_sv_thread(args):
                 this_attr_dc[sv_id][f"mapping_{k}_ratios"] = \
                     list(mapping_dicts[k][sv_id].values())
             rp = np.array(prop_dict[0][sv_id], dtype=np.int32)
-            bbs = np.concatenate(prop_dict[1][sv_id])
+            bbs = prop_dict[1][sv_id]
             this_attr_dc[sv_id]["rep_coord"] = rp
             this_attr_dc[sv_id]["bounding_box"] = np.array(
                 [bbs[:, 0].min(axis=0), bbs[:, 1].max(axis=0)])
@@ -1193,7 +1279,7 @@ def _write_props_to_sv_thread(args):
                     list_of_ver.append(single_mesh[1])
                     list_of_norm.append(single_mesh[2])
                 start2 = time.time()
-                mesh = merge_meshes_incl_norm(list_of_ind, list_of_ver, list_of_norm)
+                mesh = stitch_meshes(list_of_ind, list_of_ver, list_of_norm, **stitch_kws)
                 dt_mesh_merge += time.time() - start2
 
                 obj_mesh_dc[sv_id] = mesh
@@ -1219,30 +1305,45 @@ def _write_props_to_sv_thread(args):
     #                    f'{dt_mesh_merge_io:.2f}s')
 
 
-def merge_meshes_dict(m_storage, tmp_dict):
-    """ Merge meshes dictionaries:
-
-    m_storage: list dictionary
-    tmp_dict: list dictionary
-    {obj_id: [faces, vertices, normals]}
+def merge_meshes_dict(m_storage, tmp_dicts: Union[dict, List[dict]], obj_type: str = 'sv'):
     """
-    for obj_id in tmp_dict:
-        merge_meshes_single(m_storage, obj_id, tmp_dict[obj_id])
+    Merge mesh dictionaries into `m_storage`. The partial meshes of every object are collected first and
+    stitched once via :func:`~syconn.proc.meshes.stitch_meshes`.
 
+    Args:
+        m_storage: Object of type MeshStorage.
+        tmp_dicts: Mesh dictionary ``{obj_id: [faces, vertices, normals]}`` or a list of mesh dictionaries.
+        obj_type: Object type, used for the stitching properties, see :func:`_stitch_kwargs`.
+    """
+    if isinstance(tmp_dicts, dict):
+        tmp_dicts = [tmp_dicts]
+    partial_meshes = defaultdict(list)
+    for tmp_dict in tmp_dicts:
+        for obj_id in tmp_dict:
+            partial_meshes[obj_id].append(tmp_dict[obj_id])
+    stitch_kws = _stitch_kwargs(obj_type)
+    for obj_id, meshes in partial_meshes.items():
+        merge_meshes_single(m_storage, obj_id, meshes, stitch_kws)
+
+
+def merge_meshes_single(m_storage, obj_id, meshes: List[list], stitch_kws: dict):
+    """
+    Merge the partial meshes of an object into `m_storage`. Partial meshes and an existing mesh in
+    `m_storage` are welded at the shared chunk faces instead of concatenated.
 
-def merge_meshes_single(m_storage, obj_id, tmp_dict):
-    """ Merge meshes dictionaries:
-    m_storage: objec of type MeshStorage
-    tmp_dict: list dictionary
+    Args:
+        m_storage: Object of type MeshStorage.
+        obj_id: Object ID.
+        meshes: Partial meshes ``[faces, vertices, normals]`` of the object.
+        stitch_kws: Keyword arguments of :func:`~syconn.proc.meshes.stitch_meshes`, see :func:`_stitch_kwargs`.
     """
-    if obj_id not in m_storage:
-        m_storage[obj_id] = [tmp_dict[0], tmp_dict[1], tmp_dict[2]]
-    else:
-        # TODO: this needs to be a parameter -> add global parameter for face type
-        n_el = int((len(m_storage[obj_id][1])) / 3)
-        m_storage[obj_id][0] = np.concatenate((m_storage[obj_id][0], tmp_dict[0] + n_el))
-        m_storage[obj_id][1] = np.concatenate((m_storage[obj_id][1], tmp_dict[1]))
-        m_storage[obj_id][2] = np.concatenate((m_storage[obj_id][2], tmp_dict[2]))
+    if obj_id in m_storage:
+        meshes = [m_storage[obj_id]] + list(meshes)
+    if len(meshes) == 1:
+        m_storage[obj_id] = [meshes[0][0], meshes[0][1], meshes[0][2]]
+        return
+    m_storage[obj_id] = stitch_meshes([m[0] for m in meshes], [m[1] for m in meshes], [m[2] for m in meshes],
+                                      **stitch_kws)
 
 
 def merge_prop_dicts(prop_dicts: List[List[dict]],
@@ -1273,6 +1374,167 @@ def merge_prop_dicts(prop_dicts: List[List[dict]],
                 tot_size[k] = v
 
 
+def prop_records(ids: np.ndarray, rep_coords: np.ndarray, bounding_boxes: np.ndarray, sizes: np.ndarray,
+                 offset: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Build a property record table, e.g. from the arrays returned by
+    :func:`~syconn.extraction.find_object_properties.find_object_properties_fused`.
+
+    Args:
+        ids: Object IDs (N,).
+        rep_coords: Representative coordinates (N, 3).
+        bounding_boxes: Bounding boxes (N, 2, 3).
+        sizes: Sizes (N,).
+        offset: Optional offset which is added to the coordinates.
+
+    Returns:
+        Record table with dtype :attr:`PROP_RECORD_DTYPE`.
+    """
+    records = np.empty(len(ids), dtype=PROP_RECORD_DTYPE)
+    records['id'] = ids
+    records['rc'] = np.reshape(rep_coords, (-1, 3))
+    bounding_boxes = np.reshape(bounding_boxes, (-1, 2, 3))
+    records['bb_min'] = bounding_boxes[:, 0]
+    records['bb_max'] = bounding_boxes[:, 1]
+    records['size'] = sizes
+    if offset is not None:
+        for k in ['rc', 'bb_min', 'bb_max']:
+            records[k] += np.asarray(offset, dtype=np.int32)
+    return records
+
+
+def prop_records_from_dicts(prop_dicts: List[dict], offset: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Convert property dicts ``[rep_coord_dc, bounding_box_dc, size_dc]`` with one bounding box per object
+    (e.g. as returned by :func:`~syconn.extraction.block_processing_C.extract_cs_syntype`) into a record table.
+
+    Args:
+        prop_dicts: Property dicts.
+        offset: Optional offset which is added to the coordinates.
+
+    Returns:
+        Record table with dtype :attr:`PROP_RECORD_DTYPE`.
+    """
+    rc_dc, bb_dc, size_dc = prop_dicts
+    ids = list(rc_dc.keys())
+    return prop_records(np.array(ids, dtype=np.uint64), np.array([rc_dc[k] for k in ids]),
+                        np.array([bb_dc[k] for k in ids]), np.array([size_dc[k] for k in ids]), offset=offset)
+
+
+def merge_prop_records(records: List[np.ndarray]) -> np.ndarray:
+    """
+    Merge property record tables, e.g. of several chunks or workers.
+
+    Args:
+        records: Record tables with dtype :attr:`PROP_RECORD_DTYPE`.
+
+    Returns:
+        Record table sorted by object ID. Records with identical IDs keep their input order.
+    """
+    records = np.concatenate(records) if len(records) > 0 else np.zeros(0, dtype=PROP_RECORD_DTYPE)
+    return records[np.argsort(records['id'], kind='stable')]
+
+
+def prop_records_to_dicts(records: np.ndarray) -> List[dict]:
+    """
+    Group a property record table by object ID. Equivalent to merging the property dicts of every record
+    with :func:`merge_prop_dicts`.
+
+    Args:
+        records: Record table with dtype :attr:`PROP_RECORD_DTYPE`.
+
+    Returns:
+        Property dicts ``[rep_coord_dc, bounding_box_dc, size_dc]`` with the rep. coordinate of the last
+        occurrence, all bounding boxes (K, 2, 3) and the total size of every object ID.
+    """
+    if len(records) == 0:
+        return [{}, defaultdict(list), {}]
+    if np.any(records['id'][1:] < records['id'][:-1]):
+        records = merge_prop_records([records])
+    uniq_ids, first_ixs, cnts = np.unique(records['id'], return_index=True, return_counts=True)
+    uniq_ids = uniq_ids.tolist()
+    rc_dc = dict(zip(uniq_ids, records['rc'][first_ixs + cnts - 1]))
+    bbs = np.stack([records['bb_min'], records['bb_max']], axis=1)
+    bb_dc = defaultdict(list, zip(uniq_ids, np.split(bbs, first_ixs[1:])))
+    size_dc = dict(zip(uniq_ids, np.add.reduceat(records['size'], first_ixs).tolist()))
+    return [rc_dc, bb_dc, size_dc]
+
+
+def overlap_records(ids: np.ndarray, partner_ids: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """
+    Args:
+        ids: Object IDs (N,), e.g. of organelles.
+        partner_ids: IDs of the overlapping objects (N,), e.g. of cell SVs.
+        counts: Number of overlapping voxels (N,).
+
+    Returns:
+        Sparse COO table with dtype :attr:`OVERLAP_RECORD_DTYPE`, may contain duplicate ID pairs.
+    """
+    records = np.empty(len(ids), dtype=OVERLAP_RECORD_DTYPE)
+    records['id'] = ids
+    records['partner_id'] = partner_ids
+    records['count'] = counts
+    return records
+
+
+def merge_overlap_records(records: List[np.ndarray]) -> np.ndarray:
+    """
+    Merge overlap tables and sum the counts of duplicate ID pairs.
+
+    Args:
+        records: Overlap tables with dtype :attr:`OVERLAP_RECORD_DTYPE`.
+
+    Returns:
+        Overlap table with unique ID pairs sorted by ID and partner ID.
+    """
+    records = np.concatenate(records) if len(records) > 0 else np.zeros(0, dtype=OVERLAP_RECORD_DTYPE)
+    if len(records) == 0:
+        return records
+    records = records[np.lexsort((records['partner_id'], records['id']))]
+    new_pair = np.ones(len(records), dtype=bool)
+    new_pair[1:] = (records['id'][1:] != records['id'][:-1]) | \
+                   (records['partner_id'][1:] != records['partner_id'][:-1])
+    first_ixs = np.flatnonzero(new_pair)
+    merged = records[first_ixs]
+    merged['count'] = np.add.reduceat(records['count'], first_ixs)
+    return merged
+
+
+def invert_overlap_records(records: np.ndarray) -> np.ndarray:
+    """
+    Swap IDs and partner IDs of an overlap table, see :func:`invert_mdc`.
+
+    Args:
+        records: Overlap table with dtype :attr:`OVERLAP_RECORD_DTYPE`.
+
+    Returns:
+        Inverted overlap table with unique ID pairs sorted by ID and partner ID.
+    """
+    return merge_overlap_records([overlap_records(records['partner_id'], records['id'], records['count'])])
+
+
+def overlap_records_to_dict(records: np.ndarray, values: Optional[np.ndarray] = None) -> Dict[int, dict]:
+    """
+    Convert an overlap table into a mapping dict.
+
+    Args:
+        records: Overlap table with dtype :attr:`OVERLAP_RECORD_DTYPE`.
+        values: Optional values (N,) which are used instead of the overlap counts, e.g. overlap ratios.
+
+    Returns:
+        Mapping dict: ID -> partner ID -> value (number of overlapping voxels by default).
+    """
+    if values is None:
+        values = records['count']
+    order = np.argsort(records['id'], kind='stable')
+    ids, partner_ids, values = records['id'][order], records['partner_id'][order], np.asarray(values)[order]
+    uniq_ids, first_ixs = np.unique(ids, return_index=True)
+    bounds = first_ixs.tolist() + [len(ids)]
+    partner_ids, values = partner_ids.tolist(), values.tolist()
+    return {k: dict(zip(partner_ids[start:stop], values[start:stop]))
+            for k, start, stop in zip(uniq_ids.tolist(), bounds[:-1], bounds[1:])}
+
+
 def convert_nvox2ratio_mapdict(map_dc):
     """convert number of overlap voxels of each subcellular structure object
      inside the mapping dicts to each cell SV
@@ -13,7 +13,7 @@ import networkx as nx
 import cloudvolume
 from syconn.extraction.block_processing_C import relabel_vol_nonexist2zero
 from syconn.reps.super_segmentation import SuperSegmentationDataset
-from syconn.reps.super_segmentation_helper import stitch_skel_nx
+from syconn.proc.graphs import connect_components_mst
 from syconn.handler.basics import load_pkl2obj, kd_factory
 from syconn import global_params
 
@@ -116,13 +116,11 @@ def kimimaro_mergeskels(path_list: str, cell_id: int, nb_cpus: bool = None,
     skel = cloudvolume.PrecomputedSkeleton.simple_merge(skel_list).consolidate()
     if skel.vertices.size == 0:
         return skel
-    # convert cloud volume skeleton to networkx graph
-    skel = skelcv2nxgraph(skel)
-    # Fuse all remaining components into a single skeleton and convert it back to cloud volume skeleton
-    skel = nxgraph2skelcv(stitch_skel_nx(skel, n_jobs=nb_cpus))
+    # Fuse all remaining components into a single skeleton
+    skel = stitch_skelcv(skel, n_jobs=nb_cpus)
     # remove small stubs and single connected components with less than 500 nodes. The latter is not applicable as
-    # `stitch_skel_nx` merges all connected components regardless of their distance.
-    # TODO: kimimaro.postprocess should probably be executed before `stitch_skel_nx` to remove "dust" - requires
+    # `stitch_skelcv` merges all connected components regardless of their distance.
+    # TODO: kimimaro.postprocess should probably be executed before `stitch_skelcv` to remove "dust" - requires
     #  performance monitoring in large, "branchy" neurons and astrocytes.
     skel_post = kimimaro.postprocess(
         skel,
@@ -133,10 +131,28 @@ def kimimaro_mergeskels(path_list: str, cell_id: int, nb_cpus: bool = None,
         skel_post = skel
     # `kimimaro.postprocess` does not guarantee to return a single connected component (?!), merge them again..
     if skel_post.vertices.size > 0:
-        skel_post = nxgraph2skelcv(stitch_skel_nx(skelcv2nxgraph(skel_post)))
+        skel_post = stitch_skelcv(skel_post, n_jobs=nb_cpus)
     return skel_post
 
 
+def stitch_skelcv(skel: cloudvolume.Skeleton, n_jobs: int = 1) -> cloudvolume.Skeleton:
+    """
+    Join all connected components of a skeleton in-place by the edges of a minimum spanning tree over the
+    components, see :func:`~syconn.proc.graphs.connect_components_mst`.
+
+    Args:
+        skel: Skeleton.
+        n_jobs: Number of jobs used for query of cKDTree.
+
+    Returns:
+        Single connected component skeleton.
+    """
+    new_edges = connect_components_mst(skel.vertices, skel.edges, n_jobs=n_jobs)
+    if len(new_edges) > 0:
+        skel.edges = np.concatenate([skel.edges, new_edges.astype(skel.edges.dtype)])
+    return skel
+
+
 def skelcv2nxgraph(skel: cloudvolume.Skeleton) -> nx.Graph:
     """
     Transform skeleton (cloud volume) to networkx graph with node attributes 'position' and 'radius' taken from
@@ -5,16 +5,21 @@
 # Max-Planck-Institute of Neurobiology, Munich, Germany
 # Authors: Philipp Schubert, Joergen Kornfeld
 import os
-from collections import Counter
-from typing import Tuple, Optional, Union, List, Dict, Any
+from collections.abc import Mapping
+from typing import Tuple, Optional, Union, List, Dict, Any, Hashable, Iterator, Iterable
 
 import numpy as np
 from scipy import spatial
 
 from .. import global_params
+from ..backend.cache import get_object_cache, object_cache_key
 from ..handler.config import DynConfig
 from ..reps import log_reps
 
+#: Object IDs are divided by this number before the storage folder is derived from them, see
+#: :func:`subfold_from_ix_new`.
+SUBFOLD_DIV_BASE = 1000
+
 
 def knossos_ml_from_svixs(sv_ixs: Union[np.ndarray, List],
                           coords: Optional[Union[np.ndarray, List[np.ndarray]]] = None,
@@ -153,7 +158,7 @@ def subfold_from_ix_new(ix, n_folders):
     assert n_folders % 10 == 0
     order = int(np.log10(n_folders))
     subfold = "/"
-    div_base = 1e3  # TODO: make this a parameter
+    div_base = float(SUBFOLD_DIV_BASE)
     ix = int(ix // div_base % n_folders)  # carve out the middle part
     id_str = '{num:0{w}d}'.format(num=ix, w=order)
 
@@ -163,6 +168,24 @@ def subfold_from_ix_new(ix, n_folders):
     return subfold
 
 
+def subfold_ixs(ids: np.ndarray, n_folders: int) -> np.ndarray:
+    """
+    Storage folder index of every object ID, i.e. the position of its storage folder in
+    :func:`get_unique_subfold_ixs`. Vectorized counterpart of :func:`subfold_from_ix`.
+
+    Args:
+        ids: Object IDs.
+        n_folders: Number of storage folders.
+
+    Returns:
+        Folder index of every ID.
+    """
+    ids = np.asarray(ids, dtype=np.uint64)
+    if global_params.config.use_new_subfold:
+        ids = ids // np.uint64(SUBFOLD_DIV_BASE)
+    return (ids % np.uint64(n_folders)).astype(np.int64)
+
+
 def subfold_from_ix_OLD(ix, n_folders, old_version=False):
     """
     # TODO: remove 'old_version' as soon as possible, currently there is one usage
@@ -219,11 +242,10 @@ def ix_from_subfold_new(subfold, n_folders):
     """
     parts = subfold.strip("/").split("/")
     order = int(np.log10(n_folders))
-    # TODO: ' + "000"' needs to be adapted if `div_base` is made variable in `subfold_from_ix`
     if order % 2 == 0:
-        return np.uint("".join("%.2d" % int(part) for part in parts) + "000")
+        return np.uint(int("".join("%.2d" % int(part) for part in parts)) * SUBFOLD_DIV_BASE)
     else:
-        return np.uint("".join("%.2d" % int(part) for part in parts[:-1]) + parts[-1] + "000")
+        return np.uint(int("".join("%.2d" % int(part) for part in parts[:-1]) + parts[-1]) * SUBFOLD_DIV_BASE)
 
 
 def ix_from_subfold_OLD(subfold, n_folders):
@@ -271,8 +293,7 @@ def get_unique_subfold_ixs(n_folders):
         np.ndarray
     """
     if global_params.config.use_new_subfold:
-        # TODO: this needs to be adapted as soon as `div_base` is changed in `subfold_from_ix`
-        storage_location_ids = [int(str(ix) + "000") for ix in np.arange(n_folders)]
+        storage_location_ids = [int(ix) * SUBFOLD_DIV_BASE for ix in np.arange(n_folders)]
     else:
         storage_location_ids = np.arange(n_folders)
     return storage_location_ids
@@ -317,23 +338,47 @@ def colorcode_vertices(vertices, rep_coords, rep_values, colors=None,
                   '. Note that currently only consecutive labels are supported.'
             log_reps.error(msg)
             raise ValueError(msg)
+    rep_values = np.asarray(rep_values)
+    if rep_values.ndim == 2 and rep_values.shape[1] == 1:
+        rep_values = rep_values[:, 0]
     hull_tree = spatial.cKDTree(rep_coords)
     if k > len(rep_coords):
         k = len(rep_coords)
     dists, ixs = hull_tree.query(vertices, n_jobs=nb_cpus, k=k)
-    hull_rep = np.zeros((len(vertices)), dtype=np.int32)
-    for i in range(len(ixs)):
-        curr_reps = np.array(rep_values)[ixs[i]]
-        if np.isscalar(curr_reps):
-            curr_reps = np.array([curr_reps])
-        curr_maj = Counter(curr_reps).most_common(1)[0][0]
-        hull_rep[i] = curr_maj
+    hull_rep = knn_majority_vote(rep_values[ixs]).astype(np.int32)
     if not return_color:
         return hull_rep
     vert_col = colors[hull_rep]
     return vert_col
 
 
+def knn_majority_vote(knn_values: np.ndarray, max_elements: int = int(1e7)) -> np.ndarray:
+    """
+    Majority value of every row in `knn_values`. Ties are resolved in favor of the value which occurs
+    first in the row, i.e. the closest neighbor, which is equivalent to ``Counter(row).most_common(1)``.
+
+    Args:
+        knn_values: Values of the k nearest neighbors of N locations [N, k], sorted by distance. 1D arrays
+            are treated as k=1.
+        max_elements: Maximum number of elements of the pairwise [n, k, k] comparison processed at once.
+
+    Returns:
+        Majority value for every location [N].
+    """
+    knn_values = np.asarray(knn_values)
+    if knn_values.ndim == 1 or knn_values.shape[1] == 1:
+        return knn_values.reshape(len(knn_values)).copy()
+    n, k = knn_values.shape
+    res = np.empty(n, dtype=knn_values.dtype)
+    step = max(1, max_elements // (k * k))
+    for start in range(0, n, step):
+        vals = knn_values[start:start + step]
+        # occurrences of each neighbor's value within its row; argmax returns the first maximum
+        cnts = (vals[:, :, None] == vals[:, None, :]).sum(axis=2)
+        res[start:start + step] = vals[np.arange(len(vals)), np.argmax(cnts, axis=1)]
+    return res
+
+
 def assign_rep_values(target_coords, rep_coords, rep_values,
                       nb_cpus=-1, return_ixs=False):
     """
@@ -417,11 +462,586 @@ def surface_samples(coords: np.ndarray,
     return samples
 
 
+class SpatialIndex:
+    """
+    KD-tree over a fixed set of points, e.g. the skeleton nodes or mesh vertices of a cell (in nm), for
+    batched k-nearest neighbor, radius and majority label queries of arrays of coordinates. See
+    :func:`~syconn.reps.super_segmentation_object.SuperSegmentationObject.spatial_index`.
+
+    Examples:
+        Majority vertex label of the five nearest vertices at every synapse::
+
+            index = SpatialIndex(vertices, labels=dict(spiness=vertex_labels))
+            syn_labels = index.majority_labels(syn_coords * scaling, 'spiness', k=5)
+    """
+
+    def __init__(self, points: np.ndarray, labels: Optional[Dict[str, np.ndarray]] = None, nb_cpus: int = 1):
+        """
+        Args:
+            points: Point coordinates [N, 3].
+            labels: Per-point label arrays, each of length N.
+            nb_cpus: Number of threads used for the KD-tree queries.
+        """
+        self.points = np.asarray(points).reshape(-1, 3)
+        self.labels = dict() if labels is None else {k: np.asarray(v) for k, v in labels.items()}
+        for k, v in self.labels.items():
+            if len(v) != len(self.points):
+                raise ValueError(f'Number of labels "{k}" ({len(v)}) and points ({len(self.points)}) differ.')
+        self.nb_cpus = nb_cpus
+        self.tree = spatial.cKDTree(self.points)
+
+    def __len__(self):
+        return len(self.points)
+
+    def __repr__(self):
+        return f'{type(self).__name__}(n_points={len(self)}, labels={list(self.labels)})'
+
+    def _values(self, values: Union[str, np.ndarray]) -> np.ndarray:
+        return self.labels[values] if isinstance(values, str) else np.asarray(values)
+
+    def query(self, coords: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        k-nearest neighbor query, `k` is lowered to the number of points if necessary.
+
+        Args:
+            coords: Query coordinates [M, 3].
+            k: Number of nearest neighbors.
+
+        Returns:
+            Distances and point indices, [M] if `k` is 1, else [M, k].
+        """
+        k = min(k, len(self))
+        return self.tree.query(np.asarray(coords).reshape(-1, 3), k=k, n_jobs=self.nb_cpus)
+
+    def query_radius(self, coords: np.ndarray, radius: float, fill_nearest: bool = False) \
+            -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Points within `radius` of every coordinate in compressed sparse row format.
+
+        Args:
+            coords: Query coordinates [M, 3].
+            radius: Query radius.
+            fill_nearest: Use the nearest point for coordinates without any point within `radius`.
+
+        Returns:
+            Flat point indices and row offsets [M + 1], the neighbors of coordinate i are
+            ``ixs[offsets[i]:offsets[i + 1]]``.
+        """
+        coords = np.asarray(coords).reshape(-1, 3)
+        nbs = self.tree.query_ball_point(coords, radius, n_jobs=self.nb_cpus)
+        lengths = np.fromiter((len(nb) for nb in nbs), dtype=np.int64, count=len(nbs))
+        if fill_nearest and np.any(lengths == 0):
+            empty = np.nonzero(lengths == 0)[0]
+            _, nn_ixs = self.tree.query(coords[empty], k=1, n_jobs=self.nb_cpus)
+            for ix, nn_ix in zip(empty, nn_ixs):
+                nbs[ix] = [nn_ix]
+            lengths[empty] = 1
+        offsets = np.zeros(len(nbs) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        ixs = np.fromiter((ix for nb in nbs for ix in nb), dtype=np.int64, count=offsets[-1])
+        return ixs, offsets
+
+    def majority_labels(self, coords: np.ndarray, values: Union[str, np.ndarray], k: int = 1) -> np.ndarray:
+        """
+        Majority label of the `k` nearest points, ties are resolved in favor of the closest point.
+
+        Args:
+            coords: Query coordinates [M, 3].
+            values: Key of the per-point labels or label array.
+            k: Number of nearest neighbors.
+
+        Returns:
+            Majority label for every coordinate [M].
+        """
+        _, ixs = self.query(coords, k=k)
+        return knn_majority_vote(self._values(values)[ixs])
+
+    def radius_majority_labels(self, values: Union[str, np.ndarray], ixs: np.ndarray,
+                               offsets: np.ndarray) -> np.ndarray:
+        """
+        Majority label of the points within the neighborhoods given by :func:`~query_radius`, ties are
+        resolved in favor of the smallest label. Multi-dimensional labels (e.g. embeddings [N, D]) are
+        compared as rows, i.e. the most frequent row of every neighborhood is returned (ties are resolved
+        in favor of the lexicographically smallest row) instead of an element-wise majority. Empty
+        neighborhoods are assigned -1 (all elements for multi-dimensional labels).
+
+        Args:
+            values: Key of the per-point labels or label array [N, ...].
+            ixs: Flat point indices.
+            offsets: Row offsets.
+
+        Returns:
+            Majority label for every neighborhood [M, ...].
+        """
+        values = self._values(values)
+        n_rows = len(offsets) - 1
+        uniq, codes = np.unique(values, axis=0, return_inverse=True)
+        codes = codes.reshape(-1)
+        rows = np.repeat(np.arange(n_rows), np.diff(offsets))
+        pairs, cnts = np.unique(rows * len(uniq) + codes[ixs], return_counts=True)
+        pair_rows, pair_codes = pairs // len(uniq), pairs % len(uniq)
+        # first pair of every row after sorting by row, descending count and ascending label
+        order = np.lexsort((pair_codes, -cnts, pair_rows))
+        first = order[np.diff(pair_rows[order], prepend=-1) != 0]
+        dtype = values.dtype if values.dtype.kind in 'if' else np.int64
+        res = np.full((n_rows,) + values.shape[1:], -1, dtype=dtype)
+        res[pair_rows[first]] = uniq[pair_codes[first]]
+        return res
+
+
+class IDIndex:
+    """
+    Look-up from object ID to its index in an (unsorted) ID array, e.g.
+    :py:attr:`~syconn.reps.segmentation.SegmentationDataset.ids`. Uses a sorted copy
+    of the IDs and the corresponding sort order (16 bytes per ID) and binary search
+    instead of a python dictionary.
+
+    Examples:
+        The index can be used like the former ``soid2ix`` dictionary or with arrays::
+
+            ix = sd.soid2ix[obj_id]
+            ixs = sd.soid2ix.get_indices(obj_ids)
+    """
+
+    def __init__(self, sorted_ids: np.ndarray, order: np.ndarray):
+        """
+        Args:
+            sorted_ids: Sorted ID array.
+            order: Index of every element of `sorted_ids` in the original ID array.
+        """
+        self.sorted_ids = sorted_ids
+        self.order = order
+
+    @classmethod
+    def from_ids(cls, ids: np.ndarray) -> 'IDIndex':
+        """
+        Args:
+            ids: ID array.
+
+        Returns:
+            Index of the ID array.
+        """
+        order = np.argsort(ids, kind='stable')
+        return cls(ids[order], order)
+
+    @staticmethod
+    def paths(base_path: str) -> Tuple[str, str]:
+        """
+        Args:
+            base_path: Path of the ID array without the '.npy' suffix.
+
+        Returns:
+            Paths to the sorted ID array and the sort order.
+        """
+        return base_path + '_sorted.npy', base_path + '_order.npy'
+
+    @classmethod
+    def load(cls, base_path: str) -> 'IDIndex':
+        """
+        Memory-map a persisted index, see :func:`~save`.
+
+        Args:
+            base_path: Path of the ID array without the '.npy' suffix.
+
+        Returns:
+            The index.
+        """
+        p_sorted, p_order = cls.paths(base_path)
+        return cls(np.load(p_sorted, mmap_mode='r'), np.load(p_order, mmap_mode='r'))
+
+    def save(self, base_path: str):
+        """
+        Store the index next to the ID array.
+
+        Args:
+            base_path: Path of the ID array without the '.npy' suffix.
+        """
+        for p, arr in zip(self.paths(base_path), [self.sorted_ids, self.order]):
+            # other processes might memory-map the file concurrently
+            tmp_p = p + f'.{os.getpid()}.tmp.npy'
+            np.save(tmp_p, arr)
+            os.replace(tmp_p, p)
+
+    def __len__(self):
+        return len(self.sorted_ids)
+
+    def __contains__(self, obj_id: int) -> bool:
+        return bool(self.get_indices(np.array([obj_id]), return_found_mask=True)[1][0])
+
+    def __getitem__(self, obj_id: int) -> int:
+        ixs, found = self.get_indices(np.array([obj_id]), return_found_mask=True)
+        if not found[0]:
+            raise KeyError(obj_id)
+        return int(ixs[0])
+
+    def get_indices(self, obj_ids: Union[np.ndarray, List[int]], return_found_mask: bool = False) \
+            -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+        """
+        Vectorized look-up of the indices of `obj_ids` in the original ID array.
+
+        Args:
+            obj_ids: Object IDs.
+            return_found_mask: Return a mask of the IDs that exist instead of raising a KeyError.
+                Indices of missing IDs are 0.
+
+        Returns:
+            Index array (and mask of found IDs).
+        """
+        obj_ids = np.asarray(obj_ids)
+        if obj_ids.dtype.kind in 'iu':
+            # avoid implicit casts to float when comparing e.g. int64 queries with uint64 IDs
+            obj_ids = obj_ids.astype(self.sorted_ids.dtype, copy=False)
+        pos = np.searchsorted(self.sorted_ids, obj_ids)
+        pos[pos == len(self.sorted_ids)] = max(len(self.sorted_ids) - 1, 0)
+        if len(self.sorted_ids) == 0:
+            found = np.zeros(obj_ids.shape, dtype=bool)
+            ixs = np.zeros(obj_ids.shape, dtype=np.int64)
+        else:
+            found = self.sorted_ids[pos] == obj_ids
+            ixs = np.array(self.order[pos], dtype=np.int64)
+            ixs[~found] = 0
+        if return_found_mask:
+            return ixs, found
+        if not np.all(found):
+            raise KeyError(f'IDs {obj_ids[~found]} do not exist.')
+        return ixs
+
+
+class CSRMapping(Mapping):
+    """
+    Read-only mapping from an ID (e.g. cell ID) to an array of IDs (e.g. supervoxel IDs) in
+    compressed sparse row format: sorted keys, row pointers and the flat concatenation of all
+    value arrays. The arrays can be memory-mapped from ``.npy`` files, which avoids unpickling
+    python dictionaries with millions of entries.
+
+    Examples:
+        Look-ups in both directions::
+
+            sv_ids = csr_mapping[ssv_id]
+            ssv_ids = csr_mapping.get_keys(sv_ids)
+    """
+
+    def __init__(self, key_ids: np.ndarray, indptr: np.ndarray, value_ids: np.ndarray):
+        """
+        Args:
+            key_ids: Sorted keys.
+            indptr: Row pointers, the values of ``key_ids[i]`` are ``value_ids[indptr[i]:indptr[i+1]]``.
+            value_ids: Flat value array.
+        """
+        assert len(indptr) == len(key_ids) + 1
+        self.key_ids = key_ids
+        self.indptr = indptr
+        self.value_ids = value_ids
+        self._value_index = None
+
+    @classmethod
+    def from_dict(cls, dc: Dict[int, Union[np.ndarray, List[int]]], dtype=np.uint64) -> 'CSRMapping':
+        """
+        Args:
+            dc: Dictionary with ID arrays as values.
+            dtype: Data type of keys and values.
+
+        Returns:
+            The mapping.
+        """
+        key_ids = np.fromiter(dc.keys(), dtype=dtype, count=len(dc))
+        order = np.argsort(key_ids, kind='stable')
+        key_ids = key_ids[order]
+        values = list(dc.values())
+        values = [np.asarray(values[ix], dtype=dtype).ravel() for ix in order]
+        indptr = np.zeros(len(key_ids) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(v) for v in values])
+        value_ids = np.concatenate(values) if len(values) > 0 else np.zeros(0, dtype=dtype)
+        return cls(key_ids, indptr, value_ids)
+
+    @staticmethod
+    def paths(base_path: str) -> Tuple[str, str, str]:
+        """
+        Args:
+            base_path: Common path prefix of the array files.
+
+        Returns:
+            Paths to the key, row pointer and value arrays.
+        """
+        return base_path + '_keys.npy', base_path + '_indptr.npy', base_path + '_values.npy'
+
+    @classmethod
+    def exists(cls, base_path: str) -> bool:
+        return all(os.path.isfile(p) for p in cls.paths(base_path))
+
+    @classmethod
+    def load(cls, base_path: str, mmap_mode: Optional[str] = 'r') -> 'CSRMapping':
+        """
+        Load a persisted mapping, see :func:`~save`. Uses the persisted value index for
+        :func:`~get_keys` if it exists.
+
+        Args:
+            base_path: Common path prefix of the array files.
+            mmap_mode: Memory-map mode passed to ``np.load``.
+
+        Returns:
+            The mapping.
+        """
+        csr = cls(*[np.load(p, mmap_mode=mmap_mode) for p in cls.paths(base_path)])
+        if os.path.isfile(IDIndex.paths(base_path + '_values')[0]):
+            csr._value_index = IDIndex.load(base_path + '_values')
+        return csr
+
+    def save(self, base_path: str, save_value_index: bool = True):
+        """
+        Store the arrays as ``.npy`` files.
+
+        Args:
+            base_path: Common path prefix of the array files.
+            save_value_index: Also store the index used for look-ups from value to key.
+        """
+        for p, arr in zip(self.paths(base_path), [self.key_ids, self.indptr, self.value_ids]):
+            # other processes might memory-map the file concurrently
+            tmp_p = p + f'.{os.getpid()}.tmp.npy'
+            np.save(tmp_p, arr)
+            os.replace(tmp_p, p)
+        if save_value_index:
+            self.value_index.save(base_path + '_values')
+
+    @property
+    def value_index(self) -> IDIndex:
+        """
+        Index of :py:attr:`~value_ids`, see :class:`~IDIndex`.
+        """
+        if self._value_index is None:
+            self._value_index = IDIndex.from_ids(self.value_ids)
+        return self._value_index
+
+    def lengths(self) -> np.ndarray:
+        """
+        Returns:
+            Number of values of every key.
+        """
+        return np.diff(self.indptr)
+
+    def __len__(self):
+        return len(self.key_ids)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.key_ids.tolist())
+
+    def __contains__(self, key: int) -> bool:
+        return self._row(key) is not None
+
+    def __getitem__(self, key: int) -> np.ndarray:
+        row = self._row(key)
+        if row is None:
+            raise KeyError(key)
+        return np.array(self.value_ids[self.indptr[row]:self.indptr[row + 1]])
+
+    def _row(self, key: int) -> Optional[int]:
+        if len(self.key_ids) == 0 or not np.isscalar(key) or isinstance(key, (str, bytes)):
+            return None
+        if key < 0:
+            return None
+        key = self.key_ids.dtype.type(key)
+        row = int(np.searchsorted(self.key_ids, key))
+        if row == len(self.key_ids) or self.key_ids[row] != key:
+            return None
+        return row
+
+    def get_keys(self, value_ids: Union[np.ndarray, List[int]], return_found_mask: bool = False) \
+            -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+        """
+        Vectorized reverse look-up of the key of every value, e.g. the cell ID of supervoxel IDs.
+        Values which occur in multiple rows are assigned to one of them.
+
+        Args:
+            value_ids: Values.
+            return_found_mask: Return a mask of the values that exist instead of raising a KeyError.
+                Keys of missing values are 0.
+
+        Returns:
+            Key array (and mask of found values).
+        """
+        pos, found = self.value_index.get_indices(value_ids, return_found_mask=True)
+        if len(self.key_ids) == 0:
+            keys = np.zeros(pos.shape, dtype=self.key_ids.dtype)
+        else:
+            rows = np.searchsorted(self.indptr, pos, side='right') - 1
+            keys = self.key_ids[np.clip(rows, 0, len(self.key_ids) - 1)]
+            keys[~found] = 0
+        if return_found_mask:
+            return keys, found
+        if not np.all(found):
+            raise KeyError(f'IDs {np.asarray(value_ids)[~found]} do not exist.')
+        return keys
+
+
+class RaggedArray:
+    """
+    Array of variable-length rows (e.g. the 'mapping_mi_ids' of every supervoxel) stored as flat
+    values and row pointers instead of a numpy array with object dtype. Both arrays are persisted
+    as ``.npy`` files and can be memory-mapped; rows are returned as views.
+
+    Examples:
+        Indexing with an integer returns the row, indexing with a slice or index array returns a
+        :class:`~RaggedArray`::
+
+            ids = ragged[5]
+            ragged_subset = ragged[[3, 1]]
+    """
+
+    def __init__(self, values: np.ndarray, indptr: np.ndarray):
+        """
+        Args:
+            values: Flat value array.
+            indptr: Row pointers, row ``i`` is ``values[indptr[i]:indptr[i+1]]``.
+        """
+        self.values = values
+        self.indptr = indptr
+
+    @classmethod
+    def from_list(cls, rows: Iterable[Union[np.ndarray, List]], dtype=None) -> 'RaggedArray':
+        """
+        Args:
+            rows: Rows, e.g. a list of lists or a numpy array with object dtype.
+            dtype: Data type of the values. Inferred from the rows if None.
+
+        Returns:
+            The ragged array.
+        """
+        rows = [np.asarray(row, dtype=dtype).ravel() for row in rows]
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(row) for row in rows])
+        if dtype is None:
+            dtype = np.result_type(*[row for row in rows if len(row) > 0]) if indptr[-1] > 0 else np.float64
+        values = np.concatenate(rows).astype(dtype, copy=False) if len(rows) > 0 else np.zeros(0, dtype=dtype)
+        return cls(values, indptr)
+
+    @staticmethod
+    def paths(base_path: str) -> Tuple[str, str]:
+        """
+        Args:
+            base_path: Common path prefix of the array files.
+
+        Returns:
+            Paths to the value and row pointer arrays.
+        """
+        return base_path + '_values.npy', base_path + '_indptr.npy'
+
+    @classmethod
+    def exists(cls, base_path: str) -> bool:
+        return all(os.path.isfile(p) for p in cls.paths(base_path))
+
+    @classmethod
+    def load(cls, base_path: str, mmap_mode: Optional[str] = None) -> 'RaggedArray':
+        """
+        Args:
+            base_path: Common path prefix of the array files.
+            mmap_mode: Memory-map mode passed to ``np.load``.
+
+        Returns:
+            The ragged array.
+        """
+        # use plain ndarray views instead of np.memmap
+        return cls(*[np.asarray(np.load(p, mmap_mode=mmap_mode)) for p in cls.paths(base_path)])
+
+    def save(self, base_path: str):
+        """
+        Store the arrays as ``.npy`` files.
+
+        Args:
+            base_path: Common path prefix of the array files.
+        """
+        for p, arr in zip(self.paths(base_path), [self.values, self.indptr]):
+            # other processes might memory-map the file concurrently
+            tmp_p = p + f'.{os.getpid()}.tmp.npy'
+            np.save(tmp_p, arr)
+            os.replace(tmp_p, p)
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.values.dtype
+
+    @property
+    def shape(self) -> Tuple[int]:
+        return len(self),
+
+    def lengths(self) -> np.ndarray:
+        """
+        Returns:
+            Number of values in every row.
+        """
+        return np.diff(self.indptr)
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        for ii in range(len(self)):
+            yield self.values[self.indptr[ii]:self.indptr[ii + 1]]
+
+    def __getitem__(self, ix: Union[int, slice, np.ndarray, List[int]]) -> Union[np.ndarray, 'RaggedArray']:
+        if np.isscalar(ix):
+            ix = int(ix)
+            if ix < 0:
+                ix += len(self)
+            if not 0 <= ix < len(self):
+                raise IndexError(f'Index {ix} is out of bounds for {self}.')
+            return self.values[self.indptr[ix]:self.indptr[ix + 1]]
+        if isinstance(ix, slice):
+            start, stop, step = ix.indices(len(self))
+            if step == 1:
+                stop = max(start, stop)
+                indptr = np.asarray(self.indptr[start:stop + 1])
+                return RaggedArray(self.values[indptr[0]:indptr[-1]], indptr - indptr[0])
+            ix = np.arange(start, stop, step)
+        ix = np.asarray(ix)
+        if ix.dtype == bool:
+            ix = np.nonzero(ix)[0]
+        elif len(ix) == 0:
+            ix = ix.astype(np.int64)
+        starts = np.asarray(self.indptr[:-1])[ix]
+        lengths = np.asarray(self.indptr[1:])[ix] - starts
+        indptr = np.zeros(len(ix) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        # index of every value of the selected rows
+        value_ixs = np.repeat(starts - indptr[:-1], lengths) + np.arange(indptr[-1])
+        return RaggedArray(self.values[value_ixs], indptr)
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        return self.to_object_array()
+
+    def __repr__(self):
+        return f'{type(self).__name__}(n_rows={len(self)}, n_values={len(self.values)}, dtype={self.dtype})'
+
+    def to_object_array(self) -> np.ndarray:
+        """
+        Returns:
+            Numpy array with object dtype and the rows as elements.
+        """
+        res = np.empty(len(self), dtype=object)
+        for ii, row in enumerate(self):
+            res[ii] = row
+        return res
+
+
 class SegmentationBase:
     _scaling = None
     _working_dir = None
     _config = None
 
+    def _object_cache_key(self, kind: Hashable) -> tuple:
+        """
+        Key of the `kind` item (e.g. 'mesh', 'skeleton', 'attr_dict') of this object in the
+        process-wide object cache, see :mod:`~syconn.backend.cache`.
+        """
+        return object_cache_key(self._working_dir, self.type, self.version, self.id, kind)
+
+    def _invalidate_cached(self, *kinds: Hashable):
+        """
+        Remove the given items of this object from the process-wide object cache.
+        """
+        cache = get_object_cache()
+        for kind in kinds:
+            cache.invalidate(self._object_cache_key(kind))
+
     def _setup_working_dir(self, working_dir: Optional[str], config: Optional[DynConfig],
                            version: Optional[str], scaling: Optional[np.ndarray]):
         """
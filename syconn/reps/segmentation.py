@@ -6,13 +6,14 @@
 # Authors: Philipp Schubert, Joergen Kornfeld
 import copy
 import re
-from typing import Union, Tuple, List, Optional, Dict, Generator, Any, Iterator
+from typing import Union, Tuple, List, Optional, Dict, Generator, Any, Iterator, Iterable
 
 import networkx as nx
 from knossos_utils import knossosdataset
 from scipy import spatial
 
-from .rep_helper import subfold_from_ix, knossos_ml_from_svixs, SegmentationBase, get_unique_subfold_ixs
+from .rep_helper import subfold_from_ix, knossos_ml_from_svixs, SegmentationBase, get_unique_subfold_ixs, IDIndex, \
+    RaggedArray, subfold_ixs
 from .segmentation_helper import *
 from ..handler.basics import get_filepaths_from_dir, safe_copy, \
     write_txt2kzip
@@ -21,6 +22,7 @@ from ..handler.config import DynConfig
 from ..proc import meshes
 from ..proc.meshes import mesh_area_calc
 from ..backend.storage import VoxelStorageDyn
+from ..backend.cache import load_cached
 
 MeshType = Union[Tuple[np.ndarray, np.ndarray, np.ndarray], List[np.ndarray],
                  Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]
@@ -748,8 +750,12 @@ class SegmentationObject(SegmentationBase):
             voxels[vxs_list[..., 0], vxs_list[..., 1], vxs_list[..., 2]] = True
         else:
             if voxel_dc is None:
-                voxel_dc = VoxelStorageDyn(self.voxel_path, read_only=True, disable_locking=True)
-            voxels = voxel_dc.get_voxel_data_cubed(self.id)[0]
+                def _load_voxels():
+                    voxel_dc = VoxelStorageDyn(self.voxel_path, read_only=True, disable_locking=True)
+                    return voxel_dc.get_voxel_data_cubed(self.id)[0]
+                voxels = load_cached(self._object_cache_key('voxels'), self.voxel_path + '.pkl', _load_voxels)
+            else:
+                voxels = voxel_dc.get_voxel_data_cubed(self.id)[0]
         if self.voxel_caching:
             self._voxels = voxels
         return voxels
@@ -913,6 +919,7 @@ class SegmentationObject(SegmentationBase):
                               disable_locking=not self.enable_locking)
         mesh_dc[self.id] = [ind, vert, normals]
         mesh_dc.push()
+        self._invalidate_cached('mesh')
 
     def mesh2kzip(self, dest_path: str, ext_color: Optional[Union[
         Tuple[int, int, int, int], List, np.ndarray]] = None,
@@ -1043,9 +1050,9 @@ class SegmentationObject(SegmentationBase):
             0 if successful, -1 if attribute dictionary storage does not exist.
         """
         try:
-            glob_attr_dc = AttributeDict(self.attr_dict_path,
-                                         disable_locking=True)  # disable locking, PS 07June2019
-            self.attr_dict = glob_attr_dc[self.id]
+            # disable locking, PS 07June2019
+            self.attr_dict = load_cached(self._object_cache_key('attr_dict'), self.attr_dict_path,
+                                         lambda: AttributeDict(self.attr_dict_path, disable_locking=True)[self.id])
         except (IOError, EOFError) as e:
             log_reps.critical("Could not load SSO attributes at {} due to "
                               "{}.".format(self.attr_dict_path, e))
@@ -1065,6 +1072,7 @@ class SegmentationObject(SegmentationBase):
             orig_dc = self.attr_dict
         glob_attr_dc[self.id] = orig_dc
         glob_attr_dc.push()
+        self._invalidate_cached('attr_dict')
 
     def save_attributes(self, attr_keys: List[str], attr_values: List[Any]):
         """
@@ -1090,6 +1098,7 @@ class SegmentationObject(SegmentationBase):
         for k, v in zip(attr_keys, attr_values):
             glob_attr_dc[self.id][k] = v
         glob_attr_dc.push()
+        self._invalidate_cached('attr_dict')
 
     def load_attributes(self, attr_keys: List[str]) -> List[Any]:
         """
@@ -1762,7 +1771,8 @@ class SegmentationDataset(SegmentationBase):
             yield self.get_segmentation_object(self.ids[ix])
             ix += 1
 
-    def load_numpy_data(self, prop_name, allow_nonexisting: bool = True) -> np.ndarray:
+    def load_numpy_data(self, prop_name, allow_nonexisting: bool = True,
+                        mmap_mode: Optional[str] = None, ragged: bool = False) -> Union[np.ndarray, RaggedArray]:
         """
         Load cached array. The ordering of the returned array will correspond
         to :py:attr:`~ids`.
@@ -1774,13 +1784,28 @@ class SegmentationDataset(SegmentationBase):
         Args:
             prop_name: Identifier of the requested cache array.
             allow_nonexisting: If False, will fail for missing numpy files.
+            mmap_mode: Memory-map the array, see ``numpy.load``. Arrays with object dtype
+                cannot be memory-mapped and are loaded entirely.
+            ragged: Return properties with a variable number of values per object (e.g. 'mapping_mi_ids')
+                as :class:`~syconn.reps.rep_helper.RaggedArray`, which can be memory-mapped.
 
         Returns:
             numpy array of property `prop_name`.
         """
         if prop_name == 'celltype':
             prop_name = 'celltype_cnn_e3'
+        if RaggedArray.exists(self.path + prop_name + "s"):
+            if ragged:
+                return RaggedArray.load(self.path + prop_name + "s", mmap_mode=mmap_mode)
+            if not os.path.exists(self.path + prop_name + "s.npy"):
+                return RaggedArray.load(self.path + prop_name + "s").to_object_array()
         if os.path.exists(self.path + prop_name + "s.npy"):
+            if mmap_mode is not None:
+                try:
+                    # return plain ndarray view instead of np.memmap
+                    return np.asarray(np.load(self.path + prop_name + "s.npy", mmap_mode=mmap_mode))
+                except ValueError:  # object arrays
+                    pass
             return np.load(self.path + prop_name + "s.npy", allow_pickle=True)
         else:
             msg = f'Requested data cache "{prop_name}" did not exist in {self}.'
@@ -1820,19 +1845,25 @@ class SegmentationDataset(SegmentationBase):
         if np.isscalar(obj_id):
             return self._get_segmentation_object(obj_id, create, **kwargs)
         else:
+            # look-up of all cache indices at once
+            cache_ixs = self.soid2ix.get_indices(obj_id) if len(self._property_cache) > 0 else None
             res = []
-            for ix in obj_id:
-                obj = self._get_segmentation_object(ix, create, **kwargs)
+            for ii, ix in enumerate(obj_id):
+                obj = self._get_segmentation_object(
+                    ix, create, cache_ix=cache_ixs[ii] if cache_ixs is not None else None, **kwargs)
                 res.append(obj)
             return res
 
-    def _get_segmentation_object(self, obj_id: int, create: bool, **kwargs) -> SegmentationObject:
+    def _get_segmentation_object(self, obj_id: int, create: bool, cache_ix: Optional[int] = None,
+                                 **kwargs) -> SegmentationObject:
         """
         Initialize :py:class:`~SegmentationObject`.
 
         Args:
             obj_id: Object ID.
             create: Create folder structure. Default: False.
+            cache_ix: Index of the object in the property cache arrays. Will be queried via :py:attr:`~soid2ix`
+                if None.
 
         Returns:
             Supervoxel object.
@@ -1842,8 +1873,11 @@ class SegmentationDataset(SegmentationBase):
         kwargs_def.update(kwargs)
 
         so = SegmentationObject(**kwargs_def)
-        for k, v in self._property_cache.items():
-            so.attr_dict[k] = v[self.soid2ix[obj_id]]
+        if len(self._property_cache) > 0:
+            if cache_ix is None:
+                cache_ix = self.soid2ix[obj_id]
+            for k, v in self._property_cache.items():
+                so.attr_dict[k] = v[cache_ix]
         return so
 
     def save_version_dict(self):
@@ -1862,11 +1896,32 @@ class SegmentationDataset(SegmentationBase):
             raise FileNotFoundError('Version dictionary of SegmentationDataset not found. {}'.format(str(e)))
 
     @property
-    def soid2ix(self):
+    def soid2ix(self) -> IDIndex:
+        """
+        Look-up from object ID to its index in :py:attr:`~ids` and the numpy cache arrays, see
+        :class:`~syconn.reps.rep_helper.IDIndex`. The index is memory-mapped from ``ids_sorted.npy`` and
+        ``ids_order.npy`` (see :func:`~save_id_index`) and created in memory if these are missing or older than
+        ``ids.npy``.
+        """
         if self._soid2ix is None:
-            self._soid2ix = {k: ix for ix, k in enumerate(self.ids)}
+            base_path = self.path_ids[:-len('.npy')]
+            p_sorted = IDIndex.paths(base_path)[0]
+            if os.path.isfile(p_sorted) and os.path.isfile(self.path_ids) and \
+                    os.path.getmtime(p_sorted) >= os.path.getmtime(self.path_ids):
+                self._soid2ix = IDIndex.load(base_path)
+            else:
+                self._soid2ix = IDIndex.from_ids(self.ids)
         return self._soid2ix
 
+    def save_id_index(self):
+        """
+        Store the index of :py:attr:`~soid2ix` next to ``ids.npy``. Called at the end of
+        :func:`~syconn.proc.sd_proc.dataset_analysis`.
+        """
+        self._ids = None
+        self._soid2ix = IDIndex.from_ids(self.ids)
+        self._soid2ix.save(self.path_ids[:-len('.npy')])
+
     def enable_property_cache(self, property_keys: Iterable[str]):
         """
         Add properties to cache.
@@ -1883,7 +1938,82 @@ class SegmentationDataset(SegmentationBase):
             return
         # init index array
         _ = self.soid2ix
-        self._property_cache.update({k: self.load_numpy_data(k, allow_nonexisting=False) for k in property_keys})
+        self._property_cache.update({k: self.load_numpy_data(k, allow_nonexisting=False, mmap_mode='r', ragged=True)
+                                     for k in property_keys})
+
+    def get_attributes(self, obj_ids: Union[np.ndarray, List[int]], attr_keys: Union[str, Iterable[str]],
+                       allow_missing: bool = False) -> Union[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Vectorized attribute look-up without initializing :class:`~SegmentationObject` instances. Values are
+        taken from the property cache (see :func:`~enable_property_cache`) or the memory-mapped numpy cache
+        arrays. Only attributes without numpy cache array are read from the attribute dictionaries of the objects,
+        one storage at a time.
+
+        Examples:
+            Total number of voxels of a set of supervoxels::
+
+                total_size = np.sum(sd.get_attributes(sv_ids, 'size'))
+
+        Args:
+            obj_ids: Object IDs.
+            attr_keys: Attribute key(s).
+            allow_missing: Only used for attributes without cache array. If True, sets the attribute value to
+                None if missing. If False and missing, raise KeyError.
+
+        Returns:
+            Attribute array with the same ordering as `obj_ids` or a dictionary of arrays if
+            multiple keys were given.
+        """
+        single_key = isinstance(attr_keys, str)
+        if single_key:
+            attr_keys = [attr_keys]
+        obj_ids = np.asarray(obj_ids)
+        out = dict()
+        keys_missing = []
+        cache_ixs = None
+        for k in attr_keys:
+            if k in self._property_cache:
+                cache_arr = self._property_cache[k]
+            elif os.path.exists(self.path + k + "s.npy") or RaggedArray.exists(self.path + k + "s"):
+                cache_arr = self.load_numpy_data(k, mmap_mode='r', ragged=True)
+            else:
+                keys_missing.append(k)
+                continue
+            if cache_ixs is None:
+                cache_ixs = self.soid2ix.get_indices(obj_ids)
+            out[k] = cache_arr[cache_ixs]
+            if isinstance(out[k], RaggedArray):
+                out[k] = out[k].to_object_array()
+        if len(keys_missing) > 0:
+            log_reps.debug(f'Loading attributes {keys_missing} of {len(obj_ids)} objects from attribute '
+                           f'dictionaries of {self}.')
+            attr_values = {k: [None] * len(obj_ids) for k in keys_missing}
+            storage_ixs = subfold_ixs(obj_ids, self.n_folders_fs)
+            order = np.argsort(storage_ixs, kind='stable')
+            splits = np.nonzero(np.diff(storage_ixs[order]))[0] + 1
+            for ixs in np.split(order, splits):
+                if len(ixs) == 0:
+                    continue
+                subfold = subfold_from_ix(obj_ids[ixs[0]], self.n_folders_fs)
+                ad = AttributeDict(f'{self.so_storage_path}/{subfold}/attr_dict.pkl', disable_locking=True)
+                for ix in ixs:
+                    obj_dc = ad[obj_ids[ix]]
+                    for k in keys_missing:
+                        if k in obj_dc:
+                            attr_values[k][ix] = obj_dc[k]
+                        elif not allow_missing:
+                            raise KeyError(f'Attribute "{k}" of object {obj_ids[ix]} does not exist.')
+            for k in keys_missing:
+                values = attr_values[k]
+                try:
+                    out[k] = np.array(values)
+                except ValueError:  # ragged values
+                    out[k] = np.empty(len(values), dtype=object)
+                    for ii, v in enumerate(values):
+                        out[k][ii] = v
+        if single_key:
+            return out[attr_keys[0]]
+        return out
 
     def get_volume(self, source: str = 'total') -> float:
         """
@@ -1896,19 +2026,16 @@ class SegmentationDataset(SegmentationBase):
         Returns:
             Volume in mm^3.
         """
-        self.enable_property_cache(['size'])
         if source == 'neuron':
             g = nx.read_edgelist(global_params.config.pruned_svgraph_path, nodetype=np.uint64)
-            svids = g.nodes()
+            svids = np.fromiter(g.nodes(), dtype=np.uint64, count=g.number_of_nodes())
         elif source == 'glia':
             g = nx.read_edgelist(global_params.config.working_dir + "/glia/astrocyte_svgraph.bz2", nodetype=np.uint64)
-            svids = g.nodes()
+            svids = np.fromiter(g.nodes(), dtype=np.uint64, count=g.number_of_nodes())
         elif source == 'total':
             svids = self.ids
         else:
             raise ValueError(f'Unknown source type "{source}".')
-        total_size = 0
-        for svid in svids:
-            total_size += self.get_segmentation_object(svid).size
+        total_size = np.sum(self.get_attributes(svids, 'size'), dtype=np.int64)
         total_size_cmm = np.prod(self.scaling) * total_size / 1e18
         return total_size_cmm
@@ -16,9 +16,11 @@ from . import log_reps
 from . import rep_helper as rh
 from .rep_helper import surface_samples
 from .. import global_params
+from ..backend.base import IndexedDict
+from ..backend.cache import get_object_cache, file_token
 from ..backend.storage import AttributeDict, CompressedStorage, MeshStorage, \
-    VoxelStorage, SkeletonStorage, VoxelStorageDyn, VoxelStorageLazyLoading
-from ..handler.basics import chunkify, temp_seed
+    VoxelStorage, SkeletonStorage, VoxelStorageDyn, VoxelStorageLazyLoading, load_voxelmasks_grouped
+from ..handler.basics import chunkify, temp_seed, kd_factory
 from ..handler.multiviews import generate_rendering_locs
 from ..mp.mp_utils import start_multiprocess_imap
 from ..proc.graphs import create_graph_from_coords
@@ -271,8 +273,16 @@ def load_mesh(so: 'SegmentationObject', recompute: bool = False) -> MeshType:
         indices, vertices, normals; all flattened
 
     """
+    # look-up in process-wide cache; modification time of the storage is used as validity token
+    cache_token = file_token(so.mesh_path) if not recompute and so.version != 'tmp' else None
+    if cache_token is not None:
+        mesh = get_object_cache().get(so._object_cache_key('mesh'), cache_token)
+        if mesh is not None:
+            return mesh
+    from_storage = False
     if not recompute and so.mesh_exists:
         try:
+            from_storage = True
             mesh = MeshStorage(so.mesh_path,
                                disable_locking=True)[so.id]
             if len(mesh) == 2:
@@ -303,7 +313,10 @@ def load_mesh(so: 'SegmentationObject', recompute: bool = False) -> MeshType:
     indices = np.array(indices, dtype=np.int64)
     normals = np.array(normals, dtype=np.float32)
     col = np.array(col, dtype=np.uint8)
-    return [indices, vertices, normals]
+    mesh = [indices, vertices, normals]
+    if from_storage and cache_token is not None:
+        get_object_cache().put(so._object_cache_key('mesh'), mesh, cache_token)
+    return mesh
 
 
 def load_skeleton(so: 'SegmentationObject', recompute: bool = False) -> dict:
@@ -319,6 +332,11 @@ def load_skeleton(so: 'SegmentationObject', recompute: bool = False) -> dict:
     """
     empty_skel = dict(nodes=np.zeros((0, 3)).astype(np.int64), edges=np.zeros((0, 2)),
                       diameters=np.zeros((0,)).astype(np.int32))
+    cache_token = file_token(so.skeleton_path) if not recompute and so.version != 'tmp' else None
+    if cache_token is not None:
+        skel = get_object_cache().get(so._object_cache_key('skeleton'), cache_token)
+        if skel is not None:
+            return skel
     if not recompute and so.skeleton_exists:
         try:
             skeleton_dc = SkeletonStorage(so.skeleton_path, disable_locking=not so.enable_locking)
@@ -327,6 +345,8 @@ def load_skeleton(so: 'SegmentationObject', recompute: bool = False) -> dict:
                 skel['nodes'] = skel['nodes'].reshape((-1, 3))
             if np.ndim(skel['edges']) == 1:
                 skel['edges'] = skel['edges'].reshape((-1, 2))
+            if cache_token is not None:
+                get_object_cache().put(so._object_cache_key('skeleton'), skel, cache_token)
         except Exception as e:
             log_reps.error("\n{}\nException occured when loading skeletons.pkl"
                            " of SO ({}) with id {}.".format(e, so.type, so.id))
@@ -360,6 +380,7 @@ def save_skeleton(so: 'SegmentationObject', overwrite: bool = False):
         raise ValueError(f"Skeleton of {so} already exists.")
     skeleton_dc[so.id] = so.skeleton
     skeleton_dc.push()
+    so._invalidate_cached('skeleton')
 
 
 def sv_view_exists(args):
@@ -456,6 +477,13 @@ def load_so_meshes_bulk(sos: Union[List['SegmentationObject'], Iterable['Segment
         mesh_path = f'{base_path}/{subfold}/mesh.pkl'
         md = MeshStorage(mesh_path, disable_locking=True,
                          cache_decomp=cache_decomp)
+        if isinstance(md._dc_intern, IndexedDict):
+            # indexed backend: read only the requested meshes in file order. The decoded arrays are stored
+            # as they are and returned without copy or another decoding step by `MeshStorage.__getitem__`.
+            arr_ids = [so_id for so_id in ids if md._dc_intern.is_array_record(so_id)]
+            for so_id, mesh in md._dc_intern.iter_arrays(arr_ids):
+                md_out._dc_intern[so_id] = mesh
+            ids = [so_id for so_id in ids if not md._dc_intern.is_array_record(so_id)]
         for so_id in ids:
             md_out._dc_intern[so_id] = md._dc_intern[so_id]
     assert len(md_out) == len(sos)
@@ -535,51 +563,62 @@ def prepare_so_attr_cache(sd: 'SegmentationDataset', so_ids: np.ndarray, attr_ke
         ``attr_cache[attr_keys[0]][so_ids[0]]`` will return the attribute value of type ``attr_keys[0]`` for the first
         SegmentatonObect in `so_ids`.
     """
-    attr_cache = {k: dict() for k in attr_keys}
-    # TODO: Use BinarySearchStore
-    soid2ix = {so_id: sd.soid2ix[so_id] for so_id in so_ids}
-    sd._soid2ix = None  # free memory
+    attr_cache = dict()
+    ixs = sd.soid2ix.get_indices(so_ids)
     for attr in attr_keys:
-        np_cache = sd.load_numpy_data(attr, allow_nonexisting=False)
-        for so_id in so_ids:
-            attr_cache[attr][so_id] = np_cache[soid2ix[so_id]]
+        np_cache = sd.load_numpy_data(attr, allow_nonexisting=False, mmap_mode='r', ragged=True)
+        attr_cache[attr] = dict(zip(so_ids, np_cache[ixs]))
         del np_cache
     return attr_cache
 
 
-def load_so_voxels_bulk(sos: List['SegmentationObject'],
-                        use_new_subfold: bool = True, cache_decomp=True):
+def load_so_voxels_bulk(sos: List['SegmentationObject'], use_new_subfold: bool = True, overlap: int = 0,
+                        cubed: bool = False, batch_size: Optional[int] = 200) -> Dict[int, Tuple[Any, np.ndarray]]:
     """
+    Bulk loader for SegmentationObject (SO) voxels stored via
+    :class:`~syconn.backend.storage.VoxelStorageDyn`. Bounding boxes are loaded once per storage and the
+    segmentation cubes of all objects are read with a minimal number of cube-aligned reads, see
+    :func:`~syconn.backend.storage.load_voxelmasks_grouped`.
 
     Args:
-        sos:
-        use_new_subfold:
-        cache_decomp:
+        sos: SegmentationObjects. Objects of type 'syn' and 'syn_ssv' are not supported.
+        use_new_subfold: Use new sub-folder structure.
+        overlap: Additional voxels added to each side of the bounding boxes. Must be 0 if `cubed` is True.
+        cubed: Return a single dense 3D mask per object (see
+            :func:`~syconn.backend.storage.VoxelStorageDyn.get_voxel_data_cubed`).
+        batch_size: Number of objects loaded at once.
 
     Returns:
-
+        Dict. with key: ID, value: list of 3D binary masks and their offsets (N, 3), or, if `cubed` is True,
+        3D binary mask and offset (all in voxels; xyz).
     """
-    raise NotImplementedError('WIP')
-    vd_out = VoxelStorage(None, cache_decomp=cache_decomp)  # in-memory dict with compression
     if len(sos) == 0:
-        return vd_out
+        return dict()
+    if sos[0].type in ['syn', 'syn_ssv']:
+        raise ValueError(f'Voxels of type "{sos[0].type}" are not stored via VoxelStorageDyn.')
+    if cubed and overlap != 0:
+        raise ValueError('`overlap` is not supported for `cubed=True`.')
     base_path = sos[0].so_storage_path
     nf = sos[0].n_folders_fs
-    subf_from_ix = rh.subfold_from_ix_new if use_new_subfold else \
-        rh.subfold_from_ix_OLD
+    subf_from_ix = rh.subfold_from_ix_new if use_new_subfold else rh.subfold_from_ix_OLD
     sub2ids = defaultdict(list)
     for so in sos:
         subf = subf_from_ix(so.id, nf)
         sub2ids[subf].append(so.id)
-    cnt = 0
+    item_bbs = dict()
+    voxeldata_path = None
     for subfold, ids in sub2ids.items():
         voxel_path = f'{base_path}/{subfold}/voxel.pkl'
-        vd = VoxelStorage(voxel_path, disable_locking=True)
+        vd = VoxelStorageDyn(voxel_path, read_only=True, disable_locking=True, voxel_mode=False)
+        voxeldata_path = vd._dc_intern['meta']['voxeldata_path']
         for so_id in ids:
-            cnt += 1
-            vd_out._dc_intern[so_id] = vd._dc_intern[so_id]
-    assert cnt == len(sos)
-    return vd_out
+            item_bbs[so_id] = vd.get_boundingdata(so_id)
+    kd = kd_factory(voxeldata_path)
+    out = dict()
+    for so_id, masks in load_voxelmasks_grouped(kd, item_bbs, overlap=overlap, batch_size=batch_size):
+        offsets = np.array(item_bbs[so_id])[:, 0]
+        out[so_id] = VoxelStorageDyn._cube_voxel_masks(masks, offsets) if cubed else (masks, offsets)
+    return out
 
 
 def _helper_func(args):
@@ -17,7 +17,7 @@ import tqdm
 import numpy as np
 
 from . import log_reps
-from .rep_helper import SegmentationBase
+from .rep_helper import SegmentationBase, CSRMapping
 from .segmentation import SegmentationDataset, SegmentationObject
 from .super_segmentation_helper import assemble_from_mergelist
 from .super_segmentation_helper import view_embedding_of_sso_nocache
@@ -136,6 +136,11 @@ class SuperSegmentationDataset(SegmentationBase):
         """
         self.ssv_dict = {}
         self._mapping_dict = None
+        self._mapping_csr = None
+        # mapping dictionary which `_mapping_csr` was converted from, None if loaded from disk
+        self._mapping_csr_src = None
+        # CSR mapping and its sorted supervoxel IDs, see `sv_ids`
+        self._sv_ids = None
         self.sso_caching = sso_caching
         self.sso_locking = sso_locking
         self._mapping_lookup_reverse = None
@@ -271,7 +276,7 @@ class SuperSegmentationDataset(SegmentationBase):
         """
         Checks if the mapping dictionary exists (uper-supervoxel ID to sueprvoxel IDs).
         """
-        return os.path.exists(self.mapping_dict_path)
+        return os.path.exists(self.mapping_dict_path) or CSRMapping.exists(self.mapping_csr_path)
 
     @property
     def mapping_dict_path(self) -> str:
@@ -280,6 +285,13 @@ class SuperSegmentationDataset(SegmentationBase):
         """
         return self.path + "/mapping_dict.pkl"
 
+    @property
+    def mapping_csr_path(self) -> str:
+        """
+        Common path prefix of the ``.npy`` files of :py:attr:`~mapping_csr`.
+        """
+        return self.path + "/mapping_csr"
+
     @property
     def mapping_lookup_reverse_path(self) -> str:
         """
@@ -295,9 +307,10 @@ class SuperSegmentationDataset(SegmentationBase):
         return os.path.exists(self.version_dict_path)
 
     @property
-    def mapping_dict(self) -> Dict[int, np.ndarray]:
+    def mapping_dict(self) -> Union[CSRMapping, Dict[int, np.ndarray]]:
         """
-        Dictionary which contains the supervoxel IDs for every super-supervoxel.
+        Look-up which contains the supervoxel IDs for every super-supervoxel. The stored mapping is
+        returned as memory-mapped :py:attr:`~mapping_csr`.
         """
         if self._mapping_dict is None:
             if self.mapping_dict_exists:
@@ -306,6 +319,39 @@ class SuperSegmentationDataset(SegmentationBase):
                 self._mapping_dict = {}
         return self._mapping_dict
 
+    @property
+    def mapping_csr(self) -> CSRMapping:
+        """
+        Super-supervoxel ID to supervoxel IDs look-up in CSR format (sorted cell IDs, row pointers and flat
+        supervoxel IDs), see :class:`~syconn.reps.rep_helper.CSRMapping`. Memory-mapped from the ``.npy`` files at
+        :py:attr:`~mapping_csr_path`, which are created from ``mapping_dict.pkl`` if missing or outdated. A mapping
+        that was assembled but not yet saved is converted once per assigned dictionary, i.e. in-place modifications
+        of the dictionary are not reflected.
+        """
+        if isinstance(self._mapping_dict, CSRMapping):
+            return self._mapping_dict
+        if self._mapping_dict is not None and len(self._mapping_dict) > 0:
+            if self._mapping_csr_src is not self._mapping_dict:
+                self._mapping_csr = CSRMapping.from_dict(self._mapping_dict)
+                self._mapping_csr_src = self._mapping_dict
+            return self._mapping_csr
+        if self._mapping_csr is None or self._mapping_csr_src is not None:
+            self._mapping_csr_src = None
+            p_keys = CSRMapping.paths(self.mapping_csr_path)[0]
+            if CSRMapping.exists(self.mapping_csr_path) and (not os.path.isfile(self.mapping_dict_path) or
+                                                             os.path.getmtime(p_keys) >=
+                                                             os.path.getmtime(self.mapping_dict_path)):
+                self._mapping_csr = CSRMapping.load(self.mapping_csr_path)
+            elif os.path.isfile(self.mapping_dict_path):
+                self._mapping_csr = CSRMapping.from_dict(load_pkl2obj(self.mapping_dict_path))
+                try:
+                    self._mapping_csr.save(self.mapping_csr_path)
+                except OSError as e:
+                    log_reps.warning(f'Could not store CSR mapping of {self}: {e}')
+            else:
+                self._mapping_csr = CSRMapping.from_dict({})
+        return self._mapping_csr
+
     def sv2ssv_ids(self, ids: np.ndarray, nb_cpus=1) -> Dict[int, int]:
         """
         Use :attr:`~mapping_lookup_reverse` to query the cell ID for a given array of supervoxel IDs.
@@ -319,37 +365,40 @@ class SuperSegmentationDataset(SegmentationBase):
             Dictionary with supervoxel ID as key and cell ID as value.
         """
         assert np.ndim(ids) == 1
-        # explicitly cast to uint64 because if `ids` is a list of python int intersect auto-casts to float
-        queries = np.intersect1d(ids, self.sv_ids).astype(np.uint64)
-        log_reps.debug(f'Finished intersection of {len(ids)} query IDs.')
+        # explicitly cast to uint64 because if `ids` is a list of python int unique auto-casts to float
+        queries = np.unique(np.asarray(ids, dtype=np.uint64))
         if nb_cpus <= 1:
-            query_res = self.mapping_lookup_reverse.get_attributes(queries, 'ssv_ids')
+            query_res, found = self.mapping_lookup_reverse.get_attributes(queries, 'ssv_ids', return_found_mask=True)
         else:
-            params = [(self.mapping_lookup_reverse, ch, 'ssv_ids') for ch in np.array_split(queries, nb_cpus)]
+            params = [(self.mapping_lookup_reverse, ch, 'ssv_ids', True) for ch in np.array_split(queries, nb_cpus)]
             query_res = sm.start_multiprocess(bss_get_attr_helper, params, nb_cpus=nb_cpus, debug=nb_cpus <= 1)
-            query_res = np.concatenate(query_res)
-        log_reps.debug('Finished queries.')
-        return dict(zip(queries, query_res))
-    
+            found = np.concatenate([res[1] for res in query_res])
+            query_res = np.concatenate([res[0] for res in query_res])
+        log_reps.debug(f'Finished queries of {len(ids)} IDs.')
+        return dict(zip(queries[found], query_res[found]))
+
     @property
     def mapping_lookup_reverse(self) -> BinarySearchStore:
+        """
+        Look-up from supervoxel ID to cell ID, see :py:class:`syconn.backend.storage.BinarySearchStore`. Uses the
+        resident (memory-mapped) mode if its sidecar files exist.
+        """
         if self._mapping_lookup_reverse is None:
-            self._mapping_lookup_reverse = BinarySearchStore(self.mapping_lookup_reverse_path)
+            resident = os.path.isfile(self.mapping_lookup_reverse_path + '.ids.npy')
+            self._mapping_lookup_reverse = BinarySearchStore(self.mapping_lookup_reverse_path, resident=resident)
         return self._mapping_lookup_reverse
 
     def create_mapping_lookup_reverse(self):
         """Create data structure for efficient look-ups from supervoxel ID to cell ID,
         see :py:class:`syconn.backend.storage.BinarySearchStore`.
         """
-        ids, ssv_ids = [], []
-        for ssv_id, sv_ids in self.mapping_dict.items():
-            ssv_ids.extend([ssv_id] * len(sv_ids))
-            ids.extend(list(sv_ids))
-        ids = np.array(ids, dtype=np.uint64)
-        ssv_ids = np.array(ssv_ids, dtype=np.uint64)
+        csr = self.mapping_csr
+        ids = np.asarray(csr.value_ids, dtype=np.uint64)
+        ssv_ids = np.repeat(np.asarray(csr.key_ids, dtype=np.uint64), csr.lengths())
         BinarySearchStore(
             self.mapping_lookup_reverse_path, id_array=ids, attr_arrays=dict(ssv_ids=ssv_ids),
-            overwrite=self.overwrite)
+            overwrite=self.overwrite, resident=True)
+        self._mapping_lookup_reverse = None
 
     @property
     def ssv_ids(self) -> np.ndarray:
@@ -365,10 +414,7 @@ class SuperSegmentationDataset(SegmentationBase):
             if self._ssv_ids is not None:
                 pass
             elif len(self.mapping_dict) > 0:
-                self._ssv_ids = np.array(list(self.mapping_dict.keys()))
-            elif self.mapping_dict_exists:
-                self.load_mapping_dict()
-                self._ssv_ids = np.array(list(self.mapping_dict.keys()))
+                self._ssv_ids = np.array(self.mapping_csr.key_ids)
             else:
                 paths = glob.glob(self.path + "/so_storage/*/*/*/")
                 self._ssv_ids = np.array([int(os.path.basename(p.strip("/")))
@@ -393,9 +439,15 @@ class SuperSegmentationDataset(SegmentationBase):
     @property
     def sv_ids(self) -> np.ndarray:
         """
-        Flat array of supervoxel IDs which are part of the cells (:attr:`~.ssv_ids`) in this
-        :class:`~syconn.reps.super_segmentation_dataset.SuperSegmentationDataset` object.
+        Flat, sorted array of supervoxel IDs which are part of the cells (:attr:`~.ssv_ids`) in this
+        :class:`~syconn.reps.super_segmentation_dataset.SuperSegmentationDataset` object. The array is cached
+        until :py:attr:`~mapping_csr` is rebuilt or reloaded and must not be modified in-place.
         """
+        if self.mapping_dict_exists:
+            csr = self.mapping_csr
+            if self._sv_ids is None or self._sv_ids[0] is not csr:
+                self._sv_ids = (csr, np.sort(csr.value_ids))
+            return self._sv_ids[1]
         return self.mapping_lookup_reverse.id_array
 
     def load_numpy_data(self, prop_name: str, allow_nonexisting: bool = True, suppress_warning: bool = False) -> \
@@ -591,19 +643,30 @@ class SuperSegmentationDataset(SegmentationBase):
 
     def save_mapping_dict(self):
         """
-        Save the mapping dictionary to a `.pkl` file.
+        Save the mapping dictionary to a `.pkl` file and as CSR arrays (see :py:attr:`~mapping_csr`).
         """
         if len(self.mapping_dict) > 0:
-            write_obj2pkl(self.mapping_dict_path, self.mapping_dict)
+            csr = self.mapping_csr
+            write_obj2pkl(self.mapping_dict_path, {k: csr[k] for k in csr})
+            csr.save(self.mapping_csr_path)
+            # use the memory-mapped arrays from now on
+            self._mapping_dict = None
+            self._mapping_csr = None
+            self._mapping_csr_src = None
+            self._sv_ids = None
         else:
             log_reps.warn(f'No entries in mapping dict of {self}.')
 
     def load_mapping_dict(self):
         """
-        Load the mapping dictionary from the `.pkl` file.
+        Load the mapping dictionary, see :py:attr:`~mapping_csr`.
         """
         assert self.mapping_dict_exists
-        self._mapping_dict = load_pkl2obj(self.mapping_dict_path)
+        self._mapping_dict = None
+        self._mapping_csr = None
+        self._mapping_csr_src = None
+        self._sv_ids = None
+        self._mapping_dict = self.mapping_csr
 
     def enable_property_cache(self, property_keys: List[str]):
         """
@@ -654,7 +717,7 @@ def save_dataset_deep(ssd: SuperSegmentationDataset, extract_only: bool = False,
     # is not written here and thus should not be deleted here if overwrite = True.
     deep_ssd_storage_pths = [
         ssd.mapping_dict_path,
-        ssd.mapping_dict_path,
+        *CSRMapping.paths(ssd.mapping_csr_path),
         ssd.version_dict_path,
         f'{ssd.path}/id.npy',
         f'{ssd.path}/size.npy',
@@ -17,7 +17,8 @@ from .. import global_params
 from ..handler.basics import kd_factory, flatten_list
 from ..handler.multiviews import generate_rendering_locs
 from ..mp.mp_utils import start_multiprocess_obj, start_multiprocess_imap
-from ..proc.graphs import create_graph_from_coords, stitch_skel_nx
+from ..proc.graphs import create_graph_from_coords, stitch_skel_nx, connect_components_mst, \
+    neighborhood_majority_vote
 from ..proc.meshes import write_mesh2kzip
 from ..proc.rendering import render_sso_coords
 from ..proc.sd_proc import predict_views
@@ -757,6 +758,67 @@ def create_new_skeleton_sv_fast(args):
     return nodes, diameters, edges
 
 
+def stitch_sv_skeletons(nodes: np.ndarray, node_sv_ids: np.ndarray, sv_edges: np.ndarray, scaling: np.ndarray,
+                        max_edge_length: float = 1.5e3) -> np.ndarray:
+    """
+    Connect the skeletons of adjacent supervoxels by the closest node pair of every supervoxel graph edge.
+    Nodes are grouped by their supervoxel ID once and all edges which share the first supervoxel are resolved
+    with a single query of its KD-tree, i.e. one tree is built per supervoxel.
+
+    Args:
+        nodes: Skeleton node coordinates of all supervoxels in voxels (N, 3).
+        node_sv_ids: Supervoxel ID of every node (N,).
+        sv_edges: Supervoxel graph edges (E, 2). Edges with a supervoxel without skeleton nodes are ignored.
+        scaling: Voxel size in nanometers.
+        max_edge_length: Maximum edge length in nanometers. Longer edges are skipped.
+
+    Returns:
+        Node index pairs (M, 2) of the stitching edges in the order of `sv_edges`.
+    """
+    sv_edges = np.asarray(sv_edges, dtype=np.uint64).reshape(-1, 2)
+    node_sv_ids = np.asarray(node_sv_ids, dtype=np.uint64)
+    if len(sv_edges) == 0 or len(node_sv_ids) == 0:
+        return np.zeros((0, 2), dtype=np.uint32)
+    # group node indices by SV, nodes of every SV remain in their original order
+    node_order = np.argsort(node_sv_ids, kind='stable')
+    sv_ids, starts, cnts = np.unique(node_sv_ids[node_order], return_index=True, return_counts=True)
+    grp_ixs = np.minimum(np.searchsorted(sv_ids, sv_edges), len(sv_ids) - 1)
+    valid = np.all(sv_ids[grp_ixs] == sv_edges, axis=1)  # both SVs have a skeleton
+    grp_ixs = grp_ixs[valid]
+    nodes_scaled = (nodes * scaling).astype(np.float32)
+
+    ix1 = np.zeros(len(grp_ixs), dtype=np.int64)
+    ix2 = np.zeros(len(grp_ixs), dtype=np.int64)
+    min_dists = np.zeros(len(grp_ixs), dtype=np.float64)
+    # batch all edges by their first SV
+    edge_order = np.argsort(grp_ixs[:, 0], kind='stable')
+    first_grps, batch_starts = np.unique(grp_ixs[edge_order, 0], return_index=True)
+    batch_bounds = np.append(batch_starts, len(edge_order))
+    for g1, b_start, b_stop in zip(first_grps, batch_bounds[:-1], batch_bounds[1:]):
+        batch = edge_order[b_start:b_stop]
+        nodes1_ix = node_order[starts[g1]:starts[g1] + cnts[g1]]
+        tree = spatial.cKDTree(nodes_scaled[nodes1_ix])
+        # query the nodes of all partner SVs at once
+        g2s = grp_ixs[batch, 1]
+        nodes2_ix = np.concatenate([node_order[starts[g2]:starts[g2] + cnts[g2]] for g2 in g2s])
+        segment = np.repeat(np.arange(len(g2s)), cnts[g2s])
+        dists, nn_ixs = tree.query(nodes_scaled[nodes2_ix])
+        # first node with minimal distance of every partner SV (lexsort is stable)
+        closest = np.lexsort((dists, segment))[np.concatenate([[0], np.cumsum(cnts[g2s])[:-1]])]
+        ix1[batch] = nodes1_ix[nn_ixs[closest]]
+        ix2[batch] = nodes2_ix[closest]
+        min_dists[batch] = dists[closest]
+
+    node_dists = np.linalg.norm(nodes[ix1].astype(np.float32) * scaling -
+                                nodes[ix2].astype(np.float32) * scaling, axis=1)
+    # TODO: remove as soon as SV graphs only connect adjacent SVs.
+    skip = (min_dists < node_dists) | (node_dists > max_edge_length)
+    if np.any(skip):
+        log_reps.debug(f'Found {np.sum(skip)} long edge(s) with length up to {node_dists[skip].max() / 1e3:.0f} um '
+                       f'between SVs although they were connected within the SV graph. Skipping.')
+    return np.stack([ix1[~skip], ix2[~skip]], axis=1).astype(np.uint32)
+
+
 def from_sso_to_netkx_fast(sso, sparsify=True, max_edge_length=1.5e3):
     """
     Stitches the SV skeletons using the supervoxel graph ``sso.rag``.
@@ -796,84 +858,35 @@ def from_sso_to_netkx_fast(sso, sparsify=True, max_edge_length=1.5e3):
     ssv_skel['nodes'] = np.concatenate(nodes)
     ssv_skel['diameters'] = np.concatenate(diameters, axis=0)
     sv_id_arr = np.concatenate(sv_id_arr)
-    node_ix_arr = np.arange(len(sv_id_arr))
 
-    added_edges = set()
     # stitching
     if len(sso.sv_ids) > 1:
-        # iterates over SV object edges
+        # # TODO: bridge SVs without skeleton as soon as SV graphs only connect adjacent SVs. They might
+        # #  lead to splits in the SV graph -> fallback to `stitch_skel_nx` is slow.
         g = sso.load_sv_graph()
-        # # TODO: activate as soon as SV graphs only connect adjacent SVs.
-        # # bridge SVs without skeleton > might speed up the SSV
-        # # skeleton generation if they lead to splits in the SV-graph -> fallback
-        # # to `stitch_skel_nx` is slow.
-        # # copy edges, as those might be modified inside loop
-        # for e1, e2 in list(g.edges()):
-        #     # get closest node-pair between SV nodes in question and add new edge
-        #     nodes1 = ssv_skel['nodes'][sv_id_arr == e1.id] * sso.scaling
-        #     nodes2 = ssv_skel['nodes'][sv_id_arr == e2.id] * sso.scaling
-        #     nodes1 = nodes1.astype(np.float32)
-        #     nodes2 = nodes2.astype(np.float32)
-        #     if len(nodes1) == 0:
-        #         # bridge SV without skeleton
-        #         neighbors = g.neighbors(e1)
-        #         for p in itertools.combinations(neighbors, 2):
-        #             g.add_edge(p[0], p[1])
-        #     if len(nodes2) == 0:
-        #         # bridge SV without skeleton
-        #         neighbors = g.neighbors(e2)
-        #         for p in itertools.combinations(neighbors, 2):
-        #             g.add_edge(p[0], p[1])
-
-        for e1, e2 in g.edges():
-            # get closest node-pair between SV nodes in question and add new edge
-            nodes1 = ssv_skel['nodes'][sv_id_arr == e1.id] * sso.scaling
-            nodes2 = ssv_skel['nodes'][sv_id_arr == e2.id] * sso.scaling
-            nodes1 = nodes1.astype(np.float32)
-            nodes2 = nodes2.astype(np.float32)
-            if len(nodes1) == 0 or len(nodes2) == 0:
-                continue  # SV without skeleton
-            nodes1_ix = node_ix_arr[sv_id_arr == e1.id]
-            nodes2_ix = node_ix_arr[sv_id_arr == e2.id]
-            tree = spatial.cKDTree(nodes1)
-            dists, node_ixs1 = tree.query(nodes2)
-            # # get global index of nodes
-            ix2 = nodes2_ix[np.argmin(dists)]
-            ix1 = nodes1_ix[node_ixs1[np.argmin(dists)]]
-            added_edges.add((sv_id_arr[ix1], sv_id_arr[ix2]))
-            node_dist_check = np.linalg.norm(ssv_skel['nodes'][ix1].astype(np.float32) *
-                                             sso.scaling - ssv_skel['nodes'][ix2].astype(
-                np.float32) * sso.scaling)
-            if np.min(dists) < node_dist_check or node_dist_check > max_edge_length:
-                log_reps.debug(f'Found long edge with length '
-                               f'{node_dist_check / 1e3:.0f} um between SVs '
-                               f'{e1.id} and {e2.id} although they were '
-                               f'connected within the SV graph. Skipping.')
-                # TODO: remove as soon as SV graphs only connect adjacent SVs.
-                continue
-            edges.append(np.array([[ix1, ix2]], dtype=np.uint32))
+        sv_edges = np.array([[e1.id, e2.id] for e1, e2 in g.edges()], dtype=np.uint64)
+        edges.append(stitch_sv_skeletons(ssv_skel['nodes'], sv_id_arr, sv_edges, sso.scaling,
+                                         max_edge_length=max_edge_length))
     ssv_skel['edges'] = np.concatenate(edges)
 
     if len(ssv_skel['nodes']) == 0:
         sso.skeleton = ssv_skel
         return
-    skel_nx.add_nodes_from([(ix, dict(position=coord)) for ix, coord
-                            in enumerate(ssv_skel['nodes'])])
-    edges = [tuple(ix) for ix in ssv_skel['edges']]
-    skel_nx.add_edges_from(edges)
-    if nx.number_connected_components(skel_nx) != 1:
+    new_edges = connect_components_mst(ssv_skel['nodes'], ssv_skel['edges'], n_jobs=sso.nb_cpus)
+    if len(new_edges) > 0:
         msg = 'Stitching of SV skeletons failed during "from_sso_to_netkx_' \
               'fast" with {} connected components using the underlying SSV ' \
               'agglomeration. Please check the underlying RAG of SSV {}. ' \
-              'Now performing a slower stitching method to add missing edg' \
-              'es recursively between the closest connected components. ' \
-              'This warning might also occur if two supervoxels are connected ' \
-              'over supervoxel(s) without skeleton!' \
-              ''.format(nx.number_connected_components(skel_nx), sso.id)
-        skel_nx = stitch_skel_nx(skel_nx)
+              'Now adding the missing edges between the closest connected ' \
+              'components. This warning might also occur if two supervoxels ' \
+              'are connected over supervoxel(s) without skeleton!' \
+              ''.format(len(new_edges) + 1, sso.id)
         log_reps.warning(msg)
-        assert nx.number_connected_components(skel_nx) == 1
-        ssv_skel['edges'] = np.array(skel_nx.edges(), dtype=np.uint64)
+        ssv_skel['edges'] = np.concatenate([ssv_skel['edges'], new_edges.astype(ssv_skel['edges'].dtype)])
+    skel_nx.add_nodes_from([(ix, dict(position=coord)) for ix, coord
+                            in enumerate(ssv_skel['nodes'])])
+    edges = [tuple(ix) for ix in ssv_skel['edges']]
+    skel_nx.add_edges_from(edges)
     sso.skeleton = ssv_skel
     return skel_nx
 
@@ -1287,16 +1300,11 @@ def majorityvote_skeleton_property(sso: 'super_segmentation.SuperSegmentationObj
     if not prop_key in sso.skeleton:
         raise ValueError(f'Given property "{prop_key}" does not exist in '
                          f'skeleton of SSV {sso.id}.')
-    g = sso.weighted_graph()
-    avg_prop = []
-    for n in range(g.number_of_nodes()):
-        paths = nx.single_source_dijkstra_path(g, n, max_dist)
-        neighs = np.array(list(paths.keys()), dtype=np.int64)
-        prop_vals, cnts = np.unique(sso.skeleton[prop_key][neighs],
-                                    return_counts=True)
-        c = prop_vals[np.argmax(cnts)]
-        avg_prop.append(c)
-    avg_prop = np.array(avg_prop)
+    # path lengths along the euclidean distance (nm) weighted skeleton graph
+    edges = np.array(sso.skeleton["edges"], dtype=np.int64).reshape(-1, 2)
+    node_scaled = sso.skeleton["nodes"] * sso.scaling
+    weights = np.linalg.norm(node_scaled[edges[:, 0]] - node_scaled[edges[:, 1]], axis=1)
+    avg_prop = neighborhood_majority_vote(edges, sso.skeleton[prop_key], max_dist=max_dist, weights=weights)
     if return_res:
         return avg_prop
     sso.skeleton["%s_avg%d" % (prop_key, max_dist)] = avg_prop
@@ -9,7 +9,7 @@ import os
 import re
 import shutil
 import time
-from collections import Counter, defaultdict
+from collections import Counter
 from typing import Optional, Dict, List, Tuple, Union, Iterable, Any, TYPE_CHECKING
 import pickle as pkl
 
@@ -20,11 +20,12 @@ from scipy import spatial
 
 from . import super_segmentation_helper as ssh
 from .rep_helper import knossos_ml_from_sso, colorcode_vertices, knossos_ml_from_svixs, subfold_from_ix_SSO, \
-    SegmentationBase
+    SegmentationBase, SpatialIndex
 from .segmentation import SegmentationObject, SegmentationDataset
 from .segmentation_helper import load_so_attr_bulk
 from .. import global_params
 from ..backend.storage import CompressedStorage, MeshStorage
+from ..backend.cache import load_cached
 from ..handler.basics import write_txt2kzip, get_filepaths_from_dir, safe_copy, coordpath2anno, load_pkl2obj, \
     write_obj2pkl, flatten_list, chunkify, data2kzip
 from ..handler.config import DynConfig
@@ -260,6 +261,7 @@ class SuperSegmentationObject(SegmentationBase):
         self._views = None
         self._weighted_graph = None
         self._sample_locations = None
+        self._spatial_indices = {}
         self._rot_mat = None
         self._label_dict = {}
         self.view_dict = {}
@@ -930,7 +932,8 @@ class SuperSegmentationObject(SegmentationBase):
         :py:attr:`~ssv_dir`.
         """
         try:
-            self.attr_dict = load_pkl2obj(self.attr_dict_path)
+            self.attr_dict = load_cached(self._object_cache_key('attr_dict'), self.attr_dict_path,
+                                         lambda: load_pkl2obj(self.attr_dict_path))
             return 0
         except (IOError, EOFError, pkl.UnpicklingError) as e:
             if '[Errno 2] No such file or' not in str(e):
@@ -1006,13 +1009,13 @@ class SuperSegmentationObject(SegmentationBase):
         """
         if not rewrite and self.mesh_exists(obj_type) and not \
                 self.version == "tmp":
-            mesh_dc = MeshStorage(self.mesh_dc_path,
-                                  disable_locking=not self.enable_locking)
-            if len(mesh_dc[obj_type]) == 3:
-                ind, vert, normals = mesh_dc[obj_type]
-            else:
-                ind, vert = mesh_dc[obj_type]
-                normals = np.zeros((0,), dtype=np.float32)
+            def _load_mesh():
+                mesh = MeshStorage(self.mesh_dc_path, disable_locking=not self.enable_locking)[obj_type]
+                if len(mesh) == 2:
+                    mesh = [mesh[0], mesh[1], np.zeros((0,), dtype=np.float32)]
+                return mesh
+            ind, vert, normals = load_cached(self._object_cache_key(f'mesh_{obj_type}'), self.mesh_dc_path,
+                                             _load_mesh)[:3]
         else:
             ind, vert, normals = merge_someshes(self.get_seg_objects(obj_type), nb_cpus=self.nb_cpus,
                                                 use_new_subfold=self.config.use_new_subfold)
@@ -1020,6 +1023,7 @@ class SuperSegmentationObject(SegmentationBase):
                 mesh_dc = MeshStorage(self.mesh_dc_path, read_only=False, disable_locking=not self.enable_locking)
                 mesh_dc[obj_type] = [ind, vert, normals]
                 mesh_dc.push()
+                self._invalidate_cached(f'mesh_{obj_type}')
         return np.array(ind, dtype=np.int32), np.array(vert, dtype=np.float32), np.array(normals, dtype=np.float32)
 
     def _load_obj_mesh_compr(self, obj_type: str = "sv") -> MeshType:
@@ -1052,6 +1056,7 @@ class SuperSegmentationObject(SegmentationBase):
             orig_dc = {}
         orig_dc.update(self.attr_dict)
         write_obj2pkl(self.attr_dict_path, orig_dc)
+        self._invalidate_cached('attr_dict')
 
     def save_attributes(self, attr_keys: List[str], attr_values: List[Any]):
         """
@@ -1080,6 +1085,7 @@ class SuperSegmentationObject(SegmentationBase):
             attr_dict = {}
         for k, v in zip(attr_keys, attr_values):
             attr_dict[k] = v
+        self._invalidate_cached('attr_dict')
         try:
             write_obj2pkl(self.attr_dict_path, attr_dict)
         except IOError as e:
@@ -1374,6 +1380,7 @@ class SuperSegmentationObject(SegmentationBase):
             return
         if to_object:
             write_obj2pkl(self.skeleton_path, self.skeleton)
+            self._invalidate_cached('skeleton')
 
         if to_kzip:
             self.save_skeleton_to_kzip()
@@ -1389,7 +1396,8 @@ class SuperSegmentationObject(SegmentationBase):
         if self.skeleton is not None:
             return True
         try:
-            self.skeleton = load_pkl2obj(self.skeleton_path)
+            self.skeleton = load_cached(self._object_cache_key('skeleton'), self.skeleton_path,
+                                        lambda: load_pkl2obj(self.skeleton_path))
             self.skeleton["nodes"] = self.skeleton["nodes"].astype(np.float32)
             return True
         except:
@@ -1692,6 +1700,7 @@ class SuperSegmentationObject(SegmentationBase):
             * :py:attr:`~_views`
             * :py:attr:`~skeleton`
             * :py:attr:`~_meshes`
+            * :py:attr:`~_spatial_indices`
         """
         self._objects = {}
         self._voxels = None
@@ -1702,6 +1711,7 @@ class SuperSegmentationObject(SegmentationBase):
                         "vc": None, "mi": None, "conn": None,
                         "syn_ssv_sym": None, "syn_ssv_asym": None}
         self.skeleton = None
+        self._spatial_indices = {}
 
     def preprocess(self):
         """
@@ -2187,12 +2197,57 @@ class SuperSegmentationObject(SegmentationBase):
                                cols, force_recompute=force_recompute,
                                index_view_key=index_view_key)
 
+    def spatial_index(self, source: str = 'skeleton', semseg_key: Optional[str] = None, ds_vertices: int = 1,
+                      ignore_labels: Optional[Iterable[int]] = None) -> SpatialIndex:
+        """
+        Spatial index over the skeleton nodes or the mesh vertices. Indices are built once and kept in memory
+        until :func:`~clear_cache` is called or the underlying skeleton or mesh is replaced.
+
+        Args:
+            source: 'skeleton' or 'mesh'. Mesh indices carry the vertex labels `semseg_key`.
+            semseg_key: Key of the vertex labels in :func:`~label_dict`, only used if `source` is 'mesh'.
+            ds_vertices: Striding factor of the mesh vertices.
+            ignore_labels: Mesh vertices with labels in `ignore_labels` are excluded.
+
+        Returns:
+            Spatial index, coordinates are in nm.
+        """
+        if source == 'skeleton':
+            if self.skeleton is None:
+                self.load_skeleton()
+            ref = self.skeleton['nodes']
+            key = (source,)
+        elif source == 'mesh':
+            ref = self.mesh[1]
+            key = (source, semseg_key, ds_vertices, tuple(ignore_labels) if ignore_labels is not None else ())
+        else:
+            raise ValueError(f'Unknown source "{source}" of the spatial index.')
+        if key in self._spatial_indices and self._spatial_indices[key][0] is ref:
+            return self._spatial_indices[key][1]
+        if source == 'skeleton':
+            index = SpatialIndex(ref * self.scaling)
+        else:
+            vertices = ref.reshape((-1, 3))
+            vertex_labels = self.label_dict('vertex')[semseg_key]
+            if np.ndim(vertex_labels) == 2:
+                vertex_labels = vertex_labels.squeeze(1)
+            if len(vertex_labels) != len(vertices):
+                raise ValueError('Size of vertices and their labels does not match!')
+            vertices, vertex_labels = vertices[::ds_vertices], vertex_labels[::ds_vertices]
+            if ignore_labels is not None and len(ignore_labels) > 0:
+                mask = ~np.isin(vertex_labels, list(ignore_labels))
+                vertices, vertex_labels = vertices[mask], vertex_labels[mask]
+            index = SpatialIndex(vertices, labels={semseg_key: vertex_labels})
+        index.nb_cpus = self.nb_cpus
+        self._spatial_indices[key] = (ref, index)
+        return index
+
     def semseg_for_coords(self, coords: np.ndarray, semseg_key: str, k: int = 5,
                           ds_vertices: int = 20,
                           ignore_labels: Optional[Iterable[int]] = None):
         """
         Get the semantic segmentation with key `semseg_key` from the `k` nearest
-        vertices at every coordinate in `coords`.
+        vertices at every coordinate in `coords`. Uses the cached vertex index, see :func:`~spatial_index`.
 
         Args:
             coords: np.array
@@ -2209,35 +2264,28 @@ class SuperSegmentationObject(SegmentationBase):
 
         Returns: np.array
             Same length as `coords`. For every coordinate in `coords` returns the
-            majority label based on its k-nearest neighbors.
+            majority label based on its k-nearest neighbors, -1 if no vertex is left
+            after applying `ignore_labels`.
 
         """
         # TODO: Allow multiple keys as in self.attr_for_coords, e.g. to
         #  include semseg axoness in a single query
-        if ignore_labels is None:
-            ignore_labels = []
         coords = np.array(coords) * self.scaling
-        vertices = self.mesh[1].reshape((-1, 3))
-        if len(vertices) == 0:
+        n_vertices = len(self.mesh[1]) // 3
+        if n_vertices == 0:
             return np.zeros((0, ), dtype=np.int32)
-        if len(vertices) < 5e6:
+        if n_vertices < 5e6:
             ds_vertices = max(1, ds_vertices // 10)
-        vertex_labels = self.label_dict('vertex')[semseg_key][::ds_vertices]
-        if np.ndim(vertex_labels) == 2:
-            vertex_labels = vertex_labels.squeeze(1)
-        vertices = vertices[::ds_vertices]
-        for ign_l in ignore_labels:
-            vertices = vertices[vertex_labels != ign_l]
-            vertex_labels = vertex_labels[vertex_labels != ign_l]
-        if len(vertex_labels) != len(vertices):
-            raise ValueError('Size of vertices and their labels does not match!')
-        if len(vertices) < k:
-            log_reps.warning(f'Number of vertices ({len(vertices)}) is less than the given '
-                             f'value of k ({k}). Setting k to lower value.')
-            k = len(vertices)
-        maj_vote = colorcode_vertices(coords, vertices, vertex_labels, k=k,
-                                      return_color=False, nb_cpus=self.nb_cpus)
-        return maj_vote
+        index = self.spatial_index('mesh', semseg_key=semseg_key, ds_vertices=ds_vertices,
+                                   ignore_labels=ignore_labels)
+        if len(index) == 0:
+            log_reps.warning(f'No vertices with valid "{semseg_key}" labels in {self}.')
+            return np.full(len(coords), -1, dtype=np.int32)
+        if len(index) < k:
+            log_reps.warning(f'Number of vertices ({len(index)}) is less than the given '
+                             f'value of k ({k}). Setting k to {len(index)}.')
+            k = len(index)
+        return index.majority_labels(coords, semseg_key, k=k).astype(np.int32)
 
     def get_spine_compartments(self, semseg_key: str = 'spiness', k: int = 1,
                                min_spine_cc_size: Optional[int] = None,
@@ -2942,10 +2990,11 @@ class SuperSegmentationObject(SegmentationBase):
             list:
                 Same length as coords. For every coordinate in coords returns the
                 majority label within radius_nm or [-1] if Key does not exist.
+                Coordinates without any node within radius_nm use the nearest node.
         """
         if type(attr_keys) is str:
             attr_keys = [attr_keys]
-        coords = np.array(coords)
+        coords = np.array(coords).reshape(-1, 3)
         if self.skeleton is None:
             self.load_skeleton()
         if self.skeleton is None or len(self.skeleton["nodes"]) == 0:
@@ -2958,49 +3007,25 @@ class SuperSegmentationObject(SegmentationBase):
             log_reps.warn(f'Number of skeleton nodes ({len(self.skeleton["nodes"])}) '
                           f'is smaller than k={k} in SSO {self.id}. Lowering k.')
             k = len(self.skeleton["nodes"])
-        kdtree = scipy.spatial.cKDTree(self.skeleton["nodes"] * self.scaling)
+        index = self.spatial_index('skeleton')
         if radius_nm is None:
-            _, close_node_ids = kdtree.query(coords * self.scaling, k=k, n_jobs=self.nb_cpus)
+            _, close_node_ids = index.query(coords * self.scaling, k=k)
         else:
-            close_node_ids = kdtree.query_ball_point(coords * self.scaling, radius_nm)
-        attr_dc = defaultdict(list)
-        for i_coord in range(len(coords)):
-            curr_close_node_ids = close_node_ids[i_coord]
-            for attr_key in attr_keys:
-                # e.g. for glia SSV axoness does not exist.
-                if attr_key not in self.skeleton:
-                    el = -1 if k == 1 else [-1] * k
-                    attr_dc[attr_key].append(el)
-                    continue
-                # use nodes within radius_nm, there might be multiple node ids
-                if radius_nm is not None:
-                    if len(curr_close_node_ids) == 0:
-                        dist, curr_close_node_ids = kdtree.query(coords * self.scaling)
-                        log_reps.info(
-                            "Couldn't find skeleton nodes within {} nm. Using nearest "
-                            "one with distance {} nm. SSV ID {}, coordinate at {}."
-                            "".format(radius_nm, dist[0], self.id, coords[i_coord]))
-                    cls, cnts = np.unique(
-                        np.array(self.skeleton[attr_key])[np.array(curr_close_node_ids)],
-                        return_counts=True)
-                    if len(cls) > 0:
-                        attr_dc[attr_key].append(cls[np.argmax(cnts)])
-                    else:
-                        log_reps.info("Did not find any skeleton node within {} nm at {}."
-                                      " SSV {} (size: {}; rep. coord.: {}).".format(
-                            radius_nm, i_coord, self.id, self.size, self.rep_coord))
-                        attr_dc[attr_key].append(-1)
-                else:  # only nearest node ID
-                    attr_dc[attr_key].append(self.skeleton[attr_key][curr_close_node_ids])
-        # in case latent morphology was not predicted / needed
-        if "latent_morph" in attr_keys:
-            latent_morph = attr_dc["latent_morph"]
-            for i in range(len(latent_morph)):
-                curr_latent = latent_morph[i]
-                if np.isscalar(curr_latent) and curr_latent == -1:
-                    curr_latent = np.array([np.inf] * self.config['tcmn']['ndim_embedding'])
-                latent_morph[i] = curr_latent
-        return [np.array(attr_dc[k]) for k in attr_keys]
+            close_node_ids, offsets = index.query_radius(coords * self.scaling, radius_nm, fill_nearest=True)
+        res = []
+        for attr_key in attr_keys:
+            # e.g. for glia SSV axoness does not exist.
+            if attr_key not in self.skeleton:
+                if attr_key == "latent_morph" and k == 1:
+                    # in case latent morphology was not predicted / needed
+                    res.append(np.full((len(coords), self.config['tcmn']['ndim_embedding']), np.inf))
+                else:
+                    res.append(np.full((len(coords), k) if k > 1 else len(coords), -1))
+            elif radius_nm is None:  # only nearest node IDs
+                res.append(np.asarray(self.skeleton[attr_key])[close_node_ids])
+            else:  # use nodes within radius_nm, there might be multiple node ids
+                res.append(index.radius_majority_labels(self.skeleton[attr_key], close_node_ids, offsets))
+        return res
 
     def predict_views_axoness(self, model, verbose=False,
                               pred_key_appendix=""):
@@ -3235,13 +3260,8 @@ class SuperSegmentationObject(SegmentationBase):
         prop_array = self.skeleton[prop_key]
         assert prop_array.squeeze().ndim == 1, "Property array has to be 1D."
         maj_votes = np.zeros_like(prop_array)
-        for ii in range(len(self.skeleton["nodes"])):
-            paths = nx.single_source_dijkstra_path(self.weighted_graph(),
-                                                   ii, max_dist)
-            neighs = np.array(list(paths.keys()), dtype=np.int64)
-            labels, cnts = np.unique(prop_array[neighs], return_counts=True)
-            maj_label = labels[np.argmax(cnts)]
-            maj_votes[ii] = maj_label
+        maj_votes[:] = ssh.majorityvote_skeleton_property(self, prop_key, max_dist, return_res=True).reshape(
+            maj_votes.shape)
         return maj_votes
 
     def shortestpath2soma(self, coordinates: np.ndarray,
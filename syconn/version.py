@@ -0,0 +1,3 @@
+# THIS FILE IS GENERATED FROM SYCONN SETUP.PY
+#
+version = '2.0'
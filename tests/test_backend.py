@@ -11,7 +11,9 @@ from multiprocessing import Process, Queue
 from syconn import global_params
 # TODO: test VoxelStorageDyn
 from syconn.backend.storage import AttributeDict, CompressedStorage, VoxelStorageL, MeshStorage, \
-    VoxelStorageClass, BinarySearchStore, VoxelStorageLazyLoading
+    VoxelStorageClass, BinarySearchStore, VoxelStorageLazyLoading, load_voxelmasks_grouped
+from syconn.backend.base import FSIndexedBase, IndexedDict
+from syconn.backend.cache import ObjectCache, get_object_cache, object_cache_key
 from syconn.handler.basics import write_txt2kzip, write_data2kzip,\
      read_txt_from_zip, remove_from_zip
 
@@ -70,6 +72,50 @@ def test_BinarySearchStore():
     tf.close()
 
 
+def test_BinarySearchStore_resident_and_missing():
+    np.random.seed(0)
+    n_elements = int(1e5)
+    ids = np.random.choice(int(1e6), n_elements, replace=False).astype(np.uint64)
+    attr = dict(ssv_ids=np.random.randint(1, int(1e12), n_elements).astype(np.uint64),
+                rep_coord=np.random.randint(0, 1000, (n_elements, 3)).astype(np.int32))
+    test_p = f"{dir_path}/.binstore_resident"
+    bss = BinarySearchStore(test_p, ids, attr, n_shards=4, overwrite=True, resident=True)
+    assert os.path.isfile(bss.resident_path('ids'))
+    ixs_sample = np.random.permutation(len(ids))[:1000]
+    missing = np.setdiff1d(np.arange(int(1e6), dtype=np.uint64), ids)[:100]
+    queries = np.concatenate([ids[ixs_sample], missing])
+    for resident in [True, False]:
+        bss = BinarySearchStore(test_p, resident=resident)
+        attrs, found = bss.get_attributes(queries, 'ssv_ids', return_found_mask=True)
+        assert np.all(found[:1000]) and not np.any(found[1000:])
+        assert np.array_equal(attrs[:1000], attr['ssv_ids'][ixs_sample])
+        assert np.all(attrs[1000:] == 0)
+        attrs = bss.get_attributes_multi(ids[ixs_sample], ['ssv_ids', 'rep_coord'])
+        assert np.array_equal(attrs['rep_coord'], attr['rep_coord'][ixs_sample])
+        assert np.array_equal(attrs['ssv_ids'], attr['ssv_ids'][ixs_sample])
+        with pytest.raises(ValueError):
+            bss.get_attributes(np.array([int(1e7)], dtype=np.uint64), 'ssv_ids')
+    # every requested row is read separately
+    bss.max_read_gap = 0
+    attrs = bss.get_attributes_multi(ids[ixs_sample], ['ssv_ids', 'rep_coord'])
+    assert np.array_equal(attrs['rep_coord'], attr['rep_coord'][ixs_sample])
+    assert np.array_equal(attrs['ssv_ids'], attr['ssv_ids'][ixs_sample])
+    del bss
+    for k in ['ids', 'ssv_ids', 'rep_coord']:
+        os.remove(f'{test_p}.{k}.npy')
+    # empty store
+    bss = BinarySearchStore(test_p, np.zeros(0, dtype=np.uint64), dict(ssv_ids=np.zeros(0, dtype=np.uint64)),
+                            overwrite=True, resident=True)
+    for resident in [True, False]:
+        bss = BinarySearchStore(test_p, resident=resident)
+        attrs, found = bss.get_attributes(ids[:10], 'ssv_ids', return_found_mask=True)
+        assert not np.any(found) and np.all(attrs == 0)
+    del bss
+    for k in ['ids', 'ssv_ids']:
+        os.remove(f'{test_p}.{k}.npy')
+    os.remove(test_p)
+
+
 def get_attr_newinstances(args):
     tf, samples, key = args
     binstore = BinarySearchStore(tf)
@@ -122,6 +168,190 @@ def test_BinarySearchStore_multiprocessed():
     os.remove(test_p)
 
 
+class _IndexedAttributeDict(FSIndexedBase):
+    def __getitem__(self, item):
+        return self._dc_intern[item]
+
+    def __setitem__(self, key, value):
+        self._dc_intern[key] = value
+
+
+def test_FSIndexedBase():
+    test_p = _setup_testfile('test_indexed')
+    for fname in [test_p + '.idx']:
+        if os.path.isfile(fname):
+            os.remove(fname)
+    try:
+        # convert legacy pickle storage
+        ad = AttributeDict(test_p, read_only=False)
+        for i in range(100):
+            ad[i] = {"size": i, "rep_coord": np.ones(3, dtype=np.int32) * i}
+        ad.push()
+        ad = _IndexedAttributeDict(test_p, read_only=False)
+        assert len(ad) == 100
+        assert ad[10]["size"] == 10
+        ad.push()
+        assert os.path.isfile(test_p + '.idx')
+
+        # zero-copy read and lazy loading
+        ad = _IndexedAttributeDict(test_p, read_only=True)
+        assert len(ad._dc_intern._loaded) == 0
+        rc = ad[5]["rep_coord"]
+        assert np.array_equal(rc, np.ones(3, dtype=np.int32) * 5)
+        assert not rc.flags.writeable
+        assert len(ad._dc_intern._loaded) == 1
+        # no snapshots for change detection in read-only mode
+        assert len(ad._dc_intern._snapshots) == 0
+
+        # partial update: only modified items are appended
+        ad = _IndexedAttributeDict(test_p, read_only=False)
+        fsize = os.path.getsize(test_p)
+        _ = ad[1]
+        ad.push()
+        assert os.path.getsize(test_p) == fsize
+        ad[1]["size"] = -1
+        ad[100] = {"size": 100}
+        del ad[2]
+        ad.push()
+        assert os.path.getsize(test_p) > fsize
+        ad = _IndexedAttributeDict(test_p, read_only=True)
+        assert ad[1]["size"] == -1
+        assert ad[100]["size"] == 100
+        assert 2 not in ad
+        assert len(ad) == 100
+
+        # index is rebuilt from records
+        os.remove(test_p + '.idx')
+        ad = _IndexedAttributeDict(test_p, read_only=False)
+        assert 2 not in ad and ad[1]["size"] == -1 and len(ad) == 100
+        fsize = os.path.getsize(test_p)
+        ad.compact()
+        assert os.path.getsize(test_p) < fsize
+        assert _IndexedAttributeDict(test_p)[99]["size"] == 99
+    finally:
+        for fname in [test_p, test_p + '.idx']:
+            if os.path.isfile(fname):
+                os.remove(fname)
+
+
+def test_IndexedDict_array_records():
+    test_p = _setup_testfile('test_indexed_arrays')
+    mesh = [np.arange(300, dtype=np.uint32), np.random.rand(600).astype(np.float32),
+            np.zeros((0, ), dtype=np.float32), np.zeros((0, ), dtype=np.uint8)]
+    dc = IndexedDict(test_p)
+    for ii in range(10):
+        dc.set_arrays(ii, mesh, compress_arrays=ii % 2 == 0)
+    dc[10] = {"meta": 1}
+    dc.flush()
+    dc = IndexedDict(test_p)
+    dc.load()
+    assert dc.is_array_record(1) and not dc.is_array_record(10)
+    # partial read of vertices only
+    vert = dc.get_arrays(4, [1])[0]
+    assert vert.dtype == np.float32 and np.array_equal(vert, mesh[1])
+    res = dict(dc.iter_arrays([9, 2, 5]))
+    assert set(res.keys()) == {9, 2, 5}
+    for arr, arr_orig in zip(res[9], mesh):
+        assert arr.dtype == arr_orig.dtype and np.array_equal(arr, arr_orig)
+    assert dc[10] == {"meta": 1}
+    os.remove(test_p)
+    os.remove(test_p + '.idx')
+
+
+def test_ObjectCache():
+    cache = ObjectCache(max_bytes=3 * 800)
+    arrs = [np.ones(100, dtype=np.float64) * ii for ii in range(4)]
+    for ii in range(3):
+        cache.put(object_cache_key('wd', 'sv', 0, ii, 'mesh'), arrs[ii], token=1)
+    assert cache.get(object_cache_key('wd', 'sv', 0, 0, 'mesh'), token=1)[0] == 0
+    # exceeds size limit -> least recently used item (ID 1) is evicted
+    cache.put(object_cache_key('wd', 'sv', 0, 3, 'mesh'), arrs[3], token=1)
+    assert cache.get(object_cache_key('wd', 'sv', 0, 1, 'mesh'), token=1) is None
+    assert cache.nbytes == 3 * 800
+    # cached values are copies
+    arr = cache.get(object_cache_key('wd', 'sv', 0, np.uint64(3), 'mesh'), token=1)
+    arr[:] = -1
+    assert cache.get(object_cache_key('wd', 'sv', 0, 3, 'mesh'), token=1)[0] == 3
+    # outdated token
+    assert cache.get(object_cache_key('wd', 'sv', 0, 2, 'mesh'), token=2) is None
+    assert object_cache_key('wd', 'sv', 0, 2, 'mesh') not in cache
+    assert cache.stats() == dict(hits=3, misses=2, evictions=1, n_items=2, nbytes=2 * 800, max_bytes=3 * 800)
+
+
+def test_storage_object_cache():
+    test_p = _setup_testfile('test_object_cache')
+    cs = CompressedStorage(test_p, read_only=False)
+    cs[1] = np.arange(10)
+    cs.push()
+    # the process-wide cache is disabled by default (`object_cache_mb`)
+    cache = get_object_cache()
+    max_bytes = cache.max_bytes
+    cache.resize(2**20)
+    try:
+        cache.clear()
+        cs = CompressedStorage(test_p, cache_decomp=True)
+        _ = cs[1]
+        cs2 = CompressedStorage(test_p, cache_decomp=True)
+        assert np.array_equal(cs2[1], np.arange(10))
+        assert cache.hits == 1
+        # storage was modified -> cached item is outdated
+        time.sleep(0.01)
+        cs = CompressedStorage(test_p, read_only=False)
+        cs[1] = np.arange(5)
+        cs.push()
+        cs2 = CompressedStorage(test_p, cache_decomp=True)
+        assert np.array_equal(cs2[1], np.arange(5))
+    finally:
+        cache.resize(max_bytes)
+        cache.clear()
+        os.remove(test_p)
+
+
+class _ArrayKnossosDataset:
+    """In-memory stand-in for the segmentation KnossosDataset (`load_seg` returns zyx, zero-padded)."""
+    cube_shape = (16, 16, 8)
+
+    def __init__(self, seg):
+        self.seg = seg
+        self.n_reads = 0
+
+    def load_seg(self, size, offset, mag=1):
+        self.n_reads += 1
+        out = np.zeros(size, dtype=self.seg.dtype)
+        lo, hi = np.maximum(offset, 0), np.minimum(np.array(offset) + size, self.seg.shape)
+        if np.all(hi > lo):
+            out[tuple(slice(l - o, h - o) for l, h, o in zip(lo, hi, offset))] = \
+                self.seg[tuple(slice(l, h) for l, h in zip(lo, hi))]
+        return out.swapaxes(0, 2)
+
+
+def test_load_voxelmasks_grouped():
+    seg = np.random.randint(1, 20, size=(70, 50, 40)).astype(np.uint64)
+    kd = _ArrayKnossosDataset(seg)
+    item_bbs = dict()
+    for ix in range(1, 20):
+        vx = np.argwhere(seg == ix)
+        bb = np.array([vx.min(axis=0), vx.max(axis=0) + 1])
+        # split bounding box along x, as done for objects spanning multiple chunks
+        bb_lower, bb_upper = bb.copy(), bb.copy()
+        bb_lower[1, 0] = bb_upper[0, 0] = (bb[0, 0] + bb[1, 0]) // 2
+        item_bbs[ix] = np.array([bb_lower, bb_upper])
+    for overlap in [0, 1]:
+        for batch_size in [None, 4]:
+            kd.n_reads = 0
+            res = dict(load_voxelmasks_grouped(kd, item_bbs, overlap=overlap, batch_size=batch_size))
+            assert set(res.keys()) == set(item_bbs.keys())
+            # every cube is read at most once, i.e. much less reads than bounding boxes
+            assert kd.n_reads < len(item_bbs)
+            if batch_size is None and overlap == 0:
+                # objects are distributed over the entire volume -> single read
+                assert kd.n_reads == 1
+            for ix, masks in res.items():
+                for mask, bb in zip(masks, item_bbs[ix]):
+                    ref = kd.load_seg(bb[1] - bb[0] + 2 * overlap, bb[0] - overlap).swapaxes(0, 2) == ix
+                    assert np.array_equal(mask, ref)
+
+
 # TODO: requires revision
 @pytest.mark.xfail(strict=False)
 def test_created_then_blocking_LZ4Dict_for_3s_2_fail_then_one_successful():
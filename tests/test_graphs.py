@@ -0,0 +1,87 @@
+from syconn.proc.graphs import UnionFind, split_by_labels, union_voxel_neighbors, union_radius_neighbors, \
+    connect_components_mst, stitch_skel_nx, neighborhood_majority_vote
+import itertools
+import networkx as nx
+import numpy as np
+from scipy import spatial
+
+
+def _canonical(ccs):
+    return sorted(tuple(sorted(cc)) for cc in ccs)
+
+
+def test_union_find():
+    uf = UnionFind(6)
+    uf.union([0, 4], [3, 5])
+    uf.union(3, 0)
+    assert uf.n_components == 4 and uf.connected(0, 3) and not uf.connected(0, 1)
+    assert np.array_equal(uf.labels(), [0, 1, 2, 0, 3, 3])
+    assert _canonical(split_by_labels(uf.labels())) == [(0, 3), (1,), (2,), (4, 5)]
+
+    rng = np.random.default_rng(0)
+    voxels = np.unique(rng.integers(0, 20, (300, 3)), axis=0)
+    pts = rng.random((500, 3)) * 100
+    for coords, func, r in [(voxels, union_voxel_neighbors, 2), (pts, union_radius_neighbors, 8)]:
+        uf = UnionFind(len(coords) + 10)
+        func(uf, coords, r, offset=10)
+        g = nx.Graph()
+        g.add_nodes_from(range(len(coords)))
+        g.add_edges_from(spatial.cKDTree(coords).query_pairs(r=r))
+        assert uf.n_components == nx.number_connected_components(g) + 10
+        ccs = [cc[cc >= 10] - 10 for cc in split_by_labels(uf.labels())]
+        assert _canonical([cc for cc in ccs if len(cc)]) == _canonical(nx.connected_components(g))
+
+
+def test_stitch_skel_nx():
+    rng = np.random.default_rng(0)
+    g = nx.Graph()
+    for ii in range(30):
+        # random walk skeletons with non-consecutive node IDs
+        coords = rng.integers(0, 5000, 3) + np.cumsum(rng.integers(-10, 11, (20, 3)), axis=0)
+        g.add_nodes_from([(3 * (20 * ii + jj) + 1, dict(position=c)) for jj, c in enumerate(coords)])
+        g.add_edges_from([(3 * (20 * ii + jj) + 1, 3 * (20 * ii + jj) + 4) for jj in range(19)])
+    coords = np.array([g.nodes[n]['position'] for n in g.nodes()], dtype=np.float64)
+    # minimum spanning tree over the closest node pairs of all components
+    comps = list(nx.connected_components(g))
+    node_ixs = {n: ii for ii, n in enumerate(g.nodes())}
+    comp_graph = nx.Graph()
+    for ii in range(len(comps)):
+        for jj in range(ii + 1, len(comps)):
+            d = spatial.distance.cdist(coords[[node_ixs[n] for n in comps[ii]]],
+                                       coords[[node_ixs[n] for n in comps[jj]]])
+            comp_graph.add_edge(ii, jj, weight=d.min())
+    mst_length = nx.minimum_spanning_tree(comp_graph).size(weight='weight')
+    edges = np.array([(node_ixs[e1], node_ixs[e2]) for e1, e2 in g.edges()])
+    for k in [1, 8, len(coords)]:
+        new_edges = connect_components_mst(coords, edges, k=k)
+        assert len(new_edges) == len(comps) - 1
+        assert np.isclose(np.linalg.norm(coords[new_edges[:, 0]] - coords[new_edges[:, 1]], axis=1).sum(), mst_length)
+    n_edges = g.number_of_edges()
+    g = stitch_skel_nx(g)
+    assert nx.number_connected_components(g) == 1 and g.number_of_edges() == n_edges + len(comps) - 1
+    assert len(connect_components_mst(coords[:20], edges[:19])) == 0
+
+
+def test_neighborhood_majority_vote():
+    rng = np.random.default_rng(0)
+    coords = rng.random((300, 3)) * 100
+    labels = rng.integers(0, 3, len(coords))
+    edges = spatial.cKDTree(coords).query_pairs(r=12, output_type='ndarray')
+    weights = np.linalg.norm(coords[edges[:, 0]] - coords[edges[:, 1]], axis=1)
+    g = nx.Graph()
+    g.add_nodes_from(range(len(coords)))
+    g.add_weighted_edges_from([(e1, e2, w) for (e1, e2), w in zip(edges, weights)])
+
+    def majority(neighs):
+        cls, cnts = np.unique(labels[np.array(list(neighs))], return_counts=True)
+        return cls[np.argmax(cnts)]
+    expected = [majority([n] + [e[1] for e in itertools.islice(nx.bfs_edges(g, n), 10)]) for n in g.nodes()]
+    assert np.array_equal(neighborhood_majority_vote(edges, labels, max_nb=10), expected)
+    expected = [majority(nx.single_source_dijkstra_path(g, n, 25)) for n in g.nodes()]
+    assert np.array_equal(neighborhood_majority_vote(edges, labels, max_dist=25, weights=weights), expected)
+
+
+if __name__ == '__main__':
+    test_union_find()
+    test_stitch_skel_nx()
+    test_neighborhood_majority_vote()
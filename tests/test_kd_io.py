@@ -0,0 +1,62 @@
+from syconn.handler.kd_io import ChunkReader, KDWriter
+import numpy as np
+import pytest
+
+
+class _DummyKD:
+    def __init__(self, path):
+        self.knossos_path = path
+        self.n_calls = 0
+        self.written = dict()
+
+    def load_seg(self, offset, size, mag, datatype=np.uint64):
+        self.n_calls += 1
+        return np.full(size[::-1], offset[0], dtype=datatype)
+
+    def load_raw(self, offset, size, mag):
+        self.n_calls += 1
+        return np.zeros(size[::-1], dtype=np.uint8)
+
+    def save_seg(self, offset, data, data_mag, mags):
+        if data_mag != 1:
+            raise ValueError('Unsupported magnification.')
+        self.written[tuple(offset)] = data.copy()
+
+
+def test_chunk_reader():
+    kd_cell, kd_syntype, kd_sj = _DummyKD('cell'), _DummyKD('syntype'), _DummyKD('sj')
+    sources = dict(cell=dict(kd=kd_cell, datatype=np.uint32), sym=dict(kd=kd_syntype), asym=dict(kd=kd_syntype),
+                   sj=dict(kd=kd_sj, method='load_raw'))
+    offsets = [np.array([ii * 10, 0, 0]) for ii in range(5)]
+    size = np.array([4, 3, 2])
+    for n_prefetch in [0, 1, 2]:
+        processed = []
+        with ChunkReader(sources, n_prefetch=n_prefetch) as reader:
+            for offset, vols in reader.iter_chunks(offsets, lambda o: dict.fromkeys(sources, (o, size))):
+                assert vols['sym'] is vols['asym'], 'Identical reads were not deduplicated.'
+                assert vols['cell'].shape == tuple(size) and vols['cell'].dtype == np.uint32
+                assert np.all(vols['cell'] == offset[0])
+                processed.append(offset[0])
+            assert reader.n_reads == 3 * len(offsets) and reader.n_dedup_reads == len(offsets)
+        assert processed == [o[0] for o in offsets]
+    assert kd_syntype.n_calls == kd_sj.n_calls == 3 * len(offsets)
+
+
+def test_kd_writer():
+    kd = _DummyKD('cs_seg')
+    data = np.arange(24).reshape(2, 3, 4)
+    with KDWriter(n_threads=2, max_bytes=data.nbytes) as writer:
+        for ii in range(10):
+            writer.save_seg(kd, offset=(ii, 0, 0), data=data, data_mag=1, mags=[1])
+            data += 1  # queued arrays are copied by default
+    assert len(kd.written) == 10
+    assert all(np.array_equal(kd.written[(ii, 0, 0)], np.arange(24).reshape(2, 3, 4) + ii) for ii in range(10))
+    writer = KDWriter()
+    writer.save_seg(kd, offset=(0, 0, 0), data=data, data_mag=2, mags=[1], copy=False)
+    with pytest.raises(ValueError):
+        writer.close()
+
+
+if __name__ == '__main__':
+    test_chunk_reader()
+    test_kd_writer()
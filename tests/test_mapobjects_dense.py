@@ -7,8 +7,8 @@
 
 
 import numpy as np
-from syconn.extraction.find_object_properties import find_object_properties, \
-    map_subcell_extract_props
+from syconn.extraction.find_object_properties import find_object_properties
+from syconn.extraction.find_object_properties_C import map_subcell_extract_props
 
 
 def test_map_subcell_extract_props():
@@ -0,0 +1,52 @@
+from syconn.proc.meshes import stitch_meshes
+from syconn.proc.sd_proc import merge_meshes_dict
+import numpy as np
+
+
+def _cube_mesh(offset, scale=100.):
+    verts = np.array([[x, y, z] for x in (0, 1) for y in (0, 1) for z in (0, 1)], dtype=np.float32)
+    # outward oriented quads, split along the same diagonal in world coordinates
+    quads = [[0, 1, 3, 2], [4, 6, 7, 5], [0, 4, 5, 1], [2, 3, 7, 6], [0, 2, 6, 4], [1, 5, 7, 3]]
+    faces = np.array([[q[0], q[1], q[2]] for q in quads] + [[q[0], q[2], q[3]] for q in quads], dtype=np.uint32)
+    return faces.flatten(), ((verts + offset) * scale).flatten()
+
+
+def test_stitch_meshes():
+    ind_a, vert_a = _cube_mesh([0, 0, 0])
+    ind_b, vert_b = _cube_mesh([1, 0, 0])
+    # two cubes sharing the face at x=1 -> welded vertices and removed interior wall
+    ind, vert, norm = stitch_meshes([ind_a, ind_b], [vert_a, vert_b], [np.zeros(0), np.zeros(0)])
+    faces = ind.reshape(-1, 3)
+    assert len(vert) // 3 == 12 and len(faces) == 20 and len(norm) == 0
+    edges = np.sort(np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]]), axis=1)
+    _, cnts = np.unique(edges, axis=0, return_counts=True)
+    assert np.all(cnts == 2), 'Stitched mesh is not watertight.'
+    # vertices of the shared face are slightly displaced, across the border of a 1 nm grid cell (x=99.5)
+    vert_b_shifted = vert_b.reshape(-1, 3).copy()
+    vert_b_shifted[vert_b_shifted[:, 0] == 100, 0] = 99.4
+    vert_a_shifted = vert_a.reshape(-1, 3).copy()
+    vert_a_shifted[vert_a_shifted[:, 0] == 100, 0] = 99.6
+    ind, vert, norm = stitch_meshes([ind_a, ind_b], [vert_a_shifted.flatten(), vert_b_shifted.flatten()],
+                                    [np.zeros(0), np.zeros(0)])
+    assert len(vert) // 3 == 12 and len(ind) // 3 == 20
+    # identical partial meshes are only kept once
+    ind, vert, norm = stitch_meshes([ind_a, ind_a], [vert_a, vert_a], [np.zeros(0), np.zeros(0)])
+    assert len(ind) == len(ind_a) and len(vert) == len(vert_a)
+    assert len(stitch_meshes([], [], [])[0]) == 0
+
+
+def test_merge_meshes_dict():
+    parts = [_cube_mesh([ii, 0, 0]) for ii in range(3)]
+    m_storage = {}
+    # object 1 spans three chunks, object 2 only the first one
+    merge_meshes_dict(m_storage, [{1: [ind, vert, np.zeros(0)]} for ind, vert in parts[:2]])
+    merge_meshes_dict(m_storage, {1: [parts[2][0], parts[2][1], np.zeros(0)],
+                                  2: [parts[0][0], parts[0][1], np.zeros(0)]})
+    ind, vert, _ = m_storage[1]
+    assert len(vert) // 3 == 16 and len(ind) // 3 == 28
+    assert np.array_equal(m_storage[2][0], parts[0][0]) and np.array_equal(m_storage[2][1], parts[0][1])
+
+
+if __name__ == '__main__':
+    test_stitch_meshes()
+    test_merge_meshes_dict()
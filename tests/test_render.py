@@ -120,9 +120,35 @@ def test_egl_and_osmesa_swap_and_equivalence():
     log.debug(f'Fraction of pixels with intensity deviation: {frac_pix_afftected} < 0.05')
 
 
+@pytest.mark.filterwarnings("ignore:Modifying DynConfig items via")
+def test_atlas_and_per_location_rendering_equivalence():
+    from syconn import global_params
+    global_params.config['pyopengl_platform'] = 'osmesa'
+    from syconn.proc.ssd_assembly import init_sso_from_kzip
+    from syconn.proc.rendering import render_sso_coords
+    assert os.path.isfile(fname)
+    ssv = init_sso_from_kzip(fname, sso_id=1)
+    rendering_locations = np.concatenate(ssv.sample_locations())
+    global_params.config['rendering_atlas_size'] = 0
+    raw_views = render_sso_coords(ssv, rendering_locations, verbose=True, add_cellobjects=('mi', 'vc', 'sj'))
+    global_params.config['rendering_atlas_size'] = 4096
+    try:
+        raw_views_atlas = render_sso_coords(ssv, rendering_locations, verbose=True,
+                                            add_cellobjects=('mi', 'vc', 'sj'))
+    finally:
+        global_params.config['rendering_atlas_size'] = 0
+    assert raw_views.shape == raw_views_atlas.shape
+    # the per-location loop renders a dummy view before every location, the atlas must not need it
+    assert np.max(np.abs(raw_views[0] - raw_views_atlas[0])) <= 1
+    abs_max_dev = np.max(np.abs(raw_views - raw_views_atlas))
+    assert abs_max_dev <= 1
+    log.debug(f'Absolute max deviation of pixel intensity: {abs_max_dev} <= 1')
+
+
 if __name__ == '__main__':
     test_raw_and_index_rendering_osmesa()
     test_raw_and_index_rendering_egl()
     test_egl_and_osmesa_swap_and_equivalence()
+    test_atlas_and_per_location_rendering_equivalence()
 
 
@@ -1,9 +1,12 @@
-from syconn.reps.rep_helper import ix_from_subfold_new, subfold_from_ix_new, get_unique_subfold_ixs
+from syconn.reps.rep_helper import ix_from_subfold_new, subfold_from_ix_new, get_unique_subfold_ixs, IDIndex, \
+    CSRMapping, RaggedArray, SpatialIndex, knn_majority_vote
 from syconn.reps.segmentation import SegmentationDataset
+from syconn.backend.storage import AttributeDict
 import numpy as np
+import os
 import tempfile
 import shutil
-from collections import defaultdict
+from collections import defaultdict, Counter
 from syconn import global_params
 
 lst_n_folder_fs = [10 ** i for i in range(1, 4)]
@@ -32,6 +35,146 @@ def test_subfold2ix_inverse():
                 assert rep_id == ix_from_subfold_new(storage_ident, n_folder_fs)
 
 
+def test_id_index():
+    ids = np.random.permutation(np.arange(1, int(1e6), 3, dtype=np.uint64))
+    id_index = IDIndex.from_ids(ids)
+    assert id_index[int(ids[5])] == 5
+    assert np.array_equal(id_index.get_indices(ids[:1000]), np.arange(1000))
+    assert 2 not in id_index and int(ids[0]) in id_index
+    ixs, found = id_index.get_indices([2, int(ids[3])], return_found_mask=True)
+    assert not found[0] and found[1] and ixs[1] == 3
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        id_index.save(f'{tmp_dir}/ids')
+        id_index = IDIndex.load(f'{tmp_dir}/ids')
+        assert np.array_equal(ids[id_index.get_indices(ids[::-1])], ids[::-1])
+
+
+def test_csr_mapping():
+    sv_ids = np.random.permutation(np.arange(1, 10000, dtype=np.uint64))
+    splits = np.sort(np.random.choice(np.arange(1, len(sv_ids)), 999, replace=False))
+    mapping = {int(k): v for k, v in zip(np.random.choice(int(1e5), 1000, replace=False) + 1,
+                                         np.split(sv_ids, splits))}
+    csr = CSRMapping.from_dict(mapping)
+    assert len(csr) == len(mapping) and np.all(np.diff(csr.key_ids.astype(np.int64)) > 0)
+    assert set(csr) == set(mapping) and 0 not in csr
+    for k, v in mapping.items():
+        assert np.array_equal(csr[k], v)
+    sv_ids = np.concatenate(list(mapping.values()))
+    ssv_ids = np.concatenate([[k] * len(v) for k, v in mapping.items()])
+    assert np.array_equal(csr.get_keys(sv_ids[::-1]), ssv_ids[::-1])
+    keys, found = csr.get_keys([0, sv_ids[5]], return_found_mask=True)
+    assert not found[0] and found[1] and keys[1] == ssv_ids[5]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csr.save(f'{tmp_dir}/mapping')
+        csr = CSRMapping.load(f'{tmp_dir}/mapping')
+        assert isinstance(csr.value_ids, np.memmap)
+        assert np.array_equal(csr.get_keys(sv_ids), ssv_ids)
+        assert all(np.array_equal(csr[k], v) for k, v in mapping.items())
+
+
+def test_ragged_array():
+    rows = [np.random.randint(0, 100, np.random.randint(0, 5)).astype(np.uint64) for _ in range(1000)]
+    ragged = RaggedArray.from_list(rows)
+    assert len(ragged) == len(rows) and ragged.dtype == np.uint64
+    assert np.array_equal(ragged.lengths(), [len(r) for r in rows])
+    assert all(np.array_equal(a, b) for a, b in zip(ragged, rows))
+    assert np.array_equal(ragged[-1], rows[-1]) and np.array_equal(ragged[np.int64(3)], rows[3])
+    ixs = np.random.randint(0, len(rows), 200)
+    assert all(np.array_equal(a, rows[ix]) for a, ix in zip(ragged[ixs], ixs))
+    assert all(np.array_equal(a, b) for a, b in zip(ragged[10:20], rows[10:20]))
+    assert all(np.array_equal(a, b) for a, b in zip(ragged[::-3], rows[::-3]))
+    obj_arr = np.asarray(ragged)
+    assert obj_arr.dtype == object and np.array_equal(obj_arr[5], rows[5])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        ragged.save(f'{tmp_dir}/mapping_mi_idss')
+        assert RaggedArray.exists(f'{tmp_dir}/mapping_mi_idss')
+        ragged = RaggedArray.load(f'{tmp_dir}/mapping_mi_idss', mmap_mode='r')
+        assert all(np.array_equal(a, b) for a, b in zip(ragged[ixs], [rows[ix] for ix in ixs]))
+
+
+def test_spatial_index():
+    rng = np.random.default_rng(0)
+    pts, labels = rng.random((300, 3)) * 100, rng.integers(0, 3, 300)
+    coords = rng.random((200, 3)) * 100
+    index = SpatialIndex(pts, labels=dict(label=labels))
+    _, ixs = index.query(coords, k=6)
+    maj = index.majority_labels(coords, 'label', k=6)
+    assert np.array_equal(maj, [Counter(labels[row]).most_common(1)[0][0] for row in ixs])
+    assert np.array_equal(knn_majority_vote(labels[ixs[:, :1]]), labels[ixs[:, 0]])
+    nb_ixs, offsets = index.query_radius(coords, 10, fill_nearest=True)
+    assert np.all(np.diff(offsets) > 0)
+    expected = []
+    for ii in range(len(coords)):
+        cls, cnts = np.unique(labels[nb_ixs[offsets[ii]:offsets[ii + 1]]], return_counts=True)
+        expected.append(cls[np.argmax(cnts)])
+    assert np.array_equal(index.radius_majority_labels('label', nb_ixs, offsets), expected)
+    # multi-dimensional labels are compared as rows, i.e. the most frequent row is returned
+    emb = rng.integers(0, 2, (len(pts), 2)).astype(np.float32)
+    maj_rows = index.radius_majority_labels(emb, nb_ixs, offsets)
+    assert maj_rows.shape == (len(coords), 2) and maj_rows.dtype == np.float32
+    for ii in range(len(coords)):
+        rows, cnts = np.unique(emb[nb_ixs[offsets[ii]:offsets[ii + 1]]], axis=0, return_counts=True)
+        assert np.array_equal(maj_rows[ii], rows[np.argmax(cnts)])
+    nb_ixs, offsets = index.query_radius(coords, 0)
+    assert np.all(index.radius_majority_labels(labels, nb_ixs, offsets) == -1)
+    assert np.all(index.radius_majority_labels(emb, nb_ixs, offsets) == -1)
+
+
+def test_get_attributes():
+    with tempfile.TemporaryDirectory() as working_dir:
+        global_params.wd = working_dir
+        global_params.config['paths']['use_new_subfold'] = True
+        sd = SegmentationDataset('sv', version='tmp', working_dir=working_dir, n_folders_fs=10, create=True)
+        rng = np.random.default_rng(0)
+        ids = rng.choice(np.arange(1, 50000, dtype=np.uint64), 200, replace=False)
+        ads = dict()
+        for obj_id in ids:
+            attr_p = f'{sd.so_storage_path}/{subfold_from_ix_new(obj_id, 10)}/attr_dict.pkl'
+            if attr_p not in ads:
+                ads[attr_p] = AttributeDict(attr_p, read_only=False)
+            ads[attr_p][obj_id] = dict(size=int(rng.integers(1, 1000)), rep_coord=rng.integers(0, 100, 3),
+                                       cs_ids=rng.integers(1, 100, rng.integers(0, 4)).astype(np.uint64))
+        for ad in ads.values():
+            ad.push()
+        assert len(ads) > 1
+        np.save(sd.path + 'ids.npy', ids)
+        query = ids[rng.permutation(len(ids))[:50]]
+        expected = {k: np.array([sd.get_segmentation_object(obj_id).lookup_in_attribute_dict(k) for obj_id in query])
+                    for k in ['size', 'rep_coord']}
+        # attribute dictionaries only
+        attrs = sd.get_attributes(query, ['size', 'rep_coord'])
+        for k, v in expected.items():
+            assert np.array_equal(attrs[k], v)
+        # numpy cache arrays
+        np.save(sd.path + 'sizes.npy', np.array([sd.get_segmentation_object(obj_id).lookup_in_attribute_dict('size')
+                                                 for obj_id in ids]))
+        assert np.array_equal(sd.get_attributes(query, 'size'), expected['size'])
+        assert all(v is None for v in sd.get_attributes(query, 'missing', allow_missing=True))
+        # ragged attributes, stored as RaggedArray by dataset_analysis
+        cs_ids = [sd.get_segmentation_object(obj_id).lookup_in_attribute_dict('cs_ids') for obj_id in ids]
+        attr_fallback = sd.get_attributes(query, 'cs_ids')
+        RaggedArray.from_list(cs_ids, dtype=np.uint64).save(sd.path + 'cs_idss')
+        arr = sd.load_numpy_data('cs_ids')
+        assert isinstance(arr, np.ndarray) and arr.dtype == object and len(arr) == len(ids)
+        assert isinstance(sd.load_numpy_data('cs_ids', ragged=True), RaggedArray)
+        attr = sd.get_attributes(query, 'cs_ids')
+        assert attr.dtype == attr_fallback.dtype == object
+        for a, b, obj_id in zip(attr, attr_fallback, query):
+            ref = sd.get_segmentation_object(obj_id).lookup_in_attribute_dict('cs_ids')
+            assert np.array_equal(a, ref) and np.array_equal(b, ref)
+        # the ID index is only written explicitly
+        assert not any(os.path.isfile(p) for p in IDIndex.paths(sd.path_ids[:-len('.npy')]))
+        sd.save_id_index()
+        sd = SegmentationDataset('sv', version='tmp', working_dir=working_dir, n_folders_fs=10)
+        assert np.array_equal(sd.get_attributes(query, 'size'), expected['size'])
+        assert isinstance(sd.soid2ix.sorted_ids, np.memmap)
+
+
 if __name__ == '__main__':
     test_subfold_from_ix()
     test_subfold2ix_inverse()
+    test_id_index()
+    test_csr_mapping()
+    test_ragged_array()
+    test_spatial_index()
+    test_get_attributes()
@@ -2,14 +2,23 @@
 # Copyright (c) 2016 Philipp J. Schubert
 # All rights reserved
 
+from syconn.extraction.object_extraction_steps import extract_face_slab, stitch_face_slabs
 from syconn.extraction.find_object_properties import detect_cs, detect_cs_64bit, detect_seg_boundaries, \
-    find_object_properties, find_object_properties_cs_64bit
+    find_object_properties, find_object_properties_cs_64bit, close_and_dilate_labels, detect_seg_boundaries_parallel, \
+    detect_contact_partners_parallel, detect_contact_partners_packed, find_object_properties_fused
+from syconn.extraction.find_object_properties_C import map_subcell_extract_props
+from syconn.extraction.block_processing_C import process_block_nonzero
+from collections import defaultdict
+import tempfile
 import numpy as np
 from syconn.global_params import config
 from syconn.handler.basics import chunkify_weighted
-from syconn.reps.rep_helper import colorcode_vertices
+from syconn.proc.sd_proc import prop_records, merge_prop_records, prop_records_to_dicts, merge_prop_dicts, \
+    overlap_records, merge_overlap_records, invert_overlap_records, overlap_records_to_dict, merge_map_dicts, \
+    invert_mdc, _storage_buckets, _write_shuffle_buckets, _bucket_segments, _read_shuffle_buckets
+from syconn.reps.rep_helper import colorcode_vertices, subfold_from_ix
 from syconn.reps.connectivity_helper import cs_id_to_partner_ids_vec, cs_id_to_partner_inverse
-from scipy import spatial
+from scipy import spatial, ndimage
 
 # test cube properties
 cube_size = 5
@@ -52,6 +61,28 @@ def test_find_object_properties():
             "Bounding box dictionary mismatch."
 
 
+def test_find_object_properties_fused():
+    rng = np.random.default_rng(0)
+    cell = ndimage.label(ndimage.gaussian_filter(rng.random((30, 25, 20)), 1.2) > 0.5)[0].astype(np.uint64)
+    subcell = np.stack([ndimage.label(ndimage.gaussian_filter(rng.random(cell.shape), 1.) > 0.55)[0]
+                        for _ in range(2)]).astype(np.uint64)
+    props, overlaps = find_object_properties_fused(cell, subcell)
+    cell_props, subcell_props, mapping_dicts = map_subcell_extract_props(cell, subcell)
+    subcell_props = [[subcell_props[0][ii], subcell_props[1][ii], subcell_props[2][ii]] for ii in range(2)]
+    for (ids, rep_coords, bbs, sizes, touches_bdry), (rc_dc, bb_dc, size_dc), seg in zip(
+            props, [cell_props] + subcell_props, [cell] + list(subcell)):
+        assert np.array_equal(ids, np.sort(list(size_dc.keys())))
+        assert np.array_equal(rep_coords, [rc_dc[ix] for ix in ids])
+        assert np.array_equal(bbs, [bb_dc[ix] for ix in ids])
+        assert np.array_equal(sizes, [size_dc[ix] for ix in ids])
+        bdry_ids = np.unique(np.concatenate([seg[0].flat, seg[:, 0].flat, seg[:, :, 0].flat, seg[-1].flat,
+                                             seg[:, -1].flat, seg[:, :, -1].flat]))
+        assert np.array_equal(touches_bdry, np.isin(ids, bdry_ids))
+    for (pairs, counts), mapping_dc in zip(overlaps, mapping_dicts):
+        assert len(pairs) == sum(len(v) for v in mapping_dc.values())
+        assert all(mapping_dc[sc_id][cell_id] == cnt for (sc_id, cell_id), cnt in zip(pairs, counts))
+
+
 def _helpertest_detect_cs(distance_between_cube, stencil, cube_size, test_func=detect_cs):
     """
     Assert statement fails if test_func method does not work properly (
@@ -169,6 +200,113 @@ def test_boundary_gen():
     assert np.all(~bdry)
 
 
+def test_parallel_cs_kernels():
+    rng = np.random.default_rng(0)
+    seg = np.repeat(np.repeat(rng.integers(0, 20, (8, 8, 8)), 4, axis=0), 4, axis=1).astype(np.uint64)
+    seg[seg < 3] = 0
+    bdry = detect_seg_boundaries_parallel(seg)
+    assert np.array_equal(bdry, detect_seg_boundaries(seg))
+    offset = np.array([(-(s // 2), s // 2) for s in stencil])
+    cs = detect_contact_partners_parallel(seg, bdry, offset)
+    cs_packed = detect_contact_partners_packed(seg.astype(np.uint32), bdry, offset)
+    assert np.all(cs[..., 0] <= cs[..., 1])
+    assert np.array_equal(cs[..., 0] * 2 ** 32 + cs[..., 1], cs_packed)
+    ref = process_block_nonzero(bdry.astype(np.uint32), seg.astype(np.uint32), stencil)
+    assert np.array_equal(cs_packed, np.asarray(ref))
+
+
+def test_close_and_dilate_labels():
+    rng = np.random.default_rng(0)
+    seg = rng.integers(0, 20, (30, 25, 20)).astype(np.uint64)
+    seg[rng.random(seg.shape) < 0.97] = 0
+    for n_closings, n_dilations in [(2, 0), (1, 1), (0, 2)]:
+        _, bb_dc, _ = find_object_properties(seg)
+        # reference: per-object scipy closing and dilation
+        ref = seg.copy()
+        for ix in bb_dc:
+            obj_start, obj_end = np.array(bb_dc[ix])
+            obj_start = np.clip(obj_start - n_closings, 0, None)
+            obj_end += n_closings
+            slices = tuple(slice(obj_start[ii], obj_end[ii]) for ii in range(3))
+            sub_vol = ref[slices]
+            binary_mask = sub_vol == ix
+            res = ndimage.binary_closing(binary_mask, iterations=n_closings) if n_closings > 0 else binary_mask
+            if n_dilations > 0:
+                res = ndimage.binary_dilation(res, iterations=n_dilations)
+            sub_vol[(binary_mask | (sub_vol == 0)) & res] = ix
+        out = close_and_dilate_labels(seg.copy(), n_closings, n_dilations, bounding_boxes=bb_dc)
+        assert np.array_equal(out, ref), 'Label-aware closing/dilation differs from scipy.ndimage.'
+
+
+def test_stitch_face_slabs():
+    size, overlap, stitch_overlap = np.array([10, 8, 6]), np.array([2, 2, 1]), np.array([1, 1, 1])
+    vol = np.zeros((2 * size[0] + 2 * overlap[0], size[1] + 2 * overlap[1], size[2] + 2 * overlap[2]), np.uint64)
+    vol[5:14, 2:5, 1:4] = 1  # crosses the chunk border at x=10..14
+    vol[4:9, 6:9, 4:7] = 2  # only within the lower chunk
+    chunk, chunk_upper = vol[:size[0] + 2 * overlap[0]].copy(), vol[size[0]:].copy()
+    chunk_upper[chunk_upper > 0] += 10
+    slab = extract_face_slab(chunk, overlap, 0, True)
+    slab_upper = extract_face_slab(chunk_upper, overlap, 0, False)
+    assert slab.shape == slab_upper.shape == (4, size[1] + 4, size[2] + 2)
+    pairs, match_vx = stitch_face_slabs(slab, slab_upper, overlap, stitch_overlap, 0)
+    assert np.array_equal(pairs, [[1, 11]]) and np.array_equal(match_vx, [4 * 3 * 3])
+    # no overlap within the stitch region
+    pairs, _ = stitch_face_slabs(slab, slab_upper, overlap, np.zeros(3, dtype=np.int64), 0)
+    assert len(pairs) == 0
+
+
+def test_prop_records():
+    rng = np.random.default_rng(0)
+    prop_dcs = [{}, defaultdict(list), {}]
+    map_dc = {}
+    recs, ol_recs = [], []
+    for _ in range(5):
+        ids = rng.choice(np.arange(1, 30, dtype=np.uint64), 10, replace=False)
+        rcs, sizes, offset = rng.integers(0, 50, (10, 3)), rng.integers(1, 100, 10), rng.integers(0, 1000, 3)
+        bbs = np.stack([rcs, rcs + rng.integers(1, 5, (10, 3))], axis=1)
+        recs.append(prop_records(ids, rcs, bbs, sizes, offset=offset))
+        merge_prop_dicts([prop_dcs, [dict(zip(ids.tolist(), rcs.tolist())), dict(zip(ids.tolist(), bbs.tolist())),
+                                     dict(zip(ids.tolist(), sizes.tolist()))]], offset=offset)
+        partner_ids = rng.integers(1, 5, 10).astype(np.uint64)
+        ol_recs.append(overlap_records(ids, partner_ids, sizes))
+        merge_map_dicts([map_dc, {k: {p: s} for k, p, s in zip(ids.tolist(), partner_ids.tolist(), sizes.tolist())}])
+    rc_dc, bb_dc, size_dc = prop_records_to_dicts(merge_prop_records(recs))
+    assert size_dc == prop_dcs[2]
+    for k in prop_dcs[0]:
+        assert np.array_equal(rc_dc[k], prop_dcs[0][k])
+        assert np.array_equal(bb_dc[k], prop_dcs[1][k])
+    ol_recs = merge_overlap_records(ol_recs)
+    assert overlap_records_to_dict(ol_recs) == map_dc
+    assert overlap_records_to_dict(invert_overlap_records(ol_recs)) == invert_mdc(map_dc)
+
+
+def test_shuffle_buckets():
+    rng = np.random.default_rng(0)
+    n_folders_fs = 100
+    id_blocks, bucket_dc = _storage_buckets(n_folders_fs, 7)
+    ids = rng.choice(np.arange(1, 10**6, dtype=np.uint64), 500, replace=False)
+    rcs, sizes = rng.integers(0, 50, (500, 3)), rng.integers(1, 100, 500)
+    recs = prop_records(ids, rcs, np.stack([rcs, rcs + 1], axis=1), sizes)
+    ol_recs = overlap_records(ids, rng.integers(1, 5, 500).astype(np.uint64), sizes)
+    # IDs span storage folders of several writer jobs
+    assert len({bucket_dc[subfold_from_ix(ix, n_folders_fs)] for ix in ids}) > 1
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        shuffle_index = []
+        for ii, ixs in enumerate(np.array_split(np.arange(len(ids)), 3)):
+            p = f'{tmp_dir}/{ii}.pkl'
+            shuffle_index.append((p, _write_shuffle_buckets(p, [recs[ixs], ol_recs[ixs]], n_folders_fs, bucket_dc)))
+        read_recs, read_ol_recs = [], []
+        for job_ix in range(len(id_blocks)):
+            for tables in _read_shuffle_buckets(_bucket_segments(shuffle_index, job_ix)):
+                for table in tables:
+                    assert np.all([bucket_dc[subfold_from_ix(ix, n_folders_fs)] == job_ix for ix in table['id']])
+                read_recs.append(tables[0])
+                read_ol_recs.append(tables[1])
+    read_recs, read_ol_recs = np.concatenate(read_recs), np.concatenate(read_ol_recs)
+    assert np.array_equal(np.sort(read_recs, order='id'), np.sort(recs, order='id'))
+    assert np.array_equal(np.sort(read_ol_recs, order='id'), np.sort(ol_recs, order='id'))
+
+
 def test_chunk_weighted():
     sample_array = np.array([0, 1, 2, 3, 4, 5, 6, 7], np.uint64)
     weights = np.array([3, 1, 2, 7, 5, 8, 0, 8], np.uint64)